@@ -0,0 +1,97 @@
+''' Memory comparison of the __slots__ based pmtypes (with interning of codings) and dict based
+instances without interning, as they were before.
+The workload is that of a client: waveform and numeric metric values are parsed from nodes and kept,
+the waveform samples are converted to RtSampleContainer objects.
+Each variant runs in an own process, memory is measured with tracemalloc.
+
+    python benchmarks/bench_compact_pmtypes.py [number of reports]
+
+Result on a developer machine (python 3.11, 5000 reports):
+    dict         heap  32.1 MB   gc tracked objects  165000   gc.collect 0.078 s
+    compact      heap  27.8 MB   gc tracked objects  155001   gc.collect 0.073 s
+Most of the remaining heap are the sample values (Decimal) and the value strings of the RtSampleContainers.
+Annotations are not interned, their Type is a mutable CodedValue (interning them saved another 3.9 MB).
+'''
+import gc
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from sdc11073 import namespaces  # pylint: disable=wrong-import-position
+from sdc11073 import pmtypes  # pylint: disable=wrong-import-position
+from sdc11073.mdib import mdibbase  # pylint: disable=wrong-import-position
+
+SAMPLES_PER_REPORT = 10
+
+
+def _useDictClasses():
+    ''' replaces the compact classes by dict based subclasses and disables interning.
+    Coding stays a tuple (its __new__ refers to the module global), only its interning is disabled.'''
+    pmtypes._MAX_INTERNED = 0  # pylint: disable=protected-access
+    for name in ('CodedValue', 'T_Translation', 'Annotation', 'ApplyAnnotation',
+                 'NumericMetricValue', 'SampleArrayValue'):
+        cls = getattr(pmtypes, name)
+        setattr(pmtypes, name, type(name, (cls,), {}))
+    pmtypes.AbstractMetricValue.Annotation._cls = pmtypes.Annotation  # pylint: disable=protected-access
+    pmtypes.SampleArrayValue.ApplyAnnotations._cls = pmtypes.ApplyAnnotation  # pylint: disable=protected-access
+    pmtypes.CodedValue.Translation._cls = pmtypes.T_Translation  # pylint: disable=protected-access
+    mdibbase.RtSampleContainer = type('RtSampleContainer', (mdibbase.RtSampleContainer,), {})
+
+
+def _mkNodes():
+    nsmap = {'pm': namespaces.Prefix_Namespace.PM.namespace}
+    tag = namespaces.domTag('MetricValue')
+    sampleArray = pmtypes.SampleArrayValue(None)
+    sampleArray.DeterminationTime = time.time()
+    sampleArray.Samples = list(range(SAMPLES_PER_REPORT))
+    sampleArray.Annotation = [pmtypes.Annotation(pmtypes.CodedValue('4711')),
+                              pmtypes.Annotation(pmtypes.CodedValue('4712'))]
+    sampleArray.ApplyAnnotations = [pmtypes.ApplyAnnotation(0, 0), pmtypes.ApplyAnnotation(1, 5)]
+    numeric = pmtypes.NumericMetricValue(None)
+    numeric.DeterminationTime = time.time()
+    numeric.Value = 42
+    return sampleArray.asEtreeNode(tag, nsmap), numeric.asEtreeNode(tag, nsmap)
+
+
+def _run(variant, count):
+    if variant == 'dict':
+        _useDictClasses()
+    sampleArrayNode, numericNode = _mkNodes()
+    pmtypes.SampleArrayValue.fromNode(sampleArrayNode)  # warm up, codecs are not measured
+    pmtypes.NumericMetricValue.fromNode(numericNode)
+    gc.collect()
+    objectCount = len(gc.get_objects())
+    tracemalloc.start()
+    values = []
+    for _ in range(count):
+        sampleArray = pmtypes.SampleArrayValue.fromNode(sampleArrayNode)
+        sampleArray.node = None  # nodes are not part of the comparison
+        numeric = pmtypes.NumericMetricValue.fromNode(numericNode)
+        numeric.node = None
+        annotations = [sampleArray.Annotation[a.AnnotationIndex] for a in sampleArray.ApplyAnnotations]
+        values.append((sampleArray, numeric))
+        values.append([mdibbase.RtSampleContainer(str(s), sampleArray.DeterminationTime, sampleArray.Validity,
+                                                  annotations) for s in sampleArray.Samples])
+    heap, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    gc.collect()
+    gcTime = time.perf_counter() - start
+    print('{:12} heap {:5.1f} MB   gc tracked objects {:7}   gc.collect {:.3f} s'.format(
+        variant, heap / 1e6, len(gc.get_objects()) - objectCount, gcTime))
+
+
+def main(count):
+    for variant in ('dict', 'compact'):
+        subprocess.check_call([sys.executable, __file__, str(count), variant])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        _run(sys.argv[2], int(sys.argv[1]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,85 @@
+''' Compares the compiled container codecs with the generic container property methods.
+All descriptor and state containers of tests/70041_MDIB_Final.xml are serialized (mkNode) and parsed (updateFromNode).
+The generic variant replaces the codecs by the behavior before codecs existed: every call walks the class
+hierarchy and uses updateXMLValue / updateFromNode of every property, also for nested pmtypes.
+
+    python benchmarks/bench_containercodec.py [loops]
+
+Result on a developer machine (python 3.11, lxml 6.1, 190 containers, 20 loops, best of 5):
+    mkNode          generic   0.66 s   compiled   0.50 s   speedup 1.3
+    updateFromNode  generic   0.32 s   compiled   0.15 s   speedup 2.2
+mkNode is dominated by the creation of lxml elements, which the codec does not change.
+'''
+import copy
+import os
+import sys
+import time
+import traceback
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from sdc11073 import mdib  # pylint: disable=wrong-import-position
+from sdc11073 import pmtypes  # pylint: disable=wrong-import-position
+from sdc11073.mdib import containerbase  # pylint: disable=wrong-import-position
+
+MDIB_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'tests', '70041_MDIB_Final.xml')
+
+
+class _GenericCodec(object):
+    ''' same interface as ContainerCodec, but properties are determined and used generically on every call'''
+    def __init__(self, instance):
+        self.properties = instance._sortedContainerProperties()  # pylint: disable=protected-access
+
+    @property
+    def namedWriters(self):
+        return [(name, prop, prop.updateXMLValue) for name, prop in self.properties]
+
+    def updateNode(self, instance, node):
+        for _, prop in self.properties:
+            prop.updateXMLValue(instance, node)
+
+    def updateFromNode(self, instance, node):
+        for _, prop in self.properties:
+            prop.updateFromNode(instance, node)
+
+
+def _measure(containers, nodes, loops):
+    start = time.perf_counter()
+    for _ in range(loops):
+        for container in containers:
+            container.mkNode()
+    mkNodeTime = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(loops):
+        for container, node in zip(containers, nodes):
+            container._updateFromNode(node)  # pylint: disable=protected-access
+    return mkNodeTime, time.perf_counter() - start
+
+
+def main(loops):
+    deviceMdibContainer = mdib.DeviceMdibContainer.fromMdibFile(MDIB_FILE)
+    containers = list(deviceMdibContainer.descriptions.objects) + list(deviceMdibContainer.states.objects) \
+                 + list(deviceMdibContainer.contextStates.objects)
+    containers = [copy.copy(c) for c in containers]
+    nodes = [c.mkNode() for c in containers]
+    print('{} containers, {} loops'.format(len(containers), loops))
+    generic, compiled = [], []
+    for _ in range(5):  # interleaved repetitions, the best result of each variant is used
+        with mock.patch.object(containerbase, 'getCodec', _GenericCodec), \
+                mock.patch.object(pmtypes, 'getCodec', _GenericCodec):
+            generic.append(_measure(containers, nodes, loops))
+        compiled.append(_measure(containers, nodes, loops))
+    generic = [min(times) for times in zip(*generic)]
+    compiled = [min(times) for times in zip(*compiled)]
+    for name, genericTime, compiledTime in zip(('mkNode', 'updateFromNode'), generic, compiled):
+        print('{:15} generic {:6.2f} s   compiled {:6.2f} s   speedup {:.1f}'.format(
+            name, genericTime, compiledTime, genericTime / compiledTime))
+
+
+if __name__ == '__main__':
+    try:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
+    except Exception:
+        print(traceback.format_exc())
+        sys.exit(1)
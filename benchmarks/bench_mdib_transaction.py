@@ -0,0 +1,61 @@
+''' Time of device mdib transactions that update all NumericMetricStates of tests/70041_MDIB_Final.xml
+(getMetricState + set Value, 44 states per transaction). Notifications are not sent (no sdc device),
+the time includes mkCopy of the states and their metric values, the commit and the snapshot invalidation.
+
+    python benchmarks/bench_mdib_transaction.py [number of transactions]
+
+Result on a developer machine (python 3.11, lxml 6.1, 1000 transactions, thread cpu time, best of 5 runs):
+    keepNodes=True    44 states     1.80 ms per transaction
+    keepNodes=False   44 states     1.58 ms per transaction
+The version before frozen states (mkCopy shared the metric values with the committed state) needs 1.65 ms,
+mkCopy with copy.deepcopy of the metric values needed 4.72 ms. pmtypes have their own __deepcopy__ that copies only
+the property values, the measured values vary by about +-20% between runs.
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from sdc11073 import mdib  # pylint: disable=wrong-import-position
+from sdc11073 import namespaces  # pylint: disable=wrong-import-position
+
+MDIB_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'tests', '70041_MDIB_Final.xml')
+REPEAT = 5 # the best of REPEAT runs is printed
+
+
+class _Device(object):
+    ''' accepts all notifications of the mdib'''
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def _run(keepNodes, count):
+    deviceMdibContainer = mdib.DeviceMdibContainer.fromMdibFile(MDIB_FILE, keepNodes=keepNodes)
+    deviceMdibContainer.setSdcDevice(_Device())
+    handles = [s.descriptorHandle
+               for s in deviceMdibContainer.states.NODETYPE.get(namespaces.domTag('NumericMetricState'))]
+    with deviceMdibContainer.mdibUpdateTransaction() as tr:
+        for handle in handles:
+            st = tr.getMetricState(handle)
+            st.mkMetricValue()
+            st.metricValue.Value = 0
+    durations = []
+    for _ in range(REPEAT):
+        started = time.thread_time()
+        for i in range(count):
+            with deviceMdibContainer.mdibUpdateTransaction() as tr:
+                for handle in handles:
+                    tr.getMetricState(handle).metricValue.Value = i
+        durations.append(time.thread_time() - started)
+    print('keepNodes={:6}  {} states   {:6.2f} ms per transaction'.format(str(keepNodes), len(handles),
+                                                                          min(durations) * 1000 / count))
+
+
+def main(count):
+    for keepNodes in (True, False):
+        _run(keepNodes, count)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,120 @@
+''' Cost of the namespace translation of received messages (BaseDefinitions.normalizeXMLText).
+Compared are
+- legacy: four replace passes with byte strings that are formatted and encoded on every call (behavior before),
+- cached: translation tables built once per definitions class, no pass at all if no BICEPS namespace is in the text,
+- parser target: no text translation, namespaces are rewritten while the tree is built (lxml parser target
+  feeding a TreeBuilder).
+Parse times include the translation.
+
+    python benchmarks/bench_namespace_translation.py
+
+Result on a developer machine (python 3.11, lxml 6.1, best of 5, time per message in microseconds):
+    message                  size   legacy   cached  | parse legacy  parse cached  parse target
+    GetMdibResponse         64859     64.5     60.6  |       1375.0        1294.9       16546.5
+    WaveformStream           2635      9.3      6.3  |         52.1          49.1         856.5
+    RenewResponse             232      5.7      1.2  |         14.8          10.3          83.8
+The replace passes are cheap compared to parsing, a parser target calls python for every element and is
+more than ten times slower than parsing plus text translation. Therefore the text translation is kept, only its
+per call overhead is removed.
+'''
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from lxml import etree as etree_  # pylint: disable=wrong-import-position
+from sdc11073 import mdib  # pylint: disable=wrong-import-position
+from sdc11073.definitions_sdc import SDC_v1_Definitions  # pylint: disable=wrong-import-position
+from sdc11073.namespaces import Prefix_Namespace as Prefix  # pylint: disable=wrong-import-position
+
+MDIB_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'tests', '70041_MDIB_Final.xml')
+_NAMESPACES = ((SDC_v1_Definitions.MessageModelNamespace, Prefix.MSG.namespace),
+               (SDC_v1_Definitions.ParticipantModelNamespace, Prefix.PM.namespace),
+               (SDC_v1_Definitions.ExtensionPointNamespace, Prefix.EXT.namespace),
+               (SDC_v1_Definitions.MDPWSNameSpace, Prefix.MDPWS.namespace))
+
+
+def _legacyNormalize(xml_text):
+    for ns, internal_ns in _NAMESPACES:
+        xml_text = xml_text.replace('"{}"'.format(ns).encode('utf-8'), '"{}"'.format(internal_ns).encode('utf-8'))
+    return xml_text
+
+
+class _NormalizingTarget(object):
+    ''' parser target that builds the tree with internal namespaces'''
+    _lookup = dict(_NAMESPACES)
+
+    def __init__(self):
+        self._builder = etree_.TreeBuilder()
+
+    def _name(self, name):
+        if name[0] == '{':
+            namespace, localname = name[1:].split('}', 1)
+            internal_ns = self._lookup.get(namespace)
+            if internal_ns is not None:
+                return '{{{}}}{}'.format(internal_ns, localname)
+        return name
+
+    def start(self, tag, attrib, nsmap):
+        self._builder.start(self._name(tag), {self._name(k): v for k, v in attrib.items()},
+                            {prefix: self._lookup.get(ns, ns) for prefix, ns in nsmap.items()})
+
+    def end(self, tag):
+        self._builder.end(self._name(tag))
+
+    def data(self, data):
+        self._builder.data(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return self._builder.close()
+
+
+def _mkMessages():
+    deviceMdibContainer = mdib.DeviceMdibContainer.fromMdibFile(MDIB_FILE)
+    s12 = Prefix.S12.namespace
+    envelope = '<?xml version="1.0" encoding="UTF-8"?><s12:Envelope xmlns:s12="{}" xmlns:msg="{}" xmlns:pm="{}">' \
+               '<s12:Header/><s12:Body>{{}}</s12:Body></s12:Envelope>'.format(
+                   s12, SDC_v1_Definitions.MessageModelNamespace, SDC_v1_Definitions.ParticipantModelNamespace)
+    mdibNode = deviceMdibContainer.reconstructMdibWithContextStates()
+    getMdib = envelope.format('<msg:GetMdibResponse>{}</msg:GetMdibResponse>').encode('utf-8').replace(
+        b'{}', deviceMdibContainer.nodeToString(mdibNode, xml_declaration=False))
+    waveform = envelope.format('<msg:WaveformStream>{}</msg:WaveformStream>'.format(
+        '<msg:State>1 2 3 4 5 6 7 8</msg:State>' * 60)).encode('utf-8')
+    renew = '<?xml version="1.0" encoding="UTF-8"?><s12:Envelope xmlns:s12="{}"><s12:Header/><s12:Body>' \
+            '<wse:RenewResponse xmlns:wse="http://schemas.xmlsoap.org/ws/2004/08/eventing"/>' \
+            '</s12:Body></s12:Envelope>'.format(s12).encode('utf-8')
+    return [('GetMdibResponse', getMdib), ('WaveformStream', waveform), ('RenewResponse', renew)]
+
+
+def _content(tree):
+    ''' same content, but the target may declare namespaces at different elements'''
+    return [(e.tag, sorted(e.attrib.items()), e.text) for e in tree.iter()]
+
+
+def _usec(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    print('{:20} {:>8} {:>8} {:>8}  | {:>12}  {:>12}  {:>12}'.format(
+        'message', 'size', 'legacy', 'cached', 'parse legacy', 'parse cached', 'parse target'))
+    for name, xml_text in _mkMessages():
+        number = max(20, 200000 // len(xml_text))
+        assert _legacyNormalize(xml_text) == SDC_v1_Definitions.normalizeXMLText(xml_text)
+        targetTree = etree_.fromstring(xml_text, etree_.XMLParser(target=_NormalizingTarget()))
+        assert _content(targetTree) == _content(etree_.fromstring(SDC_v1_Definitions.normalizeXMLText(xml_text)))
+        print('{:20} {:8} {:8.1f} {:8.1f}  | {:12.1f}  {:12.1f}  {:12.1f}'.format(
+            name, len(xml_text),
+            _usec(lambda: _legacyNormalize(xml_text), number),
+            _usec(lambda: SDC_v1_Definitions.normalizeXMLText(xml_text), number),
+            _usec(lambda: etree_.fromstring(_legacyNormalize(xml_text)), number),
+            _usec(lambda: etree_.fromstring(SDC_v1_Definitions.normalizeXMLText(xml_text)), number),
+            _usec(lambda: etree_.fromstring(xml_text, etree_.XMLParser(target=_NormalizingTarget())), number)))
+
+
+if __name__ == '__main__':
+    main()
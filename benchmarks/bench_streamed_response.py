@@ -0,0 +1,121 @@
+''' Memory ceiling of a device that sends large chunked responses.
+Compared are
+- buffered: the response is serialized, denormalized and compressed completely and then split into chunks
+  (behavior before, _SdcServerRequestHandler.STREAM_CHUNKED_RESPONSES = False),
+- streamed: the envelope is serialized incrementally (lxml.etree.xmlfile), denormalized, compressed and written
+  as http chunks while it is produced (StreamedSoapResponse).
+The mdib is tests/70041_MDIB_Final.xml with the Vmds copied several times (new handles), so that it has thousands of
+descriptors. GetMdib is served from the response cache (prepared body), GetMdDescription is serialized from an etree.
+Each variant runs in an own process, device and client run in the same process, the client parses the responses
+while they are received. "peak" is the python heap (tracemalloc) needed during the request in addition to
+everything that existed before it.
+
+    python benchmarks/bench_streamed_response.py [number of vmd copies]
+
+Result on a developer machine (python 3.11, lxml 6.1, 40 copies = 3294 descriptors):
+    buffered  GetMdib           identity  response   2.23 MB   0.342 s   peak   4.7 MB
+    buffered  GetMdib           gzip      response   2.23 MB   0.073 s   peak   2.5 MB
+    buffered  GetMdDescription  identity  response   1.82 MB   0.457 s   peak   5.5 MB
+    buffered  GetMdDescription  gzip      response   1.82 MB   0.221 s   peak   5.5 MB
+    streamed  GetMdib           identity  response   2.23 MB   0.093 s   peak   0.1 MB
+    streamed  GetMdib           gzip      response   2.23 MB   0.074 s   peak   0.6 MB
+    streamed  GetMdDescription  identity  response   1.82 MB   0.243 s   peak   0.1 MB
+    streamed  GetMdDescription  gzip      response   1.82 MB   0.194 s   peak   0.7 MB
+With 80 copies the buffered peaks double (9.5 .. 13.4 MB), the streamed peaks stay the same (0.1 .. 0.7 MB):
+the memory needed for a response no longer grows with the size of the response.
+'''
+import copy
+import logging
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from lxml import etree as etree_  # pylint: disable=wrong-import-position
+from sdc11073 import compression  # pylint: disable=wrong-import-position
+from sdc11073 import mdib  # pylint: disable=wrong-import-position
+from sdc11073.pysoap.soapenvelope import DPWSThisDevice, DPWSThisModel  # pylint: disable=wrong-import-position
+from sdc11073.sdcclient import SdcClient  # pylint: disable=wrong-import-position
+from sdc11073.sdcdevice import SdcDevice  # pylint: disable=wrong-import-position
+from sdc11073.sdcdevice import httpserver  # pylint: disable=wrong-import-position
+from sdc11073.wsdiscovery import WSDiscoveryWhitelist  # pylint: disable=wrong-import-position
+
+MDIB_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'tests', '70041_MDIB_Final.xml')
+ENCODINGS = ('identity', compression.GZIP)
+
+
+def _mkLargeMdib(copies):
+    ''' copies the Vmds, handles and references to handles within a Vmd get a suffix'''
+    tree = etree_.parse(MDIB_FILE)
+    vmds = tree.xpath('//*[local-name()="Vmd"]')  # the file uses the BICEPS namespaces
+    for vmd in vmds:
+        handles = set(vmd.xpath('.//@Handle')) | {vmd.get('Handle')}
+        for i in range(1, copies):
+            vmdCopy = copy.deepcopy(vmd)
+            for node in vmdCopy.iter():
+                for name, value in node.attrib.items():
+                    if value in handles:
+                        node.set(name, '{}_{}'.format(value, i))
+                if node.text in handles:
+                    node.text = '{}_{}'.format(node.text, i)
+            vmd.getparent().append(vmdCopy)
+    return etree_.tostring(tree)
+
+
+def _mkDevice(mdibXml):
+    wsd = WSDiscoveryWhitelist(['127.0.0.1'])
+    wsd.start()
+    model = DPWSThisModel(manufacturer='Draeger', manufacturerUrl='www.draeger.com', modelName='Bench',
+                          modelNumber='1.0', modelUrl='www.draeger.com', presentationUrl='www.draeger.com')
+    device = DPWSThisDevice(friendlyName='Bench', firmwareVersion='1.0', serialNumber='1')
+    deviceMdibContainer = mdib.DeviceMdibContainer.fromString(mdibXml)
+    sdcDevice = SdcDevice(wsd, None, model, device, deviceMdibContainer, chunked_messages=True)
+    sdcDevice.startAll(startRealtimeSampleLoop=False)
+    return wsd, sdcDevice
+
+
+def _run(variant, copies):
+    if variant == 'buffered':
+        httpserver._SdcServerRequestHandler.STREAM_CHUNKED_RESPONSES = False  # pylint: disable=protected-access
+    logging.getLogger('sdc').setLevel(logging.ERROR)  # operations with targets that are not copied
+    wsd, sdcDevice = _mkDevice(_mkLargeMdib(copies))
+    clients = {}
+    for encoding in ENCODINGS:
+        sdcClient = SdcClient(sdcDevice.getXAddrs()[0], deviceType=sdcDevice.mdib.sdc_definitions.MedicalDeviceType,
+                              validate=False, my_ipaddress='127.0.0.1', stream_responses=True)
+        sdcClient.setUsedCompression(*([] if encoding == 'identity' else [encoding]))
+        sdcClient.discoverHostedServices()
+        clients[encoding] = sdcClient.client('Get')
+    for method in ('GetMdib', 'GetMdDescription'):
+        for encoding in ENCODINGS:
+            getService = clients[encoding]
+            call = getService.getMdibNode if method == 'GetMdib' else getService.getMdDescriptionNode
+            call()  # warm up, builds the cached GetMdib response
+            tracemalloc.start()
+            current, _ = tracemalloc.get_traced_memory()
+            start = time.perf_counter()
+            msgNode = call()
+            duration = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            size = len(etree_.tostring(msgNode))
+            print('{:9} {:17} {:9} response {:6.2f} MB  {:6.3f} s   peak {:5.1f} MB'.format(
+                variant, method, encoding, size / 1e6, duration, (peak - current) / 1e6))
+    sdcDevice.stopAll()
+    wsd.stop()
+
+
+def main(copies):
+    print('{} copies = {} descriptors'.format(copies, len(etree_.fromstring(_mkLargeMdib(copies)).xpath('//@Handle'))))
+    for variant in ('buffered', 'streamed'):
+        subprocess.check_call([sys.executable, __file__, str(copies), variant])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        _run(sys.argv[2], int(sys.argv[1]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 40)
@@ -0,0 +1,164 @@
+''' Reading of large chunked and compressed http bodies, complete reading compared to streaming.
+1. de-chunking of a request body (device side): the byte-at-a-time chunk header parsing and joining of all chunks
+   before (legacy) compared to HTTPReader._iter_dechunk, that reads chunk headers with readline from the buffered stream.
+2. a chunked, gzip compressed GetMdibResponse (client side) that is sent by a local http server with limited rate:
+   - complete: read the body, decompress, normalize and parse (behavior before),
+   - streamed: HTTPReader.iter_response_body -> normalizeXMLBlocks -> lxml.etree.XMLPullParser
+   "first event" is the time from the request until the parser delivered the start of the first mdib,
+   "peak" is the python heap (tracemalloc) needed in addition to the parsed tree.
+
+    python benchmarks/bench_streaming_reader.py [number of mdibs in response] [rate in MB/s]
+
+Result on a developer machine (python 3.11, lxml 6.1, 50 mdibs = 3.2 MB xml, 0.20 MB gzip, 2 MB/s):
+    dechunk 3.2 MB in 512 byte chunks:   legacy  0.035 s   buffered  0.015 s
+    complete   first event 0.118 s   parsed 0.191 s   peak   9.7 MB
+    streamed   first event 0.004 s   parsed 0.145 s   peak   0.2 MB
+The streamed response is parsed while it is received, only one block of compressed and decompressed data is in memory.
+The CPU time for decompression and parsing is the same, but it overlaps with the transfer.
+'''
+import http.server
+import io
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from lxml import etree as etree_  # pylint: disable=wrong-import-position
+from sdc11073 import compression  # pylint: disable=wrong-import-position
+from sdc11073 import mdib  # pylint: disable=wrong-import-position
+from sdc11073.definitions_sdc import SDC_v1_Definitions  # pylint: disable=wrong-import-position
+from sdc11073.httprequesthandler import HTTPReader, mkchunks  # pylint: disable=wrong-import-position
+from sdc11073.namespaces import Prefix_Namespace as Prefix  # pylint: disable=wrong-import-position
+from sdc11073.pysoap.soapclient import HTTPConnection_NODELAY  # pylint: disable=wrong-import-position
+
+MDIB_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'tests', '70041_MDIB_Final.xml')
+CHUNK_SIZE = 512  # as mkchunks of device
+MDIB_TAG = '{{{}}}Mdib'.format(Prefix.MSG.namespace)
+
+
+def _legacyReadUntil(stream, delimiter, max_bytes=16):
+    buf = bytearray()
+    delim_len = len(delimiter)
+    while len(buf) < max_bytes:
+        c = stream.read(1)
+        if not c:
+            break
+        buf += c
+        if buf[-delim_len:] == delimiter:
+            return bytes(buf[:-delim_len])
+
+
+def _legacyDechunk(stream):
+    body = []
+    while True:
+        chunk_len = int(_legacyReadUntil(stream, b'\r\n').split(b';')[0].strip(), 16)
+        bytes_to_read = chunk_len
+        while bytes_to_read:
+            chunk = stream.read(bytes_to_read)
+            bytes_to_read -= len(chunk)
+            body.append(chunk)
+        stream.read(2)
+        if chunk_len == 0:
+            break
+    return b''.join(body)
+
+
+def _mkResponse(count):
+    deviceMdibContainer = mdib.DeviceMdibContainer.fromMdibFile(MDIB_FILE)
+    mdibBytes = deviceMdibContainer.nodeToString(deviceMdibContainer.reconstructMdibWithContextStates(),
+                                                 xml_declaration=False)
+    envelope = '<?xml version="1.0" encoding="UTF-8"?><s12:Envelope xmlns:s12="{}" xmlns:msg="{}" xmlns:pm="{}">' \
+               '<s12:Header/><s12:Body><msg:GetMdibResponse>'.format(
+                   Prefix.S12.namespace, Prefix.MSG.namespace, Prefix.PM.namespace).encode('utf-8')
+    xml = envelope + mdibBytes * count + b'</msg:GetMdibResponse></s12:Body></s12:Envelope>'
+    return SDC_v1_Definitions.denormalizeXMLText(xml)
+
+
+def _mkHandler(chunkedBody, rate):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):  # pylint: disable=invalid-name
+            self.rfile.read(int(self.headers['content-length']))
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/soap+xml')
+            self.send_header('Content-Encoding', compression.GZIP)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            data = memoryview(chunkedBody)
+            block = max(1, int(rate * 0.01))  # 10 ms of data
+            for pos in range(0, len(data), block):
+                self.wfile.write(data[pos:pos + block])
+                self.wfile.flush()
+                time.sleep(0.01)
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            pass
+    return Handler
+
+
+def _complete(response, started):
+    body = HTTPReader.read_response_body(response)
+    firstEvent = time.perf_counter() - started  # parsing starts after everything is received
+    return etree_.fromstring(SDC_v1_Definitions.normalizeXMLText(body)), firstEvent
+
+
+def _streamed(response, started):
+    parser = etree_.XMLPullParser(events=('start',), tag=MDIB_TAG)
+    firstEvent = None
+    for block in SDC_v1_Definitions.normalizeXMLBlocks(HTTPReader.iter_response_body(response)):
+        parser.feed(block)
+        if firstEvent is None and next(parser.read_events(), None) is not None:
+            firstEvent = time.perf_counter() - started
+        else:
+            for _ in parser.read_events():
+                pass
+    return parser.close(), firstEvent
+
+
+def _request(port, func):
+    connection = HTTPConnection_NODELAY('127.0.0.1', port)
+    tracemalloc.start()
+    started = time.perf_counter()
+    connection.request('POST', '/', body=b'<x/>', headers={'Accept-Encoding': compression.GZIP})
+    tree, firstEvent = func(connection.getresponse(), started)
+    parsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    connection.close()
+    return tree, firstEvent, parsed, peak
+
+
+def main(count, rate):
+    xml = _mkResponse(count)
+    compressed = compression.CompressionHandler.compressPayload(compression.GZIP, xml)
+    print('{} mdibs = {:.1f} MB xml, {:.2f} MB gzip, {} MB/s'.format(count, len(xml) / 1e6, len(compressed) / 1e6,
+                                                                  rate))
+    chunked = mkchunks(xml, CHUNK_SIZE)
+    start = time.perf_counter()
+    assert _legacyDechunk(io.BufferedReader(io.BytesIO(chunked))) == xml
+    legacyTime = time.perf_counter() - start
+    start = time.perf_counter()
+    assert HTTPReader._read_dechunk(io.BufferedReader(io.BytesIO(chunked))) == xml  # pylint: disable=protected-access
+    print('dechunk {:.1f} MB in {} byte chunks:   legacy {:6.3f} s   buffered {:6.3f} s'.format(
+        len(xml) / 1e6, CHUNK_SIZE, legacyTime, time.perf_counter() - start))
+
+    server = http.server.HTTPServer(('127.0.0.1', 0), _mkHandler(mkchunks(compressed, CHUNK_SIZE), rate * 1e6))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    results = []
+    for name, func in (('complete', _complete), ('streamed', _streamed)):
+        tree, firstEvent, parsed, peak = _request(server.server_address[1], func)
+        results.append(len(tree.xpath('//*')))
+        del tree
+        print('{:10} first event {:5.3f} s   parsed {:5.3f} s   peak {:5.1f} MB'.format(name, firstEvent, parsed,
+                                                                                       peak / 1e6))
+    assert results[0] == results[1]
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50, float(sys.argv[2]) if len(sys.argv) > 2 else 2)
@@ -0,0 +1,201 @@
+''' Compression ratio and CPU time of gzip, lz4, zstd and zstd with the shipped dictionary of sdc messages
+(compression.ZSTD_SDC) on recorded traffic.
+The traffic is recorded from a device and a client in the same process: the client reads the mdib and subscribes
+everything, the device updates metrics and alerts and sends waveforms. All messages that are sent via http are
+recorded as they are sent (denormalized, not compressed).
+The dictionary (sdc11073/zstd_dict/sdc1.dict) was trained with "--train" on the traffic of the sample mdibs of the
+repository (tests/70041_MDIB_Final.xml, tests/mdib_tns.xml, tutorial/provider/mdib.xml). The benchmark uses the
+traffic of examples/ReferenceTest/reference_mdib.xml, that is not part of the training data.
+
+    python benchmarks/bench_zstd_compression.py
+    python benchmarks/bench_zstd_compression.py --train
+
+Result on a developer machine (python 3.11, zstandard 0.25, lz4 4.4, default levels, size is the average size of the
+uncompressed messages, ratio = compressed / uncompressed, time is compression + decompression in microseconds):
+    action                           count     size              gzip             x-lz4              zstd       x-zstd-sdc1
+    EpisodicMetricReport                20     2666   0.324    95.2us   0.467     9.2us   0.340    46.0us   0.112    36.0us
+    EpisodicAlertReport                 20     2484   0.377    90.1us   0.549     9.6us   0.396    47.9us   0.133    26.5us
+    GetMdibResponse                      1    18946   0.137   363.9us   0.230    29.0us   0.148    97.8us   0.119   118.3us
+    GetMdDescriptionResponse             1    12928   0.150   230.4us   0.240    22.6us   0.160    78.3us   0.119    59.6us
+    Response                             4     2573   0.333    87.1us   0.509     9.4us   0.360    41.7us   0.177    30.9us
+    GetMdStateResponse                   1     7715   0.193   142.6us   0.302    15.1us   0.207    59.4us   0.135    47.5us
+    Request                              4     1360   0.392    55.4us   0.552     7.5us   0.415    40.2us   0.129    24.6us
+    GetResponse                          1     3946   0.274    84.1us   0.418    12.4us   0.293    50.5us   0.180    41.7us
+    Subscribe                            2     1698   0.394    51.0us   0.545     6.8us   0.409    33.5us   0.218    30.6us
+    UnsubscribeResponse                  2     1395   0.380    40.3us   0.541     6.2us   0.405    38.1us   0.141    26.5us
+    SubscribeResponse                    2     1020   0.508    37.4us   0.692     6.2us   0.518    33.7us   0.268    28.1us
+    Unsubscribe                          2      726   0.575    37.5us   0.766     6.7us   0.582    34.6us   0.243    23.4us
+    Get                                  1     1312   0.386    45.4us   0.541     7.7us   0.412    41.1us   0.129    25.4us
+    GetMdDescription                     1      632   0.576    33.5us   0.769     6.1us   0.587    33.1us   0.149    22.5us
+    GetMdState                           1      620   0.585    33.9us   0.776     7.3us   0.597    35.7us   0.152    21.3us
+    GetMdib                              1      614   0.585    33.1us   0.779     6.3us   0.596    32.5us   0.142    21.3us
+    all                                 64     2736   0.311    87.1us   0.457     9.4us   0.328    45.5us   0.132    32.0us
+With the dictionary the typical reports (2.5 kB) get less than half the size of gzip and need less CPU time.
+Without dictionary zstd compresses about as well as gzip at half the CPU time, lz4 is the fastest with the largest
+result. The dictionary only works if both sides use the same one, therefore it has an own encoding name.
+'''
+import logging
+import os
+import re
+import sys
+import time
+import timeit
+import uuid
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import zstandard  # pylint: disable=wrong-import-position
+from sdc11073 import commlog  # pylint: disable=wrong-import-position
+from sdc11073 import compression  # pylint: disable=wrong-import-position
+from sdc11073 import pmtypes  # pylint: disable=wrong-import-position
+from sdc11073.location import SdcLocation  # pylint: disable=wrong-import-position
+from sdc11073.mdib import DeviceMdibContainer, ClientMdibContainer  # pylint: disable=wrong-import-position
+from sdc11073.namespaces import domTag  # pylint: disable=wrong-import-position
+from sdc11073.pysoap.soapenvelope import DPWSThisDevice, DPWSThisModel  # pylint: disable=wrong-import-position
+from sdc11073.sdcclient import SdcClient  # pylint: disable=wrong-import-position
+from sdc11073.sdcdevice import SdcDevice, waveforms  # pylint: disable=wrong-import-position
+from sdc11073.wsdiscovery import WSDiscoveryWhitelist  # pylint: disable=wrong-import-position
+
+HERE = os.path.dirname(__file__)
+TRAINING_MDIBS = [os.path.join(HERE, os.pardir, 'tests', '70041_MDIB_Final.xml'),
+                  os.path.join(HERE, os.pardir, 'tests', 'mdib_tns.xml'),
+                  os.path.join(HERE, os.pardir, 'tutorial', 'provider', 'mdib.xml')]
+BENCHMARK_MDIB = os.path.join(HERE, os.pardir, 'examples', 'ReferenceTest', 'reference_mdib.xml')
+DICT_SIZE = 64 * 1024
+ALGORITHMS = [compression.GZIP, compression.LZ4, compression.ZSTD, compression.ZSTD_SDC]
+_ACTION = re.compile(rb'<[^>]*Action[^>]*>\s*([^<\s]+)\s*<')
+
+
+class _Recorder(object):
+    ''' communication logger that keeps the sent http messages. It is not a commlog.NullLogger, therefore the device
+    does not stream responses and all responses are logged.'''
+    def __init__(self):
+        self.messages = []
+
+    def __getattr__(self, name):
+        return self._ignore
+
+    def _ignore(self, *args, **kwargs):
+        pass
+
+    def logSoapReqOut(self, xml, info=None):  # pylint: disable=unused-argument
+        self.messages.append(xml)
+
+    def logSoapRespOut(self, xml, info=None):  # pylint: disable=unused-argument
+        if xml:
+            self.messages.append(xml)
+
+
+def _mkDevice(wsd, mdibFile):
+    model = DPWSThisModel(manufacturer='Draeger', manufacturerUrl='www.draeger.com', modelName='Bench',
+                          modelNumber='1.0', modelUrl='www.draeger.com', presentationUrl='www.draeger.com')
+    device = DPWSThisDevice(friendlyName='Bench', firmwareVersion='1.0', serialNumber='1')
+    deviceMdibContainer = DeviceMdibContainer.fromMdibFile(mdibFile)
+    sdcDevice = SdcDevice(wsd, uuid.uuid4(), model, device, deviceMdibContainer)
+    for descr in deviceMdibContainer.descriptions.NODETYPE.get(domTag('RealTimeSampleArrayMetricDescriptor'), []):
+        generator = waveforms.SinusGenerator(min_value=-8.0, max_value=10.0, waveformperiod=1.2, sampleperiod=0.01)
+        deviceMdibContainer.registerWaveformGenerator(descr.handle, generator)
+    sdcDevice.startAll()
+    sdcDevice.setLocation(SdcLocation(fac='fac', poc='poc', bed='bed'))
+    return sdcDevice
+
+
+def _updateStates(mdib, cycles):
+    metrics = mdib.descriptions.NODETYPE.get(domTag('NumericMetricDescriptor'), [])
+    alertConditions = mdib.descriptions.NODETYPE.get(domTag('AlertConditionDescriptor'), [])
+    for cycle in range(cycles):
+        for i in range(0, len(metrics), 5):  # a report with some metrics
+            with mdib.mdibUpdateTransaction() as mgr:
+                for descr in metrics[i:i + 5]:
+                    state = mgr.getMetricState(descr.handle)
+                    if state.metricValue is None:
+                        state.mkMetricValue()
+                    state.metricValue.Value = cycle + i
+                    state.metricValue.Validity = pmtypes.MeasurementValidity.VALID
+        if alertConditions:
+            with mdib.mdibUpdateTransaction() as mgr:
+                state = mgr.getAlertState(alertConditions[cycle % len(alertConditions)].handle)
+                state.Presence = not state.Presence
+        time.sleep(0.05)
+
+
+def recordTraffic(mdibFile, cycles=20):
+    ''' @return: a list of tuples (action, message) of all messages that device and client sent'''
+    recorder = _Recorder()
+    commlog.defaultLogger = recorder
+    wsd = WSDiscoveryWhitelist(['127.0.0.1'])
+    wsd.start()
+    sdcDevice = _mkDevice(wsd, mdibFile)
+    try:
+        sdcClient = SdcClient(sdcDevice.getXAddrs()[0], deviceType=sdcDevice.mdib.sdc_definitions.MedicalDeviceType,
+                              validate=False, my_ipaddress='127.0.0.1')
+        sdcClient.startAll()
+        ClientMdibContainer(sdcClient).initMdib()
+        getService = sdcClient.client('Get')
+        getService.getMdDescriptionNode()
+        getService.getMdStateNode()
+        _updateStates(sdcDevice.mdib, cycles)
+        sdcClient.stopAll()
+    finally:
+        sdcDevice.stopAll()
+        wsd.stop()
+        commlog.defaultLogger = commlog.NullLogger()
+    result = []
+    for message in recorder.messages:
+        match = _ACTION.search(message)
+        if match:  # responses of http GET (wsdl) have no action, they are logged compressed
+            result.append((match.group(1).decode('utf-8'), message))
+    return result
+
+
+def train():
+    samples = [message for mdibFile in TRAINING_MDIBS for _, message in recordTraffic(mdibFile, cycles=40)]
+    level = compression.CompressionHandler.getCompressionLevel(compression.ZSTD_SDC)
+    dictionary = zstandard.train_dictionary(DICT_SIZE, samples, level=level)
+    with open(compression.ZSTD_SDC_DICT_FILE, 'wb') as f:
+        f.write(dictionary.as_bytes())
+    print('{} samples ({:.1f} MB) -> {} ({} bytes, id {})'.format(
+        len(samples), sum(len(s) for s in samples) / 1e6, compression.ZSTD_SDC_DICT_FILE, len(dictionary.as_bytes()),
+        dictionary.dict_id()))
+
+
+def _usec(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    traffic = recordTraffic(BENCHMARK_MDIB)
+    byAction = defaultdict(list)
+    for action, message in traffic:
+        byAction[action.split('/')[-1]].append(message)
+    print('{:32} {:>5} {:>8}  {}'.format('action', 'count', 'size', '  '.join('{:>16}'.format(a)
+                                                                            for a in ALGORITHMS)))
+    totals = defaultdict(lambda: [0, 0.0])
+    for action, messages in sorted(byAction.items(), key=lambda item: -sum(len(m) for m in item[1])):
+        columns = []
+        for algorithm in ALGORITHMS:
+            compressed = [compression.CompressionHandler.compressPayload(algorithm, m) for m in messages]
+            for message, data in zip(messages, compressed):
+                assert compression.CompressionHandler.decompress(data, algorithm) == message
+            number = max(1, 2000 // len(messages))
+            usec = _usec(lambda: [compression.CompressionHandler.decompress(  # pylint: disable=cell-var-from-loop
+                compression.CompressionHandler.compressPayload(algorithm, m), algorithm)  # pylint: disable=cell-var-from-loop
+                for m in messages], number) / len(messages)  # pylint: disable=cell-var-from-loop
+            ratio = sum(len(c) for c in compressed) / sum(len(m) for m in messages)
+            totals[algorithm][0] += sum(len(c) for c in compressed)
+            totals[algorithm][1] += usec * len(messages)
+            columns.append('{:6.3f} {:7.1f}us'.format(ratio, usec))
+        print('{:32} {:5} {:8.0f}  {}'.format(action, len(messages), sum(len(m) for m in messages) / len(messages),
+                                              '  '.join(columns)))
+    size = sum(len(m) for _, m in traffic)
+    print('{:32} {:5} {:8.0f}  {}'.format('all', len(traffic), size / len(traffic), '  '.join(
+        '{:6.3f} {:7.1f}us'.format(totals[a][0] / size, totals[a][1] / len(traffic)) for a in ALGORITHMS)))
+
+
+if __name__ == '__main__':
+    logging.getLogger('sdc').setLevel(logging.ERROR)
+    if '--train' in sys.argv:
+        train()
+    else:
+        main()
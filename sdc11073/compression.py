@@ -1,52 +1,214 @@
 """Compression module for pysdc."""
-from collections import OrderedDict
+from collections import OrderedDict, deque, namedtuple
+import os
+import struct
+import threading
+import time
 import zlib
 try:
     import lz4.frame
 except ImportError:
     lz4 = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 GZIP = 'gzip'
 LZ4 = 'x-lz4'
+ZSTD = 'zstd'
+ZSTD_SDC = 'x-zstd-sdc1' # zstd with the shipped dictionary of sdc messages. A new dictionary needs a new name.
 ANY = 'any'
+IDENTITY = 'identity'  # no compression
+
+ZSTD_SDC_DICT_FILE = os.path.join(os.path.dirname(__file__), 'zstd_dict', 'sdc1.dict')
 
 encodings = []
 if lz4 is not None:
     encodings.append(LZ4)
 encodings.append(GZIP)
+# zstd is appended after gzip, it is only used if it is explicitly preferred (e.g. setUsedCompression)
+if zstandard is not None:
+    encodings.append(ZSTD)
+    if os.path.exists(ZSTD_SDC_DICT_FILE):
+        encodings.append(ZSTD_SDC)
+
+_DEFAULT_LEVELS = {GZIP: zlib.Z_DEFAULT_COMPRESSION, LZ4: 0, ZSTD: 3, ZSTD_SDC: 3}
+
+_GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'  # no file name, no mtime, unknown OS
+_DEFLATE_FINAL_BLOCK = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS).flush()
+
 
 class CompressionException(Exception):
     pass
 
+class _Lz4Decompressor(object):
+    """ lz4 frame decompressor with the same interface as zlib decompress objects"""
+    def __init__(self):
+        self._decompressor = lz4.frame.LZ4FrameDecompressor()
+
+    @property
+    def eof(self):
+        return self._decompressor.eof
+
+    @property
+    def unconsumed_tail(self):
+        return b''  # the frame decompressor keeps unconsumed data itself
+
+    def decompress(self, data, max_length=0):
+        return self._decompressor.decompress(data, max_length or -1)
+
+    @staticmethod
+    def flush():
+        return b''
+
+
+class _Lz4Compressor(object):
+    """ lz4 frame compressor with the same interface as zlib compress objects"""
+    def __init__(self, level=0):
+        self._compressor = lz4.frame.LZ4FrameCompressor(compression_level=level)
+        self._header = self._compressor.begin()
+
+    def compress(self, data):
+        header, self._header = self._header, b''
+        return header + self._compressor.compress(data)
+
+    def flush(self):
+        header, self._header = self._header, b''
+        return header + self._compressor.flush()
+
+
+class _ZstdDecompressor(object):
+    """ zstd decompressor with the same interface as zlib decompress objects.
+    zstandard decompress objects have no max_length, the input is fed in small steps instead and the output
+    that exceeds max_length is kept until the next call."""
+    INPUT_STEP = 4096
+
+    def __init__(self, dict_data=None):
+        self._decompressor = zstandard.ZstdDecompressor(dict_data=dict_data).decompressobj()
+        self._pending = b''
+        self.unconsumed_tail = b''
+
+    @property
+    def eof(self):
+        return self._decompressor.eof and not self._pending
+
+    def decompress(self, data, max_length=0):
+        data = memoryview(data) # the unconsumed tail is not copied
+        parts = [self._pending]
+        size = len(self._pending)
+        pos = 0
+        while pos < len(data) and not self._decompressor.eof and (not max_length or size < max_length):
+            step = data[pos:pos + self.INPUT_STEP] if max_length else data
+            pos += len(step)
+            output = self._decompressor.decompress(step)
+            parts.append(output)
+            size += len(output)
+        self.unconsumed_tail = data[pos:]
+        result = b''.join(parts)
+        if max_length and len(result) > max_length:
+            result, self._pending = result[:max_length], result[max_length:]
+        else:
+            self._pending = b''
+        return result
+
+    @staticmethod
+    def flush():
+        return b''
+
+
+_zstd_sdc_dict = None
+_zstd_lock = threading.Lock()
+_zstd_thread_data = threading.local() # zstandard compressors must not be used by several threads at once
+
+
+def _zstdDict(algorithm):
+    ''' @return: the dictionary of algorithm or None'''
+    global _zstd_sdc_dict # pylint: disable=global-statement
+    if algorithm != ZSTD_SDC:
+        return None
+    with _zstd_lock:
+        if _zstd_sdc_dict is None:
+            with open(ZSTD_SDC_DICT_FILE, 'rb') as f:
+                _zstd_sdc_dict = zstandard.ZstdCompressionDict(f.read())
+        return _zstd_sdc_dict
+
+
+def _zstdCompressor(algorithm, level):
+    ''' @return: a ZstdCompressor of the current thread for one shot compression. They are re-used, because
+    the dictionary is loaded only once per compressor.'''
+    compressors = getattr(_zstd_thread_data, 'compressors', None)
+    if compressors is None:
+        compressors = _zstd_thread_data.compressors = {}
+    compressor = compressors.get((algorithm, level))
+    if compressor is None:
+        compressor = zstandard.ZstdCompressor(level=level, dict_data=_zstdDict(algorithm))
+        compressors[(algorithm, level)] = compressor
+    return compressor
+
+
+def _isZstd(algorithm):
+    return algorithm in (ZSTD, ZSTD_SDC) and algorithm in encodings
+
+
 class CompressionHandler(object):
     """Compression handler mixin.
     Should be used by servers and clients that are supposed to handle compression
     """
     available_encodings = encodings # initial default
+    # compression levels that differ from the default level of an algorithm, key is (algorithm, action or None)
+    _compression_levels = {}
+
+    @staticmethod
+    def setCompressionLevel(algorithm, level, action=None):
+        """Sets the compression level of an algorithm for all messages or for messages with a given action.
+        The levels depend on the algorithm: gzip 1..9, lz4 0..16, zstd 1..22 (higher means smaller and slower).
+
+        @param algorithm: one of available values specified as constants in this module
+        @param level: an int, or None to use the default again
+        @param action: if given, the level is only used for messages with this action
+        """
+        if level is None:
+            CompressionHandler._compression_levels.pop((algorithm, action), None)
+        else:
+            CompressionHandler._compression_levels[(algorithm, action)] = level
+
+    @staticmethod
+    def getCompressionLevel(algorithm, action=None):
+        """
+        @return: the level that is used for messages with action (or the default level of algorithm)
+        """
+        levels = CompressionHandler._compression_levels
+        if levels:
+            level = levels.get((algorithm, action))
+            if level is None:
+                level = levels.get((algorithm, None))
+            if level is not None:
+                return level
+        return _DEFAULT_LEVELS.get(algorithm)
 
     @classmethod
-    def compressPayload(cls, algorithm, payload):
+    def compressPayload(cls, algorithm, payload, action=None):
         """Compresses payload based on required algorithm.
         Raises CompressionException if algorithm is not supported.
 
         @param algorithm: one of available values specified as constants in this module
         @param payload: text to compress
+        @param action: optional action of the message, determines the compression level
         @return: compressed content
         """
+        level = cls.getCompressionLevel(algorithm, action)
         if algorithm == GZIP:
-            return cls._gzip_encode(payload)
+            return cls._gzip_encode(payload, level)
         elif algorithm == LZ4 and lz4 is not None:
-            return lz4.frame.compress(payload)
+            return lz4.frame.compress(payload, compression_level=level)
+        elif _isZstd(algorithm):
+            return _zstdCompressor(algorithm, level).compress(payload)
         else:
-            if lz4 is not None:
-                raise CompressionException("{} compression is not supported. "
-                                           "Only gzip and lz4 are supported".format(algorithm))
-            else:
-                raise CompressionException("{} compression is not supported. "
-                                           "Only gzip is supported".format(algorithm))
+            raise cls._unsupported(algorithm)
 
-    @staticmethod
-    def decompress(payload, algorithm):
+    @classmethod
+    def decompress(cls, payload, algorithm):
         """Compresses payload based on required algorithm.
         Raises CompressionException if algorithm is not supported.
 
@@ -58,20 +220,100 @@ class CompressionHandler(object):
             return zlib.decompress(payload, 16 + zlib.MAX_WBITS)
         elif algorithm == LZ4 and lz4 is not None:
             return lz4.frame.decompress(payload)
+        elif _isZstd(algorithm):
+            # streamed frames have no content size in the header, the decompress object does not need it
+            return _ZstdDecompressor(_zstdDict(algorithm)).decompress(payload)
         else:
-            if lz4 is not None:
-                raise CompressionException("{} compression is not supported. "
-                                           "Only gzip and lz4 are supported".format(algorithm))
-            else:
-                raise CompressionException("{} compression is not supported. "
-                                           "Only gzip is supported".format(algorithm))
+            raise cls._unsupported(algorithm)
+
+    @classmethod
+    def mkCompressor(cls, algorithm, action=None):
+        """Creates an incremental compressor for data that is produced in parts.
+        Raises CompressionException if algorithm is not supported.
+
+        @param algorithm: one of available values specified as constants in this module
+        @param action: optional action of the message, determines the compression level
+        @return: an object with methods compress(data) and flush(), both return bytes
+        """
+        level = cls.getCompressionLevel(algorithm, action)
+        if algorithm == GZIP:
+            return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        elif algorithm == LZ4 and lz4 is not None:
+            return _Lz4Compressor(level)
+        elif _isZstd(algorithm):
+            # an own compressor, a compress object must not be interleaved with other calls of its compressor
+            return zstandard.ZstdCompressor(level=level, dict_data=_zstdDict(algorithm)).compressobj()
+        else:
+            raise cls._unsupported(algorithm)
+
+    @classmethod
+    def mkDecompressor(cls, algorithm):
+        """Creates an incremental decompressor for data that is received in parts.
+        Raises CompressionException if algorithm is not supported.
+
+        @param algorithm: one of available values specified as constants in this module
+        @return: an object with methods decompress(data, max_length) and flush(), both return bytes,
+                 and attributes unconsumed_tail and eof
+        """
+        if algorithm == GZIP:
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif algorithm == LZ4 and lz4 is not None:
+            return _Lz4Decompressor()
+        elif _isZstd(algorithm):
+            return _ZstdDecompressor(_zstdDict(algorithm))
+        else:
+            raise cls._unsupported(algorithm)
+
+    @staticmethod
+    def _unsupported(algorithm):
+        return CompressionException("{} compression is not supported. "
+                                    "Only {} are supported".format(algorithm, ', '.join(encodings)))
 
     @staticmethod
-    def _gzip_encode(payload):
-        gzip_compress = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    def _gzip_encode(payload, level=zlib.Z_DEFAULT_COMPRESSION):
+        gzip_compress = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
         data = gzip_compress.compress(payload) + gzip_compress.flush()
         return data
 
+    @staticmethod
+    def gzipSegment(payload, level=zlib.Z_DEFAULT_COMPRESSION):
+        """Compresses payload to a raw deflate segment that does not reference any preceding data.
+        Segments can be compressed independently (and cached) and joined to one gzip stream with gzipJoinSegments.
+
+        @param payload: bytes
+        @param level: compression level
+        @return: tuple (payload, deflated segment)
+        """
+        deflate_compress = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return payload, deflate_compress.compress(payload) + deflate_compress.flush(zlib.Z_SYNC_FLUSH)
+
+    @classmethod
+    def gzipJoinSegments(cls, segments):
+        """Creates a gzip stream from segments.
+
+        @param segments: a list of results of gzipSegment
+        @return: gzip compressed concatenation of all payloads
+        """
+        return b''.join(cls.iterGzipSegments(segments))
+
+    @staticmethod
+    def iterGzipSegments(segments):
+        """Same as gzipJoinSegments, but the parts of the gzip stream are returned one by one, they are not joined.
+
+        @param segments: a list of results of gzipSegment
+        @return: iterator of bytes
+        """
+        crc = 0
+        size = 0
+        for payload, _ in segments:
+            crc = zlib.crc32(payload, crc)
+            size += len(payload)
+        yield _GZIP_HEADER
+        for _, segment in segments:
+            yield segment
+        yield _DEFLATE_FINAL_BLOCK
+        yield struct.pack('<II', crc & 0xffffffff, size & 0xffffffff)
+
     @staticmethod
     def parseHeader(header):
         """
@@ -97,3 +339,150 @@ class CompressionHandler(object):
                 except:
                     parsedHeaders[algName] = 1 # default
         return [pair[0] for pair in sorted(parsedHeaders.items(), key=lambda kv: kv[1], reverse=True)]
+
+
+CompressionStats = namedtuple('CompressionStats', 'messages bytes_in bytes_out cpu_time')
+
+
+class _CompressionCounters(object):
+    __slots__ = ('messages', 'bytes_in', 'bytes_out', 'cpu_time')
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_time = 0.0
+
+
+class CompressionPolicy(object):
+    ''' Decides per message which of the encodings that both sides support is used, depending on the size of the
+    payload, the measured roundtrip time of the connection and a CPU budget for compression:
+    - payloads smaller than min_size are never compressed,
+    - slow link (average roundtrip >= slow_roundtrip): the encoding with the best ratio, also if the budget is used up,
+    - CPU budget used up: no compression,
+    - fast link (average roundtrip < lan_roundtrip): only payloads >= lan_min_size, with the fastest encoding,
+    - otherwise (or no roundtrip known yet): the encoding with the best ratio.
+    Counts messages, bytes and CPU time per chosen encoding (IDENTITY for uncompressed messages).
+    The roundtrip times belong to one connection, therefore every soap client or subscription needs an own instance.'''
+    FASTEST = (LZ4, ZSTD_SDC, ZSTD, GZIP)
+    SMALLEST = (ZSTD_SDC, ZSTD, GZIP, LZ4)
+    CPU_WINDOW = 1.0  # seconds; the unused budget of at most this time can be spent at once
+
+    def __init__(self, min_size=256, lan_min_size=16384, lan_roundtrip=0.005, slow_roundtrip=0.05, cpu_budget=0.05,
+                 roundtrip_times=None):
+        '''
+        @param min_size: smaller payloads are not compressed
+        @param lan_min_size: smaller payloads are not compressed on a fast link
+        @param lan_roundtrip: a link with an average roundtrip time below this value (seconds) is a fast link
+        @param slow_roundtrip: a link with an average roundtrip time of at least this value (seconds) is a slow link
+        @param cpu_budget: fraction of the time of one CPU that may be spent for compression, e.g. 0.05 = 5%
+        @param roundtrip_times: an optional sequence of the last roundtrip times (seconds) that the owner fills,
+                                e.g. _DevSubscription.last_roundtrip_times. If None, the policy keeps the values
+                                that are passed to addRoundtripTime.
+        '''
+        self.min_size = min_size
+        self.lan_min_size = lan_min_size
+        self.lan_roundtrip = lan_roundtrip
+        self.slow_roundtrip = slow_roundtrip
+        self.cpu_budget = cpu_budget
+        self._roundtrip_times = roundtrip_times if roundtrip_times is not None else deque(maxlen=20)
+        self._credit = cpu_budget * self.CPU_WINDOW
+        self._lastCredit = time.monotonic()
+        self._counters = {}  # key: encoding, value: _CompressionCounters
+        self._lastEncoding = None
+        self._lock = threading.Lock()
+
+    def addRoundtripTime(self, roundtrip_time):
+        self._roundtrip_times.append(roundtrip_time)
+
+    def getRoundtripTime(self):
+        ''' @return: average of the last roundtrip times or None if there are none'''
+        values = list(self._roundtrip_times)
+        if not values:
+            return None
+        return sum(values) / len(values)
+
+    def _cpuExhausted(self):
+        now = time.monotonic()
+        self._credit = min(self.cpu_budget * self.CPU_WINDOW,
+                           self._credit + (now - self._lastCredit) * self.cpu_budget)
+        self._lastCredit = now
+        return self._credit <= 0
+
+    def chooseEncoding(self, size, encodings):
+        '''
+        @param size: size of the uncompressed payload
+        @param encodings: encodings that both sides support, preferred first
+        @return: the encoding to use or None for no compression
+        '''
+        if size < self.min_size or not encodings:
+            return None
+        roundtrip_time = self.getRoundtripTime()
+        if roundtrip_time is not None and roundtrip_time >= self.slow_roundtrip:
+            return self._first(self.SMALLEST, encodings)
+        with self._lock:
+            if self._cpuExhausted():
+                return None
+        if roundtrip_time is not None and roundtrip_time < self.lan_roundtrip:
+            if size < self.lan_min_size:
+                return None
+            return self._first(self.FASTEST, encodings)
+        return self._first(self.SMALLEST, encodings)
+
+    @staticmethod
+    def _first(ranking, encodings):
+        for encoding in ranking:
+            if encoding in encodings:
+                return encoding
+        return encodings[0]
+
+    def compress(self, payload, encodings, compressFunc):
+        ''' compresses payload with the chosen encoding and counts it.
+        @param encodings: encodings that both sides support, preferred first
+        @param compressFunc: callable(algorithm) that returns the compressed payload
+        @return: tuple (data, encoding), encoding is None if payload is returned uncompressed
+        '''
+        encoding = self.chooseEncoding(len(payload), encodings)
+        if encoding is None:
+            self._count(IDENTITY, len(payload), len(payload), 0.0)
+            return payload, None
+        started = time.thread_time()
+        data = compressFunc(encoding)
+        self._count(encoding, len(payload), len(data), time.thread_time() - started)
+        return data, encoding
+
+    def _count(self, encoding, bytes_in, bytes_out, cpu_time):
+        with self._lock:
+            counters = self._counters.get(encoding)
+            if counters is None:
+                counters = _CompressionCounters()
+                self._counters[encoding] = counters
+            counters.messages += 1
+            counters.bytes_in += bytes_in
+            counters.bytes_out += bytes_out
+            counters.cpu_time += cpu_time
+            self._credit -= cpu_time
+            self._lastEncoding = encoding
+
+    @property
+    def lastEncoding(self):
+        ''' the encoding of the last message (IDENTITY if it was not compressed), None if nothing was sent yet'''
+        return self._lastEncoding
+
+    @property
+    def savedBytes(self):
+        ''' number of bytes that compression saved over all messages'''
+        with self._lock:
+            return sum(c.bytes_in - c.bytes_out for c in self._counters.values())
+
+    def getStats(self, encoding):
+        ''' @return: a CompressionStats instance for encoding'''
+        with self._lock:
+            counters = self._counters.get(encoding) or _CompressionCounters()
+            return CompressionStats(counters.messages, counters.bytes_in, counters.bytes_out, counters.cpu_time)
+
+    def getAllStats(self):
+        ''' @return: a dictionary encoding => CompressionStats'''
+        with self._lock:
+            return {encoding: CompressionStats(c.messages, c.bytes_in, c.bytes_out, c.cpu_time)
+                    for encoding, c in self._counters.items()}
@@ -1,5 +1,10 @@
+import array
 from sdc11073 import isoduration
 from decimal import Decimal
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 class NullConverter(object):
     @staticmethod
@@ -60,6 +65,21 @@ class DecimalConverter(object):
         return xmlValue
 
 
+class FloatListConverter(object):
+    ''' XML representation: decimals separated by whitespace.
+    Python representation: a float64 array (numpy.ndarray if numpy is installed, otherwise array.array).
+    The whole list is converted in one pass, this is intended for sample arrays.'''
+    @staticmethod
+    def toPy(xmlValue):
+        if numpy is not None:
+            return numpy.array(xmlValue.split(), dtype=numpy.float64)
+        return array.array('d', map(float, xmlValue.split()))
+
+    @staticmethod
+    def toXML(pyValue):
+        return ' '.join(DecimalConverter.toXML(float(v)) for v in pyValue)
+
+
 class IntegerConverter(object):
     @staticmethod
     def toPy(xmlValue):
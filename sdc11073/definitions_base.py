@@ -8,6 +8,78 @@ from .namespaces import Prefix_Namespace as Prefix
 schemaFolder = os.path.join(os.path.dirname(__file__), 'xsd')
 
 
+class _NamespaceTranslation(object):
+    ''' Replaces namespaces in serialized xml. The byte strings are built only once per definitions class.
+    All replaced strings start with a common marker, text without the marker is returned without any replace pass.'''
+    def __init__(self, replacements):
+        '''
+        @param replacements: list of (old, new) byte strings
+        '''
+        self._replacements = tuple(replacements)
+        self._marker = os.path.commonprefix([old for old, _ in self._replacements])
+
+    def translate(self, xml_text):
+        if self._marker not in xml_text:
+            return xml_text
+        for old, new in self._replacements:
+            xml_text = xml_text.replace(old, new)
+        return xml_text
+
+    def translateBlocks(self, blocks):
+        ''' Translates xml text that is received in parts.
+        The end of a block is held back until the next block arrives if a replaced string could start in it.
+        @param blocks: iterable of bytes
+        @return: iterator of translated bytes
+        '''
+        tail = b''
+        for block in blocks:
+            translated, tail = self.translatePart(tail + block if tail else block)
+            if translated:
+                yield translated
+        if tail:
+            yield self.translate(tail)
+
+    def translatePart(self, data):
+        ''' Translates the beginning of data, the end is not translated if a replaced string could start in it.
+        @return: tuple (translated bytes, rest of data)
+        '''
+        cut = len(data) - max(len(old) for old, _ in self._replacements) + 1
+        if cut <= 0:
+            return b'', data
+        # an occurrence that starts before cut must be translated in this pass
+        extended = True
+        while extended:
+            extended = False
+            for old, _ in self._replacements:
+                pos = data.find(old, max(0, cut - len(old) + 1))
+                if 0 <= pos < cut < pos + len(old):
+                    cut = pos + len(old)
+                    extended = True
+        return self.translate(data[:cut]), data[cut:]
+
+
+class _TranslatingWriter(object):
+    ''' File-like object that translates namespaces of the written xml text and writes it to output.
+    close writes the held back rest, it does not close output.'''
+    def __init__(self, translation, output):
+        self._translation = translation
+        self._output = output
+        self._tail = b''
+
+    def write(self, data):
+        translated, self._tail = self._translation.translatePart(self._tail + data if self._tail else bytes(data))
+        if translated:
+            self._output.write(translated)
+
+    def close(self):
+        if self._tail:
+            self._output.write(self._translation.translate(self._tail))
+            self._tail = b''
+
+
+_namespaceTranslations = {}  # lookup definitions class => (normalizing, denormalizing) _NamespaceTranslation
+
+
 class ProtocolsRegistry(type):
     '''
     base class that has the only purpose to register classes that use this as meta class
@@ -48,25 +120,42 @@ class BaseDefinitions(metaclass=ProtocolsRegistry):
         ''' This method checks if this definition set is the correct one for a given namespace'''
         return ns in (cls.MedicalDeviceTypeNamespace, cls.BICEPSNamespace, cls.MessageModelNamespace, cls.ParticipantModelNamespace, cls.ExtensionPointNamespace, cls.MedicalDeviceType)
 
+    @classmethod
+    def _getNamespaceTranslations(cls):
+        translations = _namespaceTranslations.get(cls)
+        if translations is None:
+            namespaces = ((cls.MessageModelNamespace, Prefix.MSG.namespace), #'__BICEPS_MessageModel__'),
+                          (cls.ParticipantModelNamespace, Prefix.PM.namespace), #'__BICEPS_ParticipantModel__'),
+                          (cls.ExtensionPointNamespace, Prefix.EXT.namespace), #'__ExtensionPoint__'),
+                          (cls.MDPWSNameSpace, Prefix.MDPWS.namespace)) #'__MDPWS__')):
+            normalizing = _NamespaceTranslation(('"{}"'.format(ns).encode('utf-8'), '"{}"'.format(internal_ns).encode('utf-8'))
+                                                for ns, internal_ns in namespaces)
+            denormalizing = _NamespaceTranslation((internal_ns.encode('utf-8'), ns.encode('utf-8'))
+                                                  for ns, internal_ns in namespaces)
+            translations = (normalizing, denormalizing)
+            _namespaceTranslations[cls] = translations
+        return translations
+
     @classmethod
     def normalizeXMLText(cls, xml_text):
         ''' replace BICEPS namespaces with internal namespaces'''
-        for ns, internal_ns in ((cls.MessageModelNamespace, Prefix.MSG.namespace), #'__BICEPS_MessageModel__'),
-                                (cls.ParticipantModelNamespace, Prefix.PM.namespace), #'__BICEPS_ParticipantModel__'),
-                                (cls.ExtensionPointNamespace, Prefix.EXT.namespace), #'__ExtensionPoint__'),
-                                (cls.MDPWSNameSpace, Prefix.MDPWS.namespace)): #'__MDPWS__')):
-            xml_text = xml_text.replace('"{}"'.format(ns).encode('utf-8'), '"{}"'.format(internal_ns).encode('utf-8'))
-        return xml_text
+        return cls._getNamespaceTranslations()[0].translate(xml_text)
+
+    @classmethod
+    def normalizeXMLBlocks(cls, blocks):
+        ''' replace BICEPS namespaces with internal namespaces in xml text that is received in parts'''
+        return cls._getNamespaceTranslations()[0].translateBlocks(blocks)
 
     @classmethod
     def denormalizeXMLText(cls, xml_text):
         ''' replace internal namespaces with BICEPS namespaces'''
-        for ns, internal_ns in ((cls.MessageModelNamespace.encode('utf-8'), b'__BICEPS_MessageModel__'),
-                                (cls.ParticipantModelNamespace.encode('utf-8'), b'__BICEPS_ParticipantModel__'),
-                                (cls.ExtensionPointNamespace.encode('utf-8'), b'__ExtensionPoint__'),
-                                (cls.MDPWSNameSpace.encode('utf-8'), b'__MDPWS__')):
-            xml_text = xml_text.replace(internal_ns, ns)
-        return xml_text
+        return cls._getNamespaceTranslations()[1].translate(xml_text)
+
+    @classmethod
+    def denormalizingWriter(cls, output):
+        ''' @return: a file-like object that replaces internal namespaces with BICEPS namespaces in written xml text
+        and writes the result to output. It must be closed after the last write.'''
+        return _TranslatingWriter(cls._getNamespaceTranslations()[1], output)
 
 
 class SchemaResolverBase(etree_.Resolver):
@@ -1,3 +1,9 @@
+import asyncio
+import email.utils
+import http.client
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from http.server import BaseHTTPRequestHandler
 from .compression import CompressionHandler
 from io import BytesIO
@@ -16,6 +22,13 @@ class DecompressError(Exception):
 
     pass
 
+class BodyTooLargeError(Exception):
+
+    """Raised when a request body exceeds the max. allowed size.
+    """
+
+    pass
+
 
 def mkchunks(body, chunk_size=512):
     """
@@ -25,9 +38,11 @@ def mkchunks(body, chunk_size=512):
     :return: body converted to chunks ( but still as single bytes array)
     """
     data = BytesIO()
-    tail = body
+    body = memoryview(body)  # slices of a memoryview do not copy the remaining body
+    pos = 0
     while True:
-        head, tail = tail[:chunk_size], tail[chunk_size:]
+        head = body[pos:pos + chunk_size]
+        pos += chunk_size
         data.write(f'{len(head):x}\r\n'.encode('utf-8'))
         data.write(head)
         data.write(b'\r\n')
@@ -35,104 +50,231 @@ def mkchunks(body, chunk_size=512):
             return data.getvalue()
 
 
+class ChunkedWriter(object):
+    ''' File-like object that writes data as http chunks to a stream, optionally compressed.
+    All chunks except the last one have chunk_size bytes: small writes do not result in small chunks, and large
+    writes do not result in large chunks that the receiver has to decompress at once.
+    close writes the last chunk, it does not close the stream.'''
+    def __init__(self, stream, compressor=None, chunk_size=16384):
+        '''
+        @param stream: writable file-like object
+        @param compressor: optional result of CompressionHandler.mkCompressor
+        '''
+        self._stream = stream
+        self._compressor = compressor
+        self._chunk_size = chunk_size
+        self._buffer = []
+        self._buffered = 0
+        self.bytes_in = 0 # number of written bytes
+        self.bytes_out = 0 # number of bytes of the chunks (compressed, without chunk headers)
+
+    def write(self, data):
+        self.bytes_in += len(data)
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        if self._buffered + len(data) < self._chunk_size:
+            if data:
+                self._buffer.append(data)
+                self._buffered += len(data)
+            return
+        view = memoryview(data) # slices of large data are written without copying
+        pos = self._chunk_size - self._buffered
+        self._buffer.append(view[:pos])
+        self._buffered = self._chunk_size
+        self._writeChunk()
+        while len(view) - pos >= self._chunk_size:
+            self._buffer.append(view[pos:pos + self._chunk_size])
+            self._buffered = self._chunk_size
+            self._writeChunk()
+            pos += self._chunk_size
+        if pos < len(view):
+            self._buffer.append(bytes(view[pos:])) # a copy, the view would keep all of data alive
+            self._buffered = len(view) - pos
+
+    def close(self):
+        if self._compressor is not None:
+            data = self._compressor.flush()
+            if data:
+                self._buffer.append(data)
+                self._buffered += len(data)
+        self._writeChunk()
+        self._stream.write(b'0\r\n\r\n')
+
+    def _writeChunk(self):
+        if self._buffered:
+            self._buffer.insert(0, f'{self._buffered:x}\r\n'.encode('utf-8'))
+            self._buffer.append(b'\r\n')
+            self._stream.write(b''.join(self._buffer)) # one write per chunk, stream may be unbuffered
+            self.bytes_out += self._buffered
+            self._buffer = []
+            self._buffered = 0
+
+
 class HTTPReader(CompressionHandler):
     ''' Base class that implements decoding of incoming http requests.
     Supported features:
     - read data by content-length
     - handle chunk-encoding
     - handle compression
+    The body can be read completely (read_request_body, read_response_body) or as an iterator of decompressed
+    blocks (iter_request_body, iter_response_body) that can be fed to a parser while data is still arriving,
+    e.g. to lxml.etree.XMLPullParser.
     '''
+    BLOCKSIZE = 65536 # max. size of blocks that are read from a stream at once
+    MAX_CHUNK_HEADER = 1024 # max. length of a chunk header line (length + optional chunk-extensions)
+
     @classmethod
-    def _read_dechunk(cls, stream):
-        """De-chunk HTTP body stream.
+    def _iter_dechunk(cls, stream, blocksize=None):
+        """De-chunk HTTP body stream. Chunk headers are read with readline, therefore stream should be buffered.
         :param file stream: readable file-like object.
-        :rtype: bytes
+        :param blocksize: max. size of yielded blocks. If None, every chunk is yielded as one block.
+        :return: iterator of bytes
         :raise: DechunkError
         """
-        body = []
         CRLF = b'\r\n'
         while True:
-            chunk_header = cls._read_until(stream, CRLF)
-            chunk_headers = chunk_header.split(b';') # length + optional chunk-extensions (name=value pairs)
-            chunk_len, chunk_extensions = chunk_headers[0], chunk_headers[1:] # we do nothing with chunk-extensions...
-            if chunk_len is None:
+            chunk_header = stream.readline(cls.MAX_CHUNK_HEADER)
+            if not chunk_header.endswith(b'\n'):
                 raise DechunkError(
                     'Could not extract chunk size: unexpected end of data.')
-
+            chunk_len = chunk_header.split(b';')[0] # length + optional chunk-extensions (name=value pairs), we do nothing with chunk-extensions...
             try:
                 chunk_len = int(chunk_len.strip(), 16)
             except (ValueError, TypeError) as err:
                 raise DechunkError('Could not parse chunk size: %s' % (err,))
 
+            if chunk_len == 0: # len == 0 indicates end of data
+                # skip optional trailer, data ends with an empty line
+                while stream.readline(cls.MAX_CHUNK_HEADER) not in (CRLF, b'\n'):
+                    pass
+                return
             bytes_to_read = chunk_len
             while bytes_to_read:
-                chunk = stream.read(bytes_to_read)
+                chunk = stream.read(bytes_to_read if blocksize is None else min(bytes_to_read, blocksize))
+                if not chunk:
+                    raise DechunkError('Could not read chunk: unexpected end of data.')
                 bytes_to_read -= len(chunk)
-                body.append(chunk)
+                yield chunk
 
             # chunk ends with \r\n
             crlf = stream.read(2)
             if crlf != CRLF:
                 raise DechunkError('No CR+LF at the end of chunk!')
-            if chunk_len == 0: # len == 0 indicates end of data
-                break
-        return b''.join(body)
 
-    @staticmethod
-    def _read_until(stream, delimiter, max_bytes=16):
-        """Read until we have found the given delimiter.
+    @classmethod
+    def _read_dechunk(cls, stream):
+        """De-chunk HTTP body stream.
         :param file stream: readable file-like object.
-        :param bytes delimiter: delimiter string.
-        :param int max_bytes: maximum bytes to read.
-        :rtype: bytes|None
+        :rtype: bytes
+        :raise: DechunkError
         """
+        return cls._join_blocks(cls._iter_dechunk(stream))
 
-        buf = bytearray()
-        delim_len = len(delimiter)
-
-        while len(buf) < max_bytes:
-            c = stream.read(1)
+    @staticmethod
+    def _iter_stream(stream, length, blocksize):
+        ''' reads length bytes (or until end of stream if length is None) in blocks'''
+        if blocksize is None:
+            block = stream.read() if length is None else stream.read(length)
+            if block:
+                yield block
+            return
+        while length is None or length > 0:
+            block = stream.read(blocksize if length is None else min(length, blocksize))
+            if not block:
+                return
+            if length is not None:
+                length -= len(block)
+            yield block
 
-            if not c:
-                break
+    @classmethod
+    def _iter_decompressed(cls, blocks, actual_enc, supported_encodings):
+        ''' if we get compressed content then we check against server setting
+        if it matches continue and decompress
+        if current server setting is any, use whatever client has provided in content-encoding header
+        A decompressed block has at most BLOCKSIZE bytes, even if a small block of highly compressed data is received.'''
+        if not actual_enc:
+            yield from blocks
+            return
+        supported_encs = supported_encodings or cls.available_encodings
+        if actual_enc not in supported_encs:
+            raise DecompressError('content-encoding "{}" is not supported'.format(actual_enc))
+        decompressor = cls.mkDecompressor(actual_enc)
+        for block in blocks:
+            data = decompressor.decompress(block, cls.BLOCKSIZE)
+            while data:
+                yield data
+                if decompressor.eof:
+                    break
+                data = decompressor.decompress(decompressor.unconsumed_tail, cls.BLOCKSIZE)
+        data = decompressor.flush()
+        if data:
+            yield data
+        if not decompressor.eof:
+            raise DecompressError('content-encoding "{}": unexpected end of data'.format(actual_enc))
 
-            buf += c
-            if buf[-delim_len:] == delimiter:
-                return bytes(buf[:-delim_len])
+    @staticmethod
+    def _join_blocks(blocks):
+        ''' joins blocks without a copy if there is only one block.
+        Otherwise the blocks are not kept, only the joined data.'''
+        blocks = iter(blocks)
+        first = next(blocks, b'')
+        second = next(blocks, None)
+        if second is None:
+            return first
+        buffer = BytesIO()
+        buffer.write(first)
+        buffer.write(second)
+        for block in blocks:
+            buffer.write(block)
+        return buffer.getvalue() # shares the buffer, no copy
 
     @classmethod
-    def read_request_body(cls, http_message, supported_encodings=None):
+    def iter_request_body(cls, http_message, supported_encodings=None, blocksize=BLOCKSIZE):
         ''' checks header for content-length, chunk-encoding and compression entries.
-        Handles incoming bytes correspondingly.
-        @http_message: a http request or response read from network
-        :return: bytes
+        Handles incoming bytes correspondingly. Data is read and decompressed block by block.
+        @http_message: a http request read from network (a BaseHTTPRequestHandler)
+        @param blocksize: max. number of bytes that are read at once, None reads the body or a chunk completely
+        :return: iterator of bytes
         '''
-        http_body = None
         cl_string = http_message.headers.get('content-length')
+        length = None
         if cl_string:
             try:
-                cl = int(cl_string)
-                http_body = http_message.rfile.read(cl)
-            except TypeError:
-                http_body = http_message.rfile.read()
-        if http_body is None:
+                length = int(cl_string)
+            except (TypeError, ValueError):
+                pass
+        if length is not None:
+            blocks = cls._iter_stream(http_message.rfile, length, blocksize)
+        else:
             transfer_encoding = http_message.headers.get('transfer-encoding')
             if transfer_encoding is not None and transfer_encoding.lower() == 'chunked':
-                http_body = cls._read_dechunk(http_message.rfile)
-        if http_body is None:
-            http_body = http_message.rfile.read()
-
-        # if we get compressed content then we check against server setting
-        # if it matches continue and decompress
-        # if current server setting is any, use whatever client has provided in content-encoding header
-        actual_enc = http_message.headers.get('content-encoding')
-        if actual_enc:
-            supported_encs = supported_encodings or cls.available_encodings
-            if actual_enc in supported_encs:
-                http_body = cls.decompress(http_body, actual_enc)
+                blocks = cls._iter_dechunk(http_message.rfile, blocksize)
             else:
-                raise DecompressError('content-encoding "{}" is not supported',actual_enc )
-        return http_body
+                blocks = cls._iter_stream(http_message.rfile, None, blocksize)
+        return cls._iter_decompressed(blocks, http_message.headers.get('content-encoding'), supported_encodings)
+
+    @classmethod
+    def iter_response_body(cls, http_response, supported_encodings=None, blocksize=BLOCKSIZE):
+        ''' checks header for compression entries and handles incoming bytes correspondingly.
+        De-chunking is done by http client, blocks are returned as soon as they are available.
+        @http_response: a http.client.HTTPResponse
+        @param blocksize: max. number of bytes that are read at once, None reads the body completely
+        :return: iterator of bytes
+        '''
+        if blocksize is None:
+            blocks = cls._iter_stream(http_response, None, None)
+        else:
+            blocks = iter(lambda: http_response.read1(blocksize), b'')
+        return cls._iter_decompressed(blocks, http_response.getheader('content-encoding'), supported_encodings)
+
+    @classmethod
+    def read_request_body(cls, http_message, supported_encodings=None):
+        ''' checks header for content-length, chunk-encoding and compression entries.
+        Handles incoming bytes correspondingly.
+        @http_message: a http request or response read from network
+        :return: bytes
+        '''
+        return cls._join_blocks(cls.iter_request_body(http_message, supported_encodings, blocksize=None))
 
     @classmethod
     def read_response_body(cls, http_response, supported_encodings=None):
@@ -141,38 +283,7 @@ class HTTPReader(CompressionHandler):
         @http_message: a http request or response read from network
         :return: bytes
         '''
-        http_body = None
-        cl_string = http_response.getheader('content-length')
-        if cl_string:
-            try:
-                cl = int(cl_string)
-                http_body = http_response.read(cl)
-            except TypeError:
-                http_body = http_response.read()
-        if http_body is None:
-            transfer_encoding = http_response.getheader('transfer-encoding')
-            if transfer_encoding is not None and transfer_encoding.lower() == 'chunked':
-                # de-chunking is done by http client. we just need to read until no more data available
-                http_body = []
-                tmp = http_response.read()
-                while tmp:
-                    http_body.append(tmp)
-                    tmp = http_response.read()
-                http_body = b''.join(http_body)
-        if http_body is None:
-            http_body = http_response.read()
-
-        # if we get compressed content then we check against server setting
-        # if it matches continue and decompress
-        # if current server setting is any, use whatever client has provided in content-encoding header
-        actual_enc = http_response.getheader('content-encoding')
-        if actual_enc:
-            supported_encs = supported_encodings or cls.available_encodings
-            if actual_enc in supported_encs:
-                http_body = cls.decompress(http_body, actual_enc)
-            else:
-                raise DecompressError('content-encoding "{}" is not supported',actual_enc )
-        return http_body
+        return cls._join_blocks(cls.iter_response_body(http_response, supported_encodings, blocksize=None))
 
 
 class HTTPRequestHandler(BaseHTTPRequestHandler, CompressionHandler):
@@ -191,16 +302,304 @@ class HTTPRequestHandler(BaseHTTPRequestHandler, CompressionHandler):
         '''
         return HTTPReader.read_request_body(self)
 
-    def _compressIfRequired(self, response_bytes):
+    def _compressIfRequired(self, response_bytes, compressFunc=None):
         '''Compress response if header of request indicates that other side
-        accepts one of our supported compression encodings'''
+        accepts one of our supported compression encodings
+        :param compressFunc: optional callable(algorithm) that returns the compressed response'''
+        enc = self._acceptedEncoding()
+        if enc is not None:
+            if compressFunc is None:
+                response_bytes = self.compressPayload(enc, response_bytes)
+            else:
+                response_bytes = compressFunc(enc)
+            self.send_header('Content-Encoding', enc)
+        return response_bytes
+
+    def _acceptedEncoding(self):
+        ''' @return: the compression encoding for the response or None'''
         accepted_enc = CompressionHandler.parseHeader(self.headers.get('accept-encoding'))
         for enc in accepted_enc:
             if enc in self.server.supportedEncodings:
-                response_bytes = self.compressPayload(enc, response_bytes)
-                self.send_header('Content-Encoding', enc)
-                break
-        return response_bytes
+                return enc
+        return None
 
     def log_request(self, *args, **kwargs):
         pass   # supress printing of every request to stderr
+
+
+class AsyncHttpResponse(object):
+    def __init__(self, status, reason, body, contentType, contentEncoding=None, chunked=False, close=False):
+        self.status = status
+        self.reason = reason
+        self.body = body
+        self.contentType = contentType
+        self.contentEncoding = contentEncoding
+        self.chunked = chunked
+        self.close = close
+
+
+class _LoopWriter(object):
+    ''' File-like object that is used in an executor thread to write to an asyncio.StreamWriter.
+    Every write waits until the data is written to the transport and the transport buffer is drained,
+    a slow peer slows down the writing thread instead of filling the memory.'''
+    def __init__(self, writer, loop):
+        self._writer = writer
+        self._loop = loop
+
+    def write(self, data):
+        asyncio.run_coroutine_threadsafe(self._write(data), self._loop).result()
+
+    async def _write(self, data):
+        self._writer.write(data)
+        await self._writer.drain()
+
+
+class AsyncioHttpServerBase(threading.Thread):
+    ''' Base class of http servers that handle all connections in one asyncio event loop.
+    Connection handling (keep-alive, chunk-encoding, request body) is implemented here,
+    derived classes implement _handleRequest.
+    Blocking work shall be done with _runInExecutor, it runs in a bounded thread pool.
+    The body of an AsyncHttpResponse is bytes, a str or an object with a method write(stream, algorithm)
+    (e.g. sdcdevice.httpserver.StreamedSoapResponse) that is called in the executor to write a chunked body.
+    '''
+    MAX_BODY_SIZE = 32 * 1024 * 1024 # max. size of a request body, larger requests are answered with '413'
+    def __init__(self, name, my_ipaddress, sslContext, supportedEncodings, logger, max_workers=8):
+        '''
+        :param my_ipaddress:
+        :param sslContext:
+        :param supportedEncodings: a list od strings
+        :param max_workers: number of threads for blocking work. This is also the max. number of
+                            _runInExecutor calls that are processed at the same time, others wait in the event loop.
+        '''
+        super(AsyncioHttpServerBase, self).__init__(name=name)
+        self.daemon = True
+        self._my_ipaddress = my_ipaddress
+        self._sslContext = sslContext
+        self.my_port = None
+        self.supportedEncodings = supportedEncodings
+        self._logger = logger
+        self.started_evt = threading.Event() # helps to wait until thread has initialised is variables
+        self._maxWorkers = max_workers
+        self._executor = None
+        self._loop = None
+        self._server = None
+        self._semaphore = None
+        self._writers = set()
+        self._acceptRequests = True
+        self._stopped = False
+
+    def run(self):
+        try:
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._executor = ThreadPoolExecutor(max_workers=self._maxWorkers,
+                                                thread_name_prefix='{}_worker'.format(self.name))
+            self._semaphore = asyncio.Semaphore(self._maxWorkers)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handleConnection, self._my_ipaddress, 0, ssl=self._sslContext))
+            self.my_port = self._server.sockets[0].getsockname()[1]
+            self._onStarted()
+            self.started_evt.set()
+            self._loop.run_forever()
+            # end all connection handlers
+            tasks = [t for t in asyncio.all_tasks(self._loop) if not t.done()]
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        except Exception:
+            self._logger.error('Unhandled Exception at thread runtime. Thread will abort! {}'.format(traceback.format_exc()))
+            raise
+        finally:
+            self._loop.close()
+
+    def _onStarted(self):
+        ''' called in event loop thread after server socket is open, before started_evt is set'''
+
+    def stop(self, closeAllConnections=True):
+        if self._stopped or self._loop is None:
+            return
+        self._stopped = True
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(closeAllConnections), self._loop)
+        try:
+            future.result(timeout=5)
+        except Exception:
+            self._logger.warn('error stopping http server: {}', traceback.format_exc())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self.join(timeout=5)
+        self._executor.shutdown(wait=False)
+
+    async def _shutdown(self, closeAllConnections):
+        self._server.close()
+        if closeAllConnections:
+            self._acceptRequests = False # derived classes answer further requests with '404'
+            for writer in list(self._writers):
+                writer.close()
+        await self._server.wait_closed()
+
+    async def _handleConnection(self, reader, writer):
+        self._writers.add(writer)
+        peer = writer.get_extra_info('peername')
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break # connection closed by peer
+                requestLine, _, headerBytes = head.partition(b'\r\n')
+                try:
+                    method, path, version = requestLine.decode('latin-1').split()
+                except ValueError:
+                    await self._writeResponse(writer, AsyncHttpResponse(400, 'Bad Request', b'', 'text', close=True))
+                    break
+                headers = http.client.parse_headers(BytesIO(headerBytes))
+                try:
+                    body = await self._readBody(reader, headers, self.MAX_BODY_SIZE) if method == 'POST' else b''
+                except DechunkError as ex:
+                    self._logger.warn('bad request body from {}: {}', peer, ex)
+                    await self._writeResponse(writer, AsyncHttpResponse(400, 'Bad Request', b'', 'text', close=True))
+                    break
+                except BodyTooLargeError as ex:
+                    self._logger.warn('request body from {} too large: {}', peer, ex)
+                    await self._writeResponse(writer, AsyncHttpResponse(413, 'Payload Too Large', b'', 'text',
+                                                                        close=True))
+                    break
+                except asyncio.IncompleteReadError:
+                    break # connection closed by peer
+                response = await self._handleRequest(method, path, headers, body)
+                if not self._isKeepAlive(version, headers):
+                    response.close = True
+                await self._writeResponse(writer, response)
+                if response.close:
+                    break
+        except Exception:
+            if self._acceptRequests:
+                self._logger.error('error in connection from {}: {}', peer, traceback.format_exc())
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _handleRequest(self, method, path, headers, body):
+        ''' @return: an AsyncHttpResponse'''
+        return AsyncHttpResponse(501, 'Not Implemented', b'', 'text')
+
+    async def _runInExecutor(self, func, *args):
+        async with self._semaphore:
+            return await self._loop.run_in_executor(self._executor, func, *args)
+
+    @staticmethod
+    async def _readBody(reader, headers, maxSize):
+        ''' @return: the body as bytes
+        raises DechunkError if content-length or chunk-encoding is malformed,
+        BodyTooLargeError if the body is larger than maxSize'''
+        contentLength = headers.get('content-length')
+        if contentLength:
+            try:
+                length = int(contentLength)
+            except ValueError:
+                raise DechunkError('invalid content-length "{}"'.format(contentLength))
+            if length < 0:
+                raise DechunkError('invalid content-length "{}"'.format(contentLength))
+            if length > maxSize:
+                raise BodyTooLargeError('content-length {} > {}'.format(length, maxSize))
+            return await reader.readexactly(length)
+        transferEncoding = headers.get('transfer-encoding')
+        if transferEncoding is not None and transferEncoding.lower() == 'chunked':
+            body = []
+            size = 0
+            while True:
+                chunkHeader = await AsyncioHttpServerBase._readLine(reader)
+                try:
+                    chunkLen = int(chunkHeader.split(b';')[0].strip(), 16) # ignore chunk-extensions
+                except ValueError:
+                    raise DechunkError('invalid chunk header {!r}'.format(chunkHeader[:HTTPReader.MAX_CHUNK_HEADER]))
+                if chunkLen < 0:
+                    raise DechunkError('invalid chunk header {!r}'.format(chunkHeader))
+                if chunkLen == 0:
+                    # skip optional trailer
+                    while (await AsyncioHttpServerBase._readLine(reader)) not in (b'\r\n', b'\n', b''):
+                        pass
+                    return b''.join(body)
+                size += chunkLen
+                if size > maxSize:
+                    raise BodyTooLargeError('chunked body > {}'.format(maxSize))
+                body.append(await reader.readexactly(chunkLen))
+                if await reader.readexactly(2) != b'\r\n': # chunk ends with \r\n
+                    raise DechunkError('chunk of length {} is not followed by CRLF'.format(chunkLen))
+        return b''
+
+    @staticmethod
+    async def _readLine(reader):
+        try:
+            return await reader.readline()
+        except ValueError: # line exceeds the limit of the StreamReader
+            raise DechunkError('line too long')
+
+    @staticmethod
+    def _isKeepAlive(version, headers):
+        connection = (headers.get('connection') or '').lower()
+        if version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    async def _writeResponse(self, writer, response):
+        body = response.body
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        streamed = not isinstance(body, (bytes, bytearray))
+        lines = ['HTTP/1.1 {} {}'.format(response.status, response.reason),
+                 'Date: {}'.format(email.utils.formatdate(usegmt=True)),
+                 'Content-Type: {}'.format(response.contentType)]
+        if response.contentEncoding:
+            lines.append('Content-Encoding: {}'.format(response.contentEncoding))
+        if response.chunked or streamed:
+            lines.append('Transfer-Encoding: chunked')
+        else:
+            lines.append('Content-Length: {}'.format(len(body)))
+        if response.close:
+            lines.append('Connection: close')
+        writer.write('\r\n'.join(lines).encode('latin-1') + b'\r\n\r\n')
+        if streamed:
+            # serialization runs in the executor, every chunk is written as soon as it is complete
+            await self._runInExecutor(self._writeStreamed, writer, body, response.contentEncoding)
+            return
+        if response.chunked:
+            chunkedWriter = ChunkedWriter(writer)
+            chunkedWriter.write(body)
+            chunkedWriter.close()
+        else:
+            writer.write(body)
+        await writer.drain()
+
+    def _writeStreamed(self, writer, body, algorithm):
+        ''' runs in executor. Errors after the http header was sent can not be reported to the client,
+        the connection is closed instead.'''
+        try:
+            body.write(_LoopWriter(writer, self._loop), algorithm)
+        except Exception:
+            self._logger.error('could not write streamed response: {}', traceback.format_exc())
+            self._loop.call_soon_threadsafe(writer.close)
+
+    def _compressIfRequired(self, headers, response_bytes, compressFunc=None):
+        ''' @return: tuple (bytes, used encoding or None)'''
+        enc = self._acceptedEncoding(headers)
+        if enc is None:
+            return response_bytes, None
+        if compressFunc is None:
+            return CompressionHandler.compressPayload(enc, response_bytes), enc
+        return compressFunc(enc), enc
+
+    def _acceptedEncoding(self, headers):
+        ''' @return: the compression encoding for the response or None'''
+        accepted_enc = CompressionHandler.parseHeader(headers.get('accept-encoding'))
+        for enc in accepted_enc:
+            if enc in self.supportedEncodings:
+                return enc
+        return None
+
+    def _decompressRequest(self, headers, body):
+        actual_enc = headers.get('content-encoding')
+        if actual_enc:
+            if actual_enc in (self.supportedEncodings or CompressionHandler.available_encodings):
+                return CompressionHandler.decompress(body, actual_enc)
+            raise DecompressError('content-encoding "{}" is not supported'.format(actual_enc))
+        return body
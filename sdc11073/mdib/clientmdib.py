@@ -1,10 +1,12 @@
 import traceback
 import time
+import array
+import bisect
+import itertools
 from threading import Lock
 from collections import deque
 from collections import namedtuple
 from statistics import mean, stdev
-import copy
 from lxml import etree as etree_
 from .. import observableproperties as properties
 from . import mdibbase
@@ -13,6 +15,10 @@ from .. import namespaces
 from .. import pmtypes
 from concurrent import futures
 from .. import loghelper
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 _global_nsmap = namespaces.nsmap
 
@@ -26,6 +32,10 @@ if PROFILING:
 LOG_WF_AGE_INTERVAL = 30 # how often a log message is written with mean and stdef of waveforms age
 AGE_CALC_SAMPLES_COUNT = 100 # amount of data for wf mean age and stdev calculation
 
+# state properties that are set by a msgreader.WaveformUpdate
+_WAVEFORM_UPDATE_PROPERTIES = ('DescriptorVersion', 'StateVersion', 'ActivationState', '_MetricValue')
+_waveformOtherProperties = {} # lookup state class => names of all other properties
+
 A_NO_LOG = 0
 A_OUT_OF_RANGE = 1
 A_STILL_OUT_OF_RANGE = 2
@@ -73,18 +83,197 @@ class DeterminationTimeWarner:
 
 _AgeData = namedtuple('_AgeData', 'mean_age stdev min_age max_age')
 
+if numpy is not None:
+    def _mkFloatArray(size):
+        return numpy.zeros(size, dtype=numpy.float64)
+
+    def _toFloatArray(values):
+        return numpy.asarray(values, dtype=numpy.float64)
+
+    def _copyFloats(floatArray, start, end):
+        return floatArray[start:end].copy()
+
+    def _mkObservationTimes(firstTime, period, count):
+        return firstTime + numpy.arange(count, dtype=numpy.float64) * period
+else:
+    def _mkFloatArray(size):
+        return array.array('d', bytes(8 * size))
+
+    def _toFloatArray(values):
+        return values if isinstance(values, array.array) else array.array('d', values)
+
+    def _copyFloats(floatArray, start, end):
+        return floatArray[start:end]  # slice of an array.array is a copy
+
+    def _mkObservationTimes(firstTime, period, count):
+        return array.array('d', [firstTime + i * period for i in range(count)])
+
+
+class RtSampleArrays(namedtuple('RtSampleArrays', 'values observationTimes validities annotations samples')):
+    ''' A block of real time samples.
+    values, observationTimes: float64 arrays (numpy.ndarray if numpy is installed, otherwise array.array)
+    validities: list of (index, validity) tuples, one entry for every index where the validity changes
+    annotations: dict index => list of pmtypes.Annotation, only annotated samples are contained
+    samples: list of (index, sequence) tuples, one entry for every appended block of samples. The sequence contains
+             the original sample values (e.g. Decimal), sample i is sequence[i - index] of the last entry with index <= i.
+    '''
+    __slots__ = ()
+
+    def validity(self, index):
+        pos = bisect.bisect_right(self.validities, (index, _MAX_KEY)) - 1
+        return self.validities[pos][1] if pos >= 0 else None
+
+    def sample(self, index):
+        ''' @return: the original value of sample index, as it was appended'''
+        pos = bisect.bisect_right(self.samples, (index, _MAX_KEY)) - 1
+        start, sequence = self.samples[pos]
+        return sequence[index - start]
+
+    def getRtSampleContainer(self, index):
+        return mdibbase.RtSampleContainer(self.sample(index), self.observationTimes[index],
+                                          self.validity(index), self.annotations.get(index, []))
+
+
+class _MaxKey(object):
+    ''' compares greater than anything, used for bisect in (index, validity) tuples'''
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+_MAX_KEY = _MaxKey()
+
+
+class RtSampleSequence(object):
+    ''' Read only sequence of mdibbase.RtSampleContainer objects on top of RtSampleArrays.
+    The objects are created on access.'''
+    def __init__(self, rtSampleArrays):
+        self._arrays = rtSampleArrays
+
+    def __len__(self):
+        return len(self._arrays.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('RtSampleSequence index out of range')
+        return self._arrays.getRtSampleContainer(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._arrays.getRtSampleContainer(i)
+
+
+class RtSampleRingBuffer(object):
+    ''' Keeps the youngest max_samples real time samples of one waveform.
+    Values and observation times are stored in contiguous float64 arrays, validity and annotations in sparse
+    side indices that are keyed by the running sample number.
+    The arrays have room for 2*max_samples; samples are appended until the end is reached, then the youngest
+    samples are moved to the start. This way the buffered samples are always one contiguous slice.
+    Not thread safe, ClientRtBuffer serializes access.'''
+    def __init__(self, max_samples):
+        self._maxSamples = max_samples
+        self._values = _mkFloatArray(2 * max_samples)
+        self._observationTimes = _mkFloatArray(2 * max_samples)
+        self._start = 0  # array position of oldest sample
+        self._end = 0  # array position after youngest sample
+        self._sampleCount = 0  # running number of next sample
+        self._validities = deque()  # (sample number, validity) for every change of validity
+        self._annotations = {}  # sample number => list of annotations
+        self._annotatedSamples = deque()  # sample numbers in self._annotations, in ascending order
+        self._blocks = deque()  # (sample number, values) for every append, keeps the original values
+
+    def __len__(self):
+        return self._end - self._start
+
+    def append(self, values, observationTimes, validity, annotations=None):
+        '''
+        @param values: sequence of numbers (float, Decimal, ...). The sequence is referenced, do not modify it later.
+        @param observationTimes: sequence of floats, same length as values
+        @param validity: the validity of all values
+        @param annotations: None or a dictionary index in values => list of annotations
+        '''
+        count = len(values)
+        if count == 0:
+            return
+        firstNumber = self._sampleCount  # sample number of values[0]
+        skip = max(0, count - self._maxSamples)
+        if skip:
+            values = values[skip:]
+            observationTimes = observationTimes[skip:]
+            count -= skip
+        if self._end + count > len(self._values):
+            keep = min(len(self), self._maxSamples - count)
+            src = self._end - keep
+            self._values[:keep] = self._values[src:self._end]
+            self._observationTimes[:keep] = self._observationTimes[src:self._end]
+            self._start, self._end = 0, keep
+        self._values[self._end:self._end + count] = _toFloatArray(values)
+        self._observationTimes[self._end:self._end + count] = _toFloatArray(observationTimes)
+        self._end += count
+        self._start = max(self._start, self._end - self._maxSamples)
+        self._sampleCount = firstNumber + skip + count
+        self._blocks.append((firstNumber + skip, values))
+        if not self._validities or self._validities[-1][1] != validity:
+            self._validities.append((firstNumber + skip, validity))
+        if annotations:
+            for index in sorted(annotations):
+                if index >= skip:
+                    self._annotations[firstNumber + index] = annotations[index]
+                    self._annotatedSamples.append(firstNumber + index)
+        self._prune()
+
+    def read(self, consume=True):
+        '''
+        @param consume: if True, the buffer is empty afterwards
+        @return: RtSampleArrays with copies of the buffered samples, oldest sample first.
+        '''
+        oldestNumber = self._sampleCount - len(self)
+        values = _copyFloats(self._values, self._start, self._end)
+        observationTimes = _copyFloats(self._observationTimes, self._start, self._end)
+        validities = [(max(number - oldestNumber, 0), validity) for number, validity in self._validities]
+        annotations = {number - oldestNumber: self._annotations[number] for number in self._annotatedSamples}
+        samples = [(number - oldestNumber, blockValues) for number, blockValues in self._blocks]
+        if consume:
+            self.clear()
+        return RtSampleArrays(values, observationTimes, validities, annotations, samples)
+
+    def clear(self):
+        self._start = self._end = 0
+        self._annotations.clear()
+        self._annotatedSamples.clear()
+        self._blocks.clear()
+        while len(self._validities) > 1:  # keep current validity, it is still valid for next samples
+            self._validities.popleft()
+
+    def _prune(self):
+        oldestNumber = self._sampleCount - len(self)
+        while len(self._validities) > 1 and self._validities[1][0] <= oldestNumber:
+            self._validities.popleft()
+        while self._annotatedSamples and self._annotatedSamples[0] < oldestNumber:
+            del self._annotations[self._annotatedSamples.popleft()]
+        while len(self._blocks) > 1 and self._blocks[1][0] <= oldestNumber:
+            self._blocks.popleft()
+
+
 class ClientRtBuffer(object):
     '''Collects data of one real time stream.'''
     def __init__(self, sample_period, max_samples):
         '''
         @param sample_period: float value, in seconds. 
-                              When an incoming real time sample array is split into single RtSampleContainers, this is used to calculate the individual time stamps.
-                              Value can be zero if correct value is not known. In this case all Containers will have the observation time of the sample array.
-        @param max_samples: integer, max. length of self.rtdata
+                              When an incoming real time sample array is split into single samples, this is used to calculate the individual time stamps.
+                              Value can be zero if correct value is not known. In this case all samples will have the observation time of the sample array.
+        @param max_samples: integer, max. number of buffered samples
         '''
-        self.rt_data = deque(maxlen=max_samples)
         self.sample_period = sample_period
         self._max_samples = max_samples
+        self._buffer = RtSampleRingBuffer(max_samples)
+        self._rt_data = None  # cached RtSampleSequence, reset when the buffer changes
         self._logger = loghelper.getLoggerAdapter('sdc.client.mdib.rt')
         self._lock = Lock()
         self.last_sc = None  # last statecontainer that was handled
@@ -92,6 +281,38 @@ class ClientRtBuffer(object):
         self._reported_min_age = None
         self._reported_max_age = None
 
+    @property
+    def rt_data(self):
+        ''' a snapshot of the buffered samples as a sequence of RtSampleContainer objects (created on access).
+        The snapshot is cached until samples are added or read.
+        Unlike the deque of former versions the sequence is read only, it has no clear() or popleft() methods.
+        Use readData() or readArrays() to consume samples.'''
+        with self._lock:
+            if self._rt_data is None:
+                self._rt_data = RtSampleSequence(self._buffer.read(consume=False))
+            return self._rt_data
+
+    def addRealtimeSampleArray(self, realtimeSampleArrayContainer):
+        ''' Adds the samples of a real time sample array to the buffer without creating objects per sample.
+        :param realtimeSampleArrayContainer: a RealTimeSampleArrayMetricStateContainer instance
+        :return: observation time of youngest sample, None if there are no samples
+        '''
+        self.last_sc = realtimeSampleArrayContainer
+        metricValue = realtimeSampleArrayContainer.metricValue
+        if metricValue is None:
+            # this can happen if metric state is not activated.
+            self._logger.debug('real time sample array "{} "has no metric value, ignoring it', realtimeSampleArrayContainer.descriptorHandle)
+            return None
+        samples = metricValue.Samples
+        if samples is None or len(samples) == 0:  # samples can be a numpy array, it has no truth value
+            return None
+        observationTimes = _mkObservationTimes(metricValue.DeterminationTime, self.sample_period, len(samples))
+        with self._lock:
+            self._buffer.append(samples, observationTimes, metricValue.Validity, self._appliedAnnotations(metricValue))
+            self._rt_data = None
+            youngest = observationTimes[-1]
+            self._addAge(time.time() - youngest)
+        return youngest
 
     def mkRtSampleContainers(self, realtimeSampleArrayContainer):
         '''
@@ -106,46 +327,38 @@ class ClientRtBuffer(object):
             self._logger.debug('real time sample array "{} "has no metric value, ignoring it', realtimeSampleArrayContainer.descriptorHandle)
             return []
         observationTime = metricValue.DeterminationTime
-        annotations = metricValue.Annotations
-        applyAnnotations = metricValue.ApplyAnnotations
+        appliedAnnotations = self._appliedAnnotations(metricValue) or {}
         rtSampleContainers = []
         if metricValue.Samples is not None:
             for i, sample in enumerate(metricValue.Samples):
-                appliedAnnotations = []
-                if applyAnnotations is not None:
-                    for aa in applyAnnotations:
-                        if aa.SampleIndex == i:
-                            # there is an annotation for this sample:
-                            aIndex = aa.AnnotationIndex
-                            annot = annotations[aIndex] # index is zero-based
-                            appliedAnnotations.append(annot)
                 t = observationTime + i * self.sample_period
-                rtSampleContainers.append(mdibbase.RtSampleContainer(sample, t, metricValue.Validity, appliedAnnotations))
+                rtSampleContainers.append(mdibbase.RtSampleContainer(sample, t, metricValue.Validity,
+                                                                     appliedAnnotations.get(i, [])))
         return rtSampleContainers
 
     def addRtSampleContainers(self, sc):
         if not sc:
             return
         with self._lock:
-            self.rt_data.extend(sc)
-            self._age_of_data_list.append(time.time() - sc[-1].observationTime) # use time of youngest sample, this is the best value for indication of delays
-        try:
-            self._reported_min_age = min(self._age_of_data_list[-1], self._reported_min_age)
-        except TypeError:
-            self._reported_min_age = self._age_of_data_list[-1]
-        try:
-            self._reported_max_age = max(self._age_of_data_list[-1], self._reported_min_age)
-        except TypeError:
-            self._reported_max_age = self._age_of_data_list[-1]
+            for validity, group in itertools.groupby(sc, key=lambda x: x.validity):
+                group = list(group)
+                annotations = {i: s.annotations for i, s in enumerate(group) if s.annotations}
+                self._buffer.append([s.valueString for s in group], [s.observationTime for s in group], validity,
+                                    annotations)
+            self._rt_data = None
+            self._addAge(time.time() - sc[-1].observationTime) # use time of youngest sample, this is the best value for indication of delays
 
     def readData(self):
         ''' This read method consumes all data in buffer.
         @return: a list of RtSampleContainer objects'''    
-        with self._lock:
-            ret = copy.copy(self.rt_data)
-            self.rt_data.clear()
-        return ret
+        return list(RtSampleSequence(self.readArrays()))
 
+    def readArrays(self):
+        ''' This read method consumes all data in buffer.
+        @return: a RtSampleArrays instance'''
+        with self._lock:
+            self._rt_data = None
+            return self._buffer.read(consume=True)
 
     def get_age_stdev(self):
         with self._lock:
@@ -155,6 +368,29 @@ class ClientRtBuffer(object):
             std_deviation = 0 if len(self._age_of_data_list) < 2 else stdev(self._age_of_data_list)
             return _AgeData(mean_data, std_deviation, min_value or 0, max_value or 0)
 
+    @staticmethod
+    def _appliedAnnotations(metricValue):
+        ''' @return: None or a dictionary sample index => list of annotations'''
+        applyAnnotations = metricValue.ApplyAnnotations
+        if not applyAnnotations:
+            return None
+        annotations = metricValue.Annotations
+        result = {}
+        for aa in applyAnnotations:
+            result.setdefault(aa.SampleIndex, []).append(annotations[aa.AnnotationIndex]) # index is zero-based
+        return result
+
+    def _addAge(self, age):
+        self._age_of_data_list.append(age)
+        try:
+            self._reported_min_age = min(age, self._reported_min_age)
+        except TypeError:
+            self._reported_min_age = age
+        try:
+            self._reported_max_age = max(age, self._reported_min_age)
+        except TypeError:
+            self._reported_max_age = age
+
 _BufferedNotification = namedtuple('_BufferedNotification', 'report handler')
 
 class ClientMdibContainer(mdibbase.MdibContainer):
@@ -537,28 +773,37 @@ class ClientMdibContainer(mdibbase.MdibContainer):
             return
         waveformByHandle = {}
         waveformAge = {} # collect age of all waveforms in this report, and make one report if age is above warn limit (instead of multiple)
-        allRtSampleArrayContainers = self._msgReader.readWaveformReport(reportNode)
-        self._logger.debug('_onWaveformReport: {} waveforms received', len(allRtSampleArrayContainers))
+        allWaveforms = self._msgReader.readWaveformReportUpdates(reportNode)
+        self._logger.debug('_onWaveformReport: {} waveforms received', len(allWaveforms))
         try:
             with self.mdibLock:
                 self.mdibVersion = newMdibVersion
                 self._updateSequenceId(reportNode)
-                for new_sac in allRtSampleArrayContainers:
+                for new_sac in allWaveforms:
+                    current_sc = None
+                    if isinstance(new_sac, msgreader.WaveformUpdate):
+                        current_sc = self._updateWaveformStateInPlace(new_sac, is_buffered_report)
+                        if current_sc is None:
+                            new_sac = self._msgReader.mkStateContainerFromNode(
+                                new_sac.node, namespaces.domTag('RealTimeSampleArrayMetricState'))
+                        else:
+                            new_sac = current_sc # samples are now in current state
                     d_handle = new_sac.descriptorHandle
                     descriptorContainer = new_sac.descriptorContainer
                     if descriptorContainer is None:
                         self._logger.warn('_onWaveformReport: No Descriptor found for handle "{}"', d_handle)
 
-                    oldStateContainer = self.states.descriptorHandle.getOne(d_handle, allowNone=True)
-                    if oldStateContainer is None:
-                        self.states.addObject(new_sac)
-                        current_sc = new_sac
-                    else:
-                        if self._hasNewStateUsableStateVersion(oldStateContainer, new_sac, 'WaveformReport', is_buffered_report):
-                            # update old state container from new one
-                            oldStateContainer.updateFromOtherContainer(new_sac)
-                            self.states.updateObject(oldStateContainer)
-                        current_sc = oldStateContainer  # we will need it later
+                    if current_sc is None:
+                        oldStateContainer = self.states.descriptorHandle.getOne(d_handle, allowNone=True)
+                        if oldStateContainer is None:
+                            self.states.addObject(new_sac)
+                            current_sc = new_sac
+                        else:
+                            if self._hasNewStateUsableStateVersion(oldStateContainer, new_sac, 'WaveformReport', is_buffered_report):
+                                # update old state container from new one
+                                oldStateContainer.updateFromOtherContainer(new_sac)
+                                self.states.updateObject(oldStateContainer)
+                            current_sc = oldStateContainer  # we will need it later
                     waveformByHandle[d_handle] = current_sc
                     # add to Waveform Buffer
                     rtBuffer = self.rtBuffers.get(d_handle)
@@ -571,13 +816,11 @@ class ClientMdibContainer(mdibbase.MdibContainer):
                                 sample_period = 0  # default
                         rtBuffer = ClientRtBuffer(sample_period=sample_period, max_samples=self._maxRealtimeSamples)
                         self.rtBuffers[d_handle] = rtBuffer
-                    last_sc = rtBuffer.last_sc
-                    rtSampleContainers = rtBuffer.mkRtSampleContainers(new_sac)
-                    rtBuffer.addRtSampleContainers(rtSampleContainers)
+                    youngestObservationTime = rtBuffer.addRealtimeSampleArray(new_sac)
 
                     # check age
-                    if len(rtSampleContainers) >  0:
-                        waveformAge[d_handle] = rtSampleContainers[-1].age
+                    if youngestObservationTime is not None:
+                        waveformAge[d_handle] = time.time() - youngestObservationTime
 
                     # check descriptor version
                     if descriptorContainer.DescriptorVersion != new_sac.DescriptorVersion:
@@ -743,6 +986,7 @@ class ClientMdibContainer(mdibbase.MdibContainer):
                         pass
                     else:
                         container.updateDescrFromNode(dc.node)
+                        self.descriptions.updateObject(container) # coding or OperationTarget might have changed
                     updatedDescriptorByHandle[dc.handle] = dc
                 for sc in stateContainers:
                     # determine multikey
@@ -763,6 +1007,37 @@ class ClientMdibContainer(mdibbase.MdibContainer):
                     self.updatedDescriptorByHandle = updatedDescriptorByHandle
 
 
+    def _updateWaveformStateInPlace(self, waveformUpdate, is_buffered_report):
+        '''
+        Applies a WaveformUpdate directly to the existing state container.
+        This is only possible if the existing state has no other data than the update provides
+        (e.g. PhysiologicalRange, BodySite, extensions), and if the versions allow a plain update.
+        :param waveformUpdate: a msgreader.WaveformUpdate
+        :return: the updated state container, or None if the generic update is needed
+        '''
+        oldStateContainer = self.states.descriptorHandle.getOne(waveformUpdate.descriptorHandle, allowNone=True)
+        if oldStateContainer is None or not oldStateContainer.isRealtimeSampleArrayMetricState:
+            return None
+        if oldStateContainer.DescriptorVersion != waveformUpdate.DescriptorVersion:
+            return None
+        if waveformUpdate.StateVersion <= oldStateContainer.StateVersion:
+            return None # let generic handling compare and log
+        cls = oldStateContainer.__class__
+        otherNames = _waveformOtherProperties.get(cls)
+        if otherNames is None:
+            otherNames = tuple(name for name, _ in oldStateContainer._sortedContainerProperties() #pylint: disable=protected-access
+                               if name not in _WAVEFORM_UPDATE_PROPERTIES)
+            _waveformOtherProperties[cls] = otherNames
+        for name in otherNames:
+            if getattr(oldStateContainer, name) not in (None, []):
+                return None
+        self._hasNewStateUsableStateVersion(oldStateContainer, waveformUpdate, 'WaveformReport', is_buffered_report)
+        cls.StateVersion.updateFromNode(oldStateContainer, waveformUpdate.node)
+        cls.ActivationState.updateFromNode(oldStateContainer, waveformUpdate.node)
+        oldStateContainer.metricValue = waveformUpdate.metricValue
+        oldStateContainer.node = waveformUpdate.node
+        return oldStateContainer
+
     def _hasNewStateUsableStateVersion(self, oldStateContainer, newStateContainer, reportName, is_buffered_report):
         '''
         compare state versions old vs new
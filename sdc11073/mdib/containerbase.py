@@ -3,7 +3,8 @@ import inspect
 from lxml import etree as etree_
 from .. import observableproperties as properties
 from ..namespaces import QN_TYPE
-
+from .containercodec import getCodec
+from .containerproperties import ExtensionNodeProperty, IMMUTABLE_TYPES, copyValue
 
 class ContainerBase(object):
     NODETYPE = None   # overwrite in derived classes! determines the value of xsi:Type attribute, must be a etree_.QName object
@@ -16,15 +17,17 @@ class ContainerBase(object):
     # Initialization is from left to right
     # This is according to the inheritance in BICEPS xml schema
     _props = tuple()  # empty tuple, this base class has no properties
+    _frozen = False  # instances that are committed to a device mdib are frozen, see freeze()
+    _keepNode = True  # False: node-less mode, see releaseNode()
 
     def __init__(self, nsmapper, node=None):
         self.nsmapper = nsmapper
-        self.node = node
         if node is None:
             # initialize all ContainerProperties
-            for dummy_name, cprop in self._sortedContainerProperties():
+            for dummy_name, cprop in self._getCodec().properties:
                 cprop.initInstanceData(self)
         else:
+            self.node = node
             self._updateFromNode(node)
 
 
@@ -53,8 +56,7 @@ class ContainerBase(object):
         '''
         if setXsiType and self.NODETYPE is not None:
             node.set(QN_TYPE, self.nsmapper.docNameFromQName(self.NODETYPE))
-        for dummy_name, prop in self._sortedContainerProperties():
-            prop.updateXMLValue(self, node)
+        self._getCodec().updateNode(self, node)
         return node
 
 
@@ -62,17 +64,59 @@ class ContainerBase(object):
         ''' update members.
         '''
         # update all ContainerProperties
-        for dummy_name, cprop in self._sortedContainerProperties():
-            cprop.updateFromNode(self, node)
+        self._getCodec().updateFromNode(self, node)
 
 
-    def mkCopy(self):
-        copied = copy.copy(self)
-        cpNode = copy.deepcopy(self.node)
-        copied.node = cpNode
+    def mkCopy(self, copyNode=True):
+        '''
+        create a new, modifiable container with the same data.
+        :param copyNode: if False, the copy shares self.node instead of a deep copy of it. This is safe as long as
+                         the node is not modified in place, but only replaced (e.g. by updateNode).
+        :return: the copy (never frozen). Mutable values of container properties (pmtypes instances, lists) are
+                 copied, modifying them does not change self.
+        '''
+        cls = self.__class__
+        copied = cls.__new__(cls)
+        instanceData = copied.__dict__
+        instanceData.update(self.__dict__)
+        instanceData.pop('_Property2InstanceData', None) # do not share data of observable properties with self
+        instanceData.pop('_frozen', None)
+        for localVarName in self._getCodec().propertyVarNames:
+            value = instanceData.get(localVarName)
+            if not isinstance(value, IMMUTABLE_TYPES):
+                instanceData[localVarName] = copyValue(value)
+        if self._keepNode:
+            copied.node = copy.deepcopy(self.node) if copyNode else self.node
         return copied
 
 
+    def releaseNode(self):
+        ''' Switches this container to node-less mode: it only keeps the python values, the etree node is released
+        and updateNode does not create a new one. xml is rendered on demand (mkNode, mkStateNode, mkDescriptorNode).
+        Copies made by mkCopy inherit the mode.'''
+        self._keepNode = False
+        self.__dict__.pop('_Property2InstanceData', None)  # node is the only observable property
+        for name, prop in self._getCodec().properties:
+            if isinstance(prop, ExtensionNodeProperty):
+                # an extension node that was read from a document keeps the complete document alive
+                value = prop.getActualValue(self)
+                if value is not None and value.getparent() is not None:
+                    setattr(self, name, copy.deepcopy(value))
+
+
+    def freeze(self):
+        ''' Makes this container an immutable snapshot. A frozen container can be shared (e.g. with the
+        notification path) without copying it; modifications must be done on a copy, see mkCopy.
+        Values of container properties (pmtypes instances) of a frozen container must not be modified, mkCopy
+        creates copies of them.'''
+        self._frozen = True
+
+
+    @property
+    def isFrozen(self):
+        return self._frozen
+
+
     def _sortedContainerProperties(self):
         '''
         @return: a list of (name, object) tuples of all GenericProperties ( and subclasses)
@@ -91,11 +135,18 @@ class ContainerBase(object):
         return ret
 
 
+    def _getCodec(self):
+        '''
+        @return: the ContainerCodec of this class, it is created on first use.
+        '''
+        return getCodec(self)
+
+
     def diff(self, other):
         ''' compares all properties.
         returns a list of strings that describe differences'''
         ret = []
-        for name, dummy in self._sortedContainerProperties():
+        for name, dummy in self._getCodec().properties:
             myvalue = getattr(self, name)
             try:
                 othervalue = getattr(other, name)
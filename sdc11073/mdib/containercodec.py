@@ -0,0 +1,185 @@
+''' Compiled codecs for container classes.
+The xml mapping of a container class is defined by the container properties listed in _props of the class and its
+base classes. Walking the class hierarchy and navigating to sub elements for every property on every mkNode and
+every update from a node is expensive, therefore a ContainerCodec is built once per container class:
+- attributes of the container node itself are read and written directly,
+- direct sub elements are collected in one pass over the children of the node,
+- all other properties use their own updateXMLValue / getPyValueFromNode methods.
+The codec produces exactly the same xml and the same python values as the generic property methods.
+'''
+from lxml import etree as etree_
+from . import containerproperties as cp
+
+_codecs = {}  # lookup class => ContainerCodec
+
+
+def getCodec(instance):
+    '''
+    :param instance: a container or pmtypes object
+    :return: the ContainerCodec of the class of instance. It is created on first use
+             from the _sortedContainerProperties method of the class.
+    '''
+    cls = instance.__class__
+    codec = _codecs.get(cls)
+    if codec is None:
+        codec = ContainerCodec(instance._sortedContainerProperties())  # pylint: disable=protected-access
+        _codecs[cls] = codec
+    return codec
+
+
+def _isInherited(prop, baseClass, methodName):
+    ''' True if prop uses the method of baseClass, e.g. the behavior of the base class can be compiled.'''
+    return getattr(type(prop), methodName) is getattr(baseClass, methodName)
+
+
+def _mkAttributeWriter(attrname, localVarName, toXML):
+    def write(instance, node):
+        value = getattr(instance, localVarName, None)
+        if value is None:
+            attrib = node.attrib
+            if attrname in attrib:
+                del attrib[attrname]
+        else:
+            node.set(attrname, toXML(value))
+    return write
+
+
+def _mkSubElementWriter(tag, localVarName, default):
+    def write(instance, node):
+        value = getattr(instance, localVarName, default)
+        if value is not None:
+            oldNode = next(node.iterchildren(tag), None)
+            if oldNode is not None:
+                node.remove(oldNode)
+            node.append(value.asEtreeNode(tag, node.nsmap))
+    return write
+
+
+def _mkSubElementListWriter(tag, localVarName, default):
+    def write(instance, node):
+        value = getattr(instance, localVarName, default)
+        for oldNode in list(node.iterchildren(tag)):
+            node.remove(oldNode)
+        if value is not None:
+            nsmap = node.nsmap
+            for v in value:
+                node.append(v.asEtreeNode(tag, nsmap))
+    return write
+
+
+def _mkAttributeReader(attrname, localVarName, toPy, default):
+    def read(instance, node, children):  # pylint: disable=unused-argument
+        xmlValue = node.get(attrname)
+        setattr(instance, localVarName, default if xmlValue is None else toPy(xmlValue))
+    return read
+
+
+def _mkSubElementReader(tag, localVarName, fromNode, default):
+    def read(instance, node, children):  # pylint: disable=unused-argument
+        found = children.get(tag)
+        setattr(instance, localVarName, default if found is None else fromNode(found[0]))
+    return read
+
+
+def _mkSubElementListReader(tag, localVarName, fromNode):
+    def read(instance, node, children):  # pylint: disable=unused-argument
+        setattr(instance, localVarName, [fromNode(n) for n in children.get(tag, ())])
+    return read
+
+
+def _mkTextReader(tag, localVarName, toPy, default):
+    def read(instance, node, children):  # pylint: disable=unused-argument
+        found = children.get(tag)
+        xmlValue = None if found is None else found[0].text
+        setattr(instance, localVarName, default if xmlValue is None else toPy(xmlValue))
+    return read
+
+
+def _mkExtensionReader(tag, localVarName):
+    def read(instance, node, children):  # pylint: disable=unused-argument
+        found = children.get(tag)
+        setattr(instance, localVarName, None if found is None else found[0])
+    return read
+
+
+def _mkGenericReader(prop):
+    def read(instance, node, children):  # pylint: disable=unused-argument
+        prop.updateFromNode(instance, node)
+    return read
+
+
+class ContainerCodec(object):
+    ''' Serializes and parses all container properties of one container class.'''
+    def __init__(self, properties):
+        '''
+        :param properties: list of (name, property) tuples, as returned by _sortedContainerProperties of the class
+        '''
+        self.properties = tuple(properties)
+        # names of the instance variables that hold the property values
+        self.propertyVarNames = frozenset(prop._localVarName for _, prop in self.properties  # pylint: disable=protected-access
+                                          if getattr(prop, '_localVarName', None) is not None)
+        self._childTags = set()  # tags of direct children that are collected for the readers
+        self._writers = tuple(self._mkWriter(prop) for _, prop in self.properties)
+        self.namedWriters = tuple((name, prop, writer) for (name, prop), writer in zip(self.properties, self._writers))
+        self._readers = tuple(self._mkReader(prop) for _, prop in self.properties)
+
+    def updateNode(self, instance, node):
+        ''' writes the values of all properties of instance to node.'''
+        for writer in self._writers:
+            writer(instance, node)
+
+    def updateFromNode(self, instance, node):
+        ''' reads the values of all properties of instance from node.'''
+        children = {}
+        if self._childTags:
+            childTags = self._childTags
+            for child in node:
+                tag = child.tag
+                if tag in childTags:
+                    found = children.get(tag)
+                    if found is None:
+                        children[tag] = [child]
+                    else:
+                        found.append(child)
+        for reader in self._readers:
+            reader(instance, node, children)
+
+    @staticmethod
+    def _mkWriter(prop):
+        path = prop._subElementNames  # pylint: disable=protected-access
+        localVarName = prop._localVarName  # pylint: disable=protected-access
+        if not path:
+            if _isInherited(prop, cp.NodeAttributeProperty, 'updateXMLValue'):
+                return _mkAttributeWriter(prop._attrname, localVarName, prop._converter.toXML)  # pylint: disable=protected-access
+        elif len(path) == 1:
+            tag = etree_.QName(path[0]).text
+            if _isInherited(prop, cp.SubElementProperty, 'updateXMLValue'):
+                return _mkSubElementWriter(tag, localVarName, prop._defaultPyValue)  # pylint: disable=protected-access
+            if _isInherited(prop, cp.SubElementListProperty, 'updateXMLValue'):
+                return _mkSubElementListWriter(tag, localVarName, prop._defaultPyValue)  # pylint: disable=protected-access
+        return prop.updateXMLValue
+
+    def _mkReader(self, prop):
+        if not _isInherited(prop, cp._PropertyBase, 'updateFromNode'):  # pylint: disable=protected-access
+            return _mkGenericReader(prop)
+        path = prop._subElementNames  # pylint: disable=protected-access
+        localVarName = prop._localVarName  # pylint: disable=protected-access
+        default = prop._defaultPyValue  # pylint: disable=protected-access
+        if not path:
+            if _isInherited(prop, cp.NodeAttributeProperty, 'getPyValueFromNode'):
+                return _mkAttributeReader(prop._attrname, localVarName, prop._converter.toPy, default)  # pylint: disable=protected-access
+        elif len(path) == 1:
+            tag = etree_.QName(path[0]).text
+            if _isInherited(prop, cp.SubElementProperty, 'getPyValueFromNode'):
+                reader = _mkSubElementReader(tag, localVarName, prop.valueClass.fromNode, default)
+            elif _isInherited(prop, cp.SubElementListProperty, 'getPyValueFromNode'):
+                reader = _mkSubElementListReader(tag, localVarName, prop._cls.fromNode)  # pylint: disable=protected-access
+            elif _isInherited(prop, cp.NodeTextProperty, 'getPyValueFromNode'):
+                reader = _mkTextReader(tag, localVarName, prop._converter.toPy, default)  # pylint: disable=protected-access
+            elif _isInherited(prop, cp.ExtensionNodeProperty, 'getPyValueFromNode'):
+                reader = _mkExtensionReader(tag, localVarName)
+            else:
+                return _mkGenericReader(prop)
+            self._childTags.add(tag)
+            return reader
+        return _mkGenericReader(prop)
@@ -5,6 +5,7 @@ The properties completely hide the XML nature of data. To serve this purpose, th
 '''
 import re
 import datetime
+import decimal
 import time
 import copy
 from lxml import etree as etree_
@@ -17,6 +18,30 @@ class ElementNotFoundException(Exception):
     pass
 
 
+class FrozenContainerError(RuntimeError):
+    ''' Raised when a property of a frozen container is written.'''
+    pass
+
+
+# property values of these types are immutable, copies of containers and pmtypes can share them.
+# tuples are pmtypes.Coding instances.
+IMMUTABLE_TYPES = (str, bytes, int, float, bool, decimal.Decimal, datetime.date, datetime.time, etree_.QName, tuple,
+                   type(None))
+
+
+def copyValue(value):
+    ''' @return: a copy of a property value that can be modified without changing value.
+    Immutable values are not copied, pmtypes instances are copied with their __deepcopy__ method.'''
+    if isinstance(value, IMMUTABLE_TYPES):
+        return value
+    if isinstance(value, list):
+        return [copyValue(v) for v in value] if value else []
+    copier = getattr(value, '__deepcopy__', None)
+    if copier is not None: # pmtypes, without the overhead of copy.deepcopy
+        return copier(None)
+    return copy.deepcopy(value)
+
+
 
 class _PropertyBase(object):
     ''' Navigates to sub element and handles storage of value in instance.
@@ -78,6 +103,8 @@ class _PropertyBase(object):
 
     def __set__(self, instance, pyValue):
         '''value is the representation on the program side, e.g a float. '''
+        if getattr(instance, '_frozen', False):
+            raise FrozenContainerError('{} is frozen, cannot set {}'.format(instance, self._localVarName))
         setattr(instance, self._localVarName, pyValue)
 
 
@@ -7,6 +7,8 @@ from ..namespaces import domTag, extTag, siTag
 from .. import pmtypes
 from . import containerproperties as cp
 
+_sortedChildNamesCache = {}  # lookup container class => list of QNames
+
 
 class AbstractDescriptorContainer(ContainerBase):
     '''
@@ -157,6 +159,9 @@ class AbstractDescriptorContainer(ContainerBase):
         '''
         @return: a list of QNames
         '''
+        ret = _sortedChildNamesCache.get(self.__class__)
+        if ret is not None:
+            return ret
         ret = []
         classes = inspect.getmro(self.__class__)
         for cls in reversed(classes):
@@ -165,6 +170,7 @@ class AbstractDescriptorContainer(ContainerBase):
                 ret.extend(names)
             except:
                 continue
+        _sortedChildNamesCache[self.__class__] = ret
         return ret
 
     def mkDescriptorNode(self, setXsiType=True, tag=None):
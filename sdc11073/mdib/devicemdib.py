@@ -29,15 +29,32 @@ class SampleArraySource(object):
         
             
     def getNextSampleArray(self): 
+        '''
+        @return : timestamp, sampleperiod, list of values, activationState
+        '''
+        rtSampleArray = self.getNextRtSampleArray()
+        return (rtSampleArray.determinationTime, rtSampleArray.sampleperiod, rtSampleArray.samples,
+                rtSampleArray.activationState)
+
+
+    def getNextRtSampleArray(self):
+        '''
+        @return : a RtSampleArray instance with all samples since last call
+        '''
         if self._activationState != pmtypes.ComponentActivation.ON:
-            return (None, self._generator.sampleperiod, [], self._activationState)
+            return RtSampleArray(None, self._generator.sampleperiod, [], self._activationState)
         
         now = time.time()
         observationTime = self._lastTimeStamp or now
         samples_count = int((now - observationTime)/self._generator.sampleperiod)
-        samples = self._generator.nextSamples(samples_count)
+        try:
+            samples, cycleStarts = self._generator.nextSampleArray(samples_count)
+        except AttributeError: # a generator that only provides (value, flag) tuples
+            tuples = self._generator.nextSamples(samples_count)
+            samples = [t[0] for t in tuples]
+            cycleStarts = [i for i, t in enumerate(tuples) if t[1]]
         self._lastTimeStamp = observationTime + self._generator.sampleperiod*samples_count
-        return observationTime, self._generator.sampleperiod, samples, self._activationState
+        return RtSampleArray(observationTime, self._generator.sampleperiod, samples, self._activationState, cycleStarts)
 
 
     def setWfGenerator(self, generator):
@@ -47,17 +64,22 @@ class SampleArraySource(object):
 class RtSampleArray(object):
     ''' This class contains a list of waveform values plus time stamps and annotations.
     It is used to create Waveform notifications.'''  
-    def __init__(self, determinationTime, sampleperiod, samples, activationState):
+    __slots__ = ('determinationTime', '_sampleperiod', 'samples', 'activationState', 'cycleStarts', 'annotations',
+                 'applyAnnotations')
+
+    def __init__(self, determinationTime, sampleperiod, samples, activationState, cycleStarts=None):
         '''
         @param determinationTime: the time stamp of the first value in samples
         @param sampleperiod: the time difference between two samples
-        @param samples: a list of values (float or int)
+        @param samples: a sequence of values (float or int)
         @param acticationState: one of pmtypes.ComponentActivation values
+        @param cycleStarts: list of indices in samples that mark the beginning of a waveform period
         '''
         self.determinationTime = determinationTime
         self._sampleperiod = sampleperiod
         self.samples = samples
         self.activationState = activationState
+        self.cycleStarts = cycleStarts or []
         self.annotations = []
         self.applyAnnotations = []
         
@@ -76,7 +98,12 @@ class RtSampleArray(object):
 
     def getAnnotationTriggerTimestamps(self):
         ''' returns the time stamps of all samples that mark the beginning of a period'''
-        return [self.determinationTime + i*self._sampleperiod for i, sample in enumerate(self.samples) if sample[1]]
+        return [self.determinationTime + i*self._sampleperiod for i in self.cycleStarts]
+
+
+    @property
+    def sampleperiod(self):
+        return self._sampleperiod
         
 
     def addAnnotationsAt(self, annotation, timestamps):
@@ -343,7 +370,7 @@ class _MdibUpdateTransaction(object):
             else:
                 oldStateContainer = self._deviceMdibContainer.contextStates.handle.getOne(contextStateHandle, allowNone=True)
                 if oldStateContainer is not None:
-                    newStateContainer = oldStateContainer.mkCopy()
+                    newStateContainer = oldStateContainer.mkCopy(copyNode=False)
                     newStateContainer.incrementState()
                 else:
                     newStateContainer = self._deviceMdibContainer.mkStateContainerFromDescriptor(descriptorContainer)
@@ -407,8 +434,11 @@ class _MdibUpdateTransaction(object):
 
 
     def getRealTimeSampleArrayMetricState(self, descriptorHandle):
-        # for performance reasons, this method does not return a deep copy of the original object.
-        # This means no rollback possible. 
+        ''' Update a RealTimeSampleArrayMetricState.
+        When the transaction is committed, the copy replaces the original version,
+        and notification messages will be sent to clients.
+        @return: a copy of the state.
+        '''
         if self._closed:
             raise RuntimeError('This _MdibUpdateTransaction is closed!')
         if self._error:
@@ -416,19 +446,11 @@ class _MdibUpdateTransaction(object):
         try:
             if descriptorHandle in self.rtSampleStateUpdates:
                 raise ValueError('descriptorHandle {} already in updated set!'.format(descriptorHandle))
-            stateContainer = self._deviceMdibContainer.states.descriptorHandle.getOne(descriptorHandle, allowNone=True)
-            if stateContainer is None:
-                descriptorContainer = self._getDescriptorInTransaction(descriptorHandle)
-                stateContainer = self._deviceMdibContainer.mkStateContainerFromDescriptor(descriptorContainer)
-                self._deviceMdibContainer.states.addObject(stateContainer)
-            else:
-                stateContainer.incrementState()
-
-            if not stateContainer.isRealtimeSampleArrayMetricState:
+            old_state, new_state = self._get_or_mk_StateContainer(descriptorHandle, adjustStateVersion=False)
+            if not new_state.isRealtimeSampleArrayMetricState:
                 raise ValueError('descriptorHandle {} does not reference a RealTimeSampleArrayMetricState'.format(descriptorHandle))
-            newstate = stateContainer
-            self.rtSampleStateUpdates[descriptorHandle] = _TrItem(stateContainer, newstate)
-            return newstate
+            self.rtSampleStateUpdates[descriptorHandle] = _TrItem(old_state, new_state)
+            return new_state
         except:
             self._error = True
             raise
@@ -455,7 +477,8 @@ class _MdibUpdateTransaction(object):
             if adjustStateVersion:
                 self._deviceMdibContainer.states.setVersion(new_stateContainer)
         else:
-            new_stateContainer = old_stateContainer.mkCopy()
+            # copy on write: the node of a committed state is never modified, only replaced. No need to copy it.
+            new_stateContainer = old_stateContainer.mkCopy(copyNode=False)
             new_stateContainer.incrementState()
         return old_stateContainer, new_stateContainer
 
@@ -463,12 +486,23 @@ class _MdibUpdateTransaction(object):
 
 class DeviceMdibContainer(mdibbase.MdibContainer):
     ''' update source is the users program.'''
+    # parts of the next snapshot that did not change since the last one, None if they must be created again
+    _snapshotStates = None
+    _snapshotContextStates = None
+    _snapshotMdDescription = None  # tuple ((sequenceId, mdDescriptionVersion), node)
 #    def __init__(self, bicepsSchemaInstance=None, log_prefix=None):
-    def __init__(self, sdc_definitions, log_prefix=None):
+    def __init__(self, sdc_definitions, log_prefix=None, keepNodes=True):
+        '''
+        :param sdc_definitions: a class derived from BaseDefinitions
+        :param log_prefix: a string
+        :param keepNodes: if False, containers in this mdib do not keep an etree node (see ContainerBase.releaseNode),
+                          xml is only rendered when a message is built. This saves memory and time per transaction.
+        '''
         super(DeviceMdibContainer, self).__init__(sdc_definitions)
         self._logger = loghelper.getLoggerAdapter('sdc.device.mdib', log_prefix)
         self._sdcDevice = None
         self._trLock = Lock() # transaction lock
+        self._keepNodes = keepNodes
 
         self.sequenceId = uuid.uuid4().urn # this uuid identifies this mdib instance
         
@@ -481,6 +515,67 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
         self.preCommitHandler = None # preCommitHandler can modify transaction if needed before it is committed
         self.postCommitHandler = None # postCommitHandler can modify mdib if needed after it is committed
 
+    def _updateContainerNode(self, container, **kwargs):
+        ''' updates the node of a container that is committed to the mdib, or releases it in node-less mode.'''
+        if self._keepNodes:
+            container.updateNode(**kwargs)
+        else:
+            container.releaseNode()
+
+    def _releaseNodes(self, containers):
+        if not self._keepNodes:
+            for container in containers:
+                container.releaseNode()
+
+    def getSnapshot(self):
+        ''' returns the MdibSnapshot of the last commit, without locking if it has already been created.
+        Serializing a snapshot does not block transactions, and transactions do not modify a snapshot.
+        '''
+        snapshot = self._snapshot
+        if snapshot is None:
+            # first call after a commit, or mdib has been modified outside of a transaction
+            with self.mdibLock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = self._mkSnapshot()
+                    self._snapshot = snapshot
+        return snapshot
+
+    def _publishSnapshot(self, states=True, contextStates=True):
+        ''' must be called with mdibLock held after a commit.
+        The snapshot is created by the next getSnapshot call, commits without a reader in between (e.g. waveforms)
+        do not copy the states.
+        @param states: False if the commit did not change self.states
+        @param contextStates: False if the commit did not change self.contextStates
+        '''
+        self._snapshot = None
+        if states:
+            self._snapshotStates = None
+        if contextStates:
+            self._snapshotContextStates = None
+
+    def _invalidateSnapshot(self):
+        ''' called by modifications outside of transactions, the next snapshot is created from current data.'''
+        self._snapshot = None
+        self._snapshotStates = None
+        self._snapshotContextStates = None
+        self._snapshotMdDescription = None
+
+    def _mkSnapshot(self):
+        ''' must be called with mdibLock held.
+        The MdDescription node is only re-created if mdDescriptionVersion changed, the tuples of states and context
+        states only if they were changed.'''
+        key = (self.sequenceId, self.mdDescriptionVersion)
+        if self._snapshotMdDescription is None or self._snapshotMdDescription[0] != key:
+            self._snapshotMdDescription = (key, self._reconstructMdDescription())
+        if self._snapshotStates is None:
+            self._snapshotStates = tuple(self.states.objects)
+        if self._snapshotContextStates is None:
+            self._snapshotContextStates = tuple(self.contextStates.objects)
+        return mdibbase.MdibSnapshot(self.sequenceId, self.mdibVersion, self.mdDescriptionVersion,
+                                     self.mdStateVersion, self._snapshotMdDescription[1],
+                                     self._snapshotStates, self._snapshotContextStates)
+
     @contextmanager
     def mdibUpdateTransaction(self, setDeterminationTime=True):
         #pylint: disable=protected-access
@@ -544,19 +639,21 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
                                     newstate)
                                 del update_dict[descriptorContainer.handle]
                                 multikey_instance = self.contextStates if newstate.isContextState else self.states
-                                if oldstate:
-                                    multikey_instance.removeObjectNoLock(oldstate)
-                                multikey_instance.addObjectNoLock(newstate)
+                                multikey_instance.swapObjectNoLock(oldstate, newstate)
                             break
 
                     if corresponding_state is None:
-                        corresponding_state = self.states.descriptorHandle.getOne(descriptorContainer.handle,
-                                                                                  allowNone=True)
-                        if corresponding_state is not None:
+                        oldstate = self.states.descriptorHandle.getOne(descriptorContainer.handle, allowNone=True)
+                        if oldstate is not None:
+                            # copy on write, the state in mdib is a frozen snapshot
+                            corresponding_state = oldstate.mkCopy(copyNode=False)
                             corresponding_state.descriptorContainer = descriptorContainer
                             corresponding_state.incrementState()
                             corresponding_state.updateDescriptorVersion()
+                            self._updateContainerNode(corresponding_state)
+                            self.states.swapObjectNoLock(oldstate, corresponding_state)
                     if corresponding_state is not None:
+                        corresponding_state.freeze()
                         updated_states.append(corresponding_state)
 
                 def _incrementParentDescriptorVersion(descriptorContainer):
@@ -571,7 +668,7 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
                 for value in mgr.descriptorUpdates.values():
                     origDescriptor, newDescriptor = value.old, value.new
                     if newDescriptor is not None:
-                        newDescriptor.updateNode(setXsiType=True)
+                        self._updateContainerNode(newDescriptor, setXsiType=True)
                         # DescriptionModificationReport also contains the states that are related to the descriptors.
                         # => if there is one, update its DescriptorVersion and add it to list of states that shall be sent
                         # (Assuming that context descriptors (patient, location) are never changed,
@@ -607,11 +704,12 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
                         self._logger.error('mdibUpdateTransaction: Descriptor Handle={} did not exist before!! really??', origDescriptor.handle)
                         raise
                 mdibVersion = self.mdibVersion
-                # makes copies of all descriptors and states for sending, so that they can't be affected by transactions after this one
+                self._publishSnapshot()
+                # makes copies of all descriptors for sending, so that they can't be affected by transactions after this one.
+                # States are frozen snapshots, they can be sent without copying.
                 updated = [d.mkCopy() for d in updated]
                 created = [d.mkCopy() for d in created]
                 deleted = [d.mkCopy() for d in deleted]
-                updated_states = [s.mkCopy() for s in updated_states]
             self._sdcDevice.sendDescriptorUpdates(mdibVersion, updated=updated, created=created, deleted=deleted, updated_states=updated_states)
 
         # handle metric states
@@ -626,17 +724,18 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
                     oldstate, newstate = value.old, value.new
                     try:
                         if setDeterminationTime and newstate.metricValue is not None:
+                            # the value is a copy (see mkCopy), it is not shared with a committed state
                             newstate.metricValue.DeterminationTime = now
                         # replace the old container with the new one
-                        self.states.removeObjectNoLock(oldstate)
-                        self.states.addObjectNoLock(newstate)
+                        self.states.swapObjectNoLock(oldstate, newstate)
+                        newstate.freeze()
                         updates.append(newstate)
                     except RuntimeError:
                         self._logger.warn('mdibUpdateTransaction: {} did not exist before!! really??', newstate)
                         raise
                 mdibVersion = self.mdibVersion
-                # makes copies of all states for sending, so that they can't be affected by transactions after this one
-                updates = [s.mkCopy() for s in updates]
+                self._publishSnapshot(contextStates=False)
+                # committed states are frozen snapshots, no copies for sending needed.
             self._sdcDevice.sendMetricStateUpdates(mdibVersion, updates)
 
         # handle alert states
@@ -650,17 +749,17 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
                     try:
                         if setDeterminationTime and newstate.isAlertCondition:
                             newstate.DeterminationTime = time.time()
-                        newstate.updateNode()
+                        self._updateContainerNode(newstate)
                         # replace the old container with the new one
-                        self.states.removeObjectNoLock(oldstate)
-                        self.states.addObjectNoLock(newstate)
+                        self.states.swapObjectNoLock(oldstate, newstate)
+                        newstate.freeze()
                         updates.append(newstate)
                     except RuntimeError:
                         self._logger.warn('mdibUpdateTransaction: {} did not exist before!! really??', newstate)
                         raise
                 mdibVersion = self.mdibVersion
-                # makes copies of all states for sending, so that they can't be affected by transactions after this one
-                updates = [s.mkCopy() for s in updates]
+                self._publishSnapshot(contextStates=False)
+                # committed states are frozen snapshots, no copies for sending needed.
             self._sdcDevice.sendAlertStateUpdates(mdibVersion, updates)
 
             # handle component state states
@@ -672,17 +771,17 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
                 for value in mgr.componentStateUpdates.values():
                     oldstate, newstate = value.old, value.new
                     try:
-                        newstate.updateNode()
+                        self._updateContainerNode(newstate)
                         # replace the old container with the new one
-                        self.states.removeObjectNoLock(oldstate)
-                        self.states.addObjectNoLock(newstate)
+                        self.states.swapObjectNoLock(oldstate, newstate)
+                        newstate.freeze()
                         updates.append(newstate)
                     except RuntimeError:
                         self._logger.warn('mdibUpdateTransaction: {} did not exist before!! really??', newstate)
                         raise
                 mdibVersion = self.mdibVersion
-                # makes copies of all states for sending, so that they can't be affected by transactions after this one
-                updates = [s.mkCopy() for s in updates]
+                self._publishSnapshot(contextStates=False)
+                # committed states are frozen snapshots, no copies for sending needed.
             self._sdcDevice.sendComponentStateUpdates(mdibVersion, updates)
 
         # handle context states
@@ -696,15 +795,15 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
                     try:
                         updates.append(newstate)
                         # replace the old container with the new one
-                        self.contextStates.removeObjectNoLock(oldstate)
-                        self.contextStates.addObjectNoLock(newstate)
-                        newstate.updateNode()
+                        self.contextStates.swapObjectNoLock(oldstate, newstate)
+                        self._updateContainerNode(newstate)
+                        newstate.freeze()
                     except RuntimeError:
                         self._logger.warn('mdibUpdateTransaction: {} did not exist before!! really??', newstate)
                         raise
                 mdibVersion = self.mdibVersion
-                # makes copies of all tates for sending, so that they can't be affected by transactions after this one
-                updates = [s.mkCopy() for s in updates]
+                self._publishSnapshot(states=False)
+                # committed states are frozen snapshots, no copies for sending needed.
             self._sdcDevice.sendContextStateUpdates(mdibVersion, updates)
 
         # handle operational states
@@ -716,16 +815,16 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
                 for value in mgr.operationalStateUpdates.values():
                     oldstate, newstate = value.old, value.new
                     try:
-                        newstate.updateNode()
-                        self.states.removeObjectNoLock(oldstate)
-                        self.states.addObjectNoLock(newstate)
+                        self._updateContainerNode(newstate)
+                        self.states.swapObjectNoLock(oldstate, newstate)
+                        newstate.freeze()
                         updates.append(newstate)
                     except RuntimeError:
                         self._logger.warn('mdibUpdateTransaction: {} did not exist before!! really??', newstate)
                         raise
                 mdibVersion = self.mdibVersion
-                # makes copies of all states for sending, so that they can't be affected by transactions after this one
-                updates = [s.mkCopy() for s in updates]
+                self._publishSnapshot(contextStates=False)
+                # committed states are frozen snapshots, no copies for sending needed.
             self._sdcDevice.sendOperationalStateUpdates(mdibVersion, updates)
 
         # handle real time samples
@@ -737,14 +836,17 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
                 for value in mgr.rtSampleStateUpdates.values():
                     oldstate, newstate = value.old, value.new
                     try:
-                        newstate.updateNode()
+                        self._updateContainerNode(newstate)
+                        # replace the old container with the new one
+                        self.states.swapObjectNoLock(oldstate, newstate)
+                        newstate.freeze()
                         updates.append(newstate)
                     except RuntimeError:
                         self._logger.warn('mdibUpdateTransaction: {} did not exist before!! really??', newstate)
                         raise
                 mdibVersion = self.mdibVersion
-                # makes copies of all states for sending, so that they can't be affected by transactions after this one
-                updates = [s.mkCopy() for s in updates]
+                self._publishSnapshot(contextStates=False)
+                # committed states are frozen snapshots, no copies for sending needed.
             self._sdcDevice.sendRealtimeSamplesStateUpdates(mdibVersion, updates)
     
     
@@ -783,7 +885,7 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
                   )
         obj.SafetyClassification = safetyClassification
         obj.Type = codedValue
-        obj.updateNode()
+        self._updateContainerNode(obj)
         return obj
 
 
@@ -805,6 +907,7 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
             self._current_transaction.createDescriptor(obj)
         else:
             self.descriptions.addObject(obj)
+            self._invalidateSnapshot()
         return obj
 
 
@@ -826,6 +929,7 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
             self._current_transaction.createDescriptor(obj)
         else:
             self.descriptions.addObject(obj)
+            self._invalidateSnapshot()
         return obj
     
 
@@ -847,11 +951,12 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
         obj.Unit = unit
         obj.MetricAvailability = metricAvailability
         obj.MetricCategory = metricCategory
-        obj.updateNode()
+        self._updateContainerNode(obj)
         if self._current_transaction is not None:
             self._current_transaction.createDescriptor(obj)
         else:
             self.descriptions.addObject(obj)
+            self._invalidateSnapshot()
         return obj
 
 
@@ -874,11 +979,12 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
         obj.MetricAvailability = metricAvailability
         obj.MetricCategory = metricCategory
         obj.AllowedValue = allowedValues
-        obj.updateNode()
+        self._updateContainerNode(obj)
         if self._current_transaction is not None:
             self._current_transaction.createDescriptor(obj)
         else:
             self.descriptions.addObject(obj)
+            self._invalidateSnapshot()
         return obj
 
 
@@ -899,6 +1005,7 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
             self._current_transaction.createDescriptor(obj)
         else:
             self.descriptions.addObject(obj)
+            self._invalidateSnapshot()
         return obj
 
 
@@ -927,14 +1034,17 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
         '''
         msg_reader = msgreader.MessageReader(self)
         descriptorContainers = msg_reader.readMdDescription(mdsNode)
+        self._releaseNodes(descriptorContainers)
         if self._current_transaction is not None:
             for descr in descriptorContainers:
                 self._current_transaction.createDescriptor(descr)
         else:
             for descr in descriptorContainers:
                 self.descriptions.addObject(descr)
+            self._invalidateSnapshot()
 
         stateContainers = msg_reader.readMdState(mdsNode, additionalDescriptorContainers=descriptorContainers)
+        self._releaseNodes(stateContainers)
         for s in stateContainers:
             self.addState(s)
         self.mkStateContainersforAllDescriptors()
@@ -990,15 +1100,14 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
         # look for all waveforms that have new sample data or a changed activation state
         for handle, source in self._waveformGenerators.items():
             oldRtSampleStateContainer = self.states.descriptorHandle.getOne(handle, allowNone=True)
-            determinationTime, sampleperiod, samples, activationState = self._getNextRealtimeSample(handle)
-            if len(samples) > 0 or (oldRtSampleStateContainer is not None and oldRtSampleStateContainer.ActivationState != activationState):
-                rtsamples[handle] = RtSampleArray(determinationTime, sampleperiod, samples, activationState)
+            rtSampleArray = source.getNextRtSampleArray()
+            if len(rtSampleArray.samples) > 0 or (oldRtSampleStateContainer is not None and oldRtSampleStateContainer.ActivationState != rtSampleArray.activationState):
+                rtsamples[handle] = rtSampleArray
         
         # add annotations
         for srchandle, _annotator in self._annotators.items():
             annotation, destHandles = _annotator
             if srchandle in rtsamples:
-                samples = rtsamples[srchandle].samples
                 timestamps = rtsamples[srchandle].getAnnotationTriggerTimestamps()
                 if timestamps:
                     for destHandle in destHandles:
@@ -1027,38 +1136,41 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
                         st.SelfCheckCount = 1
                     elif st.NODETYPE == domTag('ClockState'):
                         st.LastSet = time.time()
-                    st.updateNode()
+                    self._updateContainerNode(st)
                     if self._current_transaction is not None:
                         self._current_transaction.addState(st)
                     else:
                         self.states.addObject(st)
+                        self._invalidateSnapshot()
 
 
     @classmethod
     def fromMdibFile(cls, path, createLocationContextDescr=True, createPatientContextDescr=True,
-                     protocol_definition=None, log_prefix=None):
+                     protocol_definition=None, log_prefix=None, keepNodes=True):
         """
         An alternative constructor for the class
         :param path: the input file path for creating the mdib
         :param createLocationContextDescr: same as in fromString method
         :param createPatientContextDescr: same as in fromString method
+        :param keepNodes: same as in constructor
         :return: instance
         """
         with open(path, 'rb') as f:
             xml_text = f.read()
         return DeviceMdibContainer.fromString(xml_text, createLocationContextDescr, createPatientContextDescr,
-                                              protocol_definition, log_prefix)
+                                              protocol_definition, log_prefix, keepNodes)
 
 
     @classmethod
     def fromString(cls, xml_text, createLocationContextDescr=True, createPatientContextDescr=True,
-                   protocol_definition=None, log_prefix=None):
+                   protocol_definition=None, log_prefix=None, keepNodes=True):
         """
         An alternative constructor for the class
         :param xml_text: the input string for creating the mdib
         :param createLocationContextDescr: if True, and the mdib does not contain a LocationContextDescriptor, it adds one
         :param createPatientContextDescr: if True, and the mdib does not contain a PatientContextDescriptor, it adds one
         :param protocol_definition: an optional object derived from BaseDefinitions, forces usage of this definition
+        :param keepNodes: same as in constructor
         :return: instance
         """
         # get protocol definition that matches xml_text
@@ -1071,7 +1183,7 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
         if protocol_definition is None:
             raise ValueError('cannot create instance, no known BICEPS schema version identified')
 
-        mdib = cls(protocol_definition, log_prefix=log_prefix)
+        mdib = cls(protocol_definition, log_prefix=log_prefix, keepNodes=keepNodes)
         root =  msgreader.MessageReader.getMdibRootNode(mdib.sdc_definitions, xml_text)
         mdib.bicepsSchema.bmmSchema.assertValid(root)
 
@@ -1079,8 +1191,10 @@ class DeviceMdibContainer(mdibbase.MdibContainer):
         msg_reader = msgreader.MessageReader(mdib)
         # first make descriptions and add them to mdib, and then make states (they need already existing descriptions)
         descriptorContainers = msg_reader.readMdDescription(root)
+        mdib._releaseNodes(descriptorContainers)
         mdib.addDescriptionContainers(descriptorContainers)
         stateContainers = msg_reader.readMdState(root)
+        mdib._releaseNodes(stateContainers)
         mdib.addStateContainers(stateContainers)
 
         if createLocationContextDescr or createPatientContextDescr:
@@ -6,10 +6,12 @@ from .. import observableproperties as properties
 from .. import namespaces
 from .. import pmtypes
 from .. import multikey
-from ..xmlparsing import BicepsSchema
+from ..xmlparsing import getBicepsSchema
 
 class RtSampleContainer(object):
     '''Contains a single Value'''
+    __slots__ = ('valueString', 'value', 'observationTime', 'validity', 'annotations')
+
     def __init__(self, valueString, timestamp, validity, annotations = None):
         self.valueString = valueString
         self.value = float(valueString)
@@ -52,6 +54,11 @@ class _MultikeyWithVersionLookup(multikey.MultiKeyLookup):
                 self._saveVersion(obj)
         multikey.MultiKeyLookup.removeObjectsNoLock(self, objs)
 
+    def swapObjectNoLock(self, oldObj, newObj):
+        if oldObj is not None and oldObj is not newObj:
+            self._saveVersion(oldObj)
+        multikey.MultiKeyLookup.swapObjectNoLock(self, oldObj, newObj)
+
 
 class DescriptorsLookup(_MultikeyWithVersionLookup):
     ''' This class knows about the hierarchy of descriptors and keeps the order of objects '''
@@ -71,6 +78,28 @@ class DescriptorsLookup(_MultikeyWithVersionLookup):
         self.addIndex('codingSystem', multikey.IndexDefinition(lambda obj: obj.codingSystem))
         self.addIndex('codeId', multikey.IndexDefinition(lambda obj: obj.codeId))
         self.addIndex('coding', multikey.IndexDefinition(lambda obj: obj.coding))
+        # codings of all ancestors and the descriptor itself; every tail of this path is a key => see selectDescriptors
+        self.addIndex('codingPath', multikey.IndexDefinition1n(self._mkCodingPathKeys))
+        # only operation descriptors have an OperationTarget
+        self.addIndex('OperationTarget', multikey.IndexDefinition(lambda obj: obj.OperationTarget, indexNoneValues=False))
+
+    def _mkCodingPathKeys(self, obj):
+        path = [obj.coding]
+        parentHandle = obj.parentHandle
+        while parentHandle is not None:
+            parent = self.handle.getOne(parentHandle, allowNone=True)
+            if parent is None:
+                break
+            path.append(parent.coding)
+            parentHandle = parent.parentHandle
+        path.reverse()
+        return [tuple(path[i:]) for i in range(len(path))]
+
+    def _updateCodingPathOfChildren(self, obj):
+        ''' the coding path of all descendants of obj depends on obj => re-index them'''
+        for child in self.parentHandle.get(obj.handle, []):
+            multikey.MultiKeyLookup.updateObjectNoLock(self, child)
+            self._updateCodingPathOfChildren(child)
 
 
     def _saveVersion(self, obj):
@@ -93,6 +122,7 @@ class DescriptorsLookup(_MultikeyWithVersionLookup):
         parent = None if obj.parentHandle is None else self.handle.getOne(obj.parentHandle, allowNone=True)
         if parent is not None:
             parent.addChild(obj)
+        self._updateCodingPathOfChildren(obj) # children that have been added before their parent
 
     def addObjects(self, objs):
         with self._lock:
@@ -114,6 +144,19 @@ class DescriptorsLookup(_MultikeyWithVersionLookup):
         parent = self.handle.getOne(obj.parentHandle, allowNone=True)
         if parent is not None:
             parent.rmChild(obj)
+        self._updateCodingPathOfChildren(obj)
+
+    def updateObjectNoLock(self, obj):
+        ''' re-indexes obj, and also its descendants if the coding path of obj changed'''
+        old_keys = self._getCodingPathKeys(obj)
+        _MultikeyWithVersionLookup.updateObjectNoLock(self, obj)
+        if self._getCodingPathKeys(obj) != old_keys:
+            self._updateCodingPathOfChildren(obj)
+
+    def _getCodingPathKeys(self, obj):
+        ''' the keys of obj in the codingPath index'''
+        codingPathIndex = self.codingPath
+        return [obj_ref.key for obj_ref in self._objectIDs.get(id(obj), []) if obj_ref.index_dict is codingPathIndex]
 
     def removeObjects(self, objs):
         with self._lock:
@@ -123,6 +166,11 @@ class DescriptorsLookup(_MultikeyWithVersionLookup):
         for obj in objs:
             self.removeObjectNoLock(obj)
 
+    def swapObjectNoLock(self, oldObj, newObj):
+        ''' parent keeps the order of its children, therefore descriptors are removed and added'''
+        self.removeObjectNoLock(oldObj)
+        self.addObjectNoLock(newObj)
+
     def replaceObject(self, newObj):
         with self._lock:
             self.replaceObjectNoLock(newObj)
@@ -158,6 +206,55 @@ class MultiStatesLookup(_MultikeyWithVersionLookup):
             obj.StateVersion = version
 
 
+class MdibSnapshot(object):
+    ''' The mdib content at one mdibVersion.
+    A snapshot is never modified after it has been created: it references the frozen state containers of a commit
+    and an MdDescription node that must not be modified by readers.
+    All parts of a response that is built from one snapshot have the same mdibVersion and sequenceId.
+    '''
+    def __init__(self, sequenceId, mdibVersion, mdDescriptionVersion, mdStateVersion, mdDescriptionNode,
+                 states, contextStates):
+        '''
+        @param mdDescriptionNode: an etree_ node
+        @param states: a tuple of state containers
+        @param contextStates: a tuple of context state containers
+        '''
+        self.sequenceId = sequenceId
+        self.mdibVersion = mdibVersion
+        self.mdDescriptionVersion = mdDescriptionVersion
+        self.mdStateVersion = mdStateVersion
+        self.mdDescriptionNode = mdDescriptionNode
+        self.states = states
+        self.contextStates = contextStates
+        self._lookups = None  # created with first lookup
+
+    def _getLookups(self):
+        lookups = self._lookups
+        if lookups is None:
+            statesByDescriptorHandle = {s.descriptorHandle: s for s in self.states}
+            contextStatesByHandle = {s.Handle: s for s in self.contextStates}
+            contextStatesByDescriptorHandle = {}
+            for s in self.contextStates:
+                contextStatesByDescriptorHandle.setdefault(s.descriptorHandle, []).append(s)
+            lookups = (statesByDescriptorHandle, contextStatesByHandle, contextStatesByDescriptorHandle)
+            # concurrent readers might create the lookups twice, that is harmless
+            self._lookups = lookups
+        return lookups
+
+    def getStates(self, descriptorHandle):
+        ''' @return: a list with the single state of the descriptor, or an empty list'''
+        state = self._getLookups()[0].get(descriptorHandle)
+        return [] if state is None else [state]
+
+    def getContextState(self, handle):
+        ''' @return: the context state with this handle or None'''
+        return self._getLookups()[1].get(handle)
+
+    def getContextStates(self, descriptorHandle):
+        ''' @return: a list of the context states of the descriptor'''
+        return list(self._getLookups()[2].get(descriptorHandle, []))
+
+
 class MdibContainer(object):
 
     # these observables can be used to watch any change of data in the mdib. They contain lists of containers that were changed.
@@ -179,7 +276,7 @@ class MdibContainer(object):
         @param sdc_definitions: a class derived from Definitions_Base
         '''
         self.sdc_definitions = sdc_definitions
-        self.bicepsSchema = BicepsSchema(sdc_definitions) # used for validation
+        self.bicepsSchema = getBicepsSchema(sdc_definitions) # used for validation, shared by all mdibs
         self._logger = None # must to be instantiated by derived class
         self.nsmapper = namespaces.DocNamespaceHelper()  # default map, might be replaced with nsmap from xml file  
         self.mdibVersion = 0
@@ -201,7 +298,7 @@ class MdibContainer(object):
         self.contextStates.addIndex('handle', multikey.UIndexDefinition(lambda obj: obj.Handle, indexNoneValues=False))
         self.contextStates.addIndex('NODETYPE', multikey.IndexDefinition(lambda obj: obj.NODETYPE, indexNoneValues=False))
         self.mdibLock = Lock()
-        
+        self._snapshot = None # MdibSnapshot, only used by DeviceMdibContainer
 
         self.mdStateVersion = 0
         self.mdDescriptionVersion = 0
@@ -210,6 +307,10 @@ class MdibContainer(object):
     def logger(self):
         return self._logger
 
+    def _invalidateSnapshot(self):
+        ''' called by modifications outside of transactions, the next snapshot is created from current data.'''
+        self._snapshot = None
+
 
     def addDescriptionContainers(self, descriptionContainers):
         ''' init self.descriptions with provided descriptors
@@ -221,6 +322,7 @@ class MdibContainer(object):
                 self.descriptions.addObjectNoLock(d)
                 newDescriptorByHandle[d.handle] = d
 
+        self._invalidateSnapshot()
         # finally update observable property
         if newDescriptorByHandle:
             self.newDescriptorByHandle = newDescriptorByHandle
@@ -231,6 +333,7 @@ class MdibContainer(object):
         with self.states._lock: #pylint: disable=protected-access
             self.states.clear()
             self.contextStates.clear()
+        self._invalidateSnapshot()
 
         # clear also the observable properties
         self.metricsByHandle = None
@@ -301,6 +404,7 @@ class MdibContainer(object):
                 self._logger.error('addStateContainers: {}, keys={}; {}', ex,
                                    my_multikey.Handle.keys(), traceback.format_exc())
 
+        self._invalidateSnapshot()
         # finally update observable properties
         self._updateStateObservables(stateContainers)
 
@@ -439,8 +543,7 @@ class MdibContainer(object):
         :additionalFilters: optional filters for the key = name of member attribute, value = expected value
             example: NODETYPE=domTag('SetContextStateOperationDescriptor') filters for SetContextStateOperation descriptors
         '''
-        allOperationContainers = self.getOperationDescriptors()
-        myOperations = [opC for opC in allOperationContainers if opC.OperationTarget == descriptorHandle]
+        myOperations = self.descriptions.OperationTarget.get(descriptorHandle, [])
         for k, v in additionalFilters.items():
             myOperations = [op for op in myOperations if getattr(op, k) == v]
         return myOperations
@@ -506,10 +609,15 @@ class MdibContainer(object):
         ['70041', '69650'] : returns all descriptors with CodedValue= 69650 and parent descriptor CodedValue = 70041
         ['70041', '69650', '69651'] : returns all descriptors with CodedValue= 69651 and parent descriptor CodedValue = 69650 and parent's parent descriptor CodedValue = 70041
         It is not necessary that path starts at the top of an mds, it can start anywhere.  
+        A None coding matches every descriptor.
         '''
+        normalizedCodings = [self._normalizeCoding(coding) for coding in codings]
+        if normalizedCodings and None not in normalizedCodings:
+            return self.descriptions.codingPath.get(tuple(normalizedCodings), [])
+
+        # wildcards in path, walk the tree
         selectedObjects = None
-        for coding in codings:
-            
+        for coding in normalizedCodings:
             if selectedObjects is None:
                 selectedObjects = self.descriptions.objects # initially all objects
             else:
@@ -518,13 +626,6 @@ class MdibContainer(object):
                 selectedObjects = []
                 for h in allhandles:
                     selectedObjects.extend(self.descriptions.parentHandle.get(h, []))
-                
-            # normalize coding
-            if isinstance(coding, str):
-                coding = pmtypes.CodedValue(coding, pmtypes.DefaultCodingSystem).coding
-            elif hasattr(coding, 'coding'):
-                coding=coding.coding
-                
             if coding is not None:
                 # apply filter
                 tmpObjects = [o for o in selectedObjects if o.coding == coding ]
@@ -532,6 +633,15 @@ class MdibContainer(object):
         return selectedObjects                    
 
 
+    @staticmethod
+    def _normalizeCoding(coding):
+        if isinstance(coding, str):
+            return pmtypes.CodedValue(coding, pmtypes.DefaultCodingSystem).coding
+        if hasattr(coding, 'coding'):
+            return coding.coding
+        return coding
+
+
     def getAllDescriptorsInSubTree(self, descriptorContainer, depthFirst=True, includeRoot=True):
         ''' walks the tree below descriptorContainer.
         :param descriptorContainer:
@@ -572,7 +682,7 @@ class MdibContainer(object):
                                       len(stateContainers), descriptorContainer.handle)
                     m_key.removeObjects(stateContainers)
                     deletedStatesByHandle[descriptorContainer.handle] = stateContainers
-
+        self._invalidateSnapshot()
         if deletedDescriptorByHandle:
             self.deletedDescriptorByHandle = deletedDescriptorByHandle
         if deletedStatesByHandle:
@@ -1,13 +1,33 @@
+from collections import namedtuple
 from lxml import etree as etree_
 import copy
 from .. import namespaces
 from .. import pmtypes
+from ..dataconverters import FloatListConverter
 
 
 class MdibStructureError(Exception):
     pass
 
 
+# content of a waveform state node that can be decoded without building a generic state container
+_WF_STATE_ATTRIBUTES = frozenset(('StateVersion', 'DescriptorHandle', 'DescriptorVersion', 'ActivationState',
+                                  namespaces.QN_TYPE))
+_WF_VALUE_ATTRIBUTES = frozenset(('Samples', 'DeterminationTime', 'StartTime', 'StopTime', namespaces.QN_TYPE))
+_WF_QUALITY_ATTRIBUTES = frozenset(('Validity', 'Mode', 'Qi'))
+_WF_VALUE_CHILDREN = frozenset((namespaces.domTag('MetricQuality'), namespaces.domTag('Annotation'),
+                                namespaces.domTag('ApplyAnnotation')))
+_WF_VALUE_PROPERTIES = [pmtypes.SampleArrayValue.StartTime, pmtypes.SampleArrayValue.StopTime,
+                        pmtypes.SampleArrayValue.DeterminationTime, pmtypes.SampleArrayValue.Validity,
+                        pmtypes.SampleArrayValue.Mode, pmtypes.SampleArrayValue.Qi]
+
+
+WaveformUpdate = namedtuple('WaveformUpdate', 'node descriptorHandle DescriptorVersion StateVersion metricValue')
+WaveformUpdate.__doc__ = ''' Content of a RealTimeSampleArrayMetricState in a waveform report that only has
+DescriptorVersion, StateVersion, ActivationState and a MetricValue without extensions.
+metricValue is None or a pmtypes.SampleArrayValue with Samples as float64 array.'''
+
+
 class MessageReader(object):
     ''' This class does all the conversions from DOM trees (body of SOAP messages) to MDIB objects.'''
     def __init__(self, mdib):
@@ -181,6 +201,60 @@ class MessageReader(object):
         return states
 
 
+    def readWaveformReportUpdates(self, reportNode):
+        '''
+        Parses a waveform report. Simple states are decoded into WaveformUpdate objects, this avoids the costs of
+        generic state containers. All other states are returned as StateContainer objects.
+        :param reportNode: A waveform report etree
+        :return: a list of WaveformUpdate and StateContainer objects
+        '''
+        result = []
+        for sampleArray in reportNode:
+            if sampleArray.tag.endswith('State'): # ignore everything else, e.g. Extension
+                update = self._mkWaveformUpdate(sampleArray)
+                if update is None:
+                    update = self.mkStateContainerFromNode(sampleArray, namespaces.domTag('RealTimeSampleArrayMetricState'))
+                result.append(update)
+        return result
+
+    def _mkWaveformUpdate(self, node):
+        ''' @return: a WaveformUpdate, or None if node has content that needs the generic state container'''
+        if not _WF_STATE_ATTRIBUTES.issuperset(node.attrib):
+            return None
+        if len(node) == 0:
+            metricValue = None
+        elif len(node) == 1 and node[0].tag == namespaces.domTag('MetricValue'):
+            metricValue = self._mkSampleArrayValue(node[0])
+            if metricValue is None:
+                return None
+        else:
+            return None
+        return WaveformUpdate(node, node.get('DescriptorHandle'), int(node.get('DescriptorVersion', 0)),
+                              int(node.get('StateVersion', 0)), metricValue)
+
+    def _mkSampleArrayValue(self, node):
+        if not _WF_VALUE_ATTRIBUTES.issuperset(node.attrib):
+            return None
+        hasAnnotations = False
+        for child in node:
+            if child.tag not in _WF_VALUE_CHILDREN:
+                return None
+            if child.tag == namespaces.domTag('MetricQuality'):
+                if len(child) > 0 or not _WF_QUALITY_ATTRIBUTES.issuperset(child.attrib):
+                    return None
+            else:
+                hasAnnotations = True
+        metricValue = pmtypes.SampleArrayValue(self._mdib.nsmapper)
+        metricValue.node = node
+        for prop in _WF_VALUE_PROPERTIES:
+            prop.updateFromNode(metricValue, node)
+        samples = node.get('Samples')
+        metricValue.Samples = FloatListConverter.toPy(samples) if samples is not None else []
+        if hasAnnotations:
+            pmtypes.SampleArrayValue.Annotation.updateFromNode(metricValue, node)
+            pmtypes.SampleArrayValue.ApplyAnnotations.updateFromNode(metricValue, node)
+        return metricValue
+
     def readEpisodicMetricReport(self, reportNode):
         '''
         Parses an episodic metric report
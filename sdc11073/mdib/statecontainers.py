@@ -43,12 +43,18 @@ class AbstractStateContainer(ContainerBase):
         return self.NODENAME
 
     def updateNode(self):
-        self.node = self.mkStateNode()
+        if self._keepNode:
+            self.node = self.mkStateNode()
 
 
     def mkStateNode(self, tag=None, updateDescriptorVersion=True):
         if updateDescriptorVersion:
-            self.updateDescriptorVersion()
+            if self._frozen:
+                if self.descriptorContainer is not None and self.descriptorContainer.DescriptorVersion != self.DescriptorVersion:
+                    # a frozen snapshot is not modified, render a copy with the actual DescriptorVersion instead
+                    return self.mkCopy(copyNode=False).mkStateNode(tag, updateDescriptorVersion)
+            else:
+                self.updateDescriptorVersion()
         node = super(AbstractStateContainer, self).mkNode(tag, setXsiType=True)
         node.set('DescriptorHandle', self.descriptorHandle)
         return node
@@ -63,7 +69,8 @@ class AbstractStateContainer(ContainerBase):
                 'Update from a node with different descriptor handle is not possible! Have "{}", got "{}"'.format(
                     self.descriptorHandle, descriptorHandle))
         super(AbstractStateContainer, self)._updateFromNode(node)
-        self.node = node
+        if self._keepNode:
+            self.node = node
 
     def updateFromOtherContainer(self, other, skippedProperties=None):
         if other.__class__ != self.__class__:
@@ -74,8 +81,9 @@ class AbstractStateContainer(ContainerBase):
         # update all ContainerProperties
         if skippedProperties is None:
             skippedProperties = []
-        self.node = other.node
-        for prop_name, _ in self._sortedContainerProperties():
+        if self._keepNode:
+            self.node = other.node
+        for prop_name, _ in self._getCodec().properties:
             if prop_name not in skippedProperties:
                 new_value = getattr(other, prop_name)
                 setattr(self, prop_name, new_value)
@@ -32,7 +32,9 @@ all_42_agers = person_lookup.by_age.get(42)
 class IndexDefinition(dict):
     ''' An index allows to group objects by values.
     This is a dictionary that has lists ob objects as value.
-    Each list contains objects that have the same key member'''
+    Each list contains objects that have the same key member.
+    Internally a group is an insertion ordered dict id(obj) => obj, this makes removing an object
+    from a large group (e.g. the NODETYPE index) cheap. Read access (index[key], get, values, items) returns lists.'''
 
     def __init__(self, getKeyFunc, indexNoneValues=True):
         '''
@@ -44,68 +46,132 @@ class IndexDefinition(dict):
         self._getKeyFunc = getKeyFunc
         self._indexNoneValues = indexNoneValues
 
+    def __getitem__(self, key):
+        return self._asList(dict.__getitem__(self, key))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def values(self):
+        return [self._asList(v) for v in dict.values(self)]
+
+    def items(self):
+        return [(k, self._asList(v)) for k, v in dict.items(self)]
+
+    @staticmethod
+    def _asList(group):
+        return list(group.values())
+
     def getOne(self, key, allowNone=False):
         try:
-            result = self[key]
-            if len(result) > 1:
-                raise RuntimeError('getOne: key "{}" has {} objects'.format(key, len(result)))
-            return result[0]
+            group = dict.__getitem__(self, key)
         except KeyError:
             if allowNone:
                 return
             raise RuntimeError('key "{}" not found'.format(key))
+        if len(group) > 1:
+            raise RuntimeError('getOne: key "{}" has {} objects'.format(key, len(group)))
+        return next(iter(group.values()))
 
-    def _mkKeys(self, obj):
+    def _getKeys(self, obj):
+        ''' returns the list of keys of obj, or None if obj shall not be in this index'''
         key = self._getKeyFunc(obj)
         if not self._indexNoneValues and key is None:
             return
+        return [key]
+
+    def _mkKeys(self, obj):
+        keys = self._getKeys(obj)
+        if keys is None:
+            return
+        for k in keys:
+            self._addKey(k, obj)
+        return keys
+
+    def _addKey(self, key, obj):
         try:
-            self[key].append(obj)
+            dict.__getitem__(self, key)[id(obj)] = obj
         except KeyError:
-            self[key] = [obj]
-        return [key]
+            dict.__setitem__(self, key, {id(obj): obj})
 
     def _rmKey(self, key, obj):
-        try:
-            objList = self[key]
-            objList.remove(obj)
-            if len(objList) == 0:
+        group = dict.get(self, key)
+        if group is not None and group.get(id(obj)) is obj:
+            del group[id(obj)]
+            if len(group) == 0:
                 del self[key]
-        except (KeyError, ValueError):
-            pass
+
+    def _replaceKey(self, key, oldObj, newObj):
+        ''' newObj takes the place of oldObj, key is the same for both objects'''
+        group = dict.get(self, key)
+        if group is not None and group.get(id(oldObj)) is oldObj:
+            del group[id(oldObj)]
+            group[id(newObj)] = newObj
+        else:
+            self._addKey(key, newObj)
 
 
 class UIndexDefinition(IndexDefinition):
-    ''' A unique Index, there can only be one object with that key'''
+    ''' A unique Index, there can only be one object with that key.
+    The object itself is the value of the dictionary, read access returns a list with one element.'''
 
-    def _mkKeys(self, obj):
+    @staticmethod
+    def _asList(group):
+        return [group]
+
+    def getOne(self, key, allowNone=False):
+        try:
+            return dict.__getitem__(self, key)
+        except KeyError:
+            if allowNone:
+                return
+            raise RuntimeError('key "{}" not found'.format(key))
+
+    def _getKeys(self, obj):
         keys = self._getKeyFunc(obj)
         if not self._indexNoneValues and keys is None:
             return
         if isinstance(keys, list):
             raise ValueError('list of keys not allowed in UIndex: obj= {}, keys={}'.format(obj, keys))
-            pass
-        else:
-            keys = [keys]
+        return [keys]
+
+    def _mkKeys(self, obj):
+        keys = self._getKeys(obj)
+        if keys is None:
+            return
         for k in keys:
             if k in self:
                 raise KeyError('key "{}" in already in this UIndex'.format(k))
-            self[k] = [obj]
+        for k in keys:
+            self._addKey(k, obj)
         return keys
 
+    def _addKey(self, key, obj):
+        if key in self:
+            raise KeyError('key "{}" in already in this UIndex'.format(key))
+        dict.__setitem__(self, key, obj)
+
+    def _rmKey(self, key, obj):
+        if dict.get(self, key) is obj:
+            del self[key]
+
+    def _replaceKey(self, key, oldObj, newObj):
+        if dict.get(self, key) is oldObj:
+            dict.__setitem__(self, key, newObj)
+        else:
+            self._addKey(key, newObj)
+
 
 class IndexDefinition1n(IndexDefinition):
     ''' For member values that are a list of keys (1:n relationship)'''
 
-    def _mkKeys(self, obj):
+    def _getKeys(self, obj):
         keys = self._getKeyFunc(obj)
         if not self._indexNoneValues and keys is None:
             return
-        for k in keys:
-            try:
-                self[k].append(obj)
-            except KeyError:
-                self[k] = [obj]
         return keys
 
 
@@ -235,18 +301,56 @@ class MultiKeyLookup(object):
             self._rmIndices(obj)
             self._objects.remove(obj)
 
+    def swapObject(self, oldObj, newObj):
+        with self._lock:
+            self.swapObjectNoLock(oldObj, newObj)
+
+    def swapObjectNoLock(self, oldObj, newObj):
+        ''' Replaces oldObj with newObj. This has the same result as removeObject(oldObj) + addObject(newObj),
+        but only indices with different keys for oldObj and newObj are modified.
+        If oldObj is not known, newObj is added.'''
+        obj_refs = self._objectIDs.get(id(oldObj))
+        if obj_refs is None:
+            self.addObjectNoLock(newObj)
+            return
+        if oldObj is not newObj:
+            self._objects.remove(oldObj)
+            self._objects.add(newObj)
+        self._reIndex(oldObj, newObj, obj_refs)
+
+    def _reIndex(self, oldObj, newObj, obj_refs):
+        old_keys = defaultdict(list)  # lookup id(indexDefinition) => keys of oldObj
+        for obj_ref in obj_refs:
+            old_keys[id(obj_ref.index_dict)].append(obj_ref.key)
+        new_refs = []
+        for indexDefinition in self._idxDefs.values():
+            try:
+                keys = indexDefinition._getKeys(newObj) or []
+            except (TypeError, AttributeError):
+                keys = []
+            obj_old_keys = old_keys.get(id(indexDefinition), [])
+            for k in obj_old_keys:
+                if k in keys:
+                    if oldObj is not newObj:
+                        indexDefinition._replaceKey(k, oldObj, newObj)
+                else:
+                    indexDefinition._rmKey(k, oldObj)
+            for k in keys:
+                if k not in obj_old_keys:
+                    indexDefinition._addKey(k, newObj)
+                new_refs.append(_ObjRef(indexDefinition, k))
+        del self._objectIDs[id(oldObj)]
+        self._objectIDs[id(newObj)] = new_refs
+
     def updateObject(self, obj):
-        if obj not in self._objects:
-            raise RuntimeError('object {} not known'.format(obj))
         with self._lock:
-            self._rmIndices(obj)
-            self._mkIndices(obj)
+            self.updateObjectNoLock(obj)
 
     def updateObjectNoLock(self, obj):
+        ''' call this method after key members of obj have been changed. Only changed keys are re-indexed.'''
         if obj not in self._objects:
             raise RuntimeError('object {} not known'.format(obj))
-        self._rmIndices(obj)
-        self._mkIndices(obj)
+        self._reIndex(obj, obj, self._objectIDs[id(obj)])
 
     def updateObjects(self, objs):
         with self._lock:
@@ -254,11 +358,7 @@ class MultiKeyLookup(object):
 
     def updateObjectsNoLock(self, objs):
         for obj in objs:
-            if obj not in self._objects:
-                raise RuntimeError('object {} not known'.format(obj))
-            with self._lock:
-                self._rmIndices(obj)
-                self._mkIndices(obj)
+            self.updateObjectNoLock(obj)
 
     def clear(self):
         with self._lock:
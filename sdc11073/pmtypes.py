@@ -7,6 +7,7 @@ import enum
 from lxml import etree as etree_
 from sdc11073 import namespaces
 from .mdib import containerproperties  as cp
+from .mdib.containercodec import getCodec
 from decimal import Decimal
 from math import isclose
 '''
@@ -17,9 +18,43 @@ fromEtreeNode (class method) is a constructor that is used to create a type obje
 asEtreeNode: returns an etree node that represents the object
 '''
 
+_MAX_INTERNED = 10000 # upper limit of the number of interned objects per type
+
+
+def _slotNames(*properties):
+    ''' @return: the names of the instance variables of properties, for a __slots__ declaration'''
+    return tuple(p._localVarName for p in properties) # pylint: disable=protected-access
+
+
+_instanceSlots = {} # key: class, value: tuples (slot name, True if the slot holds a container property value)
+
+
+def _getInstanceSlots(instance):
+    cls = instance.__class__
+    slots = _instanceSlots.get(cls)
+    if slots is None:
+        propertyVarNames = instance._getCodec().propertyVarNames  # pylint: disable=protected-access
+        slots = tuple((name, name in propertyVarNames) for c in cls.__mro__ for name in c.__dict__.get('__slots__', ())
+                      if name not in ('__dict__', '__weakref__'))
+        _instanceSlots[cls] = slots
+    return slots
+
+
+def _intern(lookup, key, obj):
+    ''' returns the object in lookup for key, or obj (which is then added to lookup, if lookup is not full)'''
+    interned = lookup.get(key)
+    if interned is not None:
+        return interned
+    if len(lookup) < _MAX_INTERNED:
+        lookup[key] = obj
+    return obj
+
 
 class PropertyBasedPMType(object):
-    ''' Base class that assumes all data is defined as containerproperties and _props lists all property names.'''
+    ''' Base class that assumes all data is defined as containerproperties and _props lists all property names.
+    Classes that are instantiated in high numbers (e.g. metric values) declare __slots__ for the instance variables
+    of their properties (see _slotNames), all other classes use a __dict__.'''
+    __slots__ = ()
 
     def asEtreeNode(self, qname, nsmap):
         node = etree_.Element(qname, nsmap=nsmap)
@@ -28,16 +63,20 @@ class PropertyBasedPMType(object):
 
 
     def _updateNode(self, node):
-        for prop_name, prop in self._sortedContainerProperties():
+        for prop_name, prop, writer in self._getCodec().namedWriters:
             try:
-                prop.updateXMLValue(self, node)
+                writer(self, node)
             except Exception as ex:
                 raise RuntimeError('In {}.{}, {} could not update: {}'.format(self.__class__.__name__, prop_name, str(prop), traceback.format_exc()))
 
 
     def updateFromNode(self, node):
-        for dummy, prop in self._sortedContainerProperties():
-            prop.updateFromNode(self, node)
+        self._getCodec().updateFromNode(self, node)
+
+
+    def _getCodec(self):
+        ''' @return: the compiled ContainerCodec of this class'''
+        return getCodec(self)
 
 
     def _sortedContainerProperties(self):
@@ -62,7 +101,7 @@ class PropertyBasedPMType(object):
     def __eq__(self, other):
         """ compares all properties"""
         try:
-            for name, dummy in self._sortedContainerProperties():
+            for name, dummy in self._getCodec().properties:
                 my_value = getattr(self, name)
                 other_value = getattr(other, name)
                 if my_value == other_value:
@@ -78,6 +117,38 @@ class PropertyBasedPMType(object):
     def __ne__(self, other):
         return not self == other
 
+    def __copy__(self):
+        ''' a new instance that shares all values with self'''
+        return self._copy(False)
+
+    def __deepcopy__(self, memo):
+        ''' Copies the values of the container properties with containerproperties.copyValue.
+        Other instance variables (e.g. the node that an instance was created from, the nsmapper) are not modified
+        and are shared with the copy.'''
+        return self._copy(True)
+
+    def _copy(self, copyValues):
+        cls = self.__class__
+        copied = cls.__new__(cls)
+        copyValue = cp.copyValue
+        immutableTypes = cp.IMMUTABLE_TYPES
+        for name, isPropertyValue in _getInstanceSlots(self):
+            try:
+                value = getattr(self, name)
+            except AttributeError: # slot is not set
+                continue
+            if copyValues and isPropertyValue and not isinstance(value, immutableTypes):
+                value = copyValue(value)
+            setattr(copied, name, value)
+        instanceData = getattr(self, '__dict__', None)
+        if instanceData:
+            if copyValues:
+                propertyVarNames = self._getCodec().propertyVarNames
+                instanceData = {name: copyValue(value) if name in propertyVarNames else value
+                                for name, value in instanceData.items()}
+            copied.__dict__.update(instanceData)
+        return copied
+
     @classmethod
     def fromNode(cls, node):
         ''' default fromNode Constructor that provides no arguments for class __init__'''
@@ -146,9 +217,11 @@ class NotCompareableVersionError(Exception):
     pass
 
 _CodingBase = namedtuple('_CodingBase', 'code codingSystem codingSystemVersion')
+_internedCodings = {}
+
 class Coding(_CodingBase):
     ''' Immutable representation of a coding. Can be used as key in dictionaries'''
-
+    __slots__ = ()
 
     def __new__(cls, code, codingSystem=DefaultCodingSystem, codingSystemVersion=None):
         return super(Coding, cls).__new__(cls,
@@ -156,6 +229,12 @@ class Coding(_CodingBase):
                                           codingSystem,
                                           codingSystemVersion)
 
+    @classmethod
+    def interned(cls, code, codingSystem=DefaultCodingSystem, codingSystemVersion=None):
+        ''' Same as constructor, but equal codings share one instance.'''
+        coding = cls(code, codingSystem, codingSystemVersion)
+        return _intern(_internedCodings, coding, coding)
+
     def equals(self, other, raiseNotComparableException=False):
         ''' different compare method to __eq__, overwriting this one makes Coding unhashable!
          other can be an int, a string, or a Coding.
@@ -198,7 +277,7 @@ class Coding(_CodingBase):
         code = node.get('Code')
         codingSystem = node.get('CodingSystem', DefaultCodingSystem)
         codingSystemVersion = node.get('CodingSystemVersion')
-        return cls(code, codingSystem, codingSystemVersion)
+        return cls.interned(code, codingSystem, codingSystemVersion)
 
 
 def mkCoding(code, codingSystem=DefaultCodingSystem, codingSystemVersion=None):
@@ -216,6 +295,7 @@ class T_Translation(PropertyBasedPMType):
     CodingSystemVersion = cp.NodeAttributeProperty('CodingSystemVersion')
 
     _props = ['ext_Extension', 'Code', 'CodingSystem', 'CodingSystemVersion']
+    __slots__ = _slotNames(ext_Extension, Code, CodingSystem, CodingSystemVersion) + ('coding',)
 
     def __init__(self, code=None, codingsystem=None, codingSystemVersion=None):
         '''
@@ -240,7 +320,7 @@ class T_Translation(PropertyBasedPMType):
 
     def mkCoding(self):
         if self.Code is not None:
-            self.coding = Coding(self.Code, self.CodingSystem, self.CodingSystemVersion)
+            self.coding = Coding.interned(self.Code, self.CodingSystem, self.CodingSystemVersion)
         else:
             self.coding = None
 
@@ -270,6 +350,8 @@ class _CodedValueBase(PropertyBasedPMType):
     Type = cp.XsiTypeAttributeProperty(namespaces.QN_TYPE)
     _props = ['ext_Extension', 'CodingSystemName', 'ConceptDescription',
               'Code', 'CodingSystem', 'CodingSystemVersion', 'SymbolicCodeName', 'Type']
+    __slots__ = _slotNames(ext_Extension, CodingSystemName, ConceptDescription, Code, CodingSystem,
+                           CodingSystemVersion, SymbolicCodeName, Type) + ('coding',)
     # aliases for backward compatibility
     codingSystemNames = CodingSystemName
     conceptDescriptions = ConceptDescription
@@ -299,7 +381,7 @@ class _CodedValueBase(PropertyBasedPMType):
 
     def mkCoding(self):
         if self.Code is not None:
-            self.coding = Coding(self.Code, self.CodingSystem, self.CodingSystemVersion)
+            self.coding = Coding.interned(self.Code, self.CodingSystem, self.CodingSystemVersion)
         else:
             self.coding = None
 
@@ -323,6 +405,7 @@ class _CodedValueBase(PropertyBasedPMType):
 class CodedWithTranslations(_CodedValueBase):
     Translation = cp.SubElementListProperty([namespaces.domTag('Translation')], cls = _CodedValueBase)
     _props = ['Translation']
+    __slots__ = _slotNames(Translation)
 
     def __eq__(self, other):
         ''' other can be an int, a string, a CodedValue like object (has "coding" member) or a Coding'''
@@ -336,6 +419,7 @@ class CodedWithTranslations(_CodedValueBase):
 class CodedValue(_CodedValueBase):
     Translation = cp.SubElementListProperty([namespaces.domTag('Translation')], cls = T_Translation)
     _props = ['Translation']
+    __slots__ = _slotNames(Translation)
 
     def __eq__(self, other):
         ''' This operator handles not comparable versions as different versions
@@ -399,7 +483,8 @@ class Annotation(PropertyBasedPMType):
     ext_Extension = cp.ExtensionNodeProperty()
     Type = cp.SubElementProperty([namespaces.domTag('Type')], valueClass=CodedValue)
     _props = ['ext_Extension', 'Type']
-    
+    __slots__ = _slotNames(ext_Extension, Type) + ('coding',)
+
     codedValue = Type
     ''' An Annotation contains a Type Element that is a CodedValue.
     This is intended as an immutable object. After it has been created, no modification shall be done. '''
@@ -410,6 +495,7 @@ class Annotation(PropertyBasedPMType):
  
     @classmethod
     def fromNode(cls, node):
+        # annotations are not shared, the Type is a mutable CodedValue. Only the coding is interned.
         typeNode = node.find(namespaces.domTag('Type'))
         codedValue = CodedValue.fromNode(typeNode)
         return cls(codedValue)
@@ -451,6 +537,7 @@ class InstanceIdentifier(PropertyBasedPMType):
     Root = cp.NodeAttributeProperty('Root', defaultPyValue='biceps.uri.unk') # xsd:anyURI string, default is defined in R0135
     Extension = cp.NodeAttributeProperty('Extension') # a xsd:string
     _props=('ext_Extension', 'Type', 'IdentifierName', 'Root', 'Extension')
+    __slots__ = _slotNames(ext_Extension, Type, IdentifierName, Root, Extension) + ('node',)
 
     def __init__(self, root, type_codedValue=None, identifierNames=None, extensionString=None):
         '''
@@ -585,6 +672,8 @@ class AbstractMetricValue(PropertyBasedPMType):
     Qi = cp.DecimalAttributeProperty('Qi', [namespaces.domTag('MetricQuality')], impliedPyValue=1) # pm:QualityIndicator
     Annotation = cp.SubElementListProperty([namespaces.domTag('Annotation')], Annotation)
     _props = ('ext_Extension', 'StartTime', 'StopTime', 'DeterminationTime', 'MQ_Extension', 'Validity', 'Mode', 'Qi', 'Annotation')
+    __slots__ = _slotNames(ext_Extension, StartTime, StopTime, DeterminationTime, MQ_Extension, Validity, Mode, Qi,
+                           Annotation) + ('_nsmapper', 'node')
     
     Annotations = Annotation
     def __init__(self, nsmapper, node=None):
@@ -598,8 +687,7 @@ class AbstractMetricValue(PropertyBasedPMType):
 
 
     def updateFromNode(self, node):
-        for dummy, prop in self._sortedContainerProperties():
-            prop.updateFromNode(self, node)
+        self._getCodec().updateFromNode(self, node)
         self.node = node    
 
 
@@ -620,6 +708,7 @@ class NumericMetricValue(AbstractMetricValue):
     QType = namespaces.domTag('NumericMetricValue')
     Value = cp.DecimalAttributeProperty('Value') # an integer or float
     _props = ('Value',)    
+    __slots__ = _slotNames(Value)
 
 
     def __repr__(self):
@@ -631,7 +720,7 @@ class NumericMetricValue(AbstractMetricValue):
     def __eq__(self, other):
         ''' compares all properties, special handling of Value member'''
         try:
-            for name, dummy in self._sortedContainerProperties():
+            for name, dummy in self._getCodec().properties:
                 if name == 'Value':
                     # check if more than 0.01 off
                     my_value = getattr(self, name)
@@ -663,6 +752,7 @@ class StringMetricValue(AbstractMetricValue):
     QType = namespaces.domTag('StringMetricValue')
     Value = cp.NodeAttributeProperty('Value') # a string
     _props = ('Value',)    
+    __slots__ = _slotNames(Value)
     
 
     def __repr__(self):
@@ -677,6 +767,7 @@ class ApplyAnnotation(PropertyBasedPMType):
     AnnotationIndex = cp.IntegerAttributeProperty('AnnotationIndex')
     SampleIndex = cp.IntegerAttributeProperty('SampleIndex')
     _props = ['AnnotationIndex', 'SampleIndex']
+    __slots__ = _slotNames(AnnotationIndex, SampleIndex)
 
     def __init__(self, annotationIndex, sampleIndex):
         self.AnnotationIndex = annotationIndex
@@ -699,6 +790,7 @@ class SampleArrayValue(AbstractMetricValue):
     Samples = cp.DecimalListAttributeProperty('Samples') # list of xs:decimal types 
     ApplyAnnotations = cp.SubElementListProperty([namespaces.domTag('ApplyAnnotation')], ApplyAnnotation)
     _props = ('Samples', 'ApplyAnnotations')    
+    __slots__ = _slotNames(Samples, ApplyAnnotations)
 
 
     def __repr__(self):
@@ -708,7 +800,7 @@ class SampleArrayValue(AbstractMetricValue):
     def __eq__(self, other):
         ''' compares all properties, special handling of Value member'''
         try:
-            for name, dummy in self._sortedContainerProperties():
+            for name, dummy in self._getCodec().properties:
                 if name == 'Samples':
                     ownsample = getattr(self, name)
                     othersample = getattr(other, name)
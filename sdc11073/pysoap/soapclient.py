@@ -50,6 +50,13 @@ class HTTPReturnCodeError(httplib.HTTPException):
 
 
 
+def _recorded(blocks, received):
+    ''' passes blocks through and appends them to received'''
+    for block in blocks:
+        received.append(block)
+        yield block
+
+
 class SoapClient(CompressionHandler):
     _usedSoapClients = 0
     SOCKET_TIMEOUT = 10 if sys.gettrace() is None else 1000 # higher timeout for debugging
@@ -57,7 +64,7 @@ class SoapClient(CompressionHandler):
     """SOAP Client"""
     roundtrip_time = observableproperties.ObservableProperty()
     def __init__(self, netloc, logger, sslContext, sdc_definitions, supportedEncodings=None,
-                 requestEncodings=None, chunked_requests=False):
+                 requestEncodings=None, chunked_requests=False, stream_responses=False, compressionPolicy=None):
         ''' Connects to one url
         @param netloc: the location of the service (domainname:port) ###url of the service
         @param sslContext: an optional sll.SSLContext instance
@@ -68,6 +75,12 @@ class SoapClient(CompressionHandler):
         @param requestEncodings: an optional list of encodings that the other side accepts. It is used to compress requests.
                                 If not set, requests will not be commpressed.
                                 If set, then the http request will be compressed using this method
+        @param stream_responses: if True, responses of postSoapEnvelopeTo (without responseFactory) are parsed while
+                                they are received, the complete body is never kept in memory.
+                                The received envelopes have no rawdata.
+        @param compressionPolicy: an optional compression.CompressionPolicy that decides per request if and how it is
+                                compressed (instead of always using the first of requestEncodings).
+                                The roundtrip times of this client are passed to it.
         '''
         self._log = logger
         self._sslContext = sslContext
@@ -83,6 +96,8 @@ class SoapClient(CompressionHandler):
         self._lock = Lock()
 
         self._chunked_requests = chunked_requests
+        self._stream_responses = stream_responses
+        self.compressionPolicy = compressionPolicy
 
     @property
     def netloc(self):
@@ -122,20 +137,45 @@ class SoapClient(CompressionHandler):
     
     
     def postSoapEnvelopeTo(self, path, soapEnvelopeRequest, responseFactory=None, schema=None, msg='',
-                           request_manipulator=None):
+                           request_manipulator=None, compressionPolicy=None):
         '''
         @param path: url path component
         @param soapEnvelopeRequest: The soap envelope that shall be sent
         @param responseFactory: a callable that creates a response object from received xml. If None, a ReceivedSoap12Envelope will be created
         @param schema: If given, the request is validated against this schema
         @param msg: used in logs, helps to identify the context in which the method was called
+        @param compressionPolicy: if given, it is used for this request instead of self.compressionPolicy
         '''
         if self.isClosed():
             self.connect()
-        return self.__postSoapEnvelope(soapEnvelopeRequest, responseFactory, schema, path, msg, request_manipulator)
+        return self.__postSoapEnvelope(soapEnvelopeRequest, responseFactory, schema, path, msg, request_manipulator,
+                                       compressionPolicy)
 
         
-    def __postSoapEnvelope(self, soapEnvelopeRequest, responseFactory, schema, path, msg, request_manipulator):
+    def postPreparedMessageTo(self, path, message, msg='', compressionPolicy=None):
+        '''Sends a message that is already serialized and denormalized.
+        @param path: url path component
+        @param message: an object with methods as_xml() and compress(algorithm), both return bytes
+        @param msg: used in logs, helps to identify the context in which the method was called
+        @param compressionPolicy: if given, it is used for this request instead of self.compressionPolicy
+        @return: the received content (bytes)
+        '''
+        if self.isClosed():
+            self.connect()
+        started = time.perf_counter()
+        try:
+            return self._sendSoapRequest(path, message.as_xml(), msg, compressFunc=message.compress,
+                                         compressionPolicy=compressionPolicy)
+        finally:
+            self._setRoundtripTime(started) # set roundtrip time even if method raises an exception
+
+    def _setRoundtripTime(self, started):
+        self.roundtrip_time = time.perf_counter() - started
+        if self.compressionPolicy is not None:
+            self.compressionPolicy.addRoundtripTime(self.roundtrip_time)
+
+    def __postSoapEnvelope(self, soapEnvelopeRequest, responseFactory, schema, path, msg, request_manipulator,
+                           compressionPolicy):
         if schema is not None:
             soapEnvelopeRequest.validateBody(schema)
         if hasattr(request_manipulator, 'manipulate_soapenvelope'):
@@ -151,11 +191,20 @@ class SoapClient(CompressionHandler):
             if tmp:
                 xml_request = tmp
 
+        action = getattr(soapEnvelopeRequest.address, 'action', None)
         started = time.perf_counter()
+        if self._stream_responses and responseFactory is None:
+            try:
+                return self._sendSoapRequest(path, xml_request, msg, action=action,
+                                             responseParser=lambda blocks: self._parseResponseBlocks(blocks, schema, msg),
+                                             compressionPolicy=compressionPolicy)
+            finally:
+                self._setRoundtripTime(started)
         try:
-            xml_response = self._sendSoapRequest(path, xml_request, msg)
+            xml_response = self._sendSoapRequest(path, xml_request, msg, action=action,
+                                                 compressionPolicy=compressionPolicy)
         finally:
-            self.roundtrip_time = time.perf_counter() - started # set roundtrip time even if method raises an exception
+            self._setRoundtripTime(started) # set roundtrip time even if method raises an exception
         normalized_xml_response = self._sdc_definitions.normalizeXMLText(xml_response)
         my_responseFactory = responseFactory or soapenvelope.ReceivedSoap12Envelope.fromXMLString
         try:
@@ -164,9 +213,41 @@ class SoapClient(CompressionHandler):
             self._log.error('{} XMLSyntaxError in string: "{}"', msg, normalized_xml_response)
             raise RuntimeError('{} in "{}"'.format(ex, normalized_xml_response))
 
-
-    def _sendSoapRequest(self, path, xml, msg):
-        """Send SOAP request using HTTP"""
+    def _parseResponseBlocks(self, blocks, schema, msg):
+        try:
+            return soapenvelope.ReceivedSoap12Envelope.fromXMLBlocks(self._sdc_definitions.normalizeXMLBlocks(blocks),
+                                                                    schema)
+        except XMLSyntaxError as ex:
+            self._log.error('{} XMLSyntaxError in streamed response: {}', msg, ex)
+            raise RuntimeError('{} in streamed response'.format(ex))
+
+    def _readStreamedResponse(self, response, responseParser, msg):
+        ''' passes the decompressed blocks of the response body to responseParser while they are received.'''
+        blocks = HTTPReader.iter_response_body(response)
+        received = None
+        if not isinstance(commlog.defaultLogger, commlog.NullLogger):
+            received = []
+            blocks = _recorded(blocks, received)
+        try:
+            return responseParser(blocks)
+        finally:
+            if not response.isclosed():
+                response.read() # connection can only be reused if the response was read completely
+            self._log.debug('{}: response:{}; content was streamed', msg,
+                            {k.lower(): v for k, v in response.getheaders()})
+            if received is not None:
+                commlog.defaultLogger.logSoapRespIn(b''.join(received), 'POST')
+
+    def _sendSoapRequest(self, path, xml, msg, compressFunc=None, responseParser=None, action=None,
+                         compressionPolicy=None):
+        """Send SOAP request using HTTP
+        @param compressFunc: optional callable(algorithm) that returns the compressed xml, default is compressPayload
+        @param compressionPolicy: optional compression.CompressionPolicy, default is self.compressionPolicy
+        @param action: action of the request, determines the compression level of compressPayload
+        @param responseParser: optional callable(blocks) that consumes an iterator of the received body blocks.
+                               If given, the body of a successful response is not read completely,
+                               the result of responseParser is returned instead of the content.
+        """
         if not isinstance(xml, bytes):
             xml = xml.encode('utf-8')
 
@@ -179,10 +260,20 @@ class SoapClient(CompressionHandler):
 
         if self.supportedEncodings:
             headers['Accept-Encoding'] = ','.join(self.supportedEncodings)
-        if self.requestEncodings:
+        if compressFunc is None:
+            payload = xml
+            compressFunc = lambda compr: self.compressPayload(compr, payload, action)
+        if compressionPolicy is None:
+            compressionPolicy = self.compressionPolicy
+        if compressionPolicy is not None:
+            xml, compr = compressionPolicy.compress(
+                xml, [c for c in self.requestEncodings if c in self.supportedEncodings], compressFunc)
+            if compr is not None:
+                headers['Content-Encoding'] = compr
+        elif self.requestEncodings:
             for compr in self.requestEncodings:
                 if compr in self.supportedEncodings:
-                    xml = self.compressPayload(compr, xml)
+                    xml = compressFunc(compr)
                     headers['Content-Encoding'] = compr
                     break
         if self._chunked_requests:
@@ -277,6 +368,8 @@ class SoapClient(CompressionHandler):
             if _retry_send != -1:
                 raise httplib.NotConnected()
 
+            if responseParser is not None and response.status < 300:
+                return self._readStreamedResponse(response, responseParser, msg)
             content = HTTPReader.read_response_body(response)
 
             if response.status >= 300:
@@ -1,11 +1,14 @@
 import uuid
 import copy
+import threading
+import zlib
 from io import BytesIO
 from lxml import etree as etree_
 
 from sdc11073.namespaces import wsaTag, wseTag, dpwsTag, s12Tag, xmlTag, nsmap, WSA_ANONYMOUS, docNameFromQName
 from sdc11073.namespaces import Prefix_Namespace as Prefix
 from .. import isoduration
+from ..compression import CompressionHandler, GZIP
 
 CHECK_NAMESPACES = False   # can be used to enable additional checks for too many namespaces or undefined namespaces
 
@@ -519,7 +522,8 @@ class Soap12EnvelopeBase(object):
     def bodyNode(self):
         return self._bodyNode
 
-    def _assert_valid_exception_wrapper(self, schema, content):
+    @staticmethod
+    def _assert_valid_exception_wrapper(schema, content):
         try:
             schema.assertValid(content)
         except etree_.DocumentInvalid:
@@ -602,6 +606,13 @@ class Soap12Envelope(Soap12EnvelopeBase):
         doc.write(tmp, encoding='UTF-8', xml_declaration=True, pretty_print=pretty)
         return tmp.getvalue()
 
+    def writeXml(self, output):
+        ''' Same result as as_xml, but the envelope is serialized incrementally to output.
+        @param output: a file-like object, it gets the xml text in parts of a few kilobytes.'''
+        with etree_.xmlfile(output, encoding='UTF-8') as xf:
+            xf.write_declaration()
+            xf.write(self.buildDoc())
+
     def validateBody(self, schema):
         root = self.buildDoc()
         doc = etree_.ElementTree(element=root)
@@ -638,6 +649,114 @@ class Soap12Envelope(Soap12EnvelopeBase):
             raise RuntimeError('undefined namespaces:{}'.format(xml_doc))
 
 
+class PreparedSoapBody(object):
+    ''' A soap body that is validated, serialized and gzip compressed only once, but sent in many envelopes.
+    Only the header is rendered per message and spliced in front of the serialized body, see mkEnvelope.'''
+
+    def __init__(self, bodyPart, doc_nsmap, sdc_definitions):
+        '''
+        @param bodyPart: denormalized xml text from the start of the s12:Body element to the end of the envelope
+        @param doc_nsmap: namespaces of the envelope
+        '''
+        self.bodyPart = bodyPart
+        self.doc_nsmap = doc_nsmap
+        self._sdc_definitions = sdc_definitions
+        self._lock = threading.Lock()
+        self._gzipSegments = {} # key is compression level
+        s12_prefix = [prefix for prefix, ns in doc_nsmap.items() if ns == Prefix.S12.namespace][0]
+        self._bodyTag = '<{}:Body'.format(s12_prefix).encode('utf-8')
+
+    @classmethod
+    def fromNode(cls, bodyNode, doc_nsmap, sdc_definitions, schema=None):
+        '''
+        @param bodyNode: content of the body, an etree node
+        @param schema: if not None, body is validated against this schema. Raises etree_.DocumentInvalid.
+        '''
+        soapEnvelope = Soap12Envelope(doc_nsmap)
+        soapEnvelope.addBodyElement(bodyNode)
+        soapEnvelope.validateBody(schema)
+        xml = sdc_definitions.denormalizeXMLText(soapEnvelope.as_xml())
+        s12_prefix = soapEnvelope.buildDoc().prefix
+        return cls(xml[xml.index('<{}:Body'.format(s12_prefix).encode('utf-8')):], doc_nsmap, sdc_definitions)
+
+    @classmethod
+    def fromText(cls, bodyContent, doc_nsmap, sdc_definitions, schema=None):
+        '''
+        @param bodyContent: serialized content of the body (normalized namespaces, no xml declaration)
+        @param schema: if not None, body is validated against this schema. Raises etree_.DocumentInvalid.
+        '''
+        if schema is not None:
+            Soap12EnvelopeBase._assert_valid_exception_wrapper(schema, etree_.fromstring(bodyContent)) #pylint:disable=protected-access
+        s12_prefix = [prefix for prefix, ns in doc_nsmap.items() if ns == Prefix.S12.namespace][0]
+        bodyPart = b''.join(('<{}:Body>'.format(s12_prefix).encode('utf-8'),
+                             sdc_definitions.denormalizeXMLText(bodyContent),
+                             '</{0}:Body></{0}:Envelope>'.format(s12_prefix).encode('utf-8')))
+        return cls(bodyPart, doc_nsmap, sdc_definitions)
+
+    def mkHeaderPart(self, address, headerNodes=None):
+        '''
+        @param address: a WsAddress instance
+        @param headerNodes: optional list of additional header elements
+        @return: serialized beginning of envelope including the complete s12:Header
+        '''
+        soapEnvelope = Soap12Envelope(self.doc_nsmap)
+        soapEnvelope.addHeaderObject(address)
+        for headerNode in headerNodes or []:
+            soapEnvelope.addHeaderElement(headerNode)
+        xml = self._sdc_definitions.denormalizeXMLText(soapEnvelope.as_xml())
+        return xml[:xml.rindex(self._bodyTag)]
+
+    def mkEnvelope(self, address, headerNodes=None):
+        return SplicedSoapEnvelope(self.mkHeaderPart(address, headerNodes), self, address.action)
+
+    def gzipSegment(self, level=zlib.Z_DEFAULT_COMPRESSION):
+        with self._lock:
+            segment = self._gzipSegments.get(level)
+            if segment is None:
+                segment = self._gzipSegments[level] = CompressionHandler.gzipSegment(self.bodyPart, level)
+            return segment
+
+
+class SplicedSoapEnvelope(object):
+    ''' A serialized envelope that consists of a header part and a PreparedSoapBody.
+    It is already denormalized, as_xml returns the bytes that are sent.'''
+    def __init__(self, headerPart, preparedBody, action=None):
+        '''
+        @param action: the action of the header, determines the compression level
+        '''
+        self._headerPart = headerPart
+        self._preparedBody = preparedBody
+        self.action = action
+
+    def as_xml(self, pretty=False): #pylint:disable=unused-argument
+        return self._headerPart + self._preparedBody.bodyPart
+
+    def iterXml(self):
+        ''' Same result as as_xml, but the parts are not joined.'''
+        yield self._headerPart
+        yield self._preparedBody.bodyPart
+
+    def compress(self, algorithm):
+        if algorithm == GZIP:
+            return b''.join(self.iterCompressed(algorithm))
+        return CompressionHandler.compressPayload(algorithm, self.as_xml(), self.action)
+
+    def iterCompressed(self, algorithm):
+        ''' Same result as compress, but the parts are not joined. The compressed body is re-used.
+        @return: an iterator of bytes, or None if there is no prepared compressed body for algorithm.'''
+        if algorithm == GZIP:
+            level = CompressionHandler.getCompressionLevel(GZIP, self.action)
+            return CompressionHandler.iterGzipSegments([CompressionHandler.gzipSegment(self._headerPart, level),
+                                                        self._preparedBody.gzipSegment(level)])
+        return None
+
+    def validateBody(self, schema):
+        if schema is None:
+            return
+        xml = self._preparedBody._sdc_definitions.normalizeXMLText(self.as_xml()) #pylint:disable=protected-access
+        ReceivedSoap12Envelope.fromXMLString(xml).validateBody(schema)
+
+
 class ReceivedSoap12Envelope(Soap12EnvelopeBase):
     __slots__ = ('msgNode', 'rawdata', 'address')
     def __init__(self, doc=None, rawdata=None):
@@ -682,6 +801,20 @@ class ReceivedSoap12Envelope(Soap12EnvelopeBase):
             schema.assertValid(msgNode)
         return cls(doc=doc, rawdata=xmlString)
 
+    @classmethod
+    def fromXMLBlocks(cls, blocks, schema=None):
+        ''' parses xml text that is received in parts, the document is built while data is arriving.
+        The envelope has no rawdata.
+        @param blocks: iterable of bytes'''
+        parser = etree_.ETCompatXMLParser()
+        for block in blocks:
+            parser.feed(block)
+        doc = parser.close()
+        if schema is not None:
+            msgNode = doc.find('s12:Body', nsmap)[0]
+            schema.assertValid(msgNode)
+        return cls(doc=doc)
+
 
 
 class AddressedSoap12Envelope(ReceivedSoap12Envelope):
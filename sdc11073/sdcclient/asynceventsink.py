@@ -0,0 +1,129 @@
+''' A shared event sink for many SdcClients.
+NotificationsReceiverDispatcherThread opens one http server (and one thread per connection) per SdcClient.
+AsyncioNotificationsReceiver serves the notifications of any number of SdcClients on one port in one asyncio event loop.
+Every client gets an own path; notifications are parsed in a bounded thread pool and
+handed to an ordered queue per client, the registered functions of a client are called sequentially.
+Usage:
+    sink = AsyncioNotificationsReceiver(my_ipaddress='0.0.0.0', sslContext=None, supportedEncodings=['gzip'])
+    sink.start()
+    sink.started_evt.wait(timeout=5)
+    for client in clients:
+        client.startAll(shared_event_sink=sink)
+'''
+import asyncio
+import traceback
+import uuid
+from .subscription import SOAPNotificationsDispatcher, _DispatchError
+from .. import commlog
+from .. import loghelper
+from ..httprequesthandler import AsyncioHttpServerBase, AsyncHttpResponse
+
+_SOAP_CONTENT_TYPE = 'application/soap+xml; charset=utf-8'
+
+
+class EventSinkRegistration(object):
+    ''' The part of a shared AsyncioNotificationsReceiver that belongs to one SdcClient.
+    It has the same interface that SdcClient uses of NotificationsReceiverDispatcherThread.'''
+    def __init__(self, sink, path, dispatcher, base_url):
+        self._sink = sink
+        self.path = path
+        self.dispatcher = dispatcher
+        self.base_url = base_url
+        self.queue = None  # asyncio.Queue, created in event loop
+        self.task = None  # worker task of the queue
+
+    def stop(self, closeAllConnections=True): #pylint: disable=unused-argument
+        ''' unregisters from the sink, further notifications for this path are answered with 404.
+        The shared server itself is not stopped.'''
+        self._sink.unregister(self.path)
+
+
+class AsyncioNotificationsReceiver(AsyncioHttpServerBase):
+
+    def __init__(self, my_ipaddress, sslContext, supportedEncodings, log_prefix=None, max_workers=8,
+                 queue_size=1000):
+        '''
+        :param my_ipaddress: http server will listen on this address
+        :param sslContext: http server uses this ssl context
+        :param supportedEncodings: a list of strings
+        :param max_workers: number of threads that parse notifications and call the registered functions
+        :param queue_size: max. number of parsed notifications per client that wait for processing.
+                If the queue of a client is full, the http response to the sending device is delayed.
+        '''
+        super(AsyncioNotificationsReceiver, self).__init__('Cl_AsyncNotificationsReceiver', my_ipaddress, sslContext,
+                                                           supportedEncodings,
+                                                           loghelper.getLoggerAdapter('sdc.client.notif_dispatch',
+                                                                                      log_prefix),
+                                                           max_workers)
+        self.base_url = None
+        self._queueSize = queue_size
+        self._registrations = {}  # lookup by path
+
+    def _onStarted(self):
+        scheme = 'https' if self._sslContext else 'http'
+        self.base_url = '{}://{}:{}/'.format(scheme, self._my_ipaddress, self.my_port)
+        self._logger.info('starting shared Notification receiver on {}:{}', self._my_ipaddress, self.my_port)
+
+    def register(self, log_prefix, sdc_definitions):
+        ''' creates a dispatcher with an own path and queue.
+        :param log_prefix: used for logging
+        :param sdc_definitions: namespaces etc
+        :return: EventSinkRegistration
+        '''
+        path = uuid.uuid4().hex
+        registration = EventSinkRegistration(self, path, SOAPNotificationsDispatcher(log_prefix, sdc_definitions),
+                                             '{}{}/'.format(self.base_url, path))
+        asyncio.run_coroutine_threadsafe(self._addRegistration(registration), self._loop).result(timeout=5)
+        return registration
+
+    def unregister(self, path):
+        if self._stopped:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._removeRegistration(path), self._loop)
+        future.result(timeout=5)
+
+    async def _addRegistration(self, registration):
+        registration.queue = asyncio.Queue(self._queueSize)
+        registration.task = self._loop.create_task(self._processQueue(registration))
+        self._registrations[registration.path] = registration
+
+    async def _removeRegistration(self, path):
+        registration = self._registrations.pop(path, None)
+        if registration is not None:
+            registration.task.cancel()
+
+    async def _processQueue(self, registration):
+        while True:
+            fn, request, action = await registration.queue.get()
+            try:
+                await self._runInExecutor(fn, request)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._logger.error('method {} for action "{}" failed:{}',
+                                   getattr(fn, '__name__', fn), action, traceback.format_exc())
+
+    async def _handleRequest(self, method, path, headers, body):
+        if method != 'POST':
+            return await super(AsyncioNotificationsReceiver, self)._handleRequest(method, path, headers, body)
+        registration = self._registrations.get(path.strip('/').split('/')[0])
+        if registration is None or not self._acceptRequests:
+            self._logger.warn('received a POST request for unknown path {} => returning 404 ', path)
+            return AsyncHttpResponse(404, 'Not Found', b'', _SOAP_CONTENT_TYPE, close=not self._acceptRequests)
+        try:
+            handler = await self._runInExecutor(self._parse, registration.dispatcher, path, headers, body)
+        except _DispatchError as ex:
+            self._logger.error('received a POST request, but got _DispatchError => returning {}', ex.httpErrorcode)
+            return AsyncHttpResponse(ex.httpErrorcode, ex.errorText, b'', _SOAP_CONTENT_TYPE)
+        except Exception as ex:
+            self._logger.error('received a POST request, but got Exception "{}"=> returning {}\n{}',
+                               ex, 500, traceback.format_exc())
+            return AsyncHttpResponse(500, 'server error in dispatch', b'', _SOAP_CONTENT_TYPE)
+        await registration.queue.put(handler)
+        return AsyncHttpResponse(202, 'Accepted', b'', _SOAP_CONTENT_TYPE)
+
+    def _parse(self, dispatcher, path, headers, body):
+        ''' runs in executor'''
+        request_bytes = self._decompressRequest(headers, body)
+        commlog.defaultLogger.logSoapSubscrMsgIn(request_bytes)
+        return dispatcher.getHandler(path, request_bytes)
@@ -0,0 +1,184 @@
+''' Resources that many SdcClients can share.
+Without a runtime every SdcClient has its own subscription renewal thread, notification server and http connections.
+With a ClientRuntime the number of threads does not depend on the number of clients:
+    runtime = ClientRuntime(my_ipaddress='0.0.0.0')
+    runtime.start()
+    for xAddr in device_xaddrs:
+        client = SdcClient(xAddr, deviceType=None, runtime=runtime)
+        client.startAll()
+    ...
+    runtime.stop()
+'''
+import heapq
+import itertools
+import threading
+import time
+import traceback
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from .asynceventsink import AsyncioNotificationsReceiver
+from .. import compression
+from .. import loghelper
+from ..pysoap.soapclient import SoapClient
+
+
+class _ScheduledJob(object):
+    def __init__(self, job, interval):
+        self.job = job
+        self.interval = interval
+        self.cancelled = False
+
+
+class RenewalScheduler(threading.Thread):
+    ''' Calls checkSubscriptions() of registered SubscriptionManagers periodically.
+    One thread waits for the next due time in a heap, the checks are done in a bounded thread pool.
+    A job is re-scheduled when its check is finished, so checks of one job never overlap.
+    '''
+    def __init__(self, max_workers=4, log_prefix=None):
+        super(RenewalScheduler, self).__init__(name='Cl_RenewalScheduler')
+        self.daemon = True
+        self._logger = loghelper.getLoggerAdapter('sdc.client.subscrMgr', log_prefix)
+        self._heap = []  # entries: [due time, sequence number, _ScheduledJob]
+        self._jobs = {}  # lookup id(job) => _ScheduledJob
+        self._cond = threading.Condition()
+        self._sequence = itertools.count()  # tie breaker for equal due times
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='Cl_RenewalWorker')
+        self._run = False
+
+    def register(self, job, interval):
+        '''
+        @param job: an object with a checkSubscriptions method
+        @param interval: seconds between end of a check and begin of the next one
+        '''
+        with self._cond:
+            scheduled = _ScheduledJob(job, interval)
+            self._jobs[id(job)] = scheduled
+            self._push(scheduled)
+
+    def unregister(self, job):
+        with self._cond:
+            scheduled = self._jobs.pop(id(job), None)
+            if scheduled is not None:
+                scheduled.cancelled = True  # heap entry is dropped when it becomes due
+
+    @property
+    def jobsCount(self):
+        return len(self._jobs)
+
+    def stop(self):
+        with self._cond:
+            self._run = False
+            self._cond.notify()
+        self.join(timeout=2)
+        self._executor.shutdown(wait=False)
+
+    def run(self):
+        self._run = True
+        while True:
+            with self._cond:
+                if not self._run:
+                    return
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due_time, _, scheduled = self._heap[0]
+                if scheduled.cancelled:
+                    heapq.heappop(self._heap)
+                    continue
+                delay = due_time - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+            self._executor.submit(self._runJob, scheduled)
+
+    def _push(self, scheduled):
+        heapq.heappush(self._heap, [time.monotonic() + scheduled.interval, next(self._sequence), scheduled])
+        self._cond.notify()
+
+    def _runJob(self, scheduled):
+        try:
+            scheduled.job.checkSubscriptions()
+        except Exception:
+            self._logger.error('##### check loop: {}', traceback.format_exc())
+        finally:
+            with self._cond:
+                if not scheduled.cancelled:
+                    self._push(scheduled)
+
+
+class SoapClientPool(object):
+    ''' Keep-alive http connections, shared by all clients that talk to the same netloc with the same settings.
+    Connections are reference counted, release closes a connection that is no longer used.'''
+    def __init__(self, log_prefix=None):
+        self._logger = loghelper.getLoggerAdapter('sdc.client.soap', log_prefix)
+        self._soapClients = {}  # lookup key => [SoapClient, reference count]
+        self._lock = threading.Lock()
+
+    def getSoapClient(self, address, sslContext, sdc_definitions, supportedEncodings, chunked_requests=False,
+                      stream_responses=False):
+        ''' returns a SoapClient for the netloc of address, reference count is incremented.'''
+        _url = urllib.parse.urlparse(address)
+        if _url.scheme != 'https':
+            sslContext = None
+        supportedEncodings = tuple(supportedEncodings)
+        key = (_url.scheme, _url.netloc, sslContext, sdc_definitions, supportedEncodings, chunked_requests,
+               stream_responses)
+        with self._lock:
+            entry = self._soapClients.get(key)
+            if entry is None:
+                soapClient = SoapClient(_url.netloc, self._logger, sslContext=sslContext,
+                                        sdc_definitions=sdc_definitions,
+                                        supportedEncodings=list(supportedEncodings),
+                                        chunked_requests=chunked_requests,
+                                        stream_responses=stream_responses)
+                entry = [soapClient, 0]
+                self._soapClients[key] = entry
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, soapClient):
+        with self._lock:
+            for key, entry in self._soapClients.items():
+                if entry[0] is soapClient:
+                    entry[1] -= 1
+                    if entry[1] <= 0:
+                        del self._soapClients[key]
+                        soapClient.close()
+                    return
+
+    def closeAll(self):
+        with self._lock:
+            for soapClient, _ in self._soapClients.values():
+                soapClient.close()
+            self._soapClients.clear()
+
+    def __len__(self):
+        return len(self._soapClients)
+
+
+class ClientRuntime(object):
+    ''' One notification endpoint, one renewal scheduler and one connection pool for many SdcClients.'''
+    def __init__(self, my_ipaddress, sslContext=None, supportedEncodings=None, max_workers=8, log_prefix=None):
+        '''
+        @param my_ipaddress: the event sink listens on this address
+        @param sslContext: if not None, the event sink uses https
+        @param supportedEncodings: compression encodings of the event sink. If None, all available encodings are used.
+        @param max_workers: number of threads that process notifications (renewals use half of this number)
+        '''
+        if supportedEncodings is None:
+            supportedEncodings = compression.encodings[:]
+        self.eventSink = AsyncioNotificationsReceiver(my_ipaddress, sslContext, supportedEncodings,
+                                                      log_prefix=log_prefix, max_workers=max_workers)
+        self.scheduler = RenewalScheduler(max_workers=max(1, max_workers // 2), log_prefix=log_prefix)
+        self.soapClientPool = SoapClientPool(log_prefix)
+
+    def start(self):
+        self.eventSink.start()
+        self.eventSink.started_evt.wait(timeout=5)
+        self.scheduler.start()
+
+    def stop(self):
+        self.scheduler.stop()
+        self.eventSink.stop()
+        self.soapClientPool.closeAll()
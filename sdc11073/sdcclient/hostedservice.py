@@ -1,4 +1,5 @@
 import weakref
+import time
 from lxml import etree as etree_
 import urllib
 from .. import loghelper
@@ -11,6 +12,8 @@ class HostedServiceClient(object):
     """ Base class of clients that call hosted services of a dpws device."""
     VALIDATE_MEX = False # workaraound as long as validation error due to missing dpws schema is not solved
     subscribeable_actions = tuple()
+    validationPolicy = None  # if not None, an xmlparsing.ValidationPolicy that decides if responses are validated
+    compressionPolicy = None  # if not None, a compression.CompressionPolicy for the requests of this client
     def __init__(self, soapClient, dpws_hosted, porttype, validate, sdc_definitions, bicepsParser, log_prefix=''):
         '''
         @param simple_xml_hosted_node: a "Hosted" node in a simplexml document
@@ -39,6 +42,14 @@ class HostedServiceClient(object):
     def _mexSchema(self):
         return None if not self._validate else self._bicepsParser.mexSchema
 
+    def _validateResponse(self, envelope):
+        ''' validates the body of a received envelope, according to validationPolicy if it is set.'''
+        if self.validationPolicy is None:
+            envelope.validateBody(self._bmmSchema)
+        elif envelope.msgNode is not None:
+            action = None if envelope.address is None else envelope.address.action
+            self.validationPolicy.validate(action, self._bmmSchema, envelope.msgNode)
+
     def register_mdib(self, mdib):
         ''' Client sometimes must know the mdib data (e.g. Set service, activate method).'''
         if mdib is not None and self._mdib_wref is not None:
@@ -70,7 +81,18 @@ class HostedServiceClient(object):
 
 
     def postSoapEnvelope(self, soapEnvelope, msg, request_manipulator=None):
-        return self.soapClient.postSoapEnvelopeTo(self._url.path, soapEnvelope, msg=msg, request_manipulator=request_manipulator)
+        policy = self.compressionPolicy
+        if policy is None:
+            return self.soapClient.postSoapEnvelopeTo(self._url.path, soapEnvelope, msg=msg,
+                                                      request_manipulator=request_manipulator)
+        # the soap client can be shared with other clients, the roundtrip time is measured here
+        started = time.perf_counter()
+        try:
+            return self.soapClient.postSoapEnvelopeTo(self._url.path, soapEnvelope, msg=msg,
+                                                      request_manipulator=request_manipulator,
+                                                      compressionPolicy=policy)
+        finally:
+            policy.addRoundtripTime(time.perf_counter() - started)
 
     def _mkSetMethodSoapEnvelope(self, methodName, operationHandle, requestNodes, additionalNamespaces=None):
         ''' helper to create the soap envelope
@@ -121,7 +143,7 @@ class HostedServiceClient(object):
         returnedEnvelope = self.postSoapEnvelope(soapEnvelope, msg='get {}'.format(method),
                                                  request_manipulator=request_manipulator)
         try:
-            returnedEnvelope.validateBody(self._bmmSchema)
+            self._validateResponse(returnedEnvelope)
         except ExtendedDocumentInvalid as ex:
             self._logger.error('Validation error: {}', ex)
         except TypeError as ex:
@@ -151,7 +173,7 @@ class HostedServiceClient(object):
         soapEnvelope = self._mkSoapEnvelope(methodName, xmlStringArgument, additionalHeaders)
         soapEnvelope.validateBody(self._bmmSchema)
         retEnvelope = self.postSoapEnvelope(soapEnvelope, msg='port {} method {}'.format(portTypeName, methodName))
-        retEnvelope.validateBody(self._bmmSchema)
+        self._validateResponse(retEnvelope)
         return retEnvelope
 
 
@@ -514,7 +536,7 @@ class ContextServiceClient(HostedServiceClient):
                                              nsmap=Prefix.partialMap(Prefix.MSG, Prefix.PM)))
                 params[-1].text = h
         resultSoapEnvelope = self._callGetMethod('GetContextStates', params, request_manipulator=request_manipulator)
-        resultSoapEnvelope.validateBody(self._bmmSchema)
+        self._validateResponse(resultSoapEnvelope)
         return resultSoapEnvelope.msgNode
 
 
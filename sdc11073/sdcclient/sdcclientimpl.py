@@ -7,6 +7,7 @@ import traceback
 import ssl
 import json
 import urllib
+from collections import deque
 from lxml import etree as etree_
 from cryptography import x509
 from cryptography.hazmat import backends
@@ -37,7 +38,7 @@ SoapResponseException = sdc11073.pysoap.soapenvelope.SoapResponseException
 
 
 def _mkSoapClient(scheme, netloc, logger, sslContext, sdc_definitions, supportedEncodings=None,
-                  requestEncodings=None, chunked_requests=False):
+                  requestEncodings=None, chunked_requests=False, stream_responses=False):
     if scheme == 'https':
         _sslContext = sslContext
     else:
@@ -46,7 +47,8 @@ def _mkSoapClient(scheme, netloc, logger, sslContext, sdc_definitions, supported
                                                   sdc_definitions=sdc_definitions,
                                                   supportedEncodings=supportedEncodings,
                                                   requestEncodings=requestEncodings,
-                                                  chunked_requests=chunked_requests)
+                                                  chunked_requests=chunked_requests,
+                                                  stream_responses=stream_responses)
 
 
 # default ssl context data
@@ -192,7 +194,8 @@ class SdcClient(object):
     def __init__(self, devicelocation, deviceType, validate=True, sslEvents='auto', sslContext=None,
                  my_ipaddress=None, logLevel=None, ident='',
                  soap_notifications_handler_class=None,
-                 chunked_requests=False):  # pylint:disable=too-many-arguments
+                 chunked_requests=False, runtime=None, validation_policy=None,
+                 stream_responses=False, compression_policy_factory=None):  # pylint:disable=too-many-arguments
         '''
         @param devicelocation: the XAddr location for meta data, e.g. http://10.52.219.67:62616/72c08f50-74cc-11e0-8092-027599143341
         @param deviceType: a QName that defines the device type, e.g. '{http://standards.ieee.org/downloads/11073/11073-20702-2016}MedicalDevice'
@@ -204,8 +207,20 @@ class SdcClient(object):
         @param sslContext: if not None, this context is used. Otherwise a sSSLContext is automatically generated.
         @param my_ipAddress: This address is used for the http server that receives notifications. 
              If value is None, best own address is determined automatically (recommended).  
+        @param runtime: if not None, a started clientruntime.ClientRuntime. The client then uses its event sink,
+             renewal scheduler and connection pool instead of own threads and connections.
+        @param validation_policy: if not None, an xmlparsing.ValidationPolicy that decides per action if responses
+             of the device are validated (only if validate is True).
+        @param stream_responses: if True, responses of the device are parsed while they are received
+             (lower memory and earlier parsing for large responses like GetMdib).
+        @param compression_policy_factory: if not None, a callable(roundtrip_times=...) that returns a
+             compression.CompressionPolicy for every connection to the device, e.g. the CompressionPolicy class
+             or a functools.partial of it. roundtrip_times are the measured roundtrip times of the requests of
+             this client. The policy decides per request if and how it is compressed; it belongs to this client
+             and is passed with every request, also if the connection is shared via the runtime.
         '''
         self._devicelocation = devicelocation
+        self._runtime = runtime
         self._soap_notifications_handler_class = soap_notifications_handler_class
         if deviceType is None:
             self.sdc_definitions = SDC_v1_Definitions
@@ -218,12 +233,13 @@ class SdcClient(object):
             if self.sdc_definitions is None:
                 raise ValueError('cannot create instance, no known BICEPS schema version identified')
 
-        self._bicepsSchema = xmlparsing.BicepsSchema(self.sdc_definitions)
+        self._bicepsSchema = xmlparsing.getBicepsSchema(self.sdc_definitions)
         splitted = urllib.parse.urlsplit(self._devicelocation)
         self._device_uses_https = splitted.scheme.lower() == 'https'
 
         self.log_prefix = ident or ''
         self.chunked_requests = chunked_requests
+        self.stream_responses = stream_responses
         self._sslEvents = sslEvents
         self._setupLogging(logLevel)
         self._logger = loghelper.getLoggerAdapter('sdc.client', self.log_prefix)
@@ -237,6 +253,8 @@ class SdcClient(object):
         self.hostDescription = None
         self._hostedServices = {} # lookup by service id
         self._validate = validate
+        self.validationPolicy = validation_policy
+        self._compressionPolicyFactory = compression_policy_factory
         try:
             self._logger.info('Using SSL is enabled. TLS 1.3 Support = {}', ssl.HAS_TLSv1_3)
         except AttributeError:
@@ -252,6 +270,7 @@ class SdcClient(object):
         self._serviceClients = {}
         self._mdib = None   
         self._soapClients = {} # all http connections that this client holds
+        self._compressionPolicies = {} # same key as _soapClients
         self.peerCertificate = None
         self.all_subscribed = False
 
@@ -349,19 +368,26 @@ class SdcClient(object):
         return self.client('LocalizationService')
 
 
-    def startAll(self, notSubscribedActions = None, subscriptionsCheckInterval=None, async_dispatch=True):
+    def startAll(self, notSubscribedActions = None, subscriptionsCheckInterval=None, async_dispatch=True,
+                 shared_event_sink=None):
         '''
         :param notSubscribedActions: a list of pmtypes.Actions elements or None. if None, everything is subscribed.
         :param subscriptionsCheckInterval: an interval in seconds or None
         :param async_dispatch: if True, incoming requests are queued and response is sent immediately (processing is done later).
                                 if False, response is sent after the complete processing is done.
+        :param shared_event_sink: if provided, a started asynceventsink.AsyncioNotificationsReceiver that receives
+                                the notifications of this client (and of other clients). Otherwise client creates its own.
+                                async_dispatch is ignored in that case, the shared sink always queues notifications.
         :return: None
         '''
         self.discoverHostedServices()
-        self._startEventSink(async_dispatch)
+        if shared_event_sink is None and self._runtime is not None:
+            shared_event_sink = self._runtime.eventSink
+        self._startEventSink(async_dispatch, shared_event_sink)
         
         # start subscription manager
-        self._subscriptionMgr = subscription.SubscriptionManager(self._notificationsDispatcherThread.base_url, log_prefix=self.log_prefix, checkInterval=subscriptionsCheckInterval)
+        self._subscriptionMgr = subscription.SubscriptionManager(self._notificationsDispatcherThread.base_url, log_prefix=self.log_prefix, checkInterval=subscriptionsCheckInterval,
+                                                                 scheduler=None if self._runtime is None else self._runtime.scheduler)
         self._subscriptionMgr.start()
 
         if notSubscribedActions is None:
@@ -414,7 +440,10 @@ class SdcClient(object):
         self._register_mdib(None)   
             
         for cl in self._soapClients.values():
-            cl.close()
+            if self._runtime is None:
+                cl.close()
+            else:
+                self._runtime.soapClientPool.release(cl)
         self._soapClients = {}
 
     def setUsedCompression(self, *compression_methods):
@@ -485,16 +514,34 @@ class SdcClient(object):
         _url = urllib.parse.urlparse(address)
         key = (_url.scheme, _url.netloc)
         soapClient = self._soapClients.get(key)
-        if soapClient is None:
+        if soapClient is None and self._runtime is not None:
+            soapClient = self._runtime.soapClientPool.getSoapClient(address, self._sslContext, self.sdc_definitions,
+                                                                    self._compression_methods, self.chunked_requests,
+                                                                    self.stream_responses)
+            self._soapClients[key] = soapClient
+        elif soapClient is None:
             soapClient = _mkSoapClient(_url.scheme, _url.netloc,
                                        loghelper.getLoggerAdapter('sdc.client.soap', self.log_prefix),
                                        sslContext=self._sslContext,
                                        sdc_definitions=self.sdc_definitions,
                                        supportedEncodings=self._compression_methods,
-                                       chunked_requests=self.chunked_requests)
+                                       chunked_requests=self.chunked_requests,
+                                       stream_responses=self.stream_responses)
             self._soapClients[key] = soapClient
         return soapClient
 
+    def _getCompressionPolicy(self, address):
+        ''' @return: the compression policy of this client for the connection to address or None'''
+        if self._compressionPolicyFactory is None:
+            return None
+        _url = urllib.parse.urlparse(address)
+        key = (_url.scheme, _url.netloc)
+        policy = self._compressionPolicies.get(key)
+        if policy is None:
+            policy = self._compressionPolicyFactory(roundtrip_times=deque(maxlen=20))
+            self._compressionPolicies[key] = policy
+        return policy
+
 
     def _mkHostedServices(self):
         for hosted in self.metaData.hosted.values():
@@ -514,9 +561,17 @@ class SdcClient(object):
 
     def _mkHostedServiceClient(self, porttype, soapClient, hosted):
         cls = self._servicesLookup.get(porttype, HostedServiceClient)
-        return cls(soapClient, hosted, porttype, self._validate, self.sdc_definitions, self._bicepsSchema, self.log_prefix)
-
-    def _startEventSink(self, async_dispatch):
+        serviceClient = cls(soapClient, hosted, porttype, self._validate, self.sdc_definitions, self._bicepsSchema,
+                            self.log_prefix)
+        serviceClient.validationPolicy = self.validationPolicy
+        serviceClient.compressionPolicy = self._getCompressionPolicy(hosted.endpointReferences[0].address)
+        return serviceClient
+
+    def _startEventSink(self, async_dispatch, shared_event_sink=None):
+        if shared_event_sink is not None:
+            self._notificationsDispatcherThread = shared_event_sink.register(self.log_prefix, self.sdc_definitions)
+            self._logger.info('using shared EventSink on {}', self._notificationsDispatcherThread.base_url)
+            return
         if self._sslEvents == 'auto':
             sslContext = self._sslContext if self._device_uses_https else None
         elif self._sslEvents: # True
@@ -342,11 +342,13 @@ class SubscriptionManager(threading.Thread):
     @param endTo_url: if given the destination url for end subscription notifications; if not given, the notification_url is used.
     @param check_interval: the interval (in seconds ) for getStatus requests. Defaults to SUBSCRIPTION_CHECK_INTERVAL
     @param ident: a string that is used in log output; defaults to empty string
+    @param scheduler: if given, a clientruntime.RenewalScheduler that calls checkSubscriptions periodically.
+                      The thread is not started in that case.
      '''
     allSubscriptionsOkay = properties.ObservableProperty(True) # a boolean
     keepAlive_with_renew = True  # enable as workaround if checkstatus is not supported
 
-    def __init__(self, notification_url, endTo_url=None, checkInterval=None, log_prefix=''):
+    def __init__(self, notification_url, endTo_url=None, checkInterval=None, log_prefix='', scheduler=None):
         super(SubscriptionManager, self).__init__(name='Cl_SubscriptionManager{}'.format(log_prefix))
         self.daemon = True
         self._checkInterval = checkInterval or SUBSCRIPTION_CHECK_INTERVAL
@@ -358,14 +360,42 @@ class SubscriptionManager(threading.Thread):
         self._endTo_url = endTo_url or notification_url
         self._logger = loghelper.getLoggerAdapter('sdc.client.subscrMgr', log_prefix)
         self.log_prefix = log_prefix
+        self._scheduler = scheduler
 
+    def start(self):
+        if self._scheduler is None:
+            super(SubscriptionManager, self).start()
+        else:
+            self._scheduler.register(self, self._checkInterval)
 
     def stop(self):
-        self._run = False
-        self.join(timeout=2)
+        if self._scheduler is None:
+            self._run = False
+            self.join(timeout=2)
+        else:
+            self._scheduler.unregister(self)
         with self._subscriptionsLock:
             self.subscriptions.clear()
 
+    def _updateAllSubscriptionsOkay(self):
+        with self._subscriptionsLock:
+            not_okay = [s for s in self.subscriptions.values() if not s.isSubscribed]
+            self.allSubscriptionsOkay = (len(not_okay) == 0)
+
+    def checkSubscriptions(self):
+        ''' renews (or checks status of) all subscriptions.'''
+        with self._subscriptionsLock:
+            subscriptions = list(self.subscriptions.values())
+        for subscription in subscriptions:
+            if self.keepAlive_with_renew:
+                subscription.checkStatus_renew()
+            else:
+                subscription.checkStatus(renewLimit=self._checkInterval*5)
+        self._logger.debug( '##### SubscriptionManager Interval ######')
+        for subscription in subscriptions:
+            self._logger.debug( '{}', subscription)
+        if self._scheduler is not None:
+            self._updateAllSubscriptionsOkay()
 
     def run(self):
         self._run = True
@@ -377,20 +407,8 @@ class SubscriptionManager(threading.Thread):
                         if not self._run:
                             return
                         # check if all subscriptions are okay
-                        with self._subscriptionsLock:
-                            not_okay = [s for s in self.subscriptions.values() if not s.isSubscribed]
-                            subscribed = [s.isSubscribed for s in self.subscriptions.values()]
-                            self.allSubscriptionsOkay = (len(not_okay) == 0)
-                    with self._subscriptionsLock:
-                        subscriptions = list(self.subscriptions.values())
-                    for subscription in subscriptions:
-                        if self.keepAlive_with_renew:
-                            subscription.checkStatus_renew()
-                        else:
-                            subscription.checkStatus(renewLimit=self._checkInterval*5)
-                    self._logger.debug( '##### SubscriptionManager Interval ######')
-                    for subscription in subscriptions:
-                        self._logger.debug( '{}', subscription)
+                        self._updateAllSubscriptionsOkay()
+                    self.checkSubscriptions()
                 except Exception as ex:
                     self._logger.error( '##### check loop: {}', traceback.format_exc())
         finally:
@@ -460,8 +478,9 @@ class SOAPNotificationsDispatcher(object):
         self.methods[action] = fn
         
        
-    def dispatch(self, path, xml):
-        start = time.time()
+    def getHandler(self, path, xml):
+        ''' parses the notification and looks up the registered function.
+        @return: tuple (function, soap envelope, action)'''
         normalized_xml = self._sdc_definitions.normalizeXMLText(xml)
         request = AddressedSoap12Envelope.fromXMLString(normalized_xml)
         try:
@@ -469,13 +488,17 @@ class SOAPNotificationsDispatcher(object):
         except AttributeError:
             raise _DispatchError(404, 'no action in request')
         self._logger.debug('received notification path={}, action = {}', path, action)
-        
+
         try:
             fn = self.methods[action]
         except KeyError:
             self._logger.error('action "{}" not registered. Known:{}'.format(action, self.methods.keys()))
             raise _DispatchError(404, 'action not registered')
-        
+        return fn, request, action
+
+    def dispatch(self, path, xml):
+        start = time.time()
+        fn, request, action = self.getHandler(path, xml)
         fn(request)
         duration = time.time()-start
         if duration > 0.005:
@@ -493,21 +516,7 @@ class SOAPNotificationsDispatcherThreaded(SOAPNotificationsDispatcher):
         self._worker.start()
 
     def dispatch(self, path, xml):
-        normalized_xml = self._sdc_definitions.normalizeXMLText(xml)
-        request = AddressedSoap12Envelope.fromXMLString(normalized_xml)
-        try:
-            action = request.address.action
-        except AttributeError:
-            raise _DispatchError(404, 'no action in request')
-        self._logger.debug('received notification path={}, action = {}', path, action)
-
-        try:
-            fn = self.methods[action]
-        except KeyError:
-            self._logger.error(
-                'action "{}" not registered. Known:{}'.format(action, self.methods.keys()))
-            raise _DispatchError(404, 'action not registered')
-        self._queue.put((fn, request, action))
+        self._queue.put(self.getHandler(path, xml))
         return ''
 
 
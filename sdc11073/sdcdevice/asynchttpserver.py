@@ -0,0 +1,120 @@
+''' An asyncio based alternative to httpserver.HttpServerThread.
+All connections are served by one event loop thread, idle keep-alive connections do not need an own thread.
+Dispatching of requests (xml parsing, soap handling, compression) is done in a bounded thread pool.
+Usage:
+    server = AsyncioHttpServerThread(my_ipaddress='0.0.0.0', sslContext=ssl_context, supportedEncodings=['gzip'])
+    server.start()
+    server.started_evt.wait(timeout=5)
+    sdcDevice.startAll(shared_http_server=server)
+'''
+import traceback
+import urllib.parse
+from .exceptions import HTTPRequestHandlingError
+from .httpserver import DevicesDispatcher
+from .. import pysoap
+from .. import commlog
+from .. import loghelper
+from ..httprequesthandler import AsyncioHttpServerBase, AsyncHttpResponse
+
+_SOAP_CONTENT_TYPE = 'application/soap+xml; charset=utf-8'
+
+
+class AsyncioHttpServerThread(AsyncioHttpServerBase):
+    ''' Same interface as httpserver.HttpServerThread, but connections are handled by an asyncio event loop.'''
+    # chunked responses are serialized while they are sent (except if communication is logged)
+    STREAM_CHUNKED_RESPONSES = True
+
+    def __init__(self, my_ipaddress, sslContext, supportedEncodings, log_prefix=None, chunked_responses=False,
+                 max_workers=8):
+        '''
+        :param my_ipaddress:
+        :param sslContext:
+        :param supportedEncodings: a list od strings
+        :param max_workers: number of threads that dispatch requests. This is also the max. number of requests
+                            that are processed at the same time, further requests wait in the event loop.
+        '''
+        super(AsyncioHttpServerThread, self).__init__('Dev_SdcAsyncHttpServerThread', my_ipaddress, sslContext,
+                                                      supportedEncodings,
+                                                      loghelper.getLoggerAdapter('sdc.device.httpsrv', log_prefix),
+                                                      max_workers)
+        self.chunked_responses = chunked_responses
+        # create and set up the dispatcher for all incoming requests
+        self.devices_dispatcher = DevicesDispatcher(self._logger)
+
+    def setCompressionFlag(self, useCompression):
+        '''Sets use compression attribute, kept for compatibility with HttpServerThread
+        @param useCompression: bool flag
+        '''
+        self.useCompression = useCompression # pylint: disable=attribute-defined-outside-init
+
+    async def _handleRequest(self, method, path, headers, body):
+        if method == 'POST':
+            return await self._runInExecutor(self._processPost, path, headers, body)
+        if method == 'GET':
+            return await self._runInExecutor(self._processGet, path, headers)
+        return await super(AsyncioHttpServerThread, self)._handleRequest(method, path, headers, body)
+
+    def _processPost(self, path, headers, body):
+        ''' runs in executor. Same behavior as _SdcServerRequestHandler.do_POST'''
+        if not self._acceptRequests:
+            return AsyncHttpResponse(404, 'Not Found', b'received a POST request, but have no dispatcher', 'text', close=True)
+        request = None
+        try:
+            request = self._decompressRequest(headers, body)
+            commlog.defaultLogger.logSoapReqIn(request, 'POST')
+            try:
+                #delegate handling to on_post method of dispatcher
+                if self._canStream():
+                    return AsyncHttpResponse(200, 'Ok', self.devices_dispatcher.on_post_streamed(path, headers, request),
+                                             _SOAP_CONTENT_TYPE, contentEncoding=self._acceptedEncoding(headers),
+                                             chunked=True)
+                response_xml_string, compressFunc = self.devices_dispatcher.on_post_compressible(path, headers, request)
+                http_status = 200
+                http_reason = 'Ok'
+            except HTTPRequestHandlingError as ex:
+                response_xml_string = ex.soapfault
+                if isinstance(response_xml_string, str):
+                    response_xml_string = response_xml_string.encode('utf-8')
+                compressFunc = None
+                http_status = ex.status
+                http_reason = ex.reason
+            commlog.defaultLogger.logSoapRespOut(response_xml_string, 'POST')
+            response_xml_string, encoding = self._compressIfRequired(headers, response_xml_string, compressFunc)
+            return AsyncHttpResponse(http_status, http_reason, response_xml_string, _SOAP_CONTENT_TYPE,
+                             contentEncoding=encoding, chunked=self.chunked_responses)
+        except Exception as ex:
+            # make an error 500 response with the soap fault as content
+            self._logger.error(traceback.format_exc())
+            return AsyncHttpResponse(500, 'Internal Server Error', self._mkSoapFault(path, request, ex), _SOAP_CONTENT_TYPE)
+
+    def _canStream(self):
+        return (self.chunked_responses and self.STREAM_CHUNKED_RESPONSES
+                and isinstance(commlog.defaultLogger, commlog.NullLogger))
+
+    def _mkSoapFault(self, path, request, exception):
+        try:
+            # we must create a soapEnvelope in order to generate a SoapFault
+            dev_dispatcher = self.devices_dispatcher.get_device_dispather(path)
+            normalizedRequest = dev_dispatcher.sdc_definitions.normalizeXMLText(request)
+            soapEnvelope = pysoap.soapenvelope.AddressedSoap12Envelope.fromXMLString(normalizedRequest)
+            response = pysoap.soapenvelope.SoapFault(soapEnvelope, code=pysoap.soapenvelope.SoapFaultCode.SENDER,
+                                                     reason=str(exception))
+            return dev_dispatcher.sdc_definitions.denormalizeXMLText(response.as_xml())
+        except Exception: # request is not even a soap envelope
+            return str(exception).encode('utf-8')
+
+    def _processGet(self, path, headers):
+        ''' runs in executor. Same behavior as _SdcServerRequestHandler.do_GET'''
+        parsedPath = urllib.parse.urlparse(path)
+        try:
+            commlog.defaultLogger.logSoapReqIn('', 'GET') # GET has no content, log it to document duration of processing
+            response_string = self.devices_dispatcher.on_get(path, headers)
+            response_string, encoding = self._compressIfRequired(headers, response_string)
+            commlog.defaultLogger.logSoapRespOut(response_string, 'GET')
+            if parsedPath.query == 'wsdl':
+                content_type = "text/xml; charset=utf-8"
+            else:
+                content_type = _SOAP_CONTENT_TYPE
+            return AsyncHttpResponse(200, 'Ok', response_string, content_type, contentEncoding=encoding)
+        except Exception as ex:
+            return AsyncHttpResponse(500, 'Internal Server Error', str(ex), 'text')
@@ -8,7 +8,8 @@ from .exceptions import HTTPRequestHandlingError, InvalidPathError, InvalidActio
 from .. import pysoap
 from .. import commlog
 from .. import loghelper
-from ..httprequesthandler import HTTPRequestHandler, mkchunks
+from ..compression import CompressionHandler
+from ..httprequesthandler import HTTPRequestHandler, ChunkedWriter, mkchunks
 
 
 MULTITHREADED = True
@@ -82,6 +83,12 @@ class DevicesDispatcher(object):
     def on_post(self, path, headers, request):
         return self.get_device_dispather(path).on_post(path, headers, request)
 
+    def on_post_compressible(self, path, headers, request):
+        return self.get_device_dispather(path).on_post_compressible(path, headers, request)
+
+    def on_post_streamed(self, path, headers, request):
+        return self.get_device_dispather(path).on_post_streamed(path, headers, request)
+
     def on_get(self, path, headers):
         return self.get_device_dispather(path).on_get(path, headers)
 
@@ -107,13 +114,32 @@ class HostedServiceDispatcher(object):
     def on_post(self, path, headers, request):
         """Method converts the http request into a soap envelope and calls dispatchSoapRequest.
            Return of dispatchSoapRequest (soap envelope) is converted back to a string."""
+        return self.on_post_compressible(path, headers, request)[0]
+
+    def on_post_compressible(self, path, headers, request):
+        """Same as on_post, but returns a tuple (response string, compress function or None).
+           A prepared response (SplicedSoapEnvelope) is already serialized, it provides its own compress function
+           that can re-use an already compressed body."""
         commlog.defaultLogger.logSoapReqIn(request, 'POST')
         normalizedRequest = self.sdc_definitions.normalizeXMLText(request)
         # execute the method
         soapEnvelope = pysoap.soapenvelope.AddressedSoap12Envelope.fromXMLString(normalizedRequest)
         response = self._dispatchSoapRequest(path, headers, soapEnvelope)
+        if isinstance(response, pysoap.soapenvelope.SplicedSoapEnvelope):
+            return response.as_xml(), response.compress
         normalized_response_xml_string = response.as_xml()
-        return self.sdc_definitions.denormalizeXMLText(normalized_response_xml_string)
+        response_xml_string = self.sdc_definitions.denormalizeXMLText(normalized_response_xml_string)
+        action = getattr(response.address, 'action', None)
+        return response_xml_string, lambda algorithm: CompressionHandler.compressPayload(algorithm, response_xml_string,
+                                                                                         action)
+
+    def on_post_streamed(self, path, headers, request):
+        """Same as on_post, but returns a StreamedSoapResponse, the response is serialized while it is written."""
+        commlog.defaultLogger.logSoapReqIn(request, 'POST')
+        normalizedRequest = self.sdc_definitions.normalizeXMLText(request)
+        soapEnvelope = pysoap.soapenvelope.AddressedSoap12Envelope.fromXMLString(normalizedRequest)
+        response = self._dispatchSoapRequest(path, headers, soapEnvelope)
+        return StreamedSoapResponse(response, self.sdc_definitions)
 
     def _dispatchSoapRequest(self, path, header, soapEnvelope):
         # path is a string like /0105a018-8f4c-4199-9b04-aff4835fd8e9/StateEvent, without http:/servername:port
@@ -134,8 +160,7 @@ class HostedServiceDispatcher(object):
 
     def on_get(self, path, httpHeaders):
         """ Get Requests are handled as they are, no soap envelopes"""
-        response_string = self._dispatchGetRequest(path, httpHeaders)
-        return  self.sdc_definitions.denormalizeXMLText(response_string)
+        return self._dispatchGetRequest(path, httpHeaders)  # already denormalized
 
     def _dispatchGetRequest(self, path, httpHeaders):
         parsedPath = urllib.parse.urlparse(path)
@@ -150,11 +175,51 @@ class HostedServiceDispatcher(object):
         return  self.sdc_definitions.denormalizeXMLText(response_string)
 
 
+class StreamedSoapResponse(object):
+    ''' A soap response that is serialized, denormalized and compressed while it is written as http chunks.
+    The complete xml text of the response is never in memory, only the parts of one chunk.'''
+    def __init__(self, envelope, sdc_definitions):
+        '''
+        @param envelope: a normalized Soap12Envelope or a (denormalized) SplicedSoapEnvelope
+        '''
+        self._envelope = envelope
+        self._sdc_definitions = sdc_definitions
+
+    def write(self, stream, algorithm=None):
+        '''
+        @param stream: writable file-like object
+        @param algorithm: a compression algorithm or None
+        @return: the used ChunkedWriter
+        '''
+        if isinstance(self._envelope, pysoap.soapenvelope.SplicedSoapEnvelope):
+            parts = None if algorithm is None else self._envelope.iterCompressed(algorithm)
+            if parts is None:
+                parts = self._envelope.iterXml()
+                writer = ChunkedWriter(stream, self._mkCompressor(algorithm, self._envelope.action))
+            else:
+                writer = ChunkedWriter(stream) # already compressed
+            for part in parts:
+                writer.write(part)
+        else:
+            writer = ChunkedWriter(stream, self._mkCompressor(algorithm, getattr(self._envelope.address, 'action', None)))
+            output = self._sdc_definitions.denormalizingWriter(writer)
+            self._envelope.writeXml(output)
+            output.close()
+        writer.close()
+        return writer
+
+    @staticmethod
+    def _mkCompressor(algorithm, action):
+        return None if algorithm is None else CompressionHandler.mkCompressor(algorithm, action)
+
+
 class _SdcServerRequestHandler(HTTPRequestHandler):
     protocol_version = "HTTP/1.1"  # this enables keep-alive
     # This server does NOT disable nagle algorithm. It sends Large responses,
     # and network efficiency is more important tahn short latencies.
     disable_nagle_algorithm = False
+    # chunked responses are serialized while they are sent (except if communication is logged)
+    STREAM_CHUNKED_RESPONSES = True
 
     def do_POST(self):
         """SOAP POST gateway"""
@@ -164,24 +229,29 @@ class _SdcServerRequestHandler(HTTPRequestHandler):
                 # close this connection
                 self.close_connection = 1
                 response_xml_string = 'received a POST request, but have no dispatcher'
+                compressFunc = None
                 self.send_response(404)  # not found
             else:
                 request = self._read_request()
                 commlog.defaultLogger.logSoapReqIn(request, 'POST')
                 try:
                     #delegate handling to on_post method of dispatcher
-                    response_xml_string = devices_dispatcher.on_post(self.path, self.headers, request)
+                    if self._canStream():
+                        self._writeStreamedResponse(devices_dispatcher.on_post_streamed(self.path, self.headers, request))
+                        return
+                    response_xml_string, compressFunc = devices_dispatcher.on_post_compressible(self.path, self.headers, request)
                     http_status = 200
                     http_reason = 'Ok'
                 except HTTPRequestHandlingError as ex:
                     response_xml_string = ex.soapfault
+                    compressFunc = None
                     http_status = ex.status
                     http_reason = ex.reason
 
                 commlog.defaultLogger.logSoapRespOut(response_xml_string, 'POST')
                 self.send_response(http_status, http_reason)
             assert(b'utf-8' in response_xml_string[:100].lower()) # MDPWS:R0007 A text SOAP envelope shall be serialized using utf-8 character encoding
-            response_xml_string = self._compressIfRequired(response_xml_string)
+            response_xml_string = self._compressIfRequired(response_xml_string, compressFunc)
             self.send_header("Content-type", "application/soap+xml; charset=utf-8")
             if self.server.chunked_response:
                 self.send_header("transfer-encoding", "chunked")
@@ -209,6 +279,26 @@ class _SdcServerRequestHandler(HTTPRequestHandler):
             self.end_headers()
             self.wfile.write(response_xml_string)
 
+    def _canStream(self):
+        return (self.server.chunked_response and self.STREAM_CHUNKED_RESPONSES
+                and isinstance(commlog.defaultLogger, commlog.NullLogger))
+
+    def _writeStreamedResponse(self, response):
+        ''' Writes a StreamedSoapResponse. Errors after the http header was sent can not be reported to the client,
+        the connection is closed instead.'''
+        algorithm = self._acceptedEncoding()
+        self.send_response(200, 'Ok')
+        self.send_header("Content-type", "application/soap+xml; charset=utf-8")
+        if algorithm is not None:
+            self.send_header('Content-Encoding', algorithm)
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+        try:
+            response.write(self.wfile, algorithm)
+        except Exception:
+            self.server.logger.error('could not write streamed response: {}', traceback.format_exc())
+            self.close_connection = True
+
     def do_GET(self):
         parsedPath = urllib.parse.urlparse(self.path)
         try:
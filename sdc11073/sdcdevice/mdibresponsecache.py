@@ -0,0 +1,185 @@
+import copy
+import time
+from threading import Lock
+from collections import namedtuple
+from lxml import etree as etree_
+from ..namespaces import msgTag, domTag, nsmap
+from ..namespaces import Prefix_Namespace as Prefix
+from ..pysoap.soapenvelope import PreparedSoapBody
+from ..mdib.containerproperties import CurrentTimestampAttributeProperty
+from .. import loghelper
+
+_CONTENT_MARK = '__content__'
+_CONTENT_MARK_BYTES = _CONTENT_MARK.encode('utf-8')
+
+_CacheKey = namedtuple('_CacheKey', 'snapshot withContextStates validated')
+
+
+class MdibResponseCache(object):
+    ''' Serialized GetMdibResponse and GetMdStateResponse bodies of a device mdib.
+    Responses are built from the snapshot of the mdib (DeviceMdibContainer.getSnapshot), the mdibLock is not used:
+    serializing a large response never delays a transaction.
+    Responses are keyed by the snapshot object: requests for the same snapshot are served from prebuilt bytes.
+    The mdib creates a new snapshot after every commit and after modifications outside of transactions.
+    For a new snapshot the response is assembled incrementally:
+    - the MdDescription is only re-rendered if the snapshot has a new MdDescription node,
+    - frozen state containers (committed by a transaction) are rendered only once,
+      other states are rendered for every new snapshot.
+    States that render the current time (ClockState/@DateAndTime) are never cached, a response that contains them
+    is re-used for volatile_max_age seconds at most.
+    '''
+    _volatileClasses = {}  # lookup state class => bool
+
+    def __init__(self, mdib, precompress=False, volatile_max_age=1.0, log_prefix=None):
+        '''
+        @param mdib: a DeviceMdibContainer
+        @param precompress: if True, the gzip compressed body is created together with the body.
+                            Otherwise it is created with the first request that accepts gzip encoding.
+        @param volatile_max_age: max. age in seconds of a response that contains volatile states.
+        '''
+        self._mdib = mdib
+        self._precompress = precompress
+        self._volatileMaxAge = volatile_max_age
+        self._logger = loghelper.getLoggerAdapter('sdc.device.MdibResponseCache', log_prefix)
+        self._mdDescription = (None, None)  # (key, bytes)
+        self._stateFragments = {}  # lookup id(stateContainer) => (stateContainer, bytes)
+        self._getMdibBody = (None, None, None)  # (key, PreparedSoapBody, expiration time)
+        self._getMdStateBody = (None, None, None)  # (key, PreparedSoapBody, expiration time)
+        self._hasVolatileStates = False  # set by _getStateFragments
+        self._responseNsmap = mdib.nsmapper.partialMap(Prefix.S12, Prefix.WSA, Prefix.PM, Prefix.MSG)
+        self._lock = Lock()  # protects the cached data, concurrent requests build a response only once
+
+    def getMdibBody(self, withContextStates, schema=None):
+        '''
+        @param withContextStates: if True, context states are included in MdState
+        @param schema: if not None, a new body is validated against this schema.
+        @return: a PreparedSoapBody with a GetMdibResponse
+        '''
+        with self._lock:
+            snapshot = self._mdib.getSnapshot()
+            key = self._mkKey(snapshot, withContextStates, schema)
+            if self._isValid(key, self._getMdibBody):
+                return self._getMdibBody[1]
+            responseNode = etree_.Element(msgTag('GetMdibResponse'), nsmap=Prefix.partialMap(Prefix.MSG, Prefix.PM))
+            responseNode.set('MdibVersion', str(snapshot.mdibVersion))
+            responseNode.set('SequenceId', snapshot.sequenceId)
+            mdibNode = etree_.SubElement(responseNode, msgTag('Mdib'), nsmap=self._mdib.nsmapper.docNssmap)
+            mdibNode.set('MdibVersion', str(snapshot.mdibVersion))
+            mdibNode.set('SequenceId', snapshot.sequenceId)
+            mdibNode.text = _CONTENT_MARK
+            mdStateNode = etree_.SubElement(mdibNode, domTag('MdState'),
+                                            attrib={'StateVersion': str(snapshot.mdStateVersion)})
+            mdStateNode.text = _CONTENT_MARK
+            head, middle, tail = etree_.tostring(responseNode).split(_CONTENT_MARK_BYTES)
+            content = b''.join([head, self._getMdDescriptionFragment(snapshot), middle,
+                                self._getStateFragments(snapshot, withContextStates), tail])
+            body = self._mkBody(content, schema)
+            self._getMdibBody = (key, body, self._expirationTime())
+            return body
+
+    def getMdStateBody(self, withContextStates, schema=None):
+        '''
+        @param withContextStates: if True, context states are included in MdState
+        @param schema: if not None, a new body is validated against this schema.
+        @return: a PreparedSoapBody with a GetMdStateResponse that contains all states
+        '''
+        with self._lock:
+            snapshot = self._mdib.getSnapshot()
+            key = self._mkKey(snapshot, withContextStates, schema)
+            if self._isValid(key, self._getMdStateBody):
+                return self._getMdStateBody[1]
+            responseNode = etree_.Element(msgTag('GetMdStateResponse'), nsmap=nsmap)
+            responseNode.set('MdibVersion', str(snapshot.mdibVersion))
+            responseNode.set('SequenceId', snapshot.sequenceId)
+            mdStateNode = etree_.SubElement(responseNode, msgTag('MdState'), nsmap=self._mdib.nsmapper.docNssmap)
+            mdStateNode.text = _CONTENT_MARK
+            head, tail = etree_.tostring(responseNode).split(_CONTENT_MARK_BYTES)
+            body = self._mkBody(b''.join([head, self._getStateFragments(snapshot, withContextStates), tail]), schema)
+            self._getMdStateBody = (key, body, self._expirationTime())
+            return body
+
+    def invalidate(self):
+        ''' forget everything, next request creates the responses from scratch.'''
+        with self._lock:
+            self._mdDescription = (None, None)
+            self._stateFragments = {}
+            self._getMdibBody = (None, None, None)
+            self._getMdStateBody = (None, None, None)
+
+    @staticmethod
+    def _isValid(key, entry):
+        cached_key, _, expiration_time = entry
+        if cached_key is None or cached_key.snapshot is not key.snapshot:
+            return False
+        if cached_key.withContextStates != key.withContextStates or cached_key.validated != key.validated:
+            return False
+        return expiration_time is None or time.monotonic() < expiration_time
+
+    def _expirationTime(self):
+        return time.monotonic() + self._volatileMaxAge if self._hasVolatileStates else None
+
+    def _isVolatile(self, stateContainer):
+        cls = stateContainer.__class__
+        volatile = self._volatileClasses.get(cls)
+        if volatile is None:
+            volatile = any(isinstance(prop, CurrentTimestampAttributeProperty)
+                           for _, prop in stateContainer._sortedContainerProperties()) #pylint:disable=protected-access
+            self._volatileClasses[cls] = volatile
+        return volatile
+
+    @staticmethod
+    def _mkKey(snapshot, withContextStates, schema):
+        return _CacheKey(snapshot, withContextStates, schema is not None)
+
+    def _mkBody(self, content, schema):
+        self._logger.debug('new response body, {} bytes', len(content))
+        body = PreparedSoapBody.fromText(content, self._responseNsmap, self._mdib.sdc_definitions, schema)
+        if self._precompress:
+            body.gzipSegment()
+        return body
+
+    def _getMdDescriptionFragment(self, snapshot):
+        cached_node, fragment = self._mdDescription
+        if cached_node is not snapshot.mdDescriptionNode:
+            # the node of the snapshot must not be modified, serialize a copy
+            fragment = self._mkFragment(msgTag('Mdib'), copy.deepcopy(snapshot.mdDescriptionNode))
+            self._mdDescription = (snapshot.mdDescriptionNode, fragment)
+        return fragment
+
+    def _getStateFragments(self, snapshot, withContextStates):
+        stateContainers = list(snapshot.states)
+        if withContextStates:
+            stateContainers.extend(snapshot.contextStates)
+        fragments = []
+        new_lookup = {}  # only keep fragments of current containers
+        self._hasVolatileStates = False
+        for stateContainer in stateContainers:
+            entry = self._stateFragments.get(id(stateContainer))
+            if entry is not None and entry[0] is stateContainer:
+                fragment = entry[1]
+            else:
+                try:
+                    fragment = self._mkFragment(domTag('MdState'), stateContainer.mkStateNode())
+                except RuntimeError:
+                    self._logger.error('State {} has no descriptorContainer', stateContainer.descriptorHandle)
+                    continue
+            if self._isVolatile(stateContainer):
+                self._hasVolatileStates = True
+            elif stateContainer.isFrozen:
+                new_lookup[id(stateContainer)] = (stateContainer, fragment)
+            fragments.append(fragment)
+        if not withContextStates:
+            # keep context state fragments for the other variant
+            for k, entry in self._stateFragments.items():
+                if entry[0].isContextState and k not in new_lookup:
+                    new_lookup[k] = entry
+        self._stateFragments = new_lookup
+        return b''.join(fragments)
+
+    def _mkFragment(self, parentTag, node):
+        ''' serializes node as child of a parent element with the document namespaces.
+        This avoids repeating all namespace declarations in every fragment.'''
+        parentNode = etree_.Element(parentTag, nsmap=self._mdib.nsmapper.docNssmap)
+        parentNode.append(node)
+        xml = etree_.tostring(parentNode)
+        return xml[xml.index(b'>') + 1: xml.rindex(b'</')]
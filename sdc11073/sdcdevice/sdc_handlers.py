@@ -63,7 +63,9 @@ class SdcHandler_Base(object):
 
     def __init__(self, my_uuid, ws_discovery, model, device, deviceMdibContainer, validate=True,
                  roleProvider=None, sslContext=None,
-                 logLevel=None, max_subscription_duration=7200, log_prefix='', chunked_messages=False):  # pylint:disable=too-many-arguments
+                 logLevel=None, max_subscription_duration=7200, log_prefix='', chunked_messages=False,
+                 delivery_engine=None, validation_policy=None,
+                 compression_policy_factory=None):  # pylint:disable=too-many-arguments
         """
         @param uuid: a string that becomes part of the devices url (no spaces, no special characters please. This could cause an invalid url!).
                      Parameter can be None, in this case a random uuid string is generated.
@@ -76,6 +78,13 @@ class SdcHandler_Base(object):
         @param logLevel: if not None, the "sdc.device" logger will use this level
         @param max_subscription_duration: max. possible duration of a subscription, default is 7200 seconds
         @param ident: names a device, used for logging
+        @param delivery_engine: if not None, a subscriptionmgr.NotificationDeliveryEngine instance.
+                                Notifications are then sent asynchronously to the subscribers.
+                                The engine can be shared by several devices, stopAll does not stop it.
+        @param validation_policy: if not None, an xmlparsing.ValidationPolicy that decides per action if notifications
+                                  and responses are validated (only if validate is True).
+        @param compression_policy_factory: if not None, a callable(roundtrip_times=...) that returns a
+                                  compression.CompressionPolicy for every subscription.
         """
         self._my_uuid = my_uuid or uuid.uuid4()
         self._wsdiscovery = ws_discovery
@@ -85,6 +94,8 @@ class SdcHandler_Base(object):
         self._log_prefix = log_prefix
         self._mdib.log_prefix = log_prefix
         self._validate = validate
+        self._validationPolicy = validation_policy
+        self._compressionPolicyFactory = compression_policy_factory
         self._sslContext = sslContext
         self._compression_methods = compression.encodings[:]
         self._httpServerThread = None
@@ -92,6 +103,7 @@ class SdcHandler_Base(object):
         self._logger = loghelper.getLoggerAdapter('sdc.device', log_prefix)
 
         self.chunked_messages = chunked_messages
+        self._deliveryEngine = delivery_engine
         self.contextstates_in_getmdib = self.DEFAULT_CONTEXTSTATES_IN_GETMDIB  # can be overridden per instance
         # hostDispatcher provides data of the sdc device itself
         self._hostDispatcher = self._mkHostDispatcher()
@@ -190,7 +202,10 @@ class SdcHandler_Base(object):
                                                     self._compression_methods,
                                                     max_subscription_duration,
                                                     log_prefix=self._log_prefix,
-                                                    chunked_messages=self.chunked_messages)
+                                                    chunked_messages=self.chunked_messages,
+                                                    delivery_engine=self._deliveryEngine,
+                                                    validation_policy=self._validationPolicy,
+                                                    compression_policy_factory=self._compressionPolicyFactory)
 
     def _mkScoOperationsRegistry(self, handle):
         return sco.ScoOperationsRegistry(self._subscriptionsManager, self._mdib, handle, log_prefix=self._log_prefix)
@@ -207,6 +222,10 @@ class SdcHandler_Base(object):
     def shallValidate(self):
         return self._validate
 
+    @property
+    def validationPolicy(self):
+        return self._validationPolicy
+
     @property
     def mdib(self):
         return self._mdib
@@ -449,7 +468,7 @@ class SdcHandler_Base(object):
         with self._mdib.mdibUpdateTransaction() as tr:
             for descriptorHandle, changedSample in changedSamples.items():
                 determinationTime = changedSample.determinationTime
-                samples = [s[0] for s in changedSample.samples]  # only the values without the 'start of cycle' flags
+                samples = changedSample.samples
                 activationState = changedSample.activationState
                 st = tr.getRealTimeSampleArrayMetricState(descriptorHandle)
                 if st.metricValue is None:
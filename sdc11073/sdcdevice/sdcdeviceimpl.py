@@ -6,14 +6,17 @@ class SdcDevice(object):
     defaultInstanceIdentifiers = (pmtypes.InstanceIdentifier(root='rootWithNoMeaning', extensionString='System'),)
     def __init__(self, ws_discovery, my_uuid, model, device, deviceMdibContainer, validate=True, roleProvider=None, sslContext=None,
                  logLevel=None, max_subscription_duration=7200, log_prefix='', handler_cls=None,
-                 chunked_messages=False): #pylint:disable=too-many-arguments
+                 chunked_messages=False, delivery_engine=None, validation_policy=None,
+                 compression_policy_factory=None): #pylint:disable=too-many-arguments
         # ssl protocol handling itself is delegated to a handler.
         # Specific protocol versions or behaviours are implemented there.
         if handler_cls is None:
             handler_cls = SdcHandler_Full
         self._handler = handler_cls(my_uuid, ws_discovery, model, device, deviceMdibContainer, validate,
                                 roleProvider, sslContext, logLevel, max_subscription_duration,
-                                log_prefix=log_prefix, chunked_messages=chunked_messages)
+                                log_prefix=log_prefix, chunked_messages=chunked_messages,
+                                delivery_engine=delivery_engine, validation_policy=validation_policy,
+                                compression_policy_factory=compression_policy_factory)
         self._wsdiscovery = ws_discovery
         self._logger = self._handler._logger
         self._mdib = deviceMdibContainer
@@ -54,6 +57,10 @@ class SdcDevice(object):
     def shallValidate(self):
         return self._handler._validate
 
+    @property
+    def validationPolicy(self):
+        return self._handler.validationPolicy
+
     @property
     def mdib(self):
         return self._mdib
@@ -97,6 +104,8 @@ class SdcDevice(object):
 
         :param startRealtimeSampleLoop: flag
         :param shared_http_server: id provided, use this http server. Otherwise device creates its own.
+                                   This can be a started httpserver.HttpServerThread (one thread per connection)
+                                   or asynchttpserver.AsyncioHttpServerThread (one event loop for all connections).
         :return:
         """
         return self._handler.startAll(startRealtimeSampleLoop, shared_http_server)
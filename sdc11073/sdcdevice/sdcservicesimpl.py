@@ -1,3 +1,4 @@
+import copy
 import time
 import traceback
 from collections import namedtuple, OrderedDict
@@ -10,6 +11,7 @@ from ..namespaces import msgTag, domTag, s12Tag, wsxTag, wseTag, dpwsTag, mdpwsT
 from .. import pmtypes
 from .. import loghelper
 from .exceptions import InvalidActionError, FunctionNotImplementedError
+from .mdibresponsecache import MdibResponseCache
 _msg_prefix = Prefix.MSG.prefix
 
 _wsdl_ns = Prefix.WSDL.namespace
@@ -347,6 +349,17 @@ class DPWSPortTypeImpl(SOAPActionDispatcher):
     def _bmmSchema(self):
         return None if not self._sdcDevice.shallValidate else self._sdcDevice.mdib.bicepsSchema.bmmSchema
 
+    def _validateResponse(self, response, schema):
+        ''' validates the body of a response envelope, according to the validation policy of the device if it has one.'''
+        validationPolicy = self._sdcDevice.validationPolicy
+        if validationPolicy is None:
+            response.validateBody(schema)
+            return
+        response.buildDoc()
+        if len(response.bodyNode) > 0:
+            action = response.headerNode.findtext('wsa:Action', namespaces=nsmap)
+            validationPolicy.validate(action, schema, response.bodyNode[0])
+
     @property
     def _mexSchema(self):
         return None if not self._sdcDevice.shallValidate else self._sdcDevice.mdib.bicepsSchema.mexSchema
@@ -488,6 +501,7 @@ class GetService(DPWSPortTypeImpl):
         self.register_soapActionCallback(actions.GetMdState, self._onGetMdState)
         self.register_soapActionCallback(actions.GetMdib, self._onGetMdib)
         self.register_soapActionCallback(actions.GetMdDescription, self._onGetMdDescription)
+        self._responseCache = MdibResponseCache(self._mdib, log_prefix=self._mdib.log_prefix)
 
 
     def _onGetMdState(self, httpHeader, request):  # pylint:disable=unused-argument
@@ -495,81 +509,64 @@ class GetService(DPWSPortTypeImpl):
         requestedHandles = request.bodyNode.xpath('*/msg:HandleRef/text()', namespaces=nsmap)
         if len(requestedHandles) > 0:
             self._logger.info('_onGetMdState requested Handles:{}', requestedHandles)
+        else:
+            # MessageModel: If the HANDLE reference list is empty, all states in the MDIB SHALL be included in the result list.
+            # This response is the same for all requests at the same mdibVersion, use the cache
+            body = self._responseCache.getMdStateBody(self._sdcDevice.contextstates_in_getmdib, self._bmmSchema)
+            replyAddress = request.address.mkReplyAddress(action=self._getActionString('GetMdStateResponse'))
+            return body.mkEnvelope(replyAddress)
 
-        # get the requested state containers from mdib
+        # get the requested state containers from the mdib snapshot, no locking needed
+        snapshot = self._mdib.getSnapshot()
         stateContainers = []
-        with self._mdib.mdibLock:
-            if len(requestedHandles) == 0:
-                # MessageModel: If the HANDLE reference list is empty, all states in the MDIB SHALL be included in the result list.
-                for stateContainer in self._mdib.states.objects:
-                    stateContainers.append(stateContainer)
-                if self._sdcDevice.contextstates_in_getmdib:
-                    for stateContainer in self._mdib.contextStates.objects:
-                        stateContainers.append(stateContainer)
-            else:
-                if self._sdcDevice.contextstates_in_getmdib:
-                    for handle in requestedHandles:
-                        try:
-                            # If a HANDLE reference does match a multi state HANDLE, the corresponding multi state SHALL be included in the result list
-                            stateContainers.append(self._mdib.contextStates.handle.getOne(handle))
-                        except RuntimeError:
-                            # If a HANDLE reference does match a descriptor HANDLE, all states that belong to the corresponding descriptor SHALL be included in the result list
-                            stateContainers.extend(self._mdib.states.descriptorHandle.get(handle, []))
-                            stateContainers.extend(self._mdib.contextStates.descriptorHandle.get(handle, []))
+        if self._sdcDevice.contextstates_in_getmdib:
+            for handle in requestedHandles:
+                # If a HANDLE reference does match a multi state HANDLE, the corresponding multi state SHALL be included in the result list
+                contextState = snapshot.getContextState(handle)
+                if contextState is not None:
+                    stateContainers.append(contextState)
                 else:
-                    for handle in requestedHandles:
-                        stateContainers.extend(self._mdib.states.descriptorHandle.get(handle, []))
+                    # If a HANDLE reference does match a descriptor HANDLE, all states that belong to the corresponding descriptor SHALL be included in the result list
+                    stateContainers.extend(snapshot.getStates(handle))
+                    stateContainers.extend(snapshot.getContextStates(handle))
+        else:
+            for handle in requestedHandles:
+                stateContainers.extend(snapshot.getStates(handle))
 
-                self._logger.info('_onGetMdState requested Handles:{} found {} states', requestedHandles,
-                                  len(stateContainers))
+        self._logger.info('_onGetMdState requested Handles:{} found {} states', requestedHandles,
+                          len(stateContainers))
 
-            # build response
-            nsmapper = self._mdib.nsmapper
-            responseSoapEnvelope = pysoap.soapenvelope.Soap12Envelope(
-                nsmapper.partialMap(Prefix.S12, Prefix.WSA, Prefix.PM, Prefix.MSG))
-            replyAddress = request.address.mkReplyAddress(action=self._getActionString('GetMdStateResponse'))
-            responseSoapEnvelope.addHeaderObject(replyAddress)
-            getMdStateResponseNode = etree_.Element(msgTag('GetMdStateResponse'), nsmap=nsmap)
-            getMdStateResponseNode.set('MdibVersion', str(self._mdib.mdibVersion))
-            getMdStateResponseNode.set('SequenceId', self._mdib.sequenceId)
+        # build response
+        nsmapper = self._mdib.nsmapper
+        responseSoapEnvelope = pysoap.soapenvelope.Soap12Envelope(
+            nsmapper.partialMap(Prefix.S12, Prefix.WSA, Prefix.PM, Prefix.MSG))
+        replyAddress = request.address.mkReplyAddress(action=self._getActionString('GetMdStateResponse'))
+        responseSoapEnvelope.addHeaderObject(replyAddress)
+        getMdStateResponseNode = etree_.Element(msgTag('GetMdStateResponse'), nsmap=nsmap)
+        getMdStateResponseNode.set('MdibVersion', str(snapshot.mdibVersion))
+        getMdStateResponseNode.set('SequenceId', snapshot.sequenceId)
 
-            mdStateNode = etree_.Element(msgTag('MdState'), attrib=None, nsmap=self._mdib.nsmapper.docNssmap)
-            for stateContainer in stateContainers:
-                mdStateNode.append(stateContainer.mkStateNode())
+        mdStateNode = etree_.Element(msgTag('MdState'), attrib=None, nsmap=self._mdib.nsmapper.docNssmap)
+        for stateContainer in stateContainers:
+            mdStateNode.append(stateContainer.mkStateNode())
 
-            getMdStateResponseNode.append(mdStateNode)
-            responseSoapEnvelope.addBodyElement(getMdStateResponseNode)
+        getMdStateResponseNode.append(mdStateNode)
+        responseSoapEnvelope.addBodyElement(getMdStateResponseNode)
         self._logger.debug('_onGetMdState returns {}', lambda: responseSoapEnvelope.as_xml(pretty=False))
-        responseSoapEnvelope.validateBody(self._bmmSchema)
+        self._validateResponse(responseSoapEnvelope, self._bmmSchema)
         return responseSoapEnvelope
 
     def _onGetMdib(self, httpHeader, request):  # pylint:disable=unused-argument
         self._logger.debug('_onGetMdib')
-        nsmapper = self._mdib.nsmapper
-        responseSoapEnvelope = pysoap.soapenvelope.Soap12Envelope(
-            nsmapper.partialMap(Prefix.S12, Prefix.WSA, Prefix.PM, Prefix.MSG))
-        replyAddress = request.address.mkReplyAddress(action=self._getActionString('GetMdibResponse'))
-        responseSoapEnvelope.addHeaderObject(replyAddress)
-        if self._sdcDevice.contextstates_in_getmdib:
-            mdibNode = self._mdib.reconstructMdibWithContextStates()
-        else:
-            mdibNode = self._mdib.reconstructMdib()
-        mdibVersionString = mdibNode.get('MdibVersion') # use same version a in mdib node for response
-        sequenceIdString = mdibNode.get('SequenceId')
-
-        getMdibResponseNode = etree_.Element(msgTag('GetMdibResponse'), nsmap=Prefix.partialMap(Prefix.MSG, Prefix.PM))
-        if mdibVersionString:
-            getMdibResponseNode.set('MdibVersion', mdibVersionString)
-        getMdibResponseNode.set('SequenceId', sequenceIdString)
-        getMdibResponseNode.append(mdibNode)
-        responseSoapEnvelope.addBodyElement(getMdibResponseNode)
-        self._logger.debug('_onGetMdib returns {}', lambda: responseSoapEnvelope.as_xml(pretty=False))
         try:
-            responseSoapEnvelope.validateBody(self._bmmSchema)
-        except Exception as ex:
-            self._logger.error('_onGetMdib: invalid body:{}\n{}', traceback.format_exc(),
-                               lambda: etree_.tostring(mdibNode))
+            # the response body is the same for all requests at the same mdibVersion
+            body = self._responseCache.getMdibBody(self._sdcDevice.contextstates_in_getmdib, self._bmmSchema)
+        except Exception:
+            self._logger.error('_onGetMdib: invalid body:{}', traceback.format_exc())
             raise
+        replyAddress = request.address.mkReplyAddress(action=self._getActionString('GetMdibResponse'))
+        responseSoapEnvelope = body.mkEnvelope(replyAddress)
+        self._logger.debug('_onGetMdib returns {}', lambda: responseSoapEnvelope.as_xml())
         return responseSoapEnvelope
 
     def _onGetMdDescription(self, httpHeader, request):  # pylint:disable=unused-argument
@@ -599,14 +596,16 @@ class GetService(DPWSPortTypeImpl):
         getMdDescriptionResponseNode = etree_.Element(msgTag('GetMdDescriptionResponse'),
                                                       nsmap=nsmap)
 
+        snapshot = self._mdib.getSnapshot()
         if includeMds:
-            mdDescriptionNode, mdibVersion = self._mdib.reconstructMdDescription()
+            # the node of the snapshot must not be modified, use a copy
+            mdDescriptionNode = copy.deepcopy(snapshot.mdDescriptionNode)
             mdDescriptionNode.tag = msgTag('MdDescription')  # rename according to message
-            mdibVersionString = str(mdibVersion)
+            mdibVersionString = str(snapshot.mdibVersion)
         else:
             mdDescriptionNode = etree_.Element(msgTag('MdDescription'))
             mdibVersionString = None
-        sequenceIdString = self._mdib.sequenceId
+        sequenceIdString = snapshot.sequenceId
         if mdibVersionString:
             getMdDescriptionResponseNode.set('MdibVersion', mdibVersionString)
         getMdDescriptionResponseNode.set('SequenceId', sequenceIdString)
@@ -614,7 +613,7 @@ class GetService(DPWSPortTypeImpl):
         getMdDescriptionResponseNode.append(mdDescriptionNode)
         responseSoapEnvelope.addBodyElement(getMdDescriptionResponseNode)
         self._logger.debug('_onGetMdDescription returns {}', lambda: responseSoapEnvelope.as_xml(pretty=False))
-        responseSoapEnvelope.validateBody(self._bmmSchema)
+        self._validateResponse(responseSoapEnvelope, self._bmmSchema)
         return responseSoapEnvelope
 
 
@@ -805,7 +804,7 @@ class SetService(DPWSPortTypeImpl):
             invocationStateNode.text = pmtypes.InvocationState.WAIT
 
         response.addBodyElement(replyBodyNode)
-        response.validateBody(self._bmmSchema)
+        self._validateResponse(response, self._bmmSchema)
         return response
 
     def addWsdlPortType(self, parentNode):
@@ -937,7 +936,7 @@ class ContextService(DPWSPortTypeImpl):
             invocationStateNode.text = pmtypes.InvocationState.WAIT
 
         response.addBodyElement(replyBodyNode)
-        response.validateBody(self._bmmSchema)
+        self._validateResponse(response, self._bmmSchema)
         return response
 
     def _onGetContextStates(self, httpHeader, request):  # pylint:disable=unused-argument
@@ -951,43 +950,43 @@ class ContextService(DPWSPortTypeImpl):
         replyAddress = request.address.mkReplyAddress(action=self._getActionString('GetContextStatesResponse'))
         response.addHeaderObject(replyAddress)
         getContextStatesResponseNode = etree_.Element(msgTag('GetContextStatesResponse'))
-        with self._mdib.mdibLock:
-            getContextStatesResponseNode.set('MdibVersion', str(self._mdib.mdibVersion))
-            getContextStatesResponseNode.set('SequenceId', self._mdib.sequenceId)
-            if len(requestedHandles) == 0:
-                # MessageModel: If the HANDLE reference list is empty, all states in the MDIB SHALL be included in the result list.
-                contextStateContainers = list(self._mdib.contextStates.objects)
-            else:
-                contextStateContainersLookup = OrderedDict() # lookup to avoid double entries
-                for handle in requestedHandles:
-                    # If a HANDLE reference does match a multi state HANDLE,
-                    # the corresponding multi state SHALL be included in the result list
-                    tmp = self._mdib.contextStates.handle.getOne(handle, allowNone=True)
-                    if tmp:
-                        tmp = [tmp]
-                    if not tmp:
-                        # If a HANDLE reference does match a descriptor HANDLE,
-                        # all states that belong to the corresponding descriptor SHALL be included in the result list
-                        tmp = self._mdib.contextStates.descriptorHandle.get(handle)
-                    if not tmp:
-                        # R5042: If a HANDLE reference from the msg:GetContextStates/msg:HandleRef list does match an
-                        # MDS descriptor, then all context states that are part of this MDS SHALL be included in the result list.
-                        descr = self._mdib.descriptions.handle.getOne(handle, allowNone=True)
-                        if descr:
-                            if descr.NODETYPE == domTag('MdsDescriptor'):
-                                tmp = list(self._mdib.contextStates.objects)
-                    if tmp:
-                        for st in tmp:
-                            contextStateContainersLookup[st.Handle] = st
-                contextStateContainers = contextStateContainersLookup.values()
-            if contextStateContainers:
-                for contextStateContainer in contextStateContainers:
-                    node = contextStateContainer.mkStateNode()
-                    getContextStatesResponseNode.append(node)
-                    node.tag = msgTag('ContextState')
+        snapshot = self._mdib.getSnapshot()
+        getContextStatesResponseNode.set('MdibVersion', str(snapshot.mdibVersion))
+        getContextStatesResponseNode.set('SequenceId', snapshot.sequenceId)
+        if len(requestedHandles) == 0:
+            # MessageModel: If the HANDLE reference list is empty, all states in the MDIB SHALL be included in the result list.
+            contextStateContainers = list(snapshot.contextStates)
+        else:
+            contextStateContainersLookup = OrderedDict() # lookup to avoid double entries
+            for handle in requestedHandles:
+                # If a HANDLE reference does match a multi state HANDLE,
+                # the corresponding multi state SHALL be included in the result list
+                tmp = snapshot.getContextState(handle)
+                if tmp:
+                    tmp = [tmp]
+                if not tmp:
+                    # If a HANDLE reference does match a descriptor HANDLE,
+                    # all states that belong to the corresponding descriptor SHALL be included in the result list
+                    tmp = snapshot.getContextStates(handle)
+                if not tmp:
+                    # R5042: If a HANDLE reference from the msg:GetContextStates/msg:HandleRef list does match an
+                    # MDS descriptor, then all context states that are part of this MDS SHALL be included in the result list.
+                    descr = self._mdib.descriptions.handle.getOne(handle, allowNone=True)
+                    if descr:
+                        if descr.NODETYPE == domTag('MdsDescriptor'):
+                            tmp = list(snapshot.contextStates)
+                if tmp:
+                    for st in tmp:
+                        contextStateContainersLookup[st.Handle] = st
+            contextStateContainers = contextStateContainersLookup.values()
+        if contextStateContainers:
+            for contextStateContainer in contextStateContainers:
+                node = contextStateContainer.mkStateNode()
+                getContextStatesResponseNode.append(node)
+                node.tag = msgTag('ContextState')
         response.addBodyElement(getContextStatesResponseNode)
         self._logger.debug('_onGetContextStates returns {}', lambda: response.as_xml(pretty=False))
-        response.validateBody(self._bmmSchema)
+        self._validateResponse(response, self._bmmSchema)
         return response
 
     def addWsdlPortType(self, parentNode):
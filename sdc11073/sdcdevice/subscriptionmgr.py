@@ -1,9 +1,13 @@
 import uuid
 import time
 import copy
+import heapq
+import itertools
 import socket
 import traceback
-from collections import deque, defaultdict
+import threading
+from collections import deque, defaultdict, namedtuple
+from concurrent import futures
 import urllib
 import http.client
 
@@ -20,6 +24,7 @@ from ..compression import CompressionHandler
 
 WsAddress = pysoap.soapenvelope.WsAddress
 Soap12Envelope = pysoap.soapenvelope.Soap12Envelope
+PreparedSoapBody = pysoap.soapenvelope.PreparedSoapBody
 
 MAX_ROUNDTRIP_VALUES = 20
 
@@ -42,6 +47,327 @@ class _RoundTripData(object):
         return 'min={:.4f} max={:.4f} avg={:.4f} absmax={:.4f}'.format(self.min, self.max, self.avg, self.abs_max)
 
 
+class _PreparedReport(object):
+    ''' A notification report that is validated, serialized and gzip compressed only once for all subscribers.
+    Only the header (WS-Addressing To, Action, MessageID and reference parameters) is rendered per subscriber.'''
+
+    def __init__(self, bodyNode, action, doc_nsmap, sdc_definitions, schema, validationPolicy=None):
+        '''
+        @param schema: if not None, body is validated against this schema. Raises etree_.DocumentInvalid.
+        @param validationPolicy: if not None, an xmlparsing.ValidationPolicy that decides if the body is validated
+        '''
+        self.bodyNode = bodyNode
+        self.action = action
+        self.doc_nsmap = doc_nsmap
+        self._sdc_definitions = sdc_definitions
+        if validationPolicy is None:
+            self.preparedBody = PreparedSoapBody.fromNode(bodyNode, doc_nsmap, sdc_definitions, schema)
+        else:
+            self.preparedBody = PreparedSoapBody.fromNode(bodyNode, doc_nsmap, sdc_definitions)
+            validationPolicy.validate(action, schema, bodyNode)
+
+    def mkNotification(self, to, referenceNodes):
+        ''' @return: a SplicedSoapEnvelope for one subscriber'''
+        return self.preparedBody.mkEnvelope(WsAddress(to=to, action=self.action), referenceNodes)
+
+    def coalesce(self, older):
+        ''' merges an older episodic report into this one. States of the older report whose handle is not in this
+        report are added, so every handle keeps its newest state. The merged report has the MdibVersion of this report.
+        @return: a new _PreparedReport, or None if the reports can not be merged (waveforms, descriptor updates, ...)'''
+        handleName = _COALESCE_HANDLES.get(self.bodyNode.tag)
+        if handleName is None or older.bodyNode.tag != self.bodyNode.tag:
+            return None
+        bodyNode = copy.deepcopy(self.bodyNode)
+        reportPartNode = bodyNode.find(msgTag('ReportPart'))
+        handles = set(stateNode.get(handleName) for stateNode in reportPartNode)
+        for olderReportPart in older.bodyNode.iterfind(msgTag('ReportPart')):
+            for stateNode in olderReportPart:
+                if stateNode.get(handleName) not in handles:
+                    reportPartNode.append(copy.deepcopy(stateNode))
+        # both reports were already validated, the merged one only contains their states
+        return _PreparedReport(bodyNode, self.action, self.doc_nsmap, self._sdc_definitions, None)
+
+
+# episodic reports that DeliveryPolicy.COALESCE can merge, value is the attribute that identifies a state
+_COALESCE_HANDLES = {msgTag('EpisodicMetricReport'): 'DescriptorHandle',
+                     msgTag('EpisodicAlertReport'): 'DescriptorHandle',
+                     msgTag('EpisodicComponentReport'): 'DescriptorHandle',
+                     msgTag('EpisodicOperationalStateReport'): 'DescriptorHandle',
+                     msgTag('EpisodicContextReport'): 'Handle',
+                     }
+
+
+_QueueStats = namedtuple('_QueueStats', 'depth max_depth sent dropped coalesced')
+
+
+class DeliveryPolicy(object):
+    ''' What a NotificationDeliveryEngine does if the queue of a subscriber is full.'''
+    DROP_OLDEST = 'drop_oldest'  # remove the oldest queued report
+    DROP_NEWEST = 'drop_newest'  # do not queue the new report
+    # merge the new report with the oldest queued report of the same action, the newest state per handle is kept.
+    # Only episodic state reports can be merged, for other reports (e.g. waveforms) the oldest report is dropped.
+    COALESCE = 'coalesce'
+
+
+class _SubscriptionQueue(object):
+    def __init__(self, subscription):
+        self.subscription = subscription
+        self.items = deque()
+        self.scheduled = False  # True while a worker owns this queue
+        self.closed = False  # True after enqueueEnd, no more reports are accepted
+        self.finished = threading.Event()  # set when the queue is removed from the engine
+        self.max_depth = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def stats(self):
+        return _QueueStats(len(self.items), self.max_depth, self.sent, self.dropped, self.coalesced)
+
+
+class NotificationDeliveryEngine(object):
+    ''' Delivers notification reports asynchronously.
+    Every subscription has its own bounded queue, a pool of worker threads drains the queues.
+    Reports to one subscriber keep their order, a slow subscriber only delays its own reports.'''
+    BATCH_SIZE = 10  # max. number of reports a worker sends to one subscriber before it gives other queues a chance
+
+    def __init__(self, max_workers=4, max_queue_size=50, policy=DeliveryPolicy.DROP_OLDEST, log_prefix=None):
+        '''
+        @param max_workers: number of worker threads
+        @param max_queue_size: max. number of queued reports per subscription
+        @param policy: one of the DeliveryPolicy values, determines what happens if a queue is full
+        '''
+        self._max_workers = max_workers
+        self._max_queue_size = max_queue_size
+        self._policy = policy
+        self._logger = loghelper.getLoggerAdapter('sdc.device.subscrMgr', log_prefix)
+        self._lock = threading.Lock()
+        self._queues = {}  # key: subscription, value: _SubscriptionQueue
+        self._executor = None
+
+    def enqueue(self, subscription, sendFunc, report):
+        ''' queue a report for a subscriber. sendFunc(subscription, report) is called by a worker.'''
+        with self._lock:
+            queue = self._getQueue(subscription)
+            if queue.closed:
+                return
+            if len(queue.items) >= self._max_queue_size:
+                report = self._handleOverflow(queue, report)
+                if report is None:
+                    return
+            queue.items.append((sendFunc, report))
+            queue.max_depth = max(queue.max_depth, len(queue.items))
+            if not queue.scheduled:
+                queue.scheduled = True
+                self._submit(queue)
+
+    def enqueueEnd(self, subscription, sendFunc):
+        ''' queue the last message for a subscriber, e.g. SubscriptionEnd. sendFunc(subscription) is called by a worker
+        after all queued reports were sent, afterwards the queue is removed. Later reports are not queued.
+        @return: a threading.Event that is set when the queue has been removed'''
+        with self._lock:
+            queue = self._getQueue(subscription)
+            queue.closed = True
+            queue.items.append((sendFunc, None))
+            if not queue.scheduled:
+                queue.scheduled = True
+                self._submit(queue)
+            return queue.finished
+
+    def _getQueue(self, subscription):
+        queue = self._queues.get(subscription)
+        if queue is None:
+            queue = _SubscriptionQueue(subscription)
+            self._queues[subscription] = queue
+        return queue
+
+    def _handleOverflow(self, queue, report):
+        ''' makes room in a full queue according to policy.
+        @return: the report that shall be queued, None if the new report shall be dropped.'''
+        if self._policy == DeliveryPolicy.DROP_NEWEST:
+            queue.dropped += 1
+            self._logger.warn('queue of {} is full, dropping {}', queue.subscription, report.action)
+            return None
+        if self._policy == DeliveryPolicy.COALESCE:
+            for item in queue.items:
+                if item[1].action == report.action:
+                    merged = report.coalesce(item[1])
+                    if merged is not None:
+                        queue.items.remove(item)
+                        queue.coalesced += 1
+                        return merged
+                    break
+        dropped = queue.items.popleft()
+        queue.dropped += 1
+        self._logger.warn('queue of {} is full, dropping {}', queue.subscription, dropped[1].action)
+        return report
+
+    def _submit(self, queue):
+        if self._executor is None:
+            self._executor = futures.ThreadPoolExecutor(max_workers=self._max_workers,
+                                                        thread_name_prefix='NotificationDelivery')
+        self._executor.submit(self._drain, queue)
+
+    def _drain(self, queue):
+        for _ in range(self.BATCH_SIZE):
+            with self._lock:
+                if not queue.items:
+                    queue.scheduled = False
+                    return
+                sendFunc, report = queue.items.popleft()
+            if report is None:
+                self._finish(queue, sendFunc)
+                return
+            try:
+                sendFunc(queue.subscription, report)
+                queue.sent += 1
+            except Exception:
+                self._logger.error('delivery of {} to {} failed: {}', report.action, queue.subscription,
+                                   traceback.format_exc())
+        with self._lock:
+            if queue.items and self._executor is not None:
+                self._executor.submit(self._drain, queue)  # continue later, keep scheduled flag
+            else:
+                queue.scheduled = False
+
+    def _finish(self, queue, sendFunc):
+        try:
+            sendFunc(queue.subscription)
+        except Exception:
+            self._logger.error('sending end message to {} failed: {}', queue.subscription, traceback.format_exc())
+        with self._lock:
+            if self._queues.get(queue.subscription) is queue:
+                del self._queues[queue.subscription]
+            queue.scheduled = False
+        queue.finished.set()
+
+    def discard(self, subscription):
+        ''' forget all queued reports of a subscription'''
+        with self._lock:
+            queue = self._queues.pop(subscription, None)
+            if queue is not None:
+                queue.items.clear()
+                queue.finished.set()
+
+    def getQueueStats(self, subscription):
+        with self._lock:
+            queue = self._queues.get(subscription)
+            return None if queue is None else queue.stats()
+
+    def stop(self):
+        ''' drops all queued reports and stops the worker threads. Engine can be used again afterwards.'''
+        with self._lock:
+            for queue in self._queues.values():
+                queue.items.clear()
+                queue.finished.set()
+            self._queues.clear()
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+HousekeepingStats = namedtuple('HousekeepingStats', 'expired evicted')
+_CompressionData = namedtuple('_CompressionData', 'last_encoding saved_bytes stats')
+
+
+class _HousekeepingScheduler(object):
+    ''' Detects expired subscriptions and subscriptions with delivery failures in an own thread.
+    Expiry deadlines are kept in a min-heap, the thread sleeps until the next deadline.
+    Delivery failures are queued by the sender, sending itself does no housekeeping work.
+    Detected subscriptions are handed to onExpired(list) and onFailure(list), both are called without lock.'''
+
+    def __init__(self, onExpired, onFailure, log_prefix=None):
+        self._onExpired = onExpired
+        self._onFailure = onFailure
+        self._logger = loghelper.getLoggerAdapter('sdc.device.subscrMgr', log_prefix)
+        self._cond = threading.Condition()
+        self._heap = []  # entries: (deadline, sequence number, subscription)
+        self._deadlines = {}  # lookup subscription => current deadline; other heap entries are outdated
+        self._failures = deque()
+        self._sequence = itertools.count()  # tie breaker for equal deadlines
+        self._thread = None
+        self._running = False
+
+    def schedule(self, subscription):
+        ''' (re)schedules the expiry check of a subscription, call after subscribe and renew.'''
+        deadline = subscription.expireTime
+        with self._cond:
+            self._deadlines[subscription] = deadline
+            heapq.heappush(self._heap, (deadline, next(self._sequence), subscription))
+            self._ensureStarted()
+            self._cond.notify()
+
+    def forget(self, subscription):
+        with self._cond:
+            self._deadlines.pop(subscription, None)
+
+    def reportFailure(self, subscription):
+        with self._cond:
+            self._failures.append(subscription)
+            self._ensureStarted()
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._heap = []
+            self._deadlines.clear()
+            self._failures.clear()
+            thread = self._thread
+            self._thread = None
+            self._cond.notify()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=2)
+
+    def _ensureStarted(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name='DevSubscriptionHousekeeping')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._failures:
+                    if self._heap:
+                        delay = self._heap[0][0] - time.monotonic()
+                        if delay <= 0:
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+                if not self._running:
+                    return
+                failed = list(self._failures)
+                self._failures.clear()
+                expired = self._popExpired()
+            try:
+                if failed:
+                    self._onFailure(failed)
+                if expired:
+                    self._onExpired(expired)
+            except Exception:
+                self._logger.error('housekeeping failed: {}', traceback.format_exc())
+
+    def _popExpired(self):
+        now = time.monotonic()
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, subscription = heapq.heappop(self._heap)
+            if self._deadlines.get(subscription) != deadline:
+                continue  # outdated entry, subscription was renewed or removed
+            if subscription.expireTime > now:
+                # renewed without schedule call
+                self._deadlines[subscription] = subscription.expireTime
+                heapq.heappush(self._heap, (subscription.expireTime, next(self._sequence), subscription))
+                continue
+            del self._deadlines[subscription]
+            expired.append(subscription)
+        return expired
+
+
 class _DevSubscription(object):
     MAX_NOTIFY_ERRORS = 1
     IDENT_TAG = etree_.QName('http.local.com', 'MyDevIdentifier')
@@ -78,6 +404,8 @@ class _DevSubscription(object):
         self._filters = filter_.split()
         self._sslContext = sslContext
         self._bicepsSchema = bicepsSchema
+        self.validationPolicy = None  # if not None, an xmlparsing.ValidationPolicy for the notification reports
+        self.compressionPolicy = None  # if not None, a compression.CompressionPolicy for the notification reports
 
         self._acceptedEncodings = acceptedEncodings  # these encodings does the other side accept
         self._soapClient = None
@@ -103,6 +431,11 @@ class _DevSubscription(object):
     def soapClient(self):
         return self._soapClient
 
+    @property
+    def expireTime(self):
+        ''' time.monotonic() value of expiration'''
+        return self._started + self._expireseconds
+
     @property
     def remainingSeconds(self):
         duration = int(self._expireseconds - (time.monotonic() - self._started))
@@ -143,7 +476,12 @@ class _DevSubscription(object):
         soapEnvelope.setAddress(addr)
         for identNode in self.notifyRefNodes:
             soapEnvelope.addHeaderElement(identNode)
-        soapEnvelope.validateBody(self._bicepsSchema.bmmSchema)
+        if self.validationPolicy is None:
+            soapEnvelope.validateBody(self._bicepsSchema.bmmSchema)
+        else:
+            soapEnvelope.buildDoc()
+            if len(soapEnvelope.bodyNode) > 0:
+                self.validationPolicy.validate(action, self._bicepsSchema.bmmSchema, soapEnvelope.bodyNode[0])
         return soapEnvelope
 
     def _mkEndReport(self, soapEnvelope, action):
@@ -169,11 +507,24 @@ class _DevSubscription(object):
         soapEnvelope = pysoap.soapenvelope.Soap12Envelope(doc_nsmap)
         soapEnvelope.addBodyElement(bodyNode)
         rep = self._mkNotificationReport(soapEnvelope, action)
+        self._post(lambda: self._soapClient.postSoapEnvelopeTo(self._url.path, rep,
+                                                               responseFactory=lambda x, schema: x,
+                                                               msg='sendNotificationReport {}'.format(action),
+                                                               compressionPolicy=self.compressionPolicy))
+
+    def sendPreparedReport(self, report):
+        ''' sends a _PreparedReport. Body is already validated and serialized, only the header is rendered here.'''
+        if not self.isValid:
+            return
+        message = report.mkNotification(self.notifyToAddress, self.notifyRefNodes)
+        self._post(lambda: self._soapClient.postPreparedMessageTo(self._url.path, message,
+                                                                  msg='sendNotificationReport {}'.format(report.action),
+                                                                  compressionPolicy=self.compressionPolicy))
+
+    def _post(self, postFunc):
         try:
             roundtrip_timer = observableproperties.SingleValueCollector(self._soapClient, 'roundtrip_time')
-
-            self._soapClient.postSoapEnvelopeTo(self._url.path, rep, responseFactory=lambda x, schema: x,
-                                                msg='sendNotificationReport {}'.format(action))
+            postFunc()
             try:
                 roundtrip_time = roundtrip_timer.result(0)
                 self.last_roundtrip_times.append(roundtrip_time)
@@ -287,18 +638,72 @@ class _DevSubscription(object):
         return tuple([f.split('/')[-1] for f in self._filters])
 
 
+class _ActionIndexDefinition(multikey.IndexDefinition1n):
+    ''' Index of subscriptions by their filters (actions).
+    getMatching implements the same rule as _DevSubscription.matches without looking at every subscription:
+    only the distinct filter strings are compared with the action, and the result of this comparison is kept
+    until a filter is added to or removed from the index.'''
+
+    def __init__(self):
+        super(_ActionIndexDefinition, self).__init__(lambda obj: set(obj._filters)) # pylint: disable=protected-access
+        self._matchingKeys = {}  # lookup action => list of filters that end with action
+
+    def getMatching(self, action):
+        action = action.strip()  # just to be sure there are no spaces....
+        keys = self._matchingKeys.get(action)
+        if keys is None:
+            keys = [k for k in self.keys() if k.endswith(action)]
+            self._matchingKeys[action] = keys
+        if len(keys) == 1:
+            return list(self[keys[0]])
+        result = []
+        for k in keys:
+            result.extend(obj for obj in self[k] if obj not in result)
+        return result
+
+    def _addKey(self, key, obj):
+        if key not in self:
+            self._matchingKeys.clear()
+        super(_ActionIndexDefinition, self)._addKey(key, obj)
+
+    def _rmKey(self, key, obj):
+        super(_ActionIndexDefinition, self)._rmKey(key, obj)
+        if key not in self:
+            self._matchingKeys.clear()
+
+    def clear(self):
+        super(_ActionIndexDefinition, self).clear()
+        self._matchingKeys.clear()
+
+
 class SubscriptionsManager(object):
     NotificationPrefixes = [Prefix.S12, Prefix.PM, Prefix.WSA, Prefix.WSE]
     DEFAULT_MAX_SUBSCR_DURATION = 7200  # max. possible duration of a subscription
+    END_TIMEOUT = 5  # max. seconds endAllSubscriptions waits for queued reports and SubscriptionEnd messages
 
     def __init__(self, sslContext, sdc_definitions, bicepsParser, supportedEncodings,
-                 max_subscription_duration=None, log_prefix=None, chunked_messages=False):
+                 max_subscription_duration=None, log_prefix=None, chunked_messages=False, delivery_engine=None,
+                 validation_policy=None, compression_policy_factory=None):
+        '''
+        @param delivery_engine: if not None, a NotificationDeliveryEngine instance that sends notifications asynchronously.
+                                Otherwise notifications are sent in the calling thread.
+                                The engine is not stopped by the SubscriptionsManager.
+        @param validation_policy: if not None, an xmlparsing.ValidationPolicy that decides per action if notification
+                                  reports are validated. Otherwise all reports are validated.
+        @param compression_policy_factory: if not None, a callable(roundtrip_times=...) that returns a
+                                  compression.CompressionPolicy for a new subscription, e.g. the CompressionPolicy class
+                                  or a functools.partial of it. roundtrip_times are the measured roundtrip times of the subscription.
+                                  Otherwise notifications are always compressed with the preferred encoding of the client.
+        '''
         self._sslContext = sslContext
         self.bicepsParser = bicepsParser
+        self.validationPolicy = validation_policy
+        self.compressionPolicyFactory = compression_policy_factory
         self.sdc_definitions = sdc_definitions
         self.log_prefix = log_prefix
         self._logger = loghelper.getLoggerAdapter('sdc.device.subscrMgr', self.log_prefix)
         self._chunked_messages = chunked_messages
+        self._deliveryEngine = delivery_engine
         self.soapClients = {}  # key: net location, value soapClient instance
         self._supportedEncodings = supportedEncodings
         self._max_subscription_duration = max_subscription_duration or self.DEFAULT_MAX_SUBSCR_DURATION
@@ -306,7 +711,12 @@ class SubscriptionsManager(object):
         self._subscriptions.addIndex('identifier', multikey.UIndexDefinition(lambda obj: obj.my_identifier.text))
         self._subscriptions.addIndex('netloc', multikey.IndexDefinition(
             lambda obj: obj._url.netloc))  # pylint:disable=protected-access
+        self._subscriptions.addIndex('action', _ActionIndexDefinition())
         self.base_urls = None
+        self._housekeeper = _HousekeepingScheduler(self._onSubscriptionsExpired, self._onDeliveryFailures,
+                                                   log_prefix=log_prefix)
+        self._expiredCount = 0
+        self._evictedCount = 0
 
     def setBaseUrls(self, base_urls):
         self.base_urls = base_urls
@@ -315,19 +725,23 @@ class SubscriptionsManager(object):
         acceptedEncodings = CompressionHandler.parseHeader(httpHeader.get('Accept-Encoding'))
         s = _DevSubscription.fromSoapEnvelope(soapEnvelope, self._sslContext, self.bicepsParser, acceptedEncodings,
                                               self._max_subscription_duration, self.base_urls)
-        # assign a soap client
+        s.validationPolicy = self.validationPolicy
+        if self.compressionPolicyFactory is not None:
+            s.compressionPolicy = self.compressionPolicyFactory(roundtrip_times=s.last_roundtrip_times)
+        # assign a soap client. The lock keeps the housekeeping thread from releasing it in the meantime.
         key = s._url.netloc  # pylint:disable=protected-access
-        soapClient = self.soapClients.get(key)
-        if soapClient is None:
-            soapClient = pysoap.soapclient.SoapClient(key, loghelper.getLoggerAdapter('sdc.device.soap', self.log_prefix),
-                                                      sslContext=self._sslContext, sdc_definitions=self.sdc_definitions,
-                                                      supportedEncodings=self._supportedEncodings,
-                                                      requestEncodings=acceptedEncodings,
-                                                      chunked_requests=self._chunked_messages)
-            self.soapClients[key] = soapClient
-        s.setSoapClient(soapClient)
         with self._subscriptions.lock:
+            soapClient = self.soapClients.get(key)
+            if soapClient is None:
+                soapClient = pysoap.soapclient.SoapClient(key, loghelper.getLoggerAdapter('sdc.device.soap', self.log_prefix),
+                                                          sslContext=self._sslContext, sdc_definitions=self.sdc_definitions,
+                                                          supportedEncodings=self._supportedEncodings,
+                                                          requestEncodings=acceptedEncodings,
+                                                          chunked_requests=self._chunked_messages)
+                self.soapClients[key] = soapClient
+            s.setSoapClient(soapClient)
             self._subscriptions.addObject(s)
+        self._housekeeper.schedule(s)
         self._logger.info('new {}', s)
 
         response = Soap12Envelope(Prefix.partialMap(Prefix.S12, Prefix.WSA, Prefix.WSE))
@@ -360,17 +774,11 @@ class SubscriptionsManager(object):
                 self._logger.warn('unsubscribe: no object found for id={}', identtext)
             else:
                 s.close()
-                with self._subscriptions.lock:
-                    self._subscriptions.removeObject(s)
+                self._removeSubscription(s)
                 self._logger.info('unsubscribe: object found and removed (Xaddr = {}, filter = {})', s.notifyToAddress,
                                   s._filters)  # pylint: disable=protected-access
                 # now check if we can close the soap client
-                key = s._url.netloc  # pylint: disable=protected-access
-                subscriptionsWithSameSoapClient = self._subscriptions.netloc.get(key, [])
-                if len(subscriptionsWithSameSoapClient) == 0:
-                    self.soapClients[key].close()
-                    del self.soapClients[key]
-                    self._logger.info('unsubscribe: closed soap client to {})', key)
+                self._releaseSoapClient(s._url.netloc)  # pylint: disable=protected-access
         else:
             self._logger.error('unsubscribe request did not contain an identifier!!!: {}',
                                soapEnvelope.as_xml(pretty=True))
@@ -417,10 +825,11 @@ class SubscriptionsManager(object):
             errorMessageNode = etree_.SubElement(invocationInfoNode, msgTag('InvocationErrorMessage'))
             errorMessageNode.text = str(errorMessage)
 
-        for s in subscribers:
-            self._logger.info('notifyOperation: sending report to {}', s.notifyToAddress)
-            self._sendNotificationReport(s, bodyNode, action, Prefix.partialMap(Prefix.S12, Prefix.WSA, Prefix.WSE))
-        self._doHousekeeping()
+        if subscribers:
+            report = self._prepareReport(bodyNode, action, Prefix.partialMap(Prefix.S12, Prefix.WSA, Prefix.WSE))
+            for s in subscribers:
+                self._logger.info('notifyOperation: sending report to {}', s.notifyToAddress)
+                self._deliverNotificationReport(s, report)
 
     def onGetStatusRequest(self, soapEnvelope):
         self._logger.debug('onGetStatusRequest {}', lambda: soapEnvelope.as_xml(pretty=True))
@@ -464,6 +873,7 @@ class SubscriptionsManager(object):
 
         else:
             subscr.renew(expires)
+            self._housekeeper.schedule(subscr)
 
             response = Soap12Envelope(Prefix.partialMap(Prefix.S12, Prefix.WSA, Prefix.WSE))
             replyAddress = soapEnvelope.address.mkReplyAddress(
@@ -491,10 +901,10 @@ class SubscriptionsManager(object):
             stateNode = s.mkStateNode(msgTag('MetricState'))
             reportPartNode.append(stateNode)
 
+        report = self._prepareReport(bodyNode, action, nsmapper.partialMap(*self.NotificationPrefixes))
         for s in subscribers:
             self._logger.debug('sendEpisodicMetricReport: sending report to {}', s.notifyToAddress)
-            self._sendNotificationReport(s, bodyNode, action, nsmapper.partialMap(*self.NotificationPrefixes))
-        self._doHousekeeping()
+            self._deliverNotificationReport(s, report)
 
     def sendEpisodicOperationalStateReport(self, updatedStates, nsmapper, mdibVersion, sequenceId):
         action = self.sdc_definitions.Actions.EpisodicOperationalStateReport
@@ -512,10 +922,10 @@ class SubscriptionsManager(object):
             stateNode = s.mkStateNode(msgTag('OperationState'))
             reportPartNode.append(stateNode)
 
+        report = self._prepareReport(bodyNode, action, nsmapper.partialMap(*self.NotificationPrefixes))
         for s in subscribers:
             self._logger.debug('sendEpisodicOperationalStateReport: sending report to {}', s.notifyToAddress)
-            self._sendNotificationReport(s, bodyNode, action, nsmapper.partialMap(*self.NotificationPrefixes))
-        self._doHousekeeping()
+            self._deliverNotificationReport(s, report)
 
     def sendEpisodicAlertReport(self, updatedAlertStates, nsmapper, mdibVersion, sequenceId):
         action = self.sdc_definitions.Actions.EpisodicAlertReport
@@ -533,10 +943,10 @@ class SubscriptionsManager(object):
             stateNode = s.mkStateNode(msgTag('AlertState'))
             reportPartNode.append(stateNode)
 
+        report = self._prepareReport(bodyNode, action, nsmapper.partialMap(*self.NotificationPrefixes))
         for s in subscribers:
             self._logger.debug('sendEpisodicAlertReport: sending report to {}', s.notifyToAddress)
-            self._sendNotificationReport(s, bodyNode, action, nsmapper.partialMap(*self.NotificationPrefixes))
-        self._doHousekeeping()
+            self._deliverNotificationReport(s, report)
 
     def sendEpisodicComponentStateReport(self, updatedComponentStates, nsmapper, mdibVersion, sequenceId):
         action = self.sdc_definitions.Actions.EpisodicComponentReport
@@ -554,10 +964,10 @@ class SubscriptionsManager(object):
             stateNode = s.mkStateNode(msgTag('ComponentState'))
             reportPartNode.append(stateNode)
 
+        report = self._prepareReport(bodyNode, action, nsmapper.partialMap(*self.NotificationPrefixes))
         for s in subscribers:
             self._logger.debug('sendEpisodicComponentStateReport: sending report to {}', s.notifyToAddress)
-            self._sendNotificationReport(s, bodyNode, action, nsmapper.partialMap(*self.NotificationPrefixes))
-        self._doHousekeeping()
+            self._deliverNotificationReport(s, report)
 
     def sendEpisodicContextReport(self, updatedContextStates, nsmapper, mdibVersion, sequenceId):
         action = self.sdc_definitions.Actions.EpisodicContextReport
@@ -576,10 +986,10 @@ class SubscriptionsManager(object):
             stateNode = s.mkStateNode(msgTag('ContextState'))
             reportPartNode.append(stateNode)
 
+        report = self._prepareReport(bodyNode, action, nsmapper.partialMap(*self.NotificationPrefixes))
         for s in subscribers:
             self._logger.info('sendEpisodicContextReport: sending report to {}', s.notifyToAddress)
-            self._sendNotificationReport(s, bodyNode, action, nsmapper.partialMap(*self.NotificationPrefixes))
-        self._doHousekeeping()
+            self._deliverNotificationReport(s, report)
 
     def sendRealtimeSamplesReport(self, updatedRealTimeSampleStates, nsmapper, mdibVersion, sequenceId):
         action = self.sdc_definitions.Actions.Waveform
@@ -596,18 +1006,33 @@ class SubscriptionsManager(object):
             stateNode = s.mkStateNode(msgTag('State'))
             bodyNode.append(stateNode)
 
+        report = self._prepareReport(bodyNode, action, nsmapper.partialMap(*self.NotificationPrefixes))
         for s in subscribers:
             self._logger.debug('sendRealtimeSamplesReport: sending report to {}', s.notifyToAddress)
-            self._sendNotificationReport(s, bodyNode, action, nsmapper.partialMap(*self.NotificationPrefixes))
-        self._doHousekeeping()
+            self._deliverNotificationReport(s, report)
 
     def endAllSubscriptions(self, sendSubscriptionEnd):
+        ''' removes all subscriptions. With a delivery engine the SubscriptionEnd message is sent after the queued reports
+        of the subscription (waits max. END_TIMEOUT seconds), without SubscriptionEnd the queued reports are discarded.
+        The delivery engine itself is not stopped, it might be shared by other devices; its owner stops it.'''
         action = self.sdc_definitions.Actions.SubscriptionEnd
         with self._subscriptions.lock:
+            subscriptions = list(self._subscriptions.objects)
+            self._subscriptions.clear()
+        self._housekeeper.stop()
+        if self._deliveryEngine is None:
             if sendSubscriptionEnd:
-                for s in self._subscriptions.objects:
+                for s in subscriptions:
                     s.sendNotificationEndMessage(action)
-            self._subscriptions.clear()
+            return
+        if sendSubscriptionEnd:
+            finished = [self._deliveryEngine.enqueueEnd(s, lambda subscr: subscr.sendNotificationEndMessage(action))
+                        for s in subscriptions]
+            deadline = time.monotonic() + self.END_TIMEOUT
+            for event in finished:
+                event.wait(max(0, deadline - time.monotonic()))
+        for s in subscriptions:
+            self._deliveryEngine.discard(s)
 
     def _mkDescriptorUpdatesReportPart(self, parentNode, modificationtype, descriptors, updated_states):
         ''' Helper that creates ReportPart.'''
@@ -640,14 +1065,28 @@ class SubscriptionsManager(object):
         self._mkDescriptorUpdatesReportPart(bodyNode, 'Crt', created, updated_states)
         self._mkDescriptorUpdatesReportPart(bodyNode, 'Del', deleted, updated_states)
 
+        report = self._prepareReport(bodyNode, action, nsmapper.partialMap(Prefix.S12, Prefix.PM, Prefix.WSA, Prefix.WSE))
         for s in subscribers:
-            self._sendNotificationReport(s, bodyNode, action,
-                                         nsmapper.partialMap(Prefix.S12, Prefix.PM, Prefix.WSA, Prefix.WSE))
-        self._doHousekeeping()
+            self._deliverNotificationReport(s, report)
+
+    def _prepareReport(self, bodyNode, action, doc_nsmap):
+        try:
+            return _PreparedReport(bodyNode, action, doc_nsmap, self.sdc_definitions, self.bicepsParser.bmmSchema,
+                                   self.validationPolicy)
+        except etree_.DocumentInvalid as ex:
+            # this is an error related to the document, it cannot be sent to any subscriber => re-raise
+            self._logger.error('Invalid Document: {!r}\n{}', ex, etree_.tostring(bodyNode))
+            raise
+
+    def _deliverNotificationReport(self, subscription, report):
+        if self._deliveryEngine is None:
+            self._sendNotificationReport(subscription, report)
+        else:
+            self._deliveryEngine.enqueue(subscription, self._sendNotificationReport, report)
 
-    def _sendNotificationReport(self, subscription, bodyNode, action, doc_nsmap):
+    def _sendNotificationReport(self, subscription, report):
         try:
-            subscription.sendNotificationReport(bodyNode, action, doc_nsmap)
+            subscription.sendPreparedReport(report)
         except pysoap.soapclient.HTTPReturnCodeError as ex:
             # this is an error related to the connection => log error and continue
             self._logger.error('could not send notification report: HTTP status= {}, reason={}, {}', ex.status,
@@ -660,15 +1099,17 @@ class SubscriptionsManager(object):
             self._logger.error('could not send notification report error= {!r}: {}', ex, subscription)
         except etree_.DocumentInvalid as ex:
             # this is an error related to the document, it cannot be sent to any subscriber => re-raise
-            self._logger.error('Invalid Document: {!r}\n{}', ex, etree_.tostring(bodyNode))
+            self._logger.error('Invalid Document: {!r}\n{}', ex, etree_.tostring(report.bodyNode))
             raise
         except Exception as ex:
             # this should never happen! => re-raise
             self._logger.error('could not send notification report error= {!r}: {}', ex, subscription)
+        if subscription.hasDeliveryFailure:
+            self._housekeeper.reportFailure(subscription)
 
     def _getSubscriptionsForAction(self, action):
         with self._subscriptions.lock:
-            return [s for s in self._subscriptions.objects if s.matches(action)]
+            return self._subscriptions.action.getMatching(action)
 
     def _getSubscriptionforRequest(self, soapEnvelope):
         request_name = soapEnvelope.bodyNode[0].tag
@@ -678,42 +1119,78 @@ class SubscriptionsManager(object):
         else:
             identifier = identifierNode.text
         with self._subscriptions.lock:
-            subscr = [s for s in self._subscriptions.objects if s.my_identifier.text == identifier]
-        if len(subscr) > 1:
-            raise RuntimeError('Have {} subscriptions with identifier "{}"!'.format(len(subscr), identifier))
-        elif len(subscr) == 0:
+            subscr = self._subscriptions.identifier.getOne(identifier, allowNone=True)
+        if subscr is None:
             self._logger.error('on {}: unknown Subscription identifier "{}"', request_name, identifier)
-            return
-        return subscr[0]
-
-    def _doHousekeeping(self):
-        ''' remove expired or invalid subscriptions'''
-        with self._subscriptions._lock:  # pylint: disable=protected-access
-            crap = [s for s in self._subscriptions.objects if not s.isValid]
-        unreachable_netlocs = []
-        for c in crap:
+        return subscr
+
+    def _removeSubscription(self, subscription):
+        ''' @return: True if the subscription was registered, False if it has already been removed'''
+        with self._subscriptions.lock:
+            registered = self._subscriptions.identifier.getOne(subscription.my_identifier.text, allowNone=True)
+            if registered is not subscription:
+                return False
+            self._subscriptions.removeObject(subscription)
+        self._housekeeper.forget(subscription)
+        if self._deliveryEngine is not None:
+            self._deliveryEngine.discard(subscription)
+        return True
+
+    def _releaseSoapClient(self, netloc):
+        ''' closes the soap client of netloc if no subscription uses it.'''
+        with self._subscriptions.lock:
+            if self._subscriptions.netloc.get(netloc):
+                return
+            soapClient = self.soapClients.pop(netloc, None)
+        if soapClient is not None:
+            soapClient.close()
+            self._logger.info('closed soap client to {})', netloc)
+
+    def _onSubscriptionsExpired(self, subscriptions):
+        ''' called by housekeeping thread'''
+        for s in subscriptions:
+            if self._removeSubscription(s):
+                self._logger.info('deleted expired {}', s)
+                self._expiredCount += 1
+                self._releaseSoapClient(s._url.netloc)  # pylint: disable=protected-access
+
+    def _onDeliveryFailures(self, subscriptions):
+        ''' called by housekeeping thread'''
+        netlocs = set()
+        unreachable_netlocs = set()
+        for c in subscriptions:
+            if not self._removeSubscription(c):
+                continue
+            self._logger.info('deleted {}, errors={}', c, c._notifyErrors)  # pylint: disable=protected-access
+            self._evictedCount += 1
+            netlocs.add(c._url.netloc)  # pylint: disable=protected-access
             if c.hasConnectionError:
                 # the network location is unreachable, we can remove all subscriptions that use this location
-                unreachable_netlocs.append(c.soapClient.netloc)
+                unreachable_netlocs.add(c.soapClient.netloc)
                 try:
                     c.soapClient.close()
                 except:
                     self._logger.error('error in soapClient.close(): {}', traceback.format_exc())
 
-            self._logger.info('deleting {}, errors={}', c, c._notifyErrors)  # pylint: disable=protected-access
-            with self._subscriptions.lock:
-                self._subscriptions.removeObject(c)
-
-            if c.soapClient.netloc in self.soapClients:  # remove closed soap client from list
-                del self.soapClients[c.soapClient.netloc]
-
         # now find all subscriptions that have the same address
-        with self._subscriptions._lock:  # pylint: disable=protected-access
-            also_unreachable = [s for s in self._subscriptions.objects if
-                                s.soapClient is not None and s.soapClient.netloc in unreachable_netlocs]
-            for s in also_unreachable:
-                self._logger.info('deleting also subscription {}, same endpoint', s)
-                self._subscriptions.removeObject(s)
+        if unreachable_netlocs:
+            with self._subscriptions.lock:
+                also_unreachable = [s for s in self._subscriptions.objects if
+                                    s.soapClient is not None and s.soapClient.netloc in unreachable_netlocs]
+        else:
+            also_unreachable = []
+        for s in also_unreachable:
+            if self._removeSubscription(s):
+                self._logger.info('deleted also subscription {}, same endpoint', s)
+                self._evictedCount += 1
+                netlocs.add(s._url.netloc)  # pylint: disable=protected-access
+        for netloc in netlocs:
+            self._releaseSoapClient(netloc)
+
+    def getHousekeepingStats(self):
+        ''' @return: HousekeepingStats with the number of subscriptions that expired or were removed because of
+        delivery failures (including other subscriptions to the same unreachable network location).'''
+        return HousekeepingStats(self._expiredCount, self._evictedCount)
 
     def getSubScriptionRoundtripTimes(self):
         '''Calculates roundtrip times based on last MAX_ROUNDTRIP_VALUES values.
@@ -727,6 +1204,38 @@ class SubscriptionsManager(object):
                     ret[(s.notifyToAddress, s.short_filter_names())] = s.get_roundtrip_stats()
         return ret
 
+    def getSubscriptionQueueStats(self):
+        '''Queue statistics of asynchronous notification delivery.
+
+        @return: a dictionary with key=(<notifyToAddress>, (subscriptionnames)), value = _QueueStats with members depth, max_depth, sent, dropped, coalesced.
+                 The dictionary is empty if notifications are sent synchronously.
+        '''
+        ret = {}
+        if self._deliveryEngine is None:
+            return ret
+        with self._subscriptions.lock:
+            subscriptions = list(self._subscriptions.objects)
+        for s in subscriptions:
+            stats = self._deliveryEngine.getQueueStats(s)
+            if stats is not None:
+                ret[(s.notifyToAddress, s.short_filter_names())] = stats
+        return ret
+
+    def getSubscriptionCompressionStats(self):
+        '''Compression statistics of subscriptions that have a compression policy.
+
+        @return: a dictionary with key=(<notifyToAddress>, (subscriptionnames)), value = _CompressionData with members
+                 last_encoding, saved_bytes, stats (a dictionary encoding => compression.CompressionStats).
+        '''
+        ret = {}
+        with self._subscriptions.lock:
+            for s in self._subscriptions.objects:
+                policy = s.compressionPolicy
+                if policy is not None:
+                    ret[(s.notifyToAddress, s.short_filter_names())] = _CompressionData(
+                        policy.lastEncoding, policy.savedBytes, policy.getAllStats())
+        return ret
+
     def getClientRoundtripTimes(self):
         '''Calculates roundtrip times based on last MAX_ROUNDTRIP_VALUES values.
 
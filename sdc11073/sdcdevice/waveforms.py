@@ -1,5 +1,5 @@
 import math
-import itertools
+import array
 
 
 def sinus(min_value, max_value, samples):
@@ -26,19 +26,42 @@ def triangle(min_value, max_value, samples):
 
     
 class _WaveformGeneratorBase(object):
+    ''' Cycles through the values of one waveform period.
+    The period is precomputed as a float array, samples are returned as slices of it.'''
     def __init__(self, values_generator, min_value, max_value, waveformperiod, sampleperiod):
         if sampleperiod >= waveformperiod:
             raise ValueError('please choose a waveformperiod >> sampleperiod. currently use have wp={}, sp={}'.format(waveformperiod, sampleperiod))
         self.sampleperiod = sampleperiod
         samples = int(waveformperiod / sampleperiod)
-        values = values_generator(min_value, max_value, samples)     
-        wf_with_startflag = [ (v, i==0) for i, v in  enumerate(values)]
-        self._values = wf_with_startflag
-        self._generator = itertools.cycle(self._values)
+        self._values = array.array('d', values_generator(min_value, max_value, samples))
+        self._position = 0  # index in self._values of next sample
+
+
+    def nextSampleArray(self, count):
+        '''
+        @param count: number of samples
+        @return: tuple (samples, cycleStarts); samples is an array.array of floats,
+                 cycleStarts is a list of indices in samples where a new waveform period begins.
+        '''
+        values = self._values
+        period = len(values)
+        start = self._position
+        end = start + count
+        if end <= period:
+            samples = values[start:end]
+        else:
+            full_periods, rest = divmod(end, period)
+            samples = values[start:] + values * (full_periods - 1) + values[:rest]
+        self._position = end % period
+        cycleStarts = list(range((period - start) % period, count, period))
+        return samples, cycleStarts
 
 
     def nextSamples(self, count):
-        return [next(self._generator) for i in range(count)]
+        ''' @return: a list of (value, isStartOfCycle) tuples'''
+        samples, cycleStarts = self.nextSampleArray(count)
+        cycleStarts = set(cycleStarts)
+        return [(v, i in cycleStarts) for i, v in enumerate(samples)]
 
     
 
@@ -1,38 +1,57 @@
+import copy
+import threading
+from collections import namedtuple
+from concurrent import futures
 from lxml import etree as etree_
 from .definitions_base import ProtocolsRegistry
+from . import loghelper
 
 
 class BicepsSchema(object):
+    ''' The xml schemas of one sdc definition. Every schema is parsed and compiled on first use.
+    Use getBicepsSchema to share the compiled schemas of a definition between all mdibs, clients and devices.'''
+    # schema attribute name => (name of the file path attribute of the definition class, namespace normalization)
+    _schemaFiles = {'pmSchema': ('ParticipantModelSchemaFile', True),
+                    'bmmSchema': ('MessageModelSchemaFile', True),
+                    'mexSchema': ('MetaDataExchangeSchemaFile', False),
+                    'evtSchema': ('EventingSchemaFile', False),
+                    's12Schema': ('SoapEnvelopeSchemaFile', False),
+                    'dpwsSchema': ('DPWSSchemaFile', False),
+                    }
+
     def __init__(self, definition_cls):
         '''
 
-        :param base_definition_cls: a class derived from BaseDefinitions, it contains paths to xml schema files
+        :param definition_cls: a class derived from BaseDefinitions, it contains paths to xml schema files
         '''
         self.parser = etree_.ETCompatXMLParser()
         self._versionRef = definition_cls
         self.parser.resolvers.add(self._versionRef.schemaResolver)
+        self._schemas = {}
+        self._lock = threading.Lock()  # the parser is not thread safe, schemas are compiled only once
 
-        pmSchema = self._parseFile(self._versionRef.ParticipantModelSchemaFile)
-        self.pmSchema = etree_.XMLSchema(etree=pmSchema)
-
-        bmmSchema = self._parseFile(self._versionRef.MessageModelSchemaFile)
-        self.bmmSchema = etree_.XMLSchema(etree=bmmSchema)
-
-        mexSchema = self._parseFile(self._versionRef.MetaDataExchangeSchemaFile, normalized=False)
-        self.mexSchema = etree_.XMLSchema(etree=mexSchema)
-
-        evtSchema = self._parseFile(self._versionRef.EventingSchemaFile, normalized=False)
-        self.evtSchema = etree_.XMLSchema(etree=evtSchema)
-
-        s12Schema = self._parseFile(self._versionRef.SoapEnvelopeSchemaFile, normalized=False)
-        self.s12Schema = etree_.XMLSchema(etree=s12Schema)
-
-        dpwsSchema = self._parseFile(self._versionRef.DPWSSchemaFile, normalized=False)
-        self.dpwsSchema = etree_.XMLSchema(etree=dpwsSchema)
+    pmSchema = property(lambda self: self._getSchema('pmSchema'))
+    bmmSchema = property(lambda self: self._getSchema('bmmSchema'))
+    mexSchema = property(lambda self: self._getSchema('mexSchema'))
+    evtSchema = property(lambda self: self._getSchema('evtSchema'))
+    s12Schema = property(lambda self: self._getSchema('s12Schema'))
+    dpwsSchema = property(lambda self: self._getSchema('dpwsSchema'))
 
     def __str__(self):
         return '{} {}'.format(self.__class__.__name__, self._versionRef.__name__)
 
+    def _getSchema(self, name):
+        schema = self._schemas.get(name)
+        if schema is None:
+            with self._lock:
+                schema = self._schemas.get(name)
+                if schema is None:
+                    fileAttr, normalized = self._schemaFiles[name]
+                    schemaTree = self._parseFile(getattr(self._versionRef, fileAttr), normalized=normalized)
+                    schema = etree_.XMLSchema(etree=schemaTree)
+                    self._schemas[name] = schema
+        return schema
+
     def _parseFile(self, path, normalized=True):
         with open(path, 'rb') as f:
             xml_text = f.read()
@@ -41,6 +60,154 @@ class BicepsSchema(object):
         return etree_.fromstring(xml_text, parser=self.parser, base_url=path)
 
 
+_bicepsSchemas = {}  # lookup definition_cls => BicepsSchema
+_bicepsSchemasLock = threading.Lock()
+
+
+def getBicepsSchema(definition_cls):
+    '''
+    :param definition_cls: a class derived from BaseDefinitions
+    :return: the shared BicepsSchema instance of definition_cls
+    '''
+    with _bicepsSchemasLock:
+        bicepsSchema = _bicepsSchemas.get(definition_cls)
+        if bicepsSchema is None:
+            bicepsSchema = BicepsSchema(definition_cls)
+            _bicepsSchemas[definition_cls] = bicepsSchema
+    return bicepsSchema
+
+
+class ValidationMode(object):
+    ''' How a ValidationPolicy handles the messages of an action.'''
+    ALWAYS = 'always'  # validate every message in the calling thread, an invalid message raises etree_.DocumentInvalid
+    NEVER = 'never'  # no validation
+    SAMPLED = 'sampled'  # like ALWAYS, but only every n-th message is validated
+    ASYNC = 'async'  # every n-th message is validated in a background thread, errors are logged and reported
+
+
+ValidationStats = namedtuple('ValidationStats', 'validated failed skipped')
+
+
+class _ValidationCounters(object):
+    __slots__ = ('messages', 'validated', 'failed', 'skipped')
+
+    def __init__(self):
+        self.messages = 0
+        self.validated = 0
+        self.failed = 0
+        self.skipped = 0
+
+
+class ValidationPolicy(object):
+    ''' Decides per action if and how a message is validated against a schema and counts validated and failed messages.
+    Actions without an own rule use the default rule.'''
+
+    def __init__(self, mode=ValidationMode.ALWAYS, interval=1, max_workers=1, onError=None, log_prefix=None):
+        '''
+        @param mode: default mode, one of the ValidationMode values
+        @param interval: default interval, see setRule
+        @param max_workers: number of threads that validate in ValidationMode.ASYNC
+        @param onError: if not None, it is called with (action, exception) for every failed asynchronous validation
+        '''
+        self._default = self._mkRule(mode, interval)
+        self._rules = {}  # key: action, value: (mode, interval)
+        self._counters = {}  # key: action, value: _ValidationCounters
+        self._max_workers = max_workers
+        self._onError = onError
+        self._logger = loghelper.getLoggerAdapter('sdc.validation', log_prefix)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @staticmethod
+    def _mkRule(mode, interval):
+        if mode not in (ValidationMode.ALWAYS, ValidationMode.NEVER, ValidationMode.SAMPLED, ValidationMode.ASYNC):
+            raise ValueError('unknown validation mode {}'.format(mode))
+        if interval < 1:
+            raise ValueError('interval must be >= 1, got {}'.format(interval))
+        return mode, interval
+
+    def setRule(self, action, mode, interval=1):
+        '''
+        @param mode: one of the ValidationMode values
+        @param interval: ValidationMode.SAMPLED and ValidationMode.ASYNC validate the first and then every interval-th
+                         message of the action
+        '''
+        self._rules[action] = self._mkRule(mode, interval)
+
+    def getRule(self, action):
+        ''' @return: tuple (mode, interval) that is used for action'''
+        return self._rules.get(action, self._default)
+
+    def validate(self, action, schema, node):
+        '''
+        Validates node according to the rule of action. Nothing happens if schema is None.
+        In ValidationMode.ASYNC a copy of node is validated later, otherwise etree_.DocumentInvalid is raised.
+        '''
+        if schema is None:
+            return
+        mode, interval = self.getRule(action)
+        with self._lock:
+            counters = self._counters.get(action)
+            if counters is None:
+                counters = _ValidationCounters()
+                self._counters[action] = counters
+            counters.messages += 1
+            if mode == ValidationMode.NEVER or (mode != ValidationMode.ALWAYS and (counters.messages - 1) % interval):
+                counters.skipped += 1
+                return
+            if mode == ValidationMode.ASYNC and self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(max_workers=self._max_workers,
+                                                            thread_name_prefix='Validation')
+            executor = self._executor
+        if mode == ValidationMode.ASYNC:
+            executor.submit(self._validateAsync, action, schema, copy.deepcopy(node))
+        else:
+            self._validate(action, schema, node)
+
+    def _validate(self, action, schema, node):
+        try:
+            schema.assertValid(node)
+        except etree_.DocumentInvalid:
+            self._count(action, failed=True)
+            raise
+        self._count(action, failed=False)
+
+    def _validateAsync(self, action, schema, node):
+        try:
+            self._validate(action, schema, node)
+        except etree_.DocumentInvalid as ex:
+            self._logger.error('invalid message, action={}: {}', action, ex)
+            if self._onError is not None:
+                self._onError(action, ex)
+
+    def _count(self, action, failed):
+        with self._lock:
+            counters = self._counters[action]
+            counters.validated += 1
+            if failed:
+                counters.failed += 1
+
+    def getStats(self, action):
+        ''' @return: a ValidationStats instance for action'''
+        with self._lock:
+            counters = self._counters.get(action) or _ValidationCounters()
+            return ValidationStats(counters.validated, counters.failed, counters.skipped)
+
+    def getAllStats(self):
+        ''' @return: a dictionary action => ValidationStats'''
+        with self._lock:
+            return {action: ValidationStats(c.validated, c.failed, c.skipped) for action, c in self._counters.items()}
+
+    def stop(self):
+        ''' waits until all pending asynchronous validations are done and stops the threads.
+        The policy can be used again afterwards.'''
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
 def _shortActionString(action):
     for cls in ProtocolsRegistry.protocols:
         if cls.ActionsNamespace is not None and action.startswith(cls.ActionsNamespace):
@@ -90,10 +90,10 @@ setup(
     # dependencies). You can install these using the following syntax,
     # for example:
     # $ pip install -e .[dev,test]
-#    extras_require={
-#        'dev': ['check-manifest'],
-#        'test': ['coverage'],
-#    },
+    extras_require={
+        'zstd': ['zstandard'],  # zstd compression (compression.ZSTD, compression.ZSTD_SDC)
+        'numpy': ['numpy'],  # real time sample buffers of ClientMdibContainer use numpy arrays instead of array.array
+    },
 
     # If there are data files included in your packages that need to be
     # installed, specify them here.  If using Python 2.6 or less, then these
@@ -104,6 +104,7 @@ setup(
                      'tutorial/provider/*.xml',
                      'tutorial/provider/*.py',
                      'xsd/*.xsd',
+                     'zstd_dict/*.dict',
                      'ca/*.*',
                      'codings/*.csv'],
     },
@@ -1,3 +1,4 @@
+import copy
 import threading
 import logging
 import os.path
@@ -84,6 +85,9 @@ class TestDevSubscription(_DevSubscription):
             raise
         self.reports.append(rep)
 
+    def sendPreparedReport(self, report):
+        self.sendNotificationReport(copy.deepcopy(report.bodyNode), report.action, report.doc_nsmap)
+
 
 class SomeDevice(SdcDevice):
     """A device used for unit tests
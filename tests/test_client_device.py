@@ -7,6 +7,7 @@ from itertools import product
 from lxml import etree as etree_
 import datetime
 import copy
+import http.client
 
 from sdc11073 import pmtypes
 from sdc11073 import namespaces
@@ -19,9 +20,13 @@ from sdc11073 import loghelper
 from sdc11073.pysoap.soapclient import SoapClient, HTTPReturnCodeError
 from sdc11073.pysoap.soapenvelope import ReceivedSoapFault
 from sdc11073.sdcclient import SdcClient
+from sdc11073.sdcclient.asynceventsink import AsyncioNotificationsReceiver
+from sdc11073.sdcclient.clientruntime import ClientRuntime
+from sdc11073.sdcclient.subscription import SUBSCRIPTION_CHECK_INTERVAL
 from sdc11073.mdib import ClientMdibContainer
 from sdc11073.sdcdevice import waveforms
 from sdc11073.sdcdevice.httpserver import HttpServerThread
+from sdc11073.sdcdevice.asynchttpserver import AsyncioHttpServerThread
 from sdc11073 import compression
 from tests.mockstuff import SomeDevice
 
@@ -1329,6 +1334,10 @@ class Test_Client_SomeDevice(unittest.TestCase):
 
 
 class Test_DeviceCommonHttpServer(unittest.TestCase):
+    httpServerClass = HttpServerThread
+    useSharedEventSink = False
+    useClientRuntime = False
+
     @classmethod
     def setUpClass(cls):
         mklogger()
@@ -1342,7 +1351,7 @@ class Test_DeviceCommonHttpServer(unittest.TestCase):
         self.sdcDevice_1 = SomeDevice.fromMdibFile(self.wsd, None, '70041_MDIB_Final.xml', log_prefix='<dev1> ')
 
         # common http server for both devices, borrow ssl context from device
-        self.httpserver = HttpServerThread(my_ipaddress='0.0.0.0',
+        self.httpserver = self.httpServerClass(my_ipaddress='0.0.0.0',
                                            sslContext=self.sdcDevice_1._handler._sslContext,
                                            supportedEncodings=compression.encodings[:],
                                            log_prefix='hppt_srv')
@@ -1362,19 +1371,34 @@ class Test_DeviceCommonHttpServer(unittest.TestCase):
 
         time.sleep(0.5)  # allow full init of devices
 
+        # common event sink for both clients
+        self.eventSink = None
+        if self.useSharedEventSink:
+            self.eventSink = AsyncioNotificationsReceiver(my_ipaddress='127.0.0.1', sslContext=None,
+                                                          supportedEncodings=compression.encodings[:],
+                                                          log_prefix='event_sink')
+            self.eventSink.start()
+            self.eventSink.started_evt.wait(timeout=5)
+        self.clientRuntime = None
+        if self.useClientRuntime:
+            self.clientRuntime = ClientRuntime(my_ipaddress='127.0.0.1', log_prefix='runtime')
+            self.clientRuntime.start()
+
         xAddr = self.sdcDevice_1.getXAddrs()
         self.sdcClient_1 = SdcClient(xAddr[0],
                                           deviceType=self.sdcDevice_1.mdib.sdc_definitions.MedicalDeviceType,
                                           validate=CLIENT_VALIDATE,
-                                          ident='<Draft6> ')
-        self.sdcClient_1.startAll()
+                                          ident='<Draft6> ',
+                                          runtime=self.clientRuntime)
+        self.sdcClient_1.startAll(shared_event_sink=self.eventSink)
 
         xAddr = self.sdcDevice_2.getXAddrs()
         self.sdcClient_2 = SdcClient(xAddr[0],
                                          deviceType=self.sdcDevice_2.mdib.sdc_definitions.MedicalDeviceType,
                                          validate=CLIENT_VALIDATE,
-                                         ident='<Final> ')
-        self.sdcClient_2.startAll()
+                                         ident='<Final> ',
+                                         runtime=self.clientRuntime)
+        self.sdcClient_2.startAll(shared_event_sink=self.eventSink)
 
         self._all_cl_dev = ((self.sdcClient_1, self.sdcDevice_1),
                             (self.sdcClient_2, self.sdcDevice_2))
@@ -1391,6 +1415,11 @@ class Test_DeviceCommonHttpServer(unittest.TestCase):
         for sdcClient, sdcDevice in self._all_cl_dev:
             sdcClient.stopAll()
             sdcDevice.stopAll()
+        if self.eventSink is not None:
+            self.eventSink.stop()
+        if self.clientRuntime is not None:
+            self.clientRuntime.stop()
+        self.httpserver.stop()
         self.wsd.stop()
         try:
             self.log_watcher.check()
@@ -1437,6 +1466,119 @@ class Test_DeviceCommonHttpServer(unittest.TestCase):
             sdcDevice.stopAll()
 
 
+    def test_EpisodicMetricReport(self):
+        descriptorHandle = '0x34F00100'
+        cl_mdibs = []
+        for sdcClient, _ in self._all_cl_dev:
+            cl_mdib = ClientMdibContainer(sdcClient)
+            cl_mdib.initMdib()
+            cl_mdibs.append(cl_mdib)
+        for i, (sdcClient, sdcDevice) in enumerate(self._all_cl_dev):
+            coll = observableproperties.SingleValueCollector(sdcClient, 'episodicMetricReport')
+            with sdcDevice.mdib.mdibUpdateTransaction() as mgr:
+                st = mgr.getMetricState(descriptorHandle)
+                if st.metricValue is None:
+                    st.mkMetricValue()
+                st.metricValue.Value = 42 + i
+            coll.result(timeout=NOTIFICATION_TIMEOUT)
+        for i, cl_mdib in enumerate(cl_mdibs):
+            cl_state = cl_mdib.states.descriptorHandle.getOne(descriptorHandle)
+            self.assertEqual(cl_state.metricValue.Value, 42 + i)
+
+
+class Test_DeviceCommonAsyncioHttpServer(Test_DeviceCommonHttpServer):
+    httpServerClass = AsyncioHttpServerThread
+
+    def test_streamedChunkedResponses(self):
+        self.httpserver.chunked_responses = True
+        self.assertTrue(self.httpserver._canStream())
+        for sdcClient, _ in self._all_cl_dev:
+            node = sdcClient.client('Get').getMdibNode()
+            self.assertEqual(node.tag, str(namespaces.msgTag('GetMdibResponse')))
+            self.assertIsNotNone(node.find('.//{*}MdDescription'))
+            self.assertIsNotNone(node.find('.//{*}MdState'))
+
+    def _postRaw(self, headers, body):
+        conn = http.client.HTTPConnection('127.0.0.1', self.httpserver.my_port)
+        try:
+            conn.putrequest('POST', '/{}'.format(self.sdcDevice_1.epr), skip_accept_encoding=True)
+            for name, value in headers:
+                conn.putheader(name, value)
+            conn.endheaders()
+            conn.send(body)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        finally:
+            conn.close()
+
+    def test_badRequestBody(self):
+        self.httpserver.MAX_BODY_SIZE = 1000
+        # malformed chunk header => 400
+        status = self._postRaw([('Transfer-Encoding', 'chunked')], b'zz\r\n<xml/>\r\n0\r\n\r\n')
+        self.assertEqual(status, 400)
+        # chunk not terminated by CRLF => 400
+        status = self._postRaw([('Transfer-Encoding', 'chunked')], b'6\r\n<xml/>xx0\r\n\r\n')
+        self.assertEqual(status, 400)
+        # bodies larger than MAX_BODY_SIZE => 413, a chunked body is rejected before it is read completely
+        status = self._postRaw([('Content-Length', '1001')], b'')
+        self.assertEqual(status, 413)
+        status = self._postRaw([('Transfer-Encoding', 'chunked')], b'3e9\r\n')
+        self.assertEqual(status, 413)
+        # server still works
+        for sdcClient, _ in self._all_cl_dev:
+            node = sdcClient.client('Get').getMdStateNode()
+            self.assertEqual(node.tag, str(namespaces.msgTag('GetMdStateResponse')))
+
+
+class Test_ClientsSharedEventSink(Test_DeviceCommonHttpServer):
+    httpServerClass = AsyncioHttpServerThread
+    useSharedEventSink = True
+
+    def test_sharedEventSink(self):
+        # both clients use the same port, but different paths
+        urls = [sdcClient._notificationsDispatcherThread.base_url for sdcClient, _ in self._all_cl_dev]
+        self.assertTrue(all(url.startswith(self.eventSink.base_url) for url in urls))
+        self.assertNotEqual(urls[0], urls[1])
+        self.assertEqual(len(self.eventSink._registrations), 2)
+        registration = self.eventSink.register('test', self.sdcDevice_1.mdib.sdc_definitions)
+        self.assertEqual(len(self.eventSink._registrations), 3)
+        registration.stop()
+        self.assertEqual(len(self.eventSink._registrations), 2)
+        # unknown path => 404
+        conn = http.client.HTTPConnection('127.0.0.1', self.eventSink.my_port)
+        conn.request('POST', '/{}/'.format(registration.path), body=b'<xml/>')
+        self.assertEqual(conn.getresponse().status, 404)
+        conn.close()
+
+
+class Test_ClientsSharedRuntime(Test_DeviceCommonHttpServer):
+    httpServerClass = AsyncioHttpServerThread
+    useClientRuntime = True
+
+    def test_clientRuntime(self):
+        runtime = self.clientRuntime
+        for sdcClient, _ in self._all_cl_dev:
+            self.assertTrue(sdcClient._notificationsDispatcherThread.base_url.startswith(runtime.eventSink.base_url))
+            self.assertFalse(sdcClient._subscriptionMgr.is_alive())
+        self.assertEqual(runtime.scheduler.jobsCount, 2)
+        # both devices use the same http server => one connection for both clients
+        self.assertEqual(len(runtime.soapClientPool), 1)
+        self.assertIs(self.sdcClient_1.client('Get').soapClient, self.sdcClient_2.client('Get').soapClient)
+        # renewal is done by the scheduler
+        subscription = list(self.sdcClient_1._subscriptionMgr.subscriptions.values())[0]
+        expireAt = subscription.expireAt
+        time.sleep(SUBSCRIPTION_CHECK_INTERVAL + 2)
+        self.assertGreater(subscription.expireAt, expireAt)
+        self.sdcClient_1.stopAll()
+        self.assertEqual(runtime.scheduler.jobsCount, 1)
+        self.assertEqual(len(runtime.soapClientPool), 1)
+        self.sdcClient_2.stopAll()
+        self.assertEqual(len(runtime.soapClientPool), 0)
+        self._all_cl_dev = ((self.sdcClient_2, self.sdcDevice_2),)
+        self.sdcDevice_1.stopAll()
+
+
 class Test_Client_SomeDevice_chunked(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -1527,6 +1669,25 @@ class Test_Client_SomeDevice_chunked(unittest.TestCase):
         for _, sdcDevice in self._all_cl_dev:
             sdcDevice.stopAll()
 
+    def test_streamedResponses(self):
+        # responses are parsed while they are received, the result is the same as that of a completely read response
+        xAddr = self.sdcDevice_Final.getXAddrs()
+        sdcClient = SdcClient(xAddr[0],
+                              deviceType=self.sdcDevice_Final.mdib.sdc_definitions.MedicalDeviceType,
+                              validate=CLIENT_VALIDATE,
+                              ident='<Streamed> ',
+                              stream_responses=True)
+        sdcClient.setUsedCompression(compression.GZIP)
+        sdcClient.startAll()
+        self._all_cl_dev.append((sdcClient, self.sdcDevice_Final))
+        envelope = sdcClient.client('Get').getMdib()
+        self.assertIsNone(envelope.rawdata)
+        self.assertEqual(envelope.msgNode.tag, namespaces.msgTag('GetMdibResponse'))
+        expected = self.sdcClient_Final.client('Get').getMdibNode()
+        mdDescriptionTag = namespaces.domTag('MdDescription')
+        self.assertEqual(etree_.tostring(envelope.msgNode[0].find(mdDescriptionTag)),
+                         etree_.tostring(expected[0].find(mdDescriptionTag)))
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(Test_Client_SomeDevice)
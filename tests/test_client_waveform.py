@@ -2,6 +2,7 @@ from __future__ import absolute_import
 from __future__ import print_function 
 import unittest
 import logging
+import decimal
 from lxml import etree as etree_
 import sdc11073
 from sdc11073 import namespaces
@@ -228,9 +229,15 @@ class TestClientWaveform(unittest.TestCase):
             for i in (0,1,3,4):
                 self.assertEqual(len(rtBuffer.rt_data[i].annotations), 0)
     
+            # rt_data is cached until the next report
+            rt_data = rtBuffer.rt_data
+            self.assertIs(rtBuffer.rt_data, rt_data)
+
             # add another Report (with identical data, but that is not relevant here)
             soapenvelope = sdc11073.pysoap.soapenvelope.AddressedSoap12Envelope.fromXMLString(wfReport.encode('utf-8'))
             cl._onWaveFormReport(soapenvelope)
+            self.assertIsNot(rtBuffer.rt_data, rt_data)
+            self.assertEqual(len(rt_data), 5)
             # verify only that array length is 2*bigger now
             for handle in my_handles:
                 current_samples = SAMPLES[handle]
@@ -250,6 +257,81 @@ class TestClientWaveform(unittest.TestCase):
                 self.assertEqual(len(rtBuffer.rt_data), rtBuffer._max_samples)
 
 
+    def test_inplace_update(self):
+        ''' reports with increased StateVersion update the existing state containers in place'''
+        my_handles = ('0x34F05506', '0x34F05501', '0x34F05500')
+        cl = self.sdcClient_final
+        clientmdib = sdc11073.mdib.ClientMdibContainer(cl)
+        clientmdib._bindToObservables()
+        clientmdib._isInitialized = True # fake it, because we do not call initMdib()
+        clientmdib.MDIB_VERSION_CHECK_DISABLED = True
+        for handle in my_handles:
+            attributes = {'SamplePeriod': 'P0Y0M0DT0H0M0.0157S',
+                          etree_.QName(sdc11073.namespaces.nsmap['xsi'], 'type'): 'dom:RealTimeSampleArrayMetricDescriptor',
+                          'Handle':handle}
+            element = etree_.Element('Metric', attrib=attributes, nsmap=sdc11073.namespaces.nsmap)
+            clientmdib.descriptions.addObject(sdc11073.mdib.descriptorcontainers.RealTimeSampleArrayMetricDescriptorContainer.fromNode(clientmdib.nsmapper, element, None))
+        soapenvelope = sdc11073.pysoap.soapenvelope.AddressedSoap12Envelope.fromXMLString(WfReport_draft10.encode('utf-8'))
+        cl._onWaveFormReport(soapenvelope)
+        states = {h: clientmdib.states.descriptorHandle.getOne(h) for h in my_handles}
+        # a state with a physiological range needs the generic update
+        states[my_handles[2]].PhysiologicalRange = [sdc11073.pmtypes.Range(lower=0, upper=1)]
+
+        wfReport = WfReport_draft10.replace('StateVersion="19716"', 'StateVersion="19717"').replace('StateVersion="19715"', 'StateVersion="19716"')
+        soapenvelope = sdc11073.pysoap.soapenvelope.AddressedSoap12Envelope.fromXMLString(wfReport.encode('utf-8'))
+        cl._onWaveFormReport(soapenvelope)
+        for handle in my_handles:
+            state = clientmdib.states.descriptorHandle.getOne(handle)
+            self.assertTrue(state is states[handle])
+            self.assertEqual([float(v) for v in state.metricValue.Samples], list(SAMPLES[handle]))
+            self.assertAlmostEqual(state.metricValue.DeterminationTime, OBSERVATIONTIME)
+            self.assertEqual(state.metricValue.Validity, 'Vld')
+            self.assertEqual(len(clientmdib.rtBuffers[handle].rt_data), 2 * len(SAMPLES[handle]))
+        self.assertEqual(states[my_handles[0]].StateVersion, 19717)
+        self.assertEqual(states[my_handles[1]].StateVersion, 19716)
+        self.assertEqual(states[my_handles[1]].metricValue.Annotations[0].coding.code, '4711')
+        self.assertEqual(states[my_handles[1]].metricValue.ApplyAnnotations[0].SampleIndex, 2)
+        self.assertEqual(states[my_handles[2]].PhysiologicalRange, [])
+        # fast path delivers float arrays, the generic path lists of Decimals
+        self.assertFalse(isinstance(states[my_handles[0]].metricValue.Samples, list))
+        self.assertTrue(isinstance(states[my_handles[2]].metricValue.Samples, list))
+        self.assertEqual(clientmdib.rtBuffers[my_handles[1]].rt_data[-3].annotations[0].coding.code, '4711')
+
+    def test_rtSampleRingBuffer(self):
+        buf = sdc11073.mdib.clientmdib.RtSampleRingBuffer(max_samples=5)
+        annot = sdc11073.pmtypes.Annotation(sdc11073.pmtypes.CodedValue('4711'))
+        buf.append([1, 2, 3], [10.0, 11.0, 12.0], 'Vld', {1: [annot]})
+        buf.append([4, 5, 6], [13.0, 14.0, 15.0], 'Qst')
+        self.assertEqual(len(buf), 5)
+        data = buf.read(consume=False)
+        self.assertEqual(list(data.values), [2, 3, 4, 5, 6])
+        self.assertEqual(list(data.observationTimes), [11.0, 12.0, 13.0, 14.0, 15.0])
+        self.assertEqual(data.annotations, {0: [annot]})
+        self.assertEqual([data.validity(i) for i in range(5)], ['Vld', 'Vld', 'Qst', 'Qst', 'Qst'])
+        # wrap around several times, oldest annotations and validities are removed
+        for i in range(10):
+            buf.append([i, i + 0.5], [20.0 + i, 20.5 + i], 'Qst')
+        data = buf.read()
+        self.assertEqual(list(data.values), [7.5, 8, 8.5, 9, 9.5])
+        self.assertEqual([data.sample(i) for i in range(5)], [7.5, 8, 8.5, 9, 9.5])
+        self.assertEqual(data.annotations, {})
+        self.assertEqual(data.validities, [(0, 'Qst')])
+        self.assertEqual(len(buf), 0)
+        # more samples than buffer size
+        buf.append(list(range(8)), [float(i) for i in range(8)], 'Vld', {2: [annot], 6: [annot]})
+        samples = sdc11073.mdib.clientmdib.RtSampleSequence(buf.read())
+        self.assertEqual([s.value for s in samples], [3, 4, 5, 6, 7])
+        self.assertEqual(samples[3].annotations, [annot])
+        self.assertEqual(samples[-1].validity, 'Vld')
+        # the containers keep the original values of the samples
+        buf.append([decimal.Decimal('1.5'), decimal.Decimal('2.25')], [1.0, 2.0], 'Vld')
+        buf.append([3.5], [3.0], 'Vld')
+        samples = list(sdc11073.mdib.clientmdib.RtSampleSequence(buf.read()))
+        self.assertEqual([s.valueString for s in samples], [decimal.Decimal('1.5'), decimal.Decimal('2.25'), 3.5])
+        self.assertIsInstance(samples[0].valueString, decimal.Decimal)
+        self.assertEqual([s.value for s in samples], [1.5, 2.25, 3.5])
+
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(TestClientWaveform)
@@ -1,11 +1,22 @@
 import unittest
 import time
+import collections
 import six
 import sdc11073
 from tests.mockstuff import SomeDevice
 from sdc11073.sdcclient import SdcClient
+from sdc11073.sdcclient.clientruntime import ClientRuntime
 from lxml import etree
 import sdc11073.compression as compression
+import copy
+import http.client
+import io
+import uuid
+from sdc11073.definitions_sdc import SDC_v1_Definitions
+from sdc11073.httprequesthandler import HTTPReader, ChunkedWriter, DechunkError, DecompressError, mkchunks
+from sdc11073.namespaces import Prefix_Namespace as Prefix
+from sdc11073.pysoap import soapenvelope
+from sdc11073.sdcdevice.httpserver import StreamedSoapResponse
 
 XML_REQ = '<?xml version=\'1.0\' encoding=\'UTF-8\'?> \
 <s12:Envelope xmlns:dom="__BICEPS_ParticipantModel__" xmlns:dpws="http://docs.oasis-open.org/ws-dd/ns/dpws/2009/01"' \
@@ -37,7 +48,7 @@ class Test_Compression(unittest.TestCase):
         time.sleep(1)
         self.wsd.stop()
 
-    def _start_with_compression(self, compressionFlag):
+    def _start_with_compression(self, compressionFlag, compression_policy_factory=None, runtime=None):
         """ Starts Device and Client with correct settigns  """
 
         # start device with compression settings
@@ -53,7 +64,8 @@ class Test_Compression(unittest.TestCase):
 
         # Connect a new client to the divece
         xAddr = self.sdcDevice_Final.getXAddrs()
-        self.sdcClient_Final = SdcClient(xAddr[0], deviceType=self.sdcDevice_Final.mdib.sdc_definitions.MedicalDeviceType)
+        self.sdcClient_Final = SdcClient(xAddr[0], deviceType=self.sdcDevice_Final.mdib.sdc_definitions.MedicalDeviceType,
+                                         compression_policy_factory=compression_policy_factory, runtime=runtime)
         if compressionFlag is None:
             self.sdcClient_Final.setUsedCompression()
         else:
@@ -156,6 +168,152 @@ class Test_Compression(unittest.TestCase):
         except:
             self.fail("Wrong xml syntax. Msg {}".format(content))
 
+    @unittest.skipIf(compression.ZSTD_SDC not in compression.encodings, 'no zstandard module available')
+    def test_zstd_compression(self):
+        # Create a compressed getMetadata request, zstd with dictionary is negotiated
+        self._start_with_compression(compression.ZSTD_SDC)
+
+        self.xml = self.soapClient.compressPayload(compression.ZSTD_SDC, self.xml)
+        self.xml = bytearray(self.xml)  # cast to bytes, required to bypass httplib checks for is str
+        headers = {
+            'Content-type': 'application/soap+xml',
+            'user_agent': 'pysoap',
+            'Connection': 'keep-alive',
+            'Content-Encoding': compression.ZSTD_SDC,
+            'Accept-Encoding': 'x-zstd-sdc1, gzip;q=0.5',
+            'Content-Length': str(len(self.xml))
+        }
+        self.clientHttpCon.request('POST', self.getService._url.path, body=self.xml, headers=headers)
+        # Verify response is comressed
+        response = self.clientHttpCon.getresponse()
+        responseHeaders = {k.lower(): v for k, v in response.getheaders()}
+        content = response.read()
+        self.assertEqual(responseHeaders.get('content-encoding'), compression.ZSTD_SDC)
+        content = self.soapClient.decompress(content, compression.ZSTD_SDC)
+        try:
+            etree.fromstring(content)
+        except:
+            self.fail("Wrong xml syntax. Msg {}".format(content))
+
+    def test_adaptive_compression(self):
+        self.sdcDevice_Final.subscriptionsManager.compressionPolicyFactory = compression.CompressionPolicy
+        self._start_with_compression(compression.GZIP)
+        self.soapClient.compressionPolicy = compression.CompressionPolicy()
+        self.sdcClient_Final.client('Get').getMdibNode()
+        self.assertGreater(sum(s.messages for s in self.soapClient.compressionPolicy.getAllStats().values()), 0)
+        self.assertIsNotNone(self.soapClient.compressionPolicy.getRoundtripTime())
+
+        mdib = self.sdcDevice_Final.mdib
+        descr = mdib.descriptions.NODETYPE.get(sdc11073.namespaces.domTag('NumericMetricDescriptor'))[0]
+        with mdib.mdibUpdateTransaction() as mgr:
+            state = mgr.getMetricState(descr.handle)
+            if state.metricValue is None:
+                state.mkMetricValue()
+            state.metricValue.Value = 42
+        time.sleep(0.5)
+        stats = self.sdcDevice_Final.subscriptionsManager.getSubscriptionCompressionStats()
+        self.assertGreater(sum(s.messages for data in stats.values() for s in data.stats.values()), 0)
+        for data in stats.values():
+            if data.stats:
+                self.assertIn(data.last_encoding, data.stats)
+
+    def test_client_compression_policy(self):
+        created = []
+        def factory(roundtrip_times):  # same signature as the factory of the device
+            created.append(roundtrip_times)
+            return compression.CompressionPolicy(roundtrip_times=roundtrip_times)
+        self._start_with_compression(compression.GZIP, compression_policy_factory=factory)
+        # one policy per connection, shared by the service clients, not attached to the soap client
+        self.assertEqual(len(created), 1)
+        policy = self.sdcClient_Final.client('Get').compressionPolicy
+        self.assertIs(self.sdcClient_Final.client('Set').compressionPolicy, policy)
+        self.assertIsNone(self.soapClient.compressionPolicy)
+        messages = sum(s.messages for s in policy.getAllStats().values())
+        self.sdcClient_Final.client('Get').getMdibNode()
+        self.assertEqual(sum(s.messages for s in policy.getAllStats().values()), messages + 1)
+        self.assertGreater(len(created[0]), 0)
+        self.assertIsNotNone(policy.getRoundtripTime())
+
+    def test_client_compression_policy_shared_connection(self):
+        runtime = ClientRuntime(my_ipaddress='127.0.0.1')
+        runtime.start()
+        self.addCleanup(runtime.stop) # after tearDown
+        self._start_with_compression(compression.GZIP, compression_policy_factory=compression.CompressionPolicy,
+                                     runtime=runtime)
+        sdcClient_2 = SdcClient(self.sdcDevice_Final.getXAddrs()[0],
+                                deviceType=self.sdcDevice_Final.mdib.sdc_definitions.MedicalDeviceType,
+                                compression_policy_factory=compression.CompressionPolicy, runtime=runtime)
+        sdcClient_2.setUsedCompression(compression.GZIP)
+        sdcClient_2.startAll()
+        try:
+            getClient_1 = self.sdcClient_Final.client('Get')
+            getClient_2 = sdcClient_2.client('Get')
+            self.assertIs(getClient_1.soapClient, getClient_2.soapClient)
+            self.assertIsNone(getClient_1.soapClient.compressionPolicy)
+            self.assertIsNot(getClient_1.compressionPolicy, getClient_2.compressionPolicy)
+            messages_1 = sum(s.messages for s in getClient_1.compressionPolicy.getAllStats().values())
+            messages_2 = sum(s.messages for s in getClient_2.compressionPolicy.getAllStats().values())
+            getClient_2.getMdibNode()
+            # only the policy of the client that sent the request counts it
+            self.assertEqual(sum(s.messages for s in getClient_1.compressionPolicy.getAllStats().values()), messages_1)
+            self.assertEqual(sum(s.messages for s in getClient_2.compressionPolicy.getAllStats().values()), messages_2 + 1)
+        finally:
+            sdcClient_2.stopAll()
+
+
+class Test_CompressionLevels(unittest.TestCase):
+
+    def setUp(self):
+        self.body = XML_REQ.replace('<wsx:GetMetadata/>', ''.join('<wsx:GetMetadata Dialect="{}"/>'.format(i)
+                                                                  for i in range(200))).encode('utf-8')
+
+    def tearDown(self):
+        compression.CompressionHandler._compression_levels.clear()
+
+    def test_levels(self):
+        handler = compression.CompressionHandler
+        self.assertEqual(handler.getCompressionLevel(compression.GZIP), -1)
+        handler.setCompressionLevel(compression.GZIP, 1)
+        handler.setCompressionLevel(compression.GZIP, 9, action='urn:big')
+        self.assertEqual(handler.getCompressionLevel(compression.GZIP), 1)
+        self.assertEqual(handler.getCompressionLevel(compression.GZIP, 'urn:other'), 1)
+        self.assertEqual(handler.getCompressionLevel(compression.GZIP, 'urn:big'), 9)
+        fast = handler.compressPayload(compression.GZIP, self.body, 'urn:other')
+        small = handler.compressPayload(compression.GZIP, self.body, 'urn:big')
+        self.assertLess(len(small), len(fast))
+        for data in (fast, small):
+            self.assertEqual(handler.decompress(data, compression.GZIP), self.body)
+        handler.setCompressionLevel(compression.GZIP, None)
+        self.assertEqual(handler.getCompressionLevel(compression.GZIP, 'urn:other'), -1)
+
+    def test_splicedEnvelope(self):
+        # the level of the action is also used for cached compressed bodies
+        compression.CompressionHandler.setCompressionLevel(compression.GZIP, 1, action='urn:fast')
+        doc_nsmap = Prefix.partialMap(Prefix.S12, Prefix.WSA)
+        content = ''.join(['<wsx:GetMetadata xmlns:wsx="http://schemas.xmlsoap.org/ws/2004/09/mex">']
+                          + ['<wsx:Dialect>urn:dialect:{}</wsx:Dialect>'.format(i) for i in range(200)]
+                          + ['</wsx:GetMetadata>']).encode('utf-8')
+        body = soapenvelope.PreparedSoapBody.fromText(content, doc_nsmap, SDC_v1_Definitions)
+        fast = body.mkEnvelope(soapenvelope.WsAddress(action='urn:fast', messageId=False))
+        default = body.mkEnvelope(soapenvelope.WsAddress(action='urn:default', messageId=False))
+        self.assertLess(len(default.compress(compression.GZIP)), len(fast.compress(compression.GZIP)))
+        for envelope in (fast, default):
+            self.assertEqual(compression.CompressionHandler.decompress(envelope.compress(compression.GZIP),
+                                                                       compression.GZIP), envelope.as_xml())
+
+    @unittest.skipIf(compression.ZSTD_SDC not in compression.encodings, 'no zstandard module available')
+    def test_zstdDictionary(self):
+        handler = compression.CompressionHandler
+        with_dict = handler.compressPayload(compression.ZSTD_SDC, self.body)
+        without_dict = handler.compressPayload(compression.ZSTD, self.body)
+        self.assertLess(len(with_dict), len(without_dict))
+        self.assertEqual(handler.decompress(with_dict, compression.ZSTD_SDC), self.body)
+        self.assertRaises(Exception, handler.decompress, with_dict, compression.ZSTD)
+        compressor = handler.mkCompressor(compression.ZSTD_SDC)
+        data = b''.join([compressor.compress(self.body[:100]), compressor.compress(self.body[100:]), compressor.flush()])
+        self.assertEqual(handler.decompress(data, compression.ZSTD_SDC), self.body)
+
+
 class Test_Compression_ParseHeader(unittest.TestCase):
 
     def test_parseHeader(self):
@@ -175,4 +333,186 @@ class Test_Compression_ParseHeader(unittest.TestCase):
         self.assertEqual(result, ['gzip', 'lz4'])
 
 
+class _HttpMessage(object):
+    ''' what HTTPReader needs of a BaseHTTPRequestHandler'''
+    def __init__(self, headers, body):
+        header_bytes = ''.join('{}: {}\r\n'.format(k, v) for k, v in headers.items()).encode('latin-1')
+        self.headers = http.client.parse_headers(io.BytesIO(header_bytes + b'\r\n'))
+        self.rfile = io.BufferedReader(io.BytesIO(body), buffer_size=64)
+
+
+class Test_StreamingReader(unittest.TestCase):
+
+    def setUp(self):
+        self.body = XML_REQ.replace('<wsx:GetMetadata/>', '<wsx:GetMetadata/>' * 200).encode('utf-8')
+
+    def test_dechunk(self):
+        chunked = mkchunks(self.body, chunk_size=100)
+        # chunk extensions and trailer are ignored
+        chunked = chunked.replace(b'64\r\n', b'64;name=value\r\n', 1)[:-2] + b'Trailer: x\r\n\r\n'
+        message = _HttpMessage({'Transfer-Encoding': 'chunked'}, chunked)
+        blocks = list(HTTPReader.iter_request_body(message, blocksize=30))
+        self.assertTrue(all(len(b) <= 30 for b in blocks))
+        self.assertEqual(b''.join(blocks), self.body)
+        message = _HttpMessage({'Transfer-Encoding': 'chunked'}, mkchunks(self.body))
+        self.assertEqual(HTTPReader.read_request_body(message), self.body)
+        for damaged in (mkchunks(self.body)[:-5], b'xyz\r\n' + mkchunks(self.body)):
+            message = _HttpMessage({'Transfer-Encoding': 'chunked'}, damaged)
+            self.assertRaises(DechunkError, HTTPReader.read_request_body, message)
+
+    def test_decompress(self):
+        for enc in compression.encodings:
+            compressed = compression.CompressionHandler.compressPayload(enc, self.body)
+            message = _HttpMessage({'Transfer-Encoding': 'chunked', 'Content-Encoding': enc},
+                                   mkchunks(compressed, chunk_size=50))
+            self.assertEqual(b''.join(HTTPReader.iter_request_body(message, blocksize=20)), self.body)
+            message = _HttpMessage({'Content-Length': len(compressed), 'Content-Encoding': enc}, compressed)
+            self.assertEqual(HTTPReader.read_request_body(message), self.body)
+            message = _HttpMessage({'Content-Length': len(compressed) - 10, 'Content-Encoding': enc}, compressed)
+            self.assertRaises(DecompressError, HTTPReader.read_request_body, message)
+            # a small block of highly compressed data does not result in a large decompressed block
+            body = self.body * 100
+            compressed = compression.CompressionHandler.compressPayload(enc, body)
+            message = _HttpMessage({'Content-Length': len(compressed), 'Content-Encoding': enc}, compressed)
+            blocks = list(HTTPReader.iter_request_body(message))
+            self.assertTrue(len(blocks) > 1)
+            self.assertTrue(all(len(b) <= HTTPReader.BLOCKSIZE for b in blocks))
+            self.assertEqual(b''.join(blocks), body)
+        message = _HttpMessage({'Content-Length': len(self.body), 'Content-Encoding': 'foo'}, self.body)
+        self.assertRaises(DecompressError, HTTPReader.read_request_body, message)
+
+    def test_pull_parser(self):
+        # the parser gets data before the body is read completely
+        body = XML_REQ.replace('<wsx:GetMetadata/>', ''.join('<wsx:GetMetadata Dialect="{}"/>'.format(uuid.uuid4())
+                                                             for _ in range(200))).encode('utf-8')
+        compressed = compression.CompressionHandler.compressPayload(compression.GZIP, body)
+        message = _HttpMessage({'Transfer-Encoding': 'chunked', 'Content-Encoding': compression.GZIP},
+                               mkchunks(compressed))
+        parser = etree.XMLPullParser(events=('start',))
+        first_event_pos = None
+        for block in HTTPReader.iter_request_body(message, blocksize=100):
+            parser.feed(block)
+            if first_event_pos is None and list(parser.read_events()):
+                first_event_pos = message.rfile.tell()
+        self.assertLess(first_event_pos, len(message.rfile.raw.getvalue()) / 2)
+
+    def test_normalizeXMLBlocks(self):
+        xml_text = SDC_v1_Definitions.denormalizeXMLText(self.body)
+        self.assertNotEqual(xml_text, self.body)
+        for size in (1, 7, 30, 1000):
+            blocks = [xml_text[i:i + size] for i in range(0, len(xml_text), size)]
+            self.assertEqual(b''.join(SDC_v1_Definitions.normalizeXMLBlocks(blocks)), self.body)
+
+
+class Test_StreamingWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.body = XML_REQ.replace('<wsx:GetMetadata/>', '<wsx:GetMetadata/>' * 200).encode('utf-8')
+
+    def _read(self, data, enc):
+        headers = {'Transfer-Encoding': 'chunked'}
+        if enc is not None:
+            headers['Content-Encoding'] = enc
+        return HTTPReader.read_request_body(_HttpMessage(headers, data))
+
+    def test_chunkedWriter(self):
+        for enc in [None] + compression.encodings:
+            out = io.BytesIO()
+            compressor = None if enc is None else compression.CompressionHandler.mkCompressor(enc)
+            writer = ChunkedWriter(out, compressor, chunk_size=100)
+            for part in (self.body[:10], self.body[10:20], self.body[20:500], self.body[500:]):
+                writer.write(part)
+            writer.close()
+            self.assertEqual(writer.bytes_in, len(self.body))
+            self.assertEqual(self._read(out.getvalue(), enc), self.body)
+            if enc is None:
+                self.assertEqual(writer.bytes_out, len(self.body))
+                chunk_sizes = [int(line, 16) for line in out.getvalue().split(b'\r\n')[::2] if line]
+                self.assertTrue(all(size == 100 for size in chunk_sizes[:-2]))
+                self.assertEqual(chunk_sizes[-1], 0)
+            else:
+                self.assertLess(writer.bytes_out, len(self.body))
+
+    def test_denormalizingWriter(self):
+        out = io.BytesIO()
+        writer = SDC_v1_Definitions.denormalizingWriter(out)
+        for i in range(0, len(self.body), 7):
+            writer.write(self.body[i:i + 7])
+        writer.close()
+        self.assertEqual(out.getvalue(), SDC_v1_Definitions.denormalizeXMLText(self.body))
+
+    def test_streamedSoapResponse(self):
+        doc_nsmap = Prefix.partialMap(Prefix.S12, Prefix.WSA, Prefix.PM, Prefix.MSG)
+        envelope = soapenvelope.Soap12Envelope(doc_nsmap)
+        envelope.setAddress(soapenvelope.WsAddress(action='urn:test', messageId=False))
+        envelope.addBodyString(b'<msg:GetMdibResponse xmlns:msg="__BICEPS_MessageModel__" MdibVersion="1">'
+                               + b'<msg:Mdib/>' * 1000 + b'</msg:GetMdibResponse>')
+        expected = SDC_v1_Definitions.denormalizeXMLText(envelope.as_xml())
+        self.assertNotEqual(expected, envelope.as_xml())
+        preparedBody = soapenvelope.PreparedSoapBody.fromNode(copy.deepcopy(envelope.bodyNode[0]), doc_nsmap,
+                                                              SDC_v1_Definitions)
+        splicedEnvelope = preparedBody.mkEnvelope(soapenvelope.WsAddress(action='urn:test', messageId=False))
+        for enc in [None] + compression.encodings:
+            out = io.BytesIO()
+            StreamedSoapResponse(envelope, SDC_v1_Definitions).write(out, enc)
+            self.assertEqual(self._read(out.getvalue(), enc), expected)
+            out = io.BytesIO()
+            StreamedSoapResponse(splicedEnvelope, SDC_v1_Definitions).write(out, enc)
+            self.assertEqual(self._read(out.getvalue(), enc), splicedEnvelope.as_xml())
+
+
+
+class Test_CompressionPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.encodings = [compression.GZIP, compression.LZ4]
+        self.body = XML_REQ.replace('<wsx:GetMetadata/>', ''.join('<wsx:GetMetadata Dialect="{}"/>'.format(i)
+                                                                  for i in range(200))).encode('utf-8')
+
+    def test_sizeAndRoundtrip(self):
+        policy = compression.CompressionPolicy(min_size=100, lan_min_size=1000)
+        self.assertIsNone(policy.chooseEncoding(99, self.encodings))
+        self.assertIsNone(policy.chooseEncoding(500, []))
+        # no roundtrip time known yet: best ratio
+        self.assertEqual(policy.chooseEncoding(500, self.encodings), compression.GZIP)
+        # fast link: only large payloads, fastest encoding
+        policy.addRoundtripTime(0.001)
+        self.assertIsNone(policy.chooseEncoding(500, self.encodings))
+        self.assertEqual(policy.chooseEncoding(1000, self.encodings), compression.LZ4)
+        self.assertEqual(policy.chooseEncoding(1000, [compression.GZIP]), compression.GZIP)
+        # slow link
+        roundtrip_times = collections.deque([0.2, 0.1])
+        policy = compression.CompressionPolicy(min_size=100, roundtrip_times=roundtrip_times)
+        self.assertAlmostEqual(policy.getRoundtripTime(), 0.15)
+        self.assertEqual(policy.chooseEncoding(500, [compression.LZ4, compression.GZIP]), compression.GZIP)
+        self.assertEqual(policy.chooseEncoding(500, ['x-other']), 'x-other')
+        # medium link
+        roundtrip_times.clear()
+        roundtrip_times.append(0.01)
+        self.assertEqual(policy.chooseEncoding(500, [compression.LZ4, compression.GZIP]), compression.GZIP)
+
+    def test_cpuBudget(self):
+        policy = compression.CompressionPolicy(min_size=100, cpu_budget=0.01)
+        self.assertEqual(policy.chooseEncoding(500, self.encodings), compression.GZIP)
+        policy._count(compression.GZIP, 500, 100, 1.0)  # more than the budget of the last 100 seconds
+        self.assertIsNone(policy.chooseEncoding(500, self.encodings))
+        policy.addRoundtripTime(0.1)  # a slow link is compressed nevertheless
+        self.assertEqual(policy.chooseEncoding(500, self.encodings), compression.GZIP)
 
+    def test_stats(self):
+        policy = compression.CompressionPolicy()
+        self.assertIsNone(policy.lastEncoding)
+        compressFunc = lambda algorithm: compression.CompressionHandler.compressPayload(algorithm, self.body)
+        data, encoding = policy.compress(self.body, [compression.GZIP], compressFunc)
+        self.assertEqual(encoding, compression.GZIP)
+        self.assertEqual(compression.CompressionHandler.decompress(data, compression.GZIP), self.body)
+        small = self.body[:100]
+        self.assertEqual(policy.compress(small, [compression.GZIP], compressFunc), (small, None))
+        self.assertEqual(policy.lastEncoding, compression.IDENTITY)
+        stats = policy.getStats(compression.GZIP)
+        self.assertEqual((stats.messages, stats.bytes_in, stats.bytes_out), (1, len(self.body), len(data)))
+        self.assertGreaterEqual(stats.cpu_time, 0)
+        self.assertEqual(policy.getStats(compression.IDENTITY)[:3], (1, 100, 100))
+        self.assertEqual(policy.getStats(compression.LZ4).messages, 0)
+        self.assertEqual(set(policy.getAllStats()), {compression.GZIP, compression.IDENTITY})
+        self.assertEqual(policy.savedBytes, len(self.body) - len(data))
@@ -11,6 +11,8 @@ from sdc11073.namespaces import msgTag, domTag, nsmap
 from sdc11073.namespaces import Prefix_Namespace as Prefix
 from sdc11073.pysoap.soapenvelope import GenericNode, WsAddress, Soap12Envelope, AddressedSoap12Envelope
 from sdc11073.definitions_sdc import SDC_v1_Definitions
+from sdc11073 import xmlparsing
+from sdc11073 import pmtypes
 from tests import mockstuff
 _msg_ns = Prefix.MSG.namespace
 _sdc_ns = Prefix.SDC.namespace
@@ -97,7 +99,84 @@ class TestDeviceServices(unittest.TestCase):
             httpHeader = {}
             response = getService.dispatchSoapRequest(None, httpHeader, receivedEnv)
             response.validateBody(sdcDevice.mdib.bicepsSchema.bmmSchema)
-   
+
+    def test_getMdibResponseCache(self):
+        ''' same mdibVersion => same body, new mdibVersion => new body with updated states'''
+        for sdcDevice in self._alldevices:
+            cache = sdcDevice._handler._GetDispatcher._responseCache
+            cache._volatileMaxAge = 60  # clock states shall not make the test flaky
+            body1 = cache.getMdibBody(withContextStates=True)
+            body2 = cache.getMdibBody(withContextStates=True)
+            self.assertTrue(body1 is body2)
+            mdStateBody = cache.getMdStateBody(withContextStates=True)
+            self.assertTrue(mdStateBody is cache.getMdStateBody(withContextStates=True))
+
+            descriptorHandle = sdcDevice.mdib.descriptions.NODETYPE.get(domTag('NumericMetricDescriptor'))[0].handle
+            with sdcDevice.mdib.mdibUpdateTransaction() as mgr:
+                st = mgr.getMetricState(descriptorHandle)
+                st.ActivationState = 'Off'
+            body3 = cache.getMdibBody(withContextStates=True)
+            self.assertFalse(body1 is body3)
+            self.assertFalse(mdStateBody is cache.getMdStateBody(withContextStates=True))
+            envelope = body3.mkEnvelope(WsAddress(action='GetMdibResponse'))
+            envelope.validateBody(sdcDevice.mdib.bicepsSchema.bmmSchema)
+            mdibNode = etree_.fromstring(envelope.as_xml()).find('.//{*}Mdib')
+            self.assertEqual(mdibNode.get('MdibVersion'), str(sdcDevice.mdib.mdibVersion))
+            states = [s for s in mdibNode.iter('{*}State') if s.get('DescriptorHandle') == descriptorHandle]
+            self.assertEqual(len(states), 1)
+            self.assertEqual(states[0].get('ActivationState'), 'Off')
+
+            # a modification outside of a transaction does not change the mdibVersion, but creates a new snapshot
+            mdsHandle = sdcDevice.mdib.descriptions.NODETYPE.get(domTag('MdsDescriptor'))[0].handle
+            sdcDevice.mdib.createVmdDescriptorContainer('cache_test_vmd', mdsHandle, pmtypes.CodedValue('4711'),
+                                                        pmtypes.SafetyClassification.INF)
+            body4 = cache.getMdibBody(withContextStates=True)
+            self.assertFalse(body3 is body4)
+            envelope = body4.mkEnvelope(WsAddress(action='GetMdibResponse'))
+            mdibNode = etree_.fromstring(envelope.as_xml()).find('.//{*}Mdib')
+            self.assertEqual(mdibNode.get('MdibVersion'), str(sdcDevice.mdib.mdibVersion))
+            handles = [d.get('Handle') for d in mdibNode.iter('{*}Vmd')]
+            self.assertIn('cache_test_vmd', handles)
+
+    def test_mdibSnapshot(self):
+        ''' transactions publish a new snapshot, older snapshots are not modified and readers do not need the mdibLock'''
+        for sdcDevice in self._alldevices:
+            mdib = sdcDevice.mdib
+            descriptorHandle = mdib.descriptions.NODETYPE.get(domTag('NumericMetricDescriptor'))[0].handle
+            snapshot1 = mdib.getSnapshot()
+            self.assertTrue(snapshot1 is mdib.getSnapshot())
+            self.assertEqual(snapshot1.mdibVersion, mdib.mdibVersion)
+            oldState = snapshot1.getStates(descriptorHandle)[0]
+            oldActivationState = oldState.ActivationState
+            with mdib.mdibUpdateTransaction() as mgr:
+                st = mgr.getMetricState(descriptorHandle)
+                st.ActivationState = 'Off' if oldActivationState != 'Off' else 'On'
+            snapshot2 = mdib.getSnapshot()
+            self.assertEqual(snapshot2.mdibVersion, snapshot1.mdibVersion + 1)
+            self.assertEqual(snapshot2.sequenceId, snapshot1.sequenceId)
+            self.assertTrue(snapshot2.mdDescriptionNode is snapshot1.mdDescriptionNode)
+            # a metric transaction does not change context states, the tuple is shared
+            self.assertTrue(snapshot2.contextStates is snapshot1.contextStates)
+            self.assertFalse(snapshot2.states is snapshot1.states)
+            self.assertTrue(snapshot1.getStates(descriptorHandle)[0] is oldState)
+            self.assertEqual(oldState.ActivationState, oldActivationState)
+            self.assertEqual(snapshot2.getStates(descriptorHandle)[0].ActivationState, st.ActivationState)
+
+            # a held mdibLock (e.g. a long running transaction) does not block the readers
+            getService = sdcDevice._handler._GetDispatcher
+            getEnv = self._mkGetRequest(sdcDevice, getService.port_type_string, 'GetMdState', '123')
+            getEnv.bodyNode[0].append(etree_.Element(msgTag('HandleRef')))
+            getEnv.bodyNode[0][0].text = descriptorHandle
+            receivedEnv = AddressedSoap12Envelope.fromXMLString(getEnv.as_xml())
+            with mdib.mdibLock:
+                getService._responseCache.getMdibBody(withContextStates=True)
+                response = getService._onGetMdState({}, receivedEnv)
+            responseNode = response.bodyNode[0]
+            self.assertEqual(responseNode.get('MdibVersion'), str(snapshot2.mdibVersion))
+            states = responseNode.findall('.//{*}MdState/{*}State')
+            self.assertEqual(len(states), 1)
+            self.assertEqual(states[0].get('ActivationState'), st.ActivationState)
+
 
     def test_getMdDescription(self):
         for sdcDevice in self._alldevices:
@@ -111,6 +190,19 @@ class TestDeviceServices(unittest.TestCase):
             response.validateBody(sdcDevice.mdib.bicepsSchema.bmmSchema)
 
 
+    def test_validationPolicy(self):
+        for sdcDevice in self._alldevices:
+            policy = xmlparsing.ValidationPolicy(mode=xmlparsing.ValidationMode.SAMPLED, interval=2)
+            sdcDevice._handler._validationPolicy = policy
+            getService = sdcDevice._handler._GetDispatcher
+            getEnv = self._mkGetRequest(sdcDevice, getService.port_type_string, 'GetMdDescription', '123')
+            for _ in range(3):
+                receivedEnv = AddressedSoap12Envelope.fromXMLString(getEnv.as_xml())
+                response = getService.dispatchSoapRequest(None, {}, receivedEnv)
+            self.assertEqual(policy.getStats(response.headerNode.findtext('wsa:Action', namespaces=nsmap)),
+                             xmlparsing.ValidationStats(validated=2, failed=0, skipped=1))
+
+
     def test_changeAlarmPrio(self):
         ''' This is a test for defect SDCSIM-129
         The order of children of '''
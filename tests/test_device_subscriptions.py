@@ -2,15 +2,20 @@ from __future__ import absolute_import
 from __future__ import print_function
 import unittest
 import os
+import copy
 import time
+import threading
 import logging
 import logging.handlers
+from lxml import etree as etree_
 from tests import mockstuff
 from sdc11073 import observableproperties
 import sdc11073
 from sdc11073.sdcdevice import waveforms
+from sdc11073.sdcdevice import subscriptionmgr
 from sdc11073 import namespaces
 from sdc11073 import pmtypes
+from sdc11073 import xmlparsing
 
 
 mdibFolder = os.path.dirname(__file__)
@@ -39,10 +44,15 @@ class DummySoapClient(object):
         self.sentReports.append(soapEnvelopeRequest)
         self.roundtrip_time = 0.001 # dummy
         
-    def postSoapEnvelopeTo(self, path, soapEnvelopeRequest, responseFactory=None, schema=None, msg=''): #pylint: disable=unused-argument
+    def postSoapEnvelopeTo(self, path, soapEnvelopeRequest, responseFactory=None, schema=None, msg='',
+                           compressionPolicy=None): #pylint: disable=unused-argument
         self.sentReports.append(soapEnvelopeRequest)
         self.roundtrip_time = 0.001 # dummy
 
+    def postPreparedMessageTo(self, path, message, msg='', compressionPolicy=None): #pylint: disable=unused-argument
+        self.sentReports.append(message)
+        self.roundtrip_time = 0.001 # dummy
+
         
 class TestDeviceSubscriptions(unittest.TestCase):
     
@@ -212,6 +222,329 @@ class TestDeviceSubscriptions(unittest.TestCase):
             self.assertEqual(len(testSubscr.reports), 1)
 
 
+    def test_preparedReport(self):
+        ''' verify that a report that is serialized once is correctly completed for each subscriber'''
+        mdib = self.sdcDevice_d10.mdib
+        action = mdib.sdc_definitions.Actions.OperationInvokedReport
+        subscriptionsManager = subscriptionmgr.SubscriptionsManager(None, mdib.sdc_definitions, mdib.bicepsSchema, ['gzip'])
+        subscriptions = []
+        for notifyRef in ('ref1', 'ref2'):
+            subscr = mockstuff.TestDevSubscription(action, mdib.bicepsSchema)
+            subscr.notifyRefNodes[0].text = notifyRef
+            subscr.setSoapClient(DummySoapClient())
+            subscr.sendPreparedReport = subscriptionmgr._DevSubscription.sendPreparedReport.__get__(subscr) # use real implementation
+            subscriptionsManager._subscriptions.addObject(subscr)
+            subscriptions.append(subscr)
+        subscriptionsManager.notifyOperation('urn:uuid:abc', 42, transactionId=123, operationHandleRef='something',
+                                             operationState='Fin')
+        for subscr in subscriptions:
+            self.assertEqual(len(subscr.soapClient.sentReports), 1)
+            message = subscr.soapClient.sentReports[0]
+            xml = message.as_xml()
+            self.assertEqual(sdc11073.compression.CompressionHandler.decompress(message.compress('gzip'), 'gzip'), xml)
+            env = AddressedSoap12Envelope.fromXMLString(mdib.sdc_definitions.normalizeXMLText(xml))
+            env.validateBody(mdib.bicepsSchema.bmmSchema)
+            self.assertEqual(env.address.action, action)
+            self.assertEqual(env.address.to, subscr.notifyToAddress)
+            idents = env.headerNode.findall(namespaces.wseTag('Identifier'))
+            self.assertEqual([i.text for i in idents], [subscr.notifyRefNodes[0].text])
+            self.assertEqual(env.bodyNode[0].get('MdibVersion'), '42')
+
+
+    def test_validationPolicy(self):
+        mdib = self.sdcDevice_d10.mdib
+        action = mdib.sdc_definitions.Actions.OperationInvokedReport
+        errors = []
+        policy = xmlparsing.ValidationPolicy(onError=lambda *args: errors.append(args))
+        policy.setRule(action, xmlparsing.ValidationMode.SAMPLED, interval=3)
+        subscriptionsManager = subscriptionmgr.SubscriptionsManager(None, mdib.sdc_definitions, mdib.bicepsSchema,
+                                                                    ['gzip'], validation_policy=policy)
+        subscr = mockstuff.TestDevSubscription(action, mdib.bicepsSchema)
+        subscr.setSoapClient(DummySoapClient())
+        subscr.sendPreparedReport = subscriptionmgr._DevSubscription.sendPreparedReport.__get__(subscr) # use real implementation
+        subscriptionsManager._subscriptions.addObject(subscr)
+        for i in range(5):
+            subscriptionsManager.notifyOperation('urn:uuid:abc', 42 + i, transactionId=i, operationHandleRef='something',
+                                                 operationState='Fin')
+        self.assertEqual(len(subscr.soapClient.sentReports), 5)
+        self.assertEqual(policy.getStats(action), xmlparsing.ValidationStats(validated=2, failed=0, skipped=3))
+
+        invalidBody = etree_.Element(namespaces.msgTag('OperationInvokedReport'))
+        doc_nsmap = namespaces.Prefix_Namespace.partialMap(namespaces.Prefix_Namespace.S12, namespaces.Prefix_Namespace.MSG)
+        policy.setRule(action, xmlparsing.ValidationMode.ALWAYS)
+        with self.assertRaises(etree_.DocumentInvalid):
+            subscriptionsManager._prepareReport(copy.deepcopy(invalidBody), action, doc_nsmap)
+        self.assertEqual(policy.getStats(action), xmlparsing.ValidationStats(validated=3, failed=1, skipped=3))
+
+        # invalid reports are only reported in async mode
+        policy.setRule(action, xmlparsing.ValidationMode.ASYNC)
+        subscriptionsManager._prepareReport(copy.deepcopy(invalidBody), action, doc_nsmap)
+        policy.stop()
+        self.assertEqual(policy.getStats(action), xmlparsing.ValidationStats(validated=4, failed=2, skipped=3))
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0][0], action)
+        self.assertIsInstance(errors[0][1], etree_.DocumentInvalid)
+
+        policy.setRule(action, xmlparsing.ValidationMode.NEVER)
+        subscriptionsManager._prepareReport(copy.deepcopy(invalidBody), action, doc_nsmap)
+        self.assertEqual(policy.getAllStats(), {action: xmlparsing.ValidationStats(validated=4, failed=2, skipped=4)})
+        with self.assertRaises(ValueError):
+            policy.setRule(action, xmlparsing.ValidationMode.SAMPLED, interval=0)
+
+
+    def test_subscriptionIndexes(self):
+        ''' verify that action and identifier lookups follow subscribe, unsubscribe and expiry'''
+        mdib = self.sdcDevice_d10.mdib
+        actions = mdib.sdc_definitions.Actions
+        subscriptionsManager = subscriptionmgr.SubscriptionsManager(None, mdib.sdc_definitions, mdib.bicepsSchema, ['gzip'])
+        metricSubscr = mockstuff.TestDevSubscription(actions.EpisodicMetricReport, mdib.bicepsSchema)
+        bothSubscr = mockstuff.TestDevSubscription(' '.join([actions.EpisodicMetricReport, actions.EpisodicAlertReport]),
+                                                   mdib.bicepsSchema)
+        subscriptionsManager._subscriptions.addObject(metricSubscr)
+        subscriptionsManager._subscriptions.addObject(bothSubscr)
+        all_actions = (actions.EpisodicMetricReport, actions.EpisodicAlertReport, actions.Waveform,
+                       'EpisodicAlertReport')  # the last one matches by suffix
+
+        def check():
+            for action in all_actions:
+                expected = set(s for s in subscriptionsManager._subscriptions.objects if s.matches(action))
+                found = subscriptionsManager._getSubscriptionsForAction(action)
+                self.assertEqual(len(found), len(expected))
+                self.assertEqual(set(found), expected)
+        check()
+        self.assertEqual(len(subscriptionsManager._getSubscriptionsForAction(actions.EpisodicMetricReport)), 2)
+        # new filter string after first lookup
+        waveformSubscr = mockstuff.TestDevSubscription(actions.Waveform, mdib.bicepsSchema)
+        waveformSubscr.setSoapClient(DummySoapClient())
+        subscriptionsManager._subscriptions.addObject(waveformSubscr)
+        check()
+        self.assertEqual(subscriptionsManager._getSubscriptionsForAction(actions.Waveform), [waveformSubscr])
+
+        # lookup by identifier
+        env = Soap12Envelope(namespaces.Prefix_Namespace.partialMap(namespaces.Prefix_Namespace.S12, namespaces.Prefix_Namespace.WSE))
+        env.addHeaderElement(copy.copy(bothSubscr.my_identifier))
+        env.addBodyElement(etree_.Element(namespaces.wseTag('GetStatus')))
+        env = AddressedSoap12Envelope.fromXMLString(env.as_xml())
+        self.assertIs(subscriptionsManager._getSubscriptionforRequest(env), bothSubscr)
+
+        # unsubscribe
+        subscriptionsManager._subscriptions.removeObject(bothSubscr)
+        check()
+        self.assertIsNone(subscriptionsManager._getSubscriptionforRequest(env))
+        self.assertEqual(subscriptionsManager._getSubscriptionsForAction(actions.EpisodicAlertReport), [])
+        # expiry
+        waveformSubscr._expireseconds = 0
+        subscriptionsManager._housekeeper.schedule(waveformSubscr)
+        for _ in range(20):
+            if waveformSubscr not in subscriptionsManager._subscriptions.objects:
+                break
+            time.sleep(0.1)
+        check()
+        self.assertEqual(subscriptionsManager._getSubscriptionsForAction(actions.Waveform), [])
+        self.assertEqual(subscriptionsManager._getSubscriptionsForAction(actions.EpisodicMetricReport), [metricSubscr])
+
+    def test_housekeeping(self):
+        ''' verify that expired and unreachable subscriptions are removed without any report being sent'''
+        class UnreachableSoapClient(DummySoapClient):
+            def postPreparedMessageTo(self, path, message, msg='', compressionPolicy=None):
+                raise ConnectionRefusedError('unreachable')
+
+        mdib = self.sdcDevice_d10.mdib
+        action = mdib.sdc_definitions.Actions.OperationInvokedReport
+        subscriptionsManager = subscriptionmgr.SubscriptionsManager(None, mdib.sdc_definitions, mdib.bicepsSchema, ['gzip'])
+        try:
+            shortSubscr = mockstuff.TestDevSubscription(action, mdib.bicepsSchema)
+            shortSubscr.setSoapClient(DummySoapClient())
+            longSubscr = mockstuff.TestDevSubscription(action, mdib.bicepsSchema)
+            longSubscr.setSoapClient(DummySoapClient())
+            for subscr in (shortSubscr, longSubscr):
+                subscriptionsManager._subscriptions.addObject(subscr)
+                subscriptionsManager._housekeeper.schedule(subscr)
+            shortSubscr.renew(0.5)
+            subscriptionsManager._housekeeper.schedule(shortSubscr)
+            time.sleep(1)
+            self.assertEqual(list(subscriptionsManager._subscriptions.objects), [longSubscr])
+            self.assertEqual(subscriptionsManager.getHousekeepingStats(), subscriptionmgr.HousekeepingStats(1, 0))
+
+            # two subscriptions to an unreachable location, one of them fails => both are evicted
+            unreachableSoapClient = UnreachableSoapClient()
+            unreachableSoapClient.netloc = 'unreachable:123'
+            failingSubscr = mockstuff.TestDevSubscription(action, mdib.bicepsSchema)
+            failingSubscr.setSoapClient(unreachableSoapClient)
+            failingSubscr.sendPreparedReport = subscriptionmgr._DevSubscription.sendPreparedReport.__get__(failingSubscr)
+            otherSubscr = mockstuff.TestDevSubscription(mdib.sdc_definitions.Actions.Waveform, mdib.bicepsSchema)
+            otherSubscr.setSoapClient(unreachableSoapClient)
+            subscriptionsManager._subscriptions.addObject(failingSubscr)
+            subscriptionsManager._subscriptions.addObject(otherSubscr)
+            subscriptionsManager.notifyOperation('urn:uuid:abc', 42, transactionId=123, operationHandleRef='something',
+                                                 operationState='Fin')
+            for _ in range(20):
+                if len(subscriptionsManager._subscriptions.objects) == 1:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(list(subscriptionsManager._subscriptions.objects), [longSubscr])
+            self.assertEqual(subscriptionsManager.getHousekeepingStats(), subscriptionmgr.HousekeepingStats(1, 2))
+            # subscriptions that are already removed (e.g. by an unsubscribe) are not counted again
+            subscriptionsManager._onSubscriptionsExpired([shortSubscr, otherSubscr])
+            subscriptionsManager._onDeliveryFailures([failingSubscr])
+            self.assertEqual(list(subscriptionsManager._subscriptions.objects), [longSubscr])
+            self.assertEqual(subscriptionsManager.getHousekeepingStats(), subscriptionmgr.HousekeepingStats(1, 2))
+        finally:
+            subscriptionsManager.endAllSubscriptions(sendSubscriptionEnd=False)
+
+    def test_asyncDelivery(self):
+        ''' verify that a blocked subscriber does not delay other subscribers and that its queue is bounded'''
+        class BlockedSubscription(mockstuff.TestDevSubscription):
+            notifyTo = 'http://blocked.com:123'
+            unblock = threading.Event()
+            def sendNotificationReport(self, bodyNode, action, doc_nsmap):
+                self.unblock.wait(timeout=10)
+                super(BlockedSubscription, self).sendNotificationReport(bodyNode, action, doc_nsmap)
+
+        mdib = self.sdcDevice_d10.mdib
+        action = mdib.sdc_definitions.Actions.OperationInvokedReport
+        engine = subscriptionmgr.NotificationDeliveryEngine(max_workers=2, max_queue_size=3,
+                                                            policy=subscriptionmgr.DeliveryPolicy.DROP_OLDEST)
+        subscriptionsManager = subscriptionmgr.SubscriptionsManager(None, mdib.sdc_definitions, mdib.bicepsSchema,
+                                                                    ['gzip'], delivery_engine=engine)
+        blockedSubscr = BlockedSubscription(action, mdib.bicepsSchema)
+        testSubscr = mockstuff.TestDevSubscription(action, mdib.bicepsSchema)
+        subscriptionsManager._subscriptions.addObject(blockedSubscr)
+        subscriptionsManager._subscriptions.addObject(testSubscr)
+        try:
+            for i in range(6):
+                subscriptionsManager.notifyOperation('urn:uuid:abc', i, transactionId=i, operationHandleRef='something',
+                                                     operationState='Fin')
+                for _ in range(50):
+                    if len(testSubscr.reports) == i + 1:
+                        break
+                    time.sleep(0.1)
+                self.assertEqual(len(testSubscr.reports), i + 1)
+            self.assertEqual(len(blockedSubscr.reports), 0)
+            stats = subscriptionsManager.getSubscriptionQueueStats()
+            blocked_stats = stats[(blockedSubscr.notifyToAddress, blockedSubscr.short_filter_names())]
+            # first report is in the worker, 3 are queued, 2 were dropped
+            self.assertEqual(blocked_stats.depth, 3)
+            self.assertEqual(blocked_stats.dropped, 2)
+            BlockedSubscription.unblock.set()
+            for _ in range(50):
+                if len(blockedSubscr.reports) == 4:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(len(blockedSubscr.reports), 4)
+            # verify that the latest reports were kept
+            mdibVersions = [r.bodyNode[0].get('MdibVersion') for r in blockedSubscr.reports]
+            self.assertEqual(mdibVersions, ['0', '3', '4', '5'])
+        finally:
+            BlockedSubscription.unblock.set()
+            engine.stop()
+
+    def _mkBlockedSubscriptionClass(self):
+        class BlockedSubscription(mockstuff.TestDevSubscription):
+            ''' records SubscriptionEnd as report "end" '''
+            notifyTo = 'http://blocked.com:123'
+            unblock = threading.Event()
+            def sendNotificationReport(self, bodyNode, action, doc_nsmap):
+                self.unblock.wait(timeout=10)
+                super(BlockedSubscription, self).sendNotificationReport(bodyNode, action, doc_nsmap)
+            def sendNotificationEndMessage(self, action, code='SourceShuttingDown', reason='Event source going off line.'):
+                self.reports.append('end')
+        return BlockedSubscription
+
+    def _waitForQueueDepth(self, engine, subscription, depth):
+        for _ in range(50):
+            if engine.getQueueStats(subscription).depth == depth:
+                return
+            time.sleep(0.1)
+        self.fail('queue of {} has not depth {}'.format(subscription, depth))
+
+    def test_endAllSubscriptions_sharedEngine(self):
+        ''' verify that ending the subscriptions of one manager does not affect reports of another manager that uses
+        the same delivery engine, and that SubscriptionEnd is sent after the queued reports'''
+        mdib = self.sdcDevice_d10.mdib
+        action = mdib.sdc_definitions.Actions.OperationInvokedReport
+        engine = subscriptionmgr.NotificationDeliveryEngine(max_workers=2)
+        managers = [subscriptionmgr.SubscriptionsManager(None, mdib.sdc_definitions, mdib.bicepsSchema,
+                                                         ['gzip'], delivery_engine=engine) for _ in range(2)]
+        subscriptions = []
+        for subscriptionsManager in managers:
+            cls = self._mkBlockedSubscriptionClass()
+            subscriptions.append(cls(action, mdib.bicepsSchema))
+            subscriptionsManager._subscriptions.addObject(subscriptions[-1])
+        try:
+            for subscriptionsManager in managers:
+                for i in range(3):
+                    subscriptionsManager.notifyOperation('urn:uuid:abc', i, transactionId=i,
+                                                         operationHandleRef='something', operationState='Fin')
+            # all reports of first manager are sent before SubscriptionEnd
+            unblockTimer = threading.Timer(0.5, subscriptions[0].unblock.set)
+            unblockTimer.start()
+            managers[0].endAllSubscriptions(sendSubscriptionEnd=True)
+            self.assertEqual(len(subscriptions[0].reports), 4)
+            self.assertEqual(subscriptions[0].reports[-1], 'end')
+            self.assertIsNone(engine.getQueueStats(subscriptions[0]))
+            # reports of second manager are still delivered
+            subscriptions[1].unblock.set()
+            for _ in range(50):
+                if len(subscriptions[1].reports) == 3:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(len(subscriptions[1].reports), 3)
+            # reports that are queued for later are discarded if no SubscriptionEnd is sent
+            subscriptions[1].unblock.clear()
+            for i in range(3):
+                managers[1].notifyOperation('urn:uuid:abc', i, transactionId=i,
+                                            operationHandleRef='something', operationState='Fin')
+            self._waitForQueueDepth(engine, subscriptions[1], 2)  # first report is in the worker, two are queued
+            managers[1].endAllSubscriptions(sendSubscriptionEnd=False)
+            subscriptions[1].unblock.set()
+            time.sleep(0.5)
+            self.assertEqual(len(subscriptions[1].reports), 4)
+        finally:
+            for s in subscriptions:
+                s.unblock.set()
+            engine.stop()
+
+    def test_asyncDelivery_coalesce(self):
+        ''' verify that policy COALESCE merges episodic reports and keeps the newest state of every handle'''
+        mdib = self.sdcDevice_d10.mdib
+        action = mdib.sdc_definitions.Actions.EpisodicMetricReport
+        engine = subscriptionmgr.NotificationDeliveryEngine(max_workers=2, max_queue_size=2,
+                                                            policy=subscriptionmgr.DeliveryPolicy.COALESCE)
+        subscriptionsManager = subscriptionmgr.SubscriptionsManager(None, mdib.sdc_definitions, mdib.bicepsSchema,
+                                                                    ['gzip'], delivery_engine=engine)
+        blockedSubscr = self._mkBlockedSubscriptionClass()(action, mdib.bicepsSchema)
+        subscriptionsManager._subscriptions.addObject(blockedSubscr)
+        stateA, stateB = mdib.states.NODETYPE.get(namespaces.domTag('NumericMetricState'))[:2]
+
+        def sendReport(states, mdibVersion):
+            subscriptionsManager.sendEpisodicMetricReport(states, mdib.nsmapper, mdibVersion, mdib.sequenceId)
+
+        try:
+            sendReport([stateA], 1)  # goes to the worker
+            self._waitForQueueDepth(engine, blockedSubscr, 0)
+            sendReport([stateA], 2)
+            sendReport([stateB], 3)
+            sendReport([stateB], 4)  # queue is full, merged with report 2
+            stats = engine.getQueueStats(blockedSubscr)
+            self.assertEqual(stats.depth, 2)
+            self.assertEqual(stats.coalesced, 1)
+            self.assertEqual(stats.dropped, 0)
+            blockedSubscr.unblock.set()
+            for _ in range(50):
+                if len(blockedSubscr.reports) == 3:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(len(blockedSubscr.reports), 3)
+            bodies = [r.bodyNode[0] for r in blockedSubscr.reports]
+            self.assertEqual([b.get('MdibVersion') for b in bodies], ['1', '3', '4'])
+            handles = [s.get('DescriptorHandle') for s in bodies[2].iterfind('*/*')]
+            self.assertEqual(sorted(handles), sorted([stateA.descriptorHandle, stateB.descriptorHandle]))
+        finally:
+            blockedSubscr.unblock.set()
+            engine.stop()
+
+
     def test_invalid_GetStatus_Renew(self):
         ''' verify that a subscription response is 'Fault' response in case of invalid request'''
         notifyTo = 'http://localhost:123'
@@ -99,6 +99,23 @@ class TestDeviceWaveform(unittest.TestCase):
         self.assertTrue(abs(now - determinationTime) <= 0.02)
 
 
+    def test_waveformGeneratorSampleArray(self):
+        gen = waveforms.SawtoothGenerator(min_value=0, max_value=10, waveformperiod=1.0, sampleperiod=0.1)
+        samples, cycleStarts = gen.nextSampleArray(3)
+        self.assertEqual(list(samples), [0, 1, 2])
+        self.assertEqual(cycleStarts, [0])
+        samples, cycleStarts = gen.nextSampleArray(25) # wraps around twice
+        self.assertEqual(list(samples), [3, 4, 5, 6, 7, 8, 9] + list(range(10)) + list(range(8)))
+        self.assertEqual(cycleStarts, [7, 17])
+        self.assertEqual(gen.nextSamples(3), [(8, False), (9, False), (0, True)])
+        samples, cycleStarts = gen.nextSampleArray(0)
+        self.assertEqual(len(samples), 0)
+        self.assertEqual(cycleStarts, [])
+
+        rtSampleArray = sdc11073.mdib.devicemdib.RtSampleArray(100.0, 0.1, samples, pmtypes.ComponentActivation.ON, [2, 12])
+        self.assertEqual(rtSampleArray.getAnnotationTriggerTimestamps(), [100.2, 100.0 + 12*0.1])
+
+
     def test_waveformSubscription(self):
         self._model = sdc11073.pysoap.soapenvelope.DPWSThisModel(manufacturer='Chinakracher GmbH',
                                                                  manufacturerUrl='www.chinakracher.com',
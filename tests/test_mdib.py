@@ -2,7 +2,16 @@ from __future__ import absolute_import
 from __future__ import print_function 
 import unittest
 import os
+import copy
+import threading
+from unittest import mock
+from lxml import etree as etree_
 from sdc11073 import mdib
+from sdc11073 import namespaces
+from sdc11073 import pmtypes
+from sdc11073 import xmlparsing
+from sdc11073.definitions_sdc import SDC_v1_Definitions
+from sdc11073.mdib import containerproperties
 mdibFolder = os.path.dirname(__file__)
 
 class TestMdib(unittest.TestCase):
@@ -28,6 +37,209 @@ class TestMdib(unittest.TestCase):
         deviceMdibContainer = mdib.DeviceMdibContainer.fromMdibFile(os.path.join(os.path.dirname(__file__), 'mdib_tns.xml'))
         self.assertTrue(deviceMdibContainer is not None)
 
+    def test_transactionSharesFrozenStates(self):
+        deviceMdibContainer = mdib.DeviceMdibContainer.fromMdibFile(os.path.join(mdibFolder, '70041_MDIB_Final.xml'))
+        sent = []
+
+        class _Device(object):
+            def sendMetricStateUpdates(self, mdibVersion, updates):
+                sent.extend(updates)
+
+        deviceMdibContainer.setSdcDevice(_Device())
+        handle = deviceMdibContainer.states.NODETYPE.get(namespaces.domTag('NumericMetricState'))[0].descriptorHandle
+        old_state = deviceMdibContainer.states.descriptorHandle.getOne(handle)
+        with deviceMdibContainer.mdibUpdateTransaction() as tr:
+            st = tr.getMetricState(handle)
+            st.mkMetricValue()
+            st.metricValue.Value = 42
+        committed = deviceMdibContainer.states.descriptorHandle.getOne(handle)
+        # the committed state itself is sent, it is frozen and replaced by the next transaction
+        self.assertIs(committed, st)
+        self.assertEqual(sent, [committed])
+        self.assertTrue(committed.isFrozen)
+        self.assertIsNot(committed, old_state)
+        self.assertEqual(committed.StateVersion, old_state.StateVersion + 1)
+        with self.assertRaises(containerproperties.FrozenContainerError):
+            committed.StateVersion = 0
+        with deviceMdibContainer.mdibUpdateTransaction() as tr:
+            st2 = tr.getMetricState(handle)
+        self.assertIsNot(st2, committed)
+        self.assertEqual(committed.StateVersion + 1, deviceMdibContainer.states.descriptorHandle.getOne(handle).StateVersion)
+
+    def test_rollbackKeepsCommittedStates(self):
+        deviceMdibContainer = mdib.DeviceMdibContainer.fromMdibFile(os.path.join(mdibFolder, '70041_MDIB_Final.xml'))
+        deviceMdibContainer.setSdcDevice(mock.MagicMock())
+        handle = deviceMdibContainer.states.NODETYPE.get(namespaces.domTag('NumericMetricState'))[0].descriptorHandle
+        with deviceMdibContainer.mdibUpdateTransaction() as tr:
+            st = tr.getMetricState(handle)
+            st.mkMetricValue()
+            st.metricValue.Value = 1
+            st.metricValue.Annotation.append(pmtypes.Annotation(pmtypes.CodedValue('42')))
+        committed = deviceMdibContainer.states.descriptorHandle.getOne(handle)
+        snapshotState = [s for s in deviceMdibContainer.getSnapshot().states if s.descriptorHandle == handle][0]
+        self.assertIs(snapshotState, committed)
+        expectedNode = etree_.tostring(committed.mkStateNode())
+
+        with self.assertRaises(ValueError):
+            with deviceMdibContainer.mdibUpdateTransaction() as tr:
+                st = tr.getMetricState(handle)
+                st.metricValue.Value = 2
+                st.metricValue.Annotation.append(pmtypes.Annotation(pmtypes.CodedValue('43')))
+                # the open transaction does not modify the committed state
+                self.assertEqual(committed.metricValue.Value, 1)
+                raise ValueError('rollback')
+        self.assertIs(deviceMdibContainer.states.descriptorHandle.getOne(handle), committed)
+        self.assertEqual(committed.metricValue.Value, 1)
+        self.assertEqual(len(committed.metricValue.Annotation), 1)
+        self.assertEqual(etree_.tostring(committed.mkStateNode()), expectedNode)
+        snapshotState = [s for s in deviceMdibContainer.getSnapshot().states if s.descriptorHandle == handle][0]
+        self.assertEqual(snapshotState.metricValue.Value, 1)
+
+    def test_descriptorIndexes(self):
+        deviceMdibContainer = mdib.DeviceMdibContainer.fromMdibFile(os.path.join(mdibFolder, '70041_MDIB_Final.xml'))
+
+        class _Device(object):
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: None
+
+        deviceMdibContainer.setSdcDevice(_Device())
+        descriptions = deviceMdibContainer.descriptions
+
+        def _matches(descriptor, path):
+            for code in reversed(path):
+                if descriptor is None or descriptor.codeId != code:
+                    return False
+                descriptor = descriptions.handle.getOne(descriptor.parentHandle, allowNone=True)
+            return True
+
+        for path in [('70041', '69650', '69651'), ('69650', '69651', '152464'), ('69651', '152464'), ('152464',)]:
+            indexed = deviceMdibContainer.selectDescriptors(*path)
+            self.assertTrue(len(indexed) > 0)
+            self.assertEqual(set(indexed), set(d for d in descriptions.objects if _matches(d, path)))
+        # a None coding is a wildcard, the tree is walked
+        self.assertEqual(set(deviceMdibContainer.selectDescriptors('70041', None, '69651', '152464')),
+                         set(deviceMdibContainer.selectDescriptors('70041', '69650', '69651', '152464')))
+
+        # OperationTarget index
+        for op in deviceMdibContainer.getOperationDescriptors():
+            self.assertIn(op, deviceMdibContainer.getOperationDescriptorsForDescriptorHandle(op.OperationTarget))
+            expected = [o for o in deviceMdibContainer.getOperationDescriptors() if o.OperationTarget == op.OperationTarget]
+            self.assertEqual(set(expected),
+                             set(deviceMdibContainer.getOperationDescriptorsForDescriptorHandle(op.OperationTarget)))
+
+        # create and delete descriptors in transactions
+        channel = deviceMdibContainer.selectDescriptors('70041', '69650', '69651')[0]
+        path = ('70041', '69650', '69651', '4711')
+        self.assertEqual(deviceMdibContainer.selectDescriptors(*path), [])
+        with deviceMdibContainer.mdibUpdateTransaction():
+            newDescriptor = deviceMdibContainer.createStringMetricDescriptorContainer(
+                'new_metric', channel.handle, pmtypes.CodedValue('4711'), pmtypes.SafetyClassification.INF, pmtypes.CodedValue('262656'))
+        found = deviceMdibContainer.selectDescriptors(*path)
+        self.assertEqual([d.handle for d in found], ['new_metric'])
+        with deviceMdibContainer.mdibUpdateTransaction() as tr:
+            tr.removeDescriptor('new_metric')
+        self.assertEqual(deviceMdibContainer.selectDescriptors(*path), [])
+
+        # children that are added before the parent get the complete path
+        lookup = mdib.mdibbase.DescriptorsLookup()
+        descriptors = deviceMdibContainer.getAllDescriptorsInSubTree(channel)
+        lookup.addObjects(reversed([d.mkCopy() for d in descriptors]))
+        child = [d for d in descriptors if d.parentHandle == channel.handle][0]
+        self.assertIn(child.handle, [d.handle for d in lookup.codingPath.get((channel.coding, child.coding))])
+
+    def test_containerCodec(self):
+        ''' compiled codecs must produce the same xml and values as the generic container properties'''
+        deviceMdibContainer = mdib.DeviceMdibContainer.fromMdibFile(os.path.join(mdibFolder, '70041_MDIB_Final.xml'))
+        containers = list(deviceMdibContainer.descriptions.objects) + list(deviceMdibContainer.states.objects) \
+                     + list(deviceMdibContainer.contextStates.objects)
+        for container in containers:
+            nsmap = container.nsmapper.docNssmap
+            with mock.patch('time.time', return_value=1234.5):  # CurrentTimestampAttributeProperty writes current time
+                compiledNode = container._updateNode(etree_.Element('x', nsmap=nsmap), setXsiType=True)
+                genericNode = etree_.Element('x', nsmap=nsmap)
+                genericNode.set(namespaces.QN_TYPE, container.nsmapper.docNameFromQName(container.NODETYPE))
+                for _, prop in container._sortedContainerProperties():
+                    prop.updateXMLValue(container, genericNode)
+            self.assertEqual(etree_.tostring(compiledNode), etree_.tostring(genericNode))
+
+            compiled = copy.copy(container)
+            compiled._updateFromNode(compiledNode)
+            generic = copy.copy(container)
+            for _, prop in container._sortedContainerProperties():
+                prop.updateFromNode(generic, compiledNode)
+            self.assertEqual(compiled.diff(generic), [])
+
+    def test_nodelessMdib(self):
+        with mock.patch('time.time', return_value=1234.5):  # initial values of some states are timestamps
+            mdibs = [mdib.DeviceMdibContainer.fromMdibFile(os.path.join(mdibFolder, '70041_MDIB_Final.xml'),
+                                                           createLocationContextDescr=False,
+                                                           createPatientContextDescr=False,
+                                                           keepNodes=keepNodes) for keepNodes in (True, False)]
+        sent = []
+
+        class _Device(object):
+            def sendMetricStateUpdates(self, mdibVersion, updates):
+                sent.extend(updates)
+
+        handle = mdibs[0].states.NODETYPE.get(namespaces.domTag('NumericMetricState'))[0].descriptorHandle
+        for deviceMdibContainer in mdibs:
+            deviceMdibContainer.sequenceId = 'urn:uuid:test'
+            deviceMdibContainer.setSdcDevice(_Device())
+            with deviceMdibContainer.mdibUpdateTransaction(setDeterminationTime=False) as tr:
+                st = tr.getMetricState(handle)
+                st.mkMetricValue()
+                st.metricValue.Value = 42
+        nodeMdib, nodelessMdib = mdibs
+        self.assertEqual(etree_.tostring(nodeMdib.reconstructMdDescription()[0]),
+                         etree_.tostring(nodelessMdib.reconstructMdDescription()[0]))
+        with mock.patch('time.time', return_value=1234.5):
+            renderedStates = [sorted(etree_.tostring(node) for node in m.reconstructMdibWithContextStates().iter(namespaces.domTag('State')))
+                              for m in mdibs]
+        self.assertEqual(renderedStates[0], renderedStates[1])
+        self.assertIsNotNone(nodeMdib.states.descriptorHandle.getOne(handle).node)
+        for container in list(nodelessMdib.descriptions.objects) + list(nodelessMdib.states.objects):
+            self.assertIsNone(container.node)
+        # notifications render the sent states on demand
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(etree_.tostring(sent[0].mkStateNode()), etree_.tostring(sent[1].mkStateNode()))
+        self.assertIsNone(sent[1].node)
+
+    def test_sharedBicepsSchema(self):
+        mdibs = [mdib.DeviceMdibContainer(SDC_v1_Definitions) for _ in range(2)]
+        self.assertIs(mdibs[0].bicepsSchema, mdibs[1].bicepsSchema)
+        self.assertIs(mdibs[0].bicepsSchema, xmlparsing.getBicepsSchema(SDC_v1_Definitions))
+
+        # schemas are compiled on first use, concurrent first access compiles only once
+        bicepsSchema = xmlparsing.BicepsSchema(SDC_v1_Definitions)
+        self.assertEqual(bicepsSchema._schemas, {})
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(bicepsSchema.bmmSchema)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(list(bicepsSchema._schemas.keys()), ['bmmSchema'])
+        self.assertEqual(len(set(id(r) for r in results)), 1)
+        self.assertIs(results[0], bicepsSchema.bmmSchema)
+        for name in ('pmSchema', 'mexSchema', 'evtSchema', 's12Schema', 'dpwsSchema'):
+            self.assertIsInstance(getattr(bicepsSchema, name), etree_.XMLSchema)
+
+
+    def test_namespaceTranslation(self):
+        deviceMdibContainer = mdib.DeviceMdibContainer.fromMdibFile(os.path.join(mdibFolder, '70041_MDIB_Final.xml'))
+        node = deviceMdibContainer.reconstructMdibWithContextStates()
+        normalized = etree_.tostring(node, encoding='utf-8')
+        denormalized = deviceMdibContainer.nodeToString(node, xml_declaration=False)
+        for prefix in (namespaces.Prefix_Namespace.MSG, namespaces.Prefix_Namespace.PM,
+                       namespaces.Prefix_Namespace.EXT, namespaces.Prefix_Namespace.MDPWS):
+            self.assertNotIn(prefix.namespace.encode('utf-8'), denormalized)
+        self.assertIn(SDC_v1_Definitions.ParticipantModelNamespace.encode('utf-8'), denormalized)
+        self.assertEqual(SDC_v1_Definitions.normalizeXMLText(denormalized), normalized)
+        # text without any of the namespaces is returned as it is
+        text = b'<wse:Renew xmlns:wse="http://schemas.xmlsoap.org/ws/2004/08/eventing"/>'
+        self.assertIs(SDC_v1_Definitions.normalizeXMLText(text), text)
+        self.assertIs(SDC_v1_Definitions.denormalizeXMLText(text), text)
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(TestMdib)
@@ -0,0 +1,117 @@
+import unittest
+from sdc11073 import multikey
+
+
+class _Obj(object):
+    def __init__(self, handle, nodetype, sources=None):
+        self.handle = handle
+        self.nodetype = nodetype
+        self.sources = sources or []
+
+    def __repr__(self):
+        return '_Obj({}, {})'.format(self.handle, self.nodetype)
+
+
+class _CountingIndexDefinition(multikey.IndexDefinition):
+    ''' counts modifications of the index'''
+    def __init__(self, getKeyFunc):
+        super(_CountingIndexDefinition, self).__init__(getKeyFunc)
+        self.added = 0
+        self.removed = 0
+
+    def _addKey(self, key, obj):
+        self.added += 1
+        super(_CountingIndexDefinition, self)._addKey(key, obj)
+
+    def _rmKey(self, key, obj):
+        self.removed += 1
+        super(_CountingIndexDefinition, self)._rmKey(key, obj)
+
+
+class TestMultiKeyLookup(unittest.TestCase):
+
+    def setUp(self):
+        self.lookup = multikey.MultiKeyLookup()
+        self.lookup.addIndex('handle', multikey.UIndexDefinition(lambda obj: obj.handle))
+        self.lookup.addIndex('nodetype', _CountingIndexDefinition(lambda obj: obj.nodetype))
+        self.lookup.addIndex('source', multikey.IndexDefinition1n(lambda obj: obj.sources))
+
+    def test_readAccess(self):
+        objs = [_Obj('h{}'.format(i), 'A' if i % 2 else 'B', ['s{}'.format(i % 3)]) for i in range(10)]
+        self.lookup.addObjects(objs)
+        self.assertEqual(self.lookup.handle.get('h1'), [objs[1]])
+        self.assertEqual(self.lookup.handle['h2'], [objs[2]])
+        self.assertTrue(self.lookup.handle.getOne('h3') is objs[3])
+        self.assertIsNone(self.lookup.handle.getOne('xx', allowNone=True))
+        self.assertIsNone(self.lookup.handle.get('xx'))
+        self.assertEqual(self.lookup.nodetype.get('A'), [o for o in objs if o.nodetype == 'A'])  # insertion order
+        self.assertEqual(self.lookup.source.get('s0'), [objs[0], objs[3], objs[6], objs[9]])
+        self.assertRaises(RuntimeError, self.lookup.nodetype.getOne, 'A')
+        self.assertEqual(sorted(k for k, _ in self.lookup.nodetype.items()), ['A', 'B'])
+        # modifying the result does not modify the index
+        self.lookup.nodetype.get('A').clear()
+        self.assertEqual(len(self.lookup.nodetype.get('A')), 5)
+
+        self.lookup.removeObject(objs[1])
+        self.assertNotIn(objs[1], self.lookup.nodetype.get('A'))
+        self.assertNotIn('h1', self.lookup.handle)
+        self.lookup.removeObjects([o for o in objs if o.nodetype == 'A'])
+        self.assertNotIn('A', self.lookup.nodetype)
+
+    def test_swapObject(self):
+        objs = [_Obj('h{}'.format(i), 'A') for i in range(1000)]
+        self.lookup.addObjects(objs)
+        nodetype_index = self.lookup.nodetype
+        nodetype_index.added = nodetype_index.removed = 0
+
+        new_obj = _Obj('h5', 'A', ['x'])
+        self.lookup.swapObject(objs[5], new_obj)
+        # nodetype key did not change => no remove / add in this index
+        self.assertEqual(nodetype_index.added, 0)
+        self.assertEqual(nodetype_index.removed, 0)
+        self.assertTrue(self.lookup.handle.getOne('h5') is new_obj)
+        self.assertIn(new_obj, nodetype_index.get('A'))
+        self.assertNotIn(objs[5], nodetype_index.get('A'))
+        self.assertEqual(len(nodetype_index.get('A')), 1000)
+        self.assertEqual(self.lookup.source.get('x'), [new_obj])
+        self.assertIn(new_obj, self.lookup.objects)
+        self.assertNotIn(objs[5], self.lookup.objects)
+
+        # swap with changed keys
+        new_obj2 = _Obj('h5', 'B')
+        self.lookup.swapObject(new_obj, new_obj2)
+        self.assertEqual(nodetype_index.get('B'), [new_obj2])
+        self.assertEqual(len(nodetype_index.get('A')), 999)
+        self.assertNotIn('x', self.lookup.source)
+
+        # remove after swap works as before
+        self.lookup.removeObject(new_obj2)
+        self.assertNotIn('B', nodetype_index)
+        self.assertNotIn('h5', self.lookup.handle)
+
+        # unknown old object => new object is added
+        new_obj3 = _Obj('h_new', 'C')
+        self.lookup.swapObject(None, new_obj3)
+        self.assertTrue(self.lookup.handle.getOne('h_new') is new_obj3)
+
+        # swap must not violate unique index
+        self.assertRaises(KeyError, self.lookup.swapObject, objs[1], _Obj('h2', 'A'))
+
+    def test_updateObject(self):
+        obj = _Obj('h1', 'A')
+        other = _Obj('h2', 'A')
+        self.lookup.addObjects([obj, other])
+        nodetype_index = self.lookup.nodetype
+        nodetype_index.added = nodetype_index.removed = 0
+        self.lookup.updateObject(obj)
+        self.assertEqual(nodetype_index.added, 0)
+        self.assertEqual(nodetype_index.removed, 0)
+
+        obj.nodetype = 'B'
+        obj.handle = 'h1_new'
+        self.lookup.updateObject(obj)
+        self.assertEqual(nodetype_index.get('A'), [other])
+        self.assertEqual(nodetype_index.get('B'), [obj])
+        self.assertTrue(self.lookup.handle.getOne('h1_new') is obj)
+        self.assertNotIn('h1', self.lookup.handle)
+        self.assertRaises(RuntimeError, self.lookup.updateObject, _Obj('h3', 'A'))
@@ -1,5 +1,8 @@
 import unittest
+import copy
+from lxml import etree as etree_
 
+from sdc11073 import namespaces
 from sdc11073 import pmtypes
 
 
@@ -22,3 +25,65 @@ class TestPmtypes(unittest.TestCase):
         c3 = pmtypes.CodedValue(42)
         c3.Translation.append(pmtypes.T_Translation(41)) # same translation as c2
         self.assertEqual(c2, c3)
+
+    def test_compactTypes(self):
+        nsmap = {'pm': namespaces.Prefix_Namespace.PM.namespace}
+        for obj in (pmtypes.CodedValue(42), pmtypes.T_Translation(41), pmtypes.NumericMetricValue(None),
+                    pmtypes.SampleArrayValue(None), pmtypes.Annotation(pmtypes.CodedValue(1)),
+                    pmtypes.ApplyAnnotation(1, 2), pmtypes.InstanceIdentifier('abc'), pmtypes.Coding('42')):
+            self.assertFalse(hasattr(obj, '__dict__'), msg=obj.__class__.__name__)
+            copied = copy.deepcopy(obj)
+            self.assertEqual(obj, copied)
+        value = pmtypes.NumericMetricValue(None)
+        value.Value = 42
+        value.Annotation = [pmtypes.Annotation(pmtypes.CodedValue(1))]
+        node = value.asEtreeNode(namespaces.domTag('MetricValue'), nsmap)
+        self.assertEqual(pmtypes.NumericMetricValue.fromNode(node), value)
+
+    def test_interning(self):
+        nsmap = {'pm': namespaces.Prefix_Namespace.PM.namespace}
+        self.assertIs(pmtypes.Coding.interned('42'), pmtypes.Coding.interned(42))
+        self.assertIs(pmtypes.CodedValue(42).coding, pmtypes.CodedValue('42').coding)
+        self.assertIsNot(pmtypes.Coding.interned('42'), pmtypes.Coding.interned('42', codingSystem='abc'))
+
+        def _mkAnnotationNode(code):
+            return pmtypes.Annotation(pmtypes.CodedValue(code)).asEtreeNode(namespaces.domTag('Annotation'), nsmap)
+
+        # parsed annotations share the interned coding, but not the mutable CodedValue
+        annotation = pmtypes.Annotation.fromNode(_mkAnnotationNode('4711'))
+        other = pmtypes.Annotation.fromNode(_mkAnnotationNode('4711'))
+        self.assertIsNot(annotation, other)
+        self.assertEqual(annotation, other)
+        self.assertIs(annotation.coding, other.coding)
+        self.assertEqual(annotation.coding, pmtypes.Coding('4711'))
+        annotation.Type.Code = '999'
+        self.assertEqual(other.Type.Code, '4711')
+        node = _mkAnnotationNode('4711')
+        etree_.SubElement(node[0], namespaces.domTag('ConceptDescription')).text = 'foo'
+        self.assertEqual(pmtypes.Annotation.fromNode(node).coding, pmtypes.Coding('4711'))
+
+    def test_copy(self):
+        nsmap = {'pm': namespaces.Prefix_Namespace.PM.namespace}
+        value = pmtypes.NumericMetricValue(None)
+        value.Value = 42
+        value.Annotation = [pmtypes.Annotation(pmtypes.CodedValue(1))]
+        value = pmtypes.NumericMetricValue.fromNode(value.asEtreeNode(namespaces.domTag('MetricValue'), nsmap))
+        # deepcopy copies the property values, the node is shared
+        copied = copy.deepcopy(value)
+        self.assertEqual(copied, value)
+        self.assertIs(copied.node, value.node)
+        self.assertIsNot(copied.Annotation, value.Annotation)
+        self.assertIsNot(copied.Annotation[0], value.Annotation[0])
+        self.assertIsNot(copied.Annotation[0].Type, value.Annotation[0].Type)
+        copied.Annotation[0].Type.Code = '2'
+        copied.Annotation.append(pmtypes.Annotation(pmtypes.CodedValue(3)))
+        self.assertEqual(value.Annotation[0].Type.Code, '1')
+        self.assertEqual(len(value.Annotation), 1)
+        # copy shares the values
+        shallow = copy.copy(value)
+        self.assertIs(shallow.Annotation, value.Annotation)
+        # classes without __slots__
+        group = pmtypes.OperationGroup(pmtypes.CodedValue(1), operations=['a', 'b'])
+        copiedGroup = copy.deepcopy(group)
+        self.assertEqual(copiedGroup, group)
+        self.assertIsNot(copiedGroup.Operations, group.Operations)
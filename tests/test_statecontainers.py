@@ -77,6 +77,33 @@ class TestStateContainers(unittest.TestCase):
         self._verifyAbstractStateContainerDataEqual(sc, sc2)
 
 
+    def test_frozenStateContainer(self):
+        sc = statecontainers.AbstractStateContainer(nsmapper=self.nsmapper,
+                                                    descriptorContainer=self.dc,
+                                                    node=None)
+        sc.updateNode()
+        sc.freeze()
+        self.assertTrue(sc.isFrozen)
+        with self.assertRaises(containerproperties.FrozenContainerError):
+            sc.incrementState()
+
+        # a copy is modifiable and does not affect the frozen container
+        sc2 = sc.mkCopy(copyNode=False)
+        self.assertFalse(sc2.isFrozen)
+        sc2.incrementState()
+        self.assertEqual(sc2.StateVersion, 1)
+        self.assertEqual(sc.StateVersion, 0)
+        sc2.updateNode()
+        self.assertEqual(sc.node.get('StateVersion'), '0')
+        self.assertEqual(sc2.node.get('StateVersion'), '1')
+
+        # mkStateNode renders the actual DescriptorVersion, but the frozen container stays unchanged
+        self.dc.DescriptorVersion += 1
+        node = sc.mkStateNode()
+        self.assertEqual(node.get('DescriptorVersion'), str(self.dc.DescriptorVersion))
+        self.assertEqual(sc.DescriptorVersion, self.dc.DescriptorVersion - 1)
+
+
     def _verifyAbstractStateContainerDataEqual(self, sc1, sc2):
         self.assertEqual(sc1.DescriptorVersion, sc2.DescriptorVersion)
         self.assertEqual(sc1.StateVersion, sc2.StateVersion)